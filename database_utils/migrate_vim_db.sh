@@ -36,7 +36,7 @@ QUIET_MODE=""
 BACKUP_DIR=""
 BACKUP_FILE=""
 #TODO update it with the last database version
-LAST_DB_VERSION=23
+LAST_DB_VERSION=25
 
 # Detect paths
 MYSQL=$(which mysql)
@@ -181,6 +181,8 @@ fi
 #[ $OPENVIM_VER_NUM -ge 5018 ] && DATABASE_TARGET_VER_NUM=21   #0.5.18  => 21
 #[ $OPENVIM_VER_NUM -ge 5021 ] && DATABASE_TARGET_VER_NUM=22   #0.5.21  => 22
 #[ $OPENVIM_VER_NUM -ge 5024 ] && DATABASE_TARGET_VER_NUM=23   #0.5.24  => 23
+#[ $OPENVIM_VER_NUM -ge 5029 ] && DATABASE_TARGET_VER_NUM=24   #0.5.29  => 24
+#[ $OPENVIM_VER_NUM -ge 5029 ] && DATABASE_TARGET_VER_NUM=25   #0.5.29  => 25
 # TODO ... put next versions here
 
 function upgrade_to_1(){
@@ -780,6 +782,61 @@ function downgrade_from_23(){
     sql "DELETE FROM schema_version WHERE version_int = '23';"
 }
 
+function upgrade_to_24(){
+    echo "    Add 'broadcast_groups' column to 'ofcs' table"
+    sql "ALTER TABLE ofcs ADD COLUMN broadcast_groups enum('true','false') NOT NULL DEFAULT 'false' AFTER nets_with_same_vlan;"
+    sql "INSERT INTO schema_version (version_int, version, openvim_ver, comments, date) "\
+        "VALUES (24, '0.24', '0.5.29', 'Add broadcast_groups to ofcs', '2026-10-19');"
+}
+
+function downgrade_from_24(){
+    echo "    Remove 'broadcast_groups' column from 'ofcs' table"
+    sql "ALTER TABLE ofcs DROP COLUMN broadcast_groups;"
+    sql "DELETE FROM schema_version WHERE version_int = '24';"
+}
+
+function upgrade_to_25(){
+    echo "    Add 'cluster_members', 'cluster_leases' and 'cluster_tasks' tables"
+    sql "CREATE TABLE IF NOT EXISTS cluster_members (
+        instance_id VARCHAR(64) NOT NULL,
+        endpoint VARCHAR(255) NULL DEFAULT NULL,
+        started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        heartbeat_at TIMESTAMP NULL DEFAULT NULL,
+        PRIMARY KEY (instance_id) )
+        COLLATE='utf8_general_ci'
+        ENGINE=InnoDB;"
+    sql "CREATE TABLE IF NOT EXISTS cluster_leases (
+        resource_type ENUM('host','ofc','dhcp','controller') NOT NULL,
+        resource_id VARCHAR(36) NOT NULL,
+        owner VARCHAR(64) NULL DEFAULT NULL,
+        acquired_at TIMESTAMP NULL DEFAULT NULL,
+        expires_at TIMESTAMP NULL DEFAULT NULL,
+        PRIMARY KEY (resource_type, resource_id),
+        INDEX owner (owner) )
+        COLLATE='utf8_general_ci'
+        ENGINE=InnoDB;"
+    sql "CREATE TABLE IF NOT EXISTS cluster_tasks (
+        id INT(10) UNSIGNED NOT NULL AUTO_INCREMENT,
+        resource_type ENUM('host','ofc','dhcp','controller') NOT NULL,
+        resource_id VARCHAR(36) NOT NULL,
+        task MEDIUMTEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (id),
+        INDEX resource (resource_type, resource_id) )
+        COLLATE='utf8_general_ci'
+        ENGINE=InnoDB;"
+    sql "INSERT INTO schema_version (version_int, version, openvim_ver, comments, date) "\
+        "VALUES (25, '0.25', '0.5.29', 'Add cluster_members, cluster_leases and cluster_tasks', '2026-10-19');"
+}
+
+function downgrade_from_25(){
+    echo "    Remove 'cluster_members', 'cluster_leases' and 'cluster_tasks' tables"
+    sql "DROP TABLE IF EXISTS cluster_tasks;"
+    sql "DROP TABLE IF EXISTS cluster_leases;"
+    sql "DROP TABLE IF EXISTS cluster_members;"
+    sql "DELETE FROM schema_version WHERE version_int = '25';"
+}
+
 # TODO ... put functions here
 
 
@@ -46,6 +46,58 @@ CREATE DATABASE /*!32312 IF NOT EXISTS*/ `{{vim_db}}` /*!40100 DEFAULT CHARACTER
 
 USE `{{vim_db}}`;
 
+--
+-- Table structure for table `cluster_leases`
+--
+
+DROP TABLE IF EXISTS `cluster_leases`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!40101 SET character_set_client = utf8 */;
+CREATE TABLE `cluster_leases` (
+  `resource_type` enum('host','ofc','dhcp','controller') NOT NULL,
+  `resource_id` varchar(36) NOT NULL,
+  `owner` varchar(64) DEFAULT NULL,
+  `acquired_at` timestamp NULL DEFAULT NULL,
+  `expires_at` timestamp NULL DEFAULT NULL,
+  PRIMARY KEY (`resource_type`,`resource_id`),
+  KEY `owner` (`owner`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Table structure for table `cluster_members`
+--
+
+DROP TABLE IF EXISTS `cluster_members`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!40101 SET character_set_client = utf8 */;
+CREATE TABLE `cluster_members` (
+  `instance_id` varchar(64) NOT NULL,
+  `endpoint` varchar(255) DEFAULT NULL,
+  `started_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `heartbeat_at` timestamp NULL DEFAULT NULL,
+  PRIMARY KEY (`instance_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Table structure for table `cluster_tasks`
+--
+
+DROP TABLE IF EXISTS `cluster_tasks`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!40101 SET character_set_client = utf8 */;
+CREATE TABLE `cluster_tasks` (
+  `id` int(10) unsigned NOT NULL AUTO_INCREMENT,
+  `resource_type` enum('host','ofc','dhcp','controller') NOT NULL,
+  `resource_id` varchar(36) NOT NULL,
+  `task` mediumtext NOT NULL,
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  KEY `resource` (`resource_type`,`resource_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
 --
 -- Table structure for table `flavors`
 --
@@ -363,6 +415,7 @@ CREATE TABLE `ofcs` (
   `last_error` varchar(255) DEFAULT NULL,
   `status` enum('ACTIVE','INACTIVE','ERROR') DEFAULT 'ACTIVE',
   `nets_with_same_vlan` enum('true','false') NOT NULL DEFAULT 'false',
+  `broadcast_groups` enum('true','false') NOT NULL DEFAULT 'false',
   PRIMARY KEY (`uuid`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8;
 /*!40101 SET character_set_client = @saved_cs_client */;
@@ -1037,7 +1090,9 @@ INSERT INTO `schema_version` VALUES
 (20,'0.20','0.5.17','Add image_size to instance_devices','2017-06-01'),
 (21,'0.21','0.5.18','Add routes, links and dns to inets','2017-06-21'),
 (22,'0.22','0.5.21','Changed type of ram in flavors from SMALLINT to MEDIUMINT','2017-11-14'),
-(23,'0.23','0.5.24','Add hypervisor, os_type to instances and add hypervisors to hosts','2018-03-20');
+(23,'0.23','0.5.24','Add hypervisor, os_type to instances and add hypervisors to hosts','2018-03-20'),
+(24,'0.24','0.5.29','Add broadcast_groups to ofcs','2026-10-19'),
+(25,'0.25','0.5.29','Add cluster_members, cluster_leases and cluster_tasks','2026-10-19');
 /*!40000 ALTER TABLE `schema_version` ENABLE KEYS */;
 UNLOCK TABLES;
 /*!40103 SET TIME_ZONE=@OLD_TIME_ZONE */;
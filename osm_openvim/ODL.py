@@ -369,6 +369,9 @@ class OF_conn(openflow_conn.OpenflowConn):
 
                         actions[instruction['order']] = ('vlan', instruction['set-field']['vlan-match']['vlan-id']['vlan-id'])
 
+                    elif 'group-action' in instruction:
+                        actions[instruction['order']] = ('group', instruction['group-action']['group-id'])
+
                 actions = [x for x in actions if x != None]
 
                 rule['actions'] = list(actions)
@@ -435,6 +438,45 @@ class OF_conn(openflow_conn.OpenflowConn):
             self.logger.error("del_flow " + error_text)
             raise openflow_conn.OpenflowconnConnectionException(error_text)
 
+    def _translate_actions(self, action_list):
+        """
+        Build the opendaylight action list from the generic one
+        :param action_list: list of actions, composed by a pair tuples ('vlan', None/int), ('out', port) or
+            ('group', group_id)
+        :return: list of opendaylight actions. Raise a OpenflowconnUnexpectedResponse exception if unknown
+        """
+        actions = []
+        order = 0
+        for action in action_list:
+            new_action = { 'order': order }
+            if  action[0] == "vlan":
+                if action[1] == None:
+                    # strip vlan
+                    new_action['strip-vlan-action'] = dict()
+                else:
+                    new_action['set-field'] = dict()
+                    new_action['set-field']['vlan-match'] = dict()
+                    new_action['set-field']['vlan-match']['vlan-id'] = dict()
+                    new_action['set-field']['vlan-match']['vlan-id']['vlan-id-present'] = True
+                    new_action['set-field']['vlan-match']['vlan-id']['vlan-id'] = int(action[1])
+            elif action[0] == 'out':
+                new_action['output-action'] = dict()
+                if not action[1] in self.pp2ofi:
+                    error_msj = 'Port '+action[1]+' is not present in the switch'
+                    raise openflow_conn.OpenflowconnUnexpectedResponse(error_msj)
+
+                new_action['output-action']['output-node-connector'] = self.pp2ofi[ action[1] ]
+            elif action[0] == 'group':
+                new_action['group-action'] = {'group-id': int(action[1])}
+            else:
+                error_msj = "Unknown item '%s' in action list" % action[0]
+                self.logger.error("new_flow " + error_msj)
+                raise openflow_conn.OpenflowconnUnexpectedResponse(error_msj)
+
+            actions.append(new_action)
+            order += 1
+        return actions
+
     def new_flow(self, data):
         """
         Insert a new static rule
@@ -447,6 +489,7 @@ class OF_conn(openflow_conn.OpenflowConn):
                 actions:      list of actions, composed by a pair tuples with these posibilities:
                     ('vlan', None/int): for stripping/setting a vlan tag
                     ('out', port):      send to this port
+                    ('group', group_id): send to this group
         :return: Raise a OpenflowconnConnectionException expection in case of failure
         """
 
@@ -486,36 +529,8 @@ class OF_conn(openflow_conn.OpenflowConn):
             flow['instructions']['instruction'].append(dict())
             flow['instructions']['instruction'][0]['order'] = 1
             flow['instructions']['instruction'][0]['apply-actions'] = dict()
-            flow['instructions']['instruction'][0]['apply-actions']['action'] = list()
-            actions = flow['instructions']['instruction'][0]['apply-actions']['action']
-
-            order = 0
-            for action in data['actions']:
-                new_action = { 'order': order }
-                if  action[0] == "vlan":
-                    if action[1] == None:
-                        # strip vlan
-                        new_action['strip-vlan-action'] = dict()
-                    else:
-                        new_action['set-field'] = dict()
-                        new_action['set-field']['vlan-match'] = dict()
-                        new_action['set-field']['vlan-match']['vlan-id'] = dict()
-                        new_action['set-field']['vlan-match']['vlan-id']['vlan-id-present'] = True
-                        new_action['set-field']['vlan-match']['vlan-id']['vlan-id'] = int(action[1])
-                elif action[0] == 'out':
-                    new_action['output-action'] = dict()
-                    if not action[1] in self.pp2ofi:
-                        error_msj = 'Port '+action[1]+' is not present in the switch'
-                        raise openflow_conn.OpenflowconnUnexpectedResponse(error_msj)
-
-                    new_action['output-action']['output-node-connector'] = self.pp2ofi[ action[1] ]
-                else:
-                    error_msj = "Unknown item '%s' in action list" % action[0]
-                    self.logger.error("new_flow " + error_msj)
-                    raise openflow_conn.OpenflowconnUnexpectedResponse(error_msj)
-
-                actions.append(new_action)
-                order += 1
+            flow['instructions']['instruction'][0]['apply-actions']['action'] = self._translate_actions(
+                data['actions'])
 
             # print json.dumps(sdata)
             of_response = requests.put(self.url+"/restconf/config/opendaylight-inventory:nodes/node/" + self.id +
@@ -534,6 +549,55 @@ class OF_conn(openflow_conn.OpenflowConn):
             self.logger.error("new_flow " + error_text)
             raise openflow_conn.OpenflowconnConnectionException(error_text)
 
+    def new_group(self, data):
+        """
+        Insert or replace a group of type ALL
+        :param data: dictionary with 'group_id' and 'buckets', a list of action lists. See new_flow
+        :return: Raise a OpenflowconnConnectionException expection in case of failure
+        """
+        try:
+            if len(self.pp2ofi) == 0:
+                self.obtain_port_correspondence()
+
+            group = {'group-id': data['group_id'], 'group-name': "openvim-" + str(data['group_id']),
+                     'group-type': 'group-all', 'barrier': False, 'buckets': {'bucket': []}}
+            for bucket_id, bucket_actions in enumerate(data['buckets']):
+                group['buckets']['bucket'].append({'bucket-id': bucket_id,
+                                                   'action': self._translate_actions(bucket_actions)})
+            of_response = requests.put(self.url+"/restconf/config/opendaylight-inventory:nodes/node/" + self.id +
+                                       "/group/" + str(data['group_id']), headers=self.headers,
+                                       data=json.dumps({'flow-node-inventory:group': [group]}))
+            error_text = "Openflow response %d: %s" % (of_response.status_code, of_response.text)
+            if of_response.status_code != 200 and of_response.status_code != 201:
+                self.logger.warning("new_group " + error_text)
+                raise openflow_conn.OpenflowconnUnexpectedResponse(error_text)
+            self.logger.debug("new_group OK " + error_text)
+            return None
+        except requests.exceptions.RequestException as e:
+            error_text = type(e).__name__ + ": " + str(e)
+            self.logger.error("new_group " + error_text)
+            raise openflow_conn.OpenflowconnConnectionException(error_text)
+
+    def del_group(self, group_id):
+        """
+        Delete an existing group
+        :param group_id: group identifier
+        :return: Raise a OpenflowconnConnectionException expection in case of failure
+        """
+        try:
+            of_response = requests.delete(self.url+"/restconf/config/opendaylight-inventory:nodes/node/" + self.id +
+                                          "/group/" + str(group_id), headers=self.headers)
+            error_text = "Openflow response %d: %s" % (of_response.status_code, of_response.text)
+            if of_response.status_code != 200:
+                self.logger.warning("del_group " + error_text)
+                raise openflow_conn.OpenflowconnUnexpectedResponse(error_text)
+            self.logger.debug("del_group OK " + error_text)
+            return None
+        except requests.exceptions.RequestException as e:
+            error_text = type(e).__name__ + ": " + str(e)
+            self.logger.error("del_group " + error_text)
+            raise openflow_conn.OpenflowconnConnectionException(error_text)
+
     def clear_all_flows(self):
         """
         Delete all existing rules
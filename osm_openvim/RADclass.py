@@ -80,8 +80,8 @@ class RADclass():
         It uses both a ssh and a libvirt connection. 
         It is desirable in future versions get rid of the ssh connection, but currently 
         libvirt does not provide all the needed information. 
+        All the information is gathered at once with HostInventory.collect and then parsed locally.
         Returns (True, Warning) in case of success and (False, <error>) in case of error"""
-        warning_text=""
         try:
             #Get virsh and ssh connection
             (return_status, code) = get_ssh_connection(machine, user, password)
@@ -102,9 +102,28 @@ class RADclass():
     #         (return_status, code) = self.set_connection_info(machine, user, password)
     #         if not return_status:
     #             return (return_status, 'Error in '+machine+': '+code)
-            
+
+            inventory = HostInventory()
+            inventory.collect(ssh_conn, virsh_conn)
+            ssh_conn.close()
+            virsh_conn.close()
+            return self.parse_inventory(inventory, machine)
+        except libvirt.libvirtError, e:
+            text = e.get_error_message()
+            print 'RADclass.obtain_RAD() exception:', text
+            return (False, text)
+        except paramiko.ssh_exception.SSHException, e:
+            text = e.args[0]
+            print  "obtain_RAD ssh Exception:", text
+            return False, text
+
+    def parse_inventory(self, inventory, machine=""):
+        """Fills the RAD information from a HostInventory, without any connection to the server.
+        Returns (True, Warning) in case of success and (False, <error>) in case of error"""
+        warning_text=""
+        try:
             #Set server name
-            machine_name = get_hostname(virsh_conn)
+            machine_name = get_hostname(inventory)
             (return_status, code) = self.set_name(machine_name)
             if not return_status:
                 return (return_status, 'Error at self.set_name in '+machine+': '+code)
@@ -112,14 +131,14 @@ class RADclass():
             
             #Get the server processors information
             processors = dict()
-            (return_status, code) = get_processor_information(ssh_conn, virsh_conn, processors)
+            (return_status, code) = get_processor_information(inventory, processors)
             if not return_status:
                 return (return_status, 'Error at get_processor_information in '+machine+': '+code)
             warning_text += code
             
             #Get the server memory information
             memory_nodes = dict()
-            (return_status, code) = get_memory_information(ssh_conn, virsh_conn, memory_nodes)
+            (return_status, code) = get_memory_information(inventory, memory_nodes)
             if not return_status:
                 return (return_status, 'Error at get_memory_information in '+machine+': '+code)
             warning_text += code
@@ -127,7 +146,7 @@ class RADclass():
             #Get nics information
             nic_topology = dict()
     #         (return_status, code) = get_nic_information_old(ssh_conn, nic_topology)
-            (return_status, code) = get_nic_information(ssh_conn, virsh_conn, nic_topology)
+            (return_status, code) = get_nic_information(inventory, nic_topology)
             if not return_status:
                 return (return_status, 'Error at get_nic_information in '+machine+': '+code)
             warning_text += code
@@ -153,7 +172,7 @@ class RADclass():
             
             #Fill os data
             os = OpSys()
-            (return_status, code) = get_os_information(ssh_conn, os)
+            (return_status, code) = get_os_information(inventory, os)
             if not return_status:
                 return (return_status, 'Error at get_os_information in '+machine+': '+code)
             warning_text += code
@@ -164,7 +183,7 @@ class RADclass():
             
             #Fill hypervisor data
             hypervisor = Hypervisor()
-            (return_status, code) = get_hypervisor_information(virsh_conn, hypervisor)
+            (return_status, code) = get_hypervisor_information(inventory, hypervisor)
             if not return_status:
                 return (return_status, 'Error at get_hypervisor_information in '+machine+': '+code)
             warning_text += code
@@ -172,16 +191,11 @@ class RADclass():
             if not return_status:
                 return (return_status, 'Error at self.set_hypervisor in '+machine+': '+code)
             warning_text += code
-            ssh_conn.close()
                 
             return (True, warning_text)
-        except libvirt.libvirtError, e:
-            text = e.get_error_message()
-            print 'RADclass.obtain_RAD() exception:', text
-            return (False, text)
         except paramiko.ssh_exception.SSHException, e:
             text = e.args[0]
-            print  "obtain_RAD ssh Exception:", text
+            print  "parse_inventory Exception:", text
             return False, text
 
     def set_name(self,name):
@@ -854,38 +868,129 @@ class OpSys():
         text+= '    bit_architecture: '+self.bit_architecture+'\n'
         return text
      
-def get_hostname(virsh_conn):
-    return virsh_conn.getHostname().rstrip('\n')
+#Script run at the compute node by HostInventory.collect with a single ssh command. Each section starts with a
+#'@@@ <name>' line and is followed by its standard error at '@@@ <name>:stderr'
+INVENTORY_SCRIPT = r'''
+ERR=$(mktemp)
+section() {
+    name=$1
+    echo "@@@ $name"
+    eval "$2" 2>"$ERR"
+    echo "@@@ $name:stderr"
+    cat "$ERR"
+}
+section cpuinfo 'cat /proc/cpuinfo'
+section hugepage_size 'sudo hugeadm --page-sizes'
+section nr_hugepages 'for f in /sys/devices/system/node/node*/hugepages/hugepages-*kB/nr_hugepages; do [ -f $f ] && echo "$f $(cat $f)"; done'
+section intel_iommu 'dmesg |grep -e Intel-IOMMU'
+section amd_iommu 'dmesg |grep -e AMD-Vi'
+section redhat_release 'cat /etc/redhat-release'
+section lsb_release 'lsb_release -d -s'
+section os_type 'uname -o'
+section architecture 'uname -i'
+section ethtool 'for i in $(ls /sys/class/net); do echo "== $i"; sudo ethtool $i 2>"$ERR.ethtool" | grep -e Speed -e "Link detected"; sed "s/^/!! /" "$ERR.ethtool"; done; rm -f "$ERR.ethtool"'
+rm -f "$ERR"
+'''
 
-def get_hugepage_size(ssh_conn):
-    command = 'sudo hugeadm --page-sizes'
-#  command = 'hugeadm --page-sizes-all'
-    (_, stdout, stderr) = ssh_conn.exec_command(command)
-    error = stderr.read()
-    if len(error)>0:
-        raise paramiko.ssh_exception.SSHException(command +' : '+ error)
-    mem=stdout.read()
+class HostInventory():
+    """Raw information of a compute node, gathered with one ssh command that runs INVENTORY_SCRIPT and with one
+    libvirt listAllDevices call plus the XML descriptors of the network devices and their pci parents.
+    It is parsed locally by the get_*_information functions. It can be converted to and from a dictionary, so that
+    it can be recorded and parsed later, e.g. by the unit tests"""
+    def __init__(self, data=None):
+        self.hostname = None
+        self.capabilities = None        #Text. XML of libvirt getCapabilities
+        self.sysinfo = None             #Text. XML of libvirt getSysinfo
+        self.hypervisor_type = None
+        self.hypervisor_version = None
+        self.hypervisor_lib_version = None
+        self.net_devices = list()       #List of libvirt net device names, in libvirt order
+        self.devices = dict()           #Dictionary of XML descriptors. Keys are libvirt node device names
+        self.script_output = ""         #Text. Output of INVENTORY_SCRIPT
+        self.sections = None
+        if data:
+            self.from_dict(data)
+
+    def collect(self, ssh_conn, virsh_conn):
+        """Obtains all the information from the remote server"""
+        (stdin, stdout, stderr) = ssh_conn.exec_command("bash -s")
+        stdin.write(INVENTORY_SCRIPT)
+        stdin.channel.shutdown_write()
+        
+        self.hostname = virsh_conn.getHostname()
+        self.capabilities = virsh_conn.getCapabilities()
+        self.sysinfo = virsh_conn.getSysinfo(0)
+        self.hypervisor_type = virsh_conn.getType()
+        self.hypervisor_version = virsh_conn.getVersion()
+        self.hypervisor_lib_version = virsh_conn.getLibVersion()
+        #Names are known locally; only the net devices and their pci parents need their XML
+        devices = virsh_conn.listAllDevices(libvirt.VIR_CONNECT_LIST_NODE_DEVICES_CAP_NET |
+                                            libvirt.VIR_CONNECT_LIST_NODE_DEVICES_CAP_PCI_DEV)
+        devices_by_name = dict((device.name(), device) for device in devices)
+        self.net_devices = [device.name() for device in devices if device.name().startswith('net_')]
+        self.devices = dict()
+        for name in self.net_devices:
+            net_xml = devices_by_name[name].XMLDesc(0)
+            self.devices[name] = net_xml
+            parent = ElementTree.fromstring(net_xml).find('parent')
+            if parent is not None and parent.text in devices_by_name and parent.text not in self.devices:
+                self.devices[parent.text] = devices_by_name[parent.text].XMLDesc(0)
+        
+        self.script_output = stdout.read()
+        error = stderr.read()
+        if len(error)>0:
+            raise paramiko.ssh_exception.SSHException('inventory script : '+ error)
+        self.sections = None
+
+    def to_dict(self):
+        return {"hostname": self.hostname, "capabilities": self.capabilities, "sysinfo": self.sysinfo,
+                "hypervisor_type": self.hypervisor_type, "hypervisor_version": self.hypervisor_version,
+                "hypervisor_lib_version": self.hypervisor_lib_version, "net_devices": self.net_devices,
+                "devices": self.devices, "script_output": self.script_output}
+
+    def from_dict(self, data):
+        for key, value in data.items():
+            setattr(self, key, value)
+        self.sections = None
+
+    def section(self, name, check_error=False):
+        """Returns the output of a INVENTORY_SCRIPT section. If check_error, an exception is raised when the
+        section wrote to the standard error"""
+        if self.sections is None:
+            self.sections = dict()
+            lines = None
+            for line in self.script_output.splitlines(True):
+                if line.startswith('@@@ '):
+                    lines = self.sections[line[4:].rstrip('\n')] = list()
+                elif lines is not None:
+                    lines.append(line)
+        error = "".join(self.sections.get(name+':stderr', ()))
+        if check_error and len(error)>0:
+            raise paramiko.ssh_exception.SSHException(name +' : '+ error)
+        return "".join(self.sections.get(name, ()))
+
+def get_hostname(inventory):
+    return inventory.hostname.rstrip('\n')
+
+def get_hugepage_size(inventory):
+    mem=inventory.section('hugepage_size', check_error=True)
     if mem=="":
         return 0
     return int(mem)
 
-def get_hugepage_nr(ssh_conn,hugepage_sz, node_id):
-    command = 'cat /sys/devices/system/node/node'+str(node_id)+'/hugepages/hugepages-'+str(hugepage_sz/1024)+'kB/nr_hugepages'
-    (_, stdout, _) = ssh_conn.exec_command(command)
-    #print command, 
-    #text = stdout.read()
-    #print "'"+text+"'"
-    #return int(text)
-    
-    try:
-        value=int(stdout.read())
-    except: 
-        value=0
-    return value
+def get_hugepage_nr(inventory,hugepage_sz, node_id):
+    path = '/sys/devices/system/node/node'+str(node_id)+'/hugepages/hugepages-'+str(hugepage_sz/1024)+'kB/nr_hugepages'
+    for line in inventory.section('nr_hugepages').splitlines():
+        if line.startswith(path+' '):
+            try:
+                return int(line[len(path)+1:])
+            except:
+                return 0
+    return 0
 
-def get_memory_information(ssh_conn, virsh_conn, memory_nodes):
+def get_memory_information(inventory, memory_nodes):
     warning_text=""
-    tree=ElementTree.fromstring(virsh_conn.getSysinfo(0))
+    tree=ElementTree.fromstring(inventory.sysinfo)
     memory_dict = dict()
     node_id = 0 #TODO revise. Added for allowing VM as compute hosts 
     for target in tree.findall("memory_device"):
@@ -965,26 +1070,22 @@ def get_memory_information(ssh_conn, virsh_conn, memory_nodes):
     
     #Fill memory nodes
     #Hugepage size is constant for all nodes
-    hugepage_sz = get_hugepage_size(ssh_conn)
+    hugepage_sz = get_hugepage_size(inventory)
     for node_id, modules in memory_dict.iteritems():
         memory_node = MemoryNode()
-        memory_node.set(modules, hugepage_sz, get_hugepage_nr(ssh_conn,hugepage_sz, node_id))
+        memory_node.set(modules, hugepage_sz, get_hugepage_nr(inventory,hugepage_sz, node_id))
         memory_nodes[node_id] = memory_node
         
     return (True, warning_text)
 
-def get_cpu_topology_ht(ssh_conn, topology):
-    command = 'cat /proc/cpuinfo'
-    (_, stdout, stderr) = ssh_conn.exec_command(command)
-    error = stderr.read()
-    if len(error)>0:
-        raise paramiko.ssh_exception.SSHException(command +' : '+ error)
+def get_cpu_topology_ht(inventory, topology):
+    cpuinfo = inventory.section('cpuinfo', check_error=True)
     sockets = []
     cores = []
     core_map = {}
     core_details = []
     core_lines = {}
-    for line in stdout.readlines():
+    for line in cpuinfo.splitlines(True):
         if len(line.strip()) != 0:
             name, value = line.split(":", 1)
             core_lines[name.strip()] = value.strip()
@@ -1015,12 +1116,12 @@ def get_cpu_topology_ht(ssh_conn, topology):
       
     return (True, "")
 
-def get_processor_information(ssh_conn, vish_conn, processors):
+def get_processor_information(inventory, processors):
     warning_text=""
     #Processor features are the same for all processors
     #TODO (at least using virsh capabilities)nr_numa_nodes
     capabilities = list()
-    tree=ElementTree.fromstring(vish_conn.getCapabilities())
+    tree=ElementTree.fromstring(inventory.capabilities)
     for target in tree.findall("host/cpu/feature"):
         if target.get("name") == 'pdpe1gb':
             capabilities.append('lps')
@@ -1035,38 +1136,27 @@ def get_processor_information(ssh_conn, vish_conn, processors):
     if target.text == 'x86_64' or target.text == 'amd64':
         capabilities.append('64b')
       
-    command = 'cat /proc/cpuinfo | grep flags'
-    (_, stdout, stderr) = ssh_conn.exec_command(command)
-    error = stderr.read()
-    if len(error)>0:
-        raise paramiko.ssh_exception.SSHException(command +' : '+ error)
-    line = stdout.readline()
+    line = ""
+    for cpuinfo_line in inventory.section('cpuinfo', check_error=True).splitlines(True):
+        if 'flags' in cpuinfo_line:
+            line = cpuinfo_line
+            break
     if 'ept' in line or 'npt' in line:
         capabilities.append('tlbps')
     
     #Find out if IOMMU is enabled
-    command = 'dmesg |grep -e Intel-IOMMU'
-    (_, stdout, stderr) = ssh_conn.exec_command(command)
-    error = stderr.read()
-    if len(error)>0:
-        raise paramiko.ssh_exception.SSHException(command +' : '+ error)
-    if 'enabled' in stdout.read():
+    if 'enabled' in inventory.section('intel_iommu', check_error=True):
         capabilities.append('iommu')
       
     #Equivalent for AMD
-    command = 'dmesg |grep -e AMD-Vi'
-    (_, stdout, stderr) = ssh_conn.exec_command(command)
-    error = stderr.read()
-    if len(error)>0:
-        raise paramiko.ssh_exception.SSHException(command +' : '+ error)
-    if len(stdout.read()) > 0:
+    if len(inventory.section('amd_iommu', check_error=True)) > 0:
         capabilities.append('iommu')
     
     #-----------------------------------------------------------
     topology = dict()
     #In case hyperthreading is active it is necessary to determine cpu topology using /proc/cpuinfo
     if 'ht' in capabilities:
-        (return_status, code) = get_cpu_topology_ht(ssh_conn, topology)
+        (return_status, code) = get_cpu_topology_ht(inventory, topology)
         if not return_status:
             return (return_status, code)
         warning_text += code
@@ -1082,8 +1172,7 @@ def get_processor_information(ssh_conn, vish_conn, processors):
     #-----------------------------------------------------------         
     #Create a dictionary with the information of all processors
     #p_fam = p_man = p_ver = None
-    tree=ElementTree.fromstring(vish_conn.getSysinfo(0))
-    #print vish_conn.getSysinfo(0)
+    tree=ElementTree.fromstring(inventory.sysinfo)
     #return (False, 'forces error for debuging')
     not_populated=False
     socket_id = -1     #in case we can not determine the socket_id we assume incremental order, starting by 0
@@ -1130,15 +1219,25 @@ def get_processor_information(ssh_conn, vish_conn, processors):
     
     return (True, warning_text)
 
-def get_nic_information(ssh_conn, virsh_conn, nic_topology):   
+def get_nic_information(inventory, nic_topology):   
     warning_text=""
+    #Get ethtool output of each interface
+    ethtool = dict()
+    for line in inventory.section('ethtool').splitlines():
+        if line.startswith('== '):
+            ethtool_lines = list()
+            ethtool_errors = list()
+            ethtool[line[3:]] = (ethtool_lines, ethtool_errors)
+        elif line.startswith('!! '):
+            ethtool_errors.append(line[3:])
+        else:
+            ethtool_lines.append(line)
     #Get list of net devices
-    net_devices = virsh_conn.listDevices('net',0)
-    print virsh_conn.listDevices('net',0)
+    net_devices = inventory.net_devices
     for device in net_devices:
         try:
             #Get the XML descriptor of the device:
-            net_XML = ElementTree.fromstring(virsh_conn.nodeDeviceLookupByName(device).XMLDesc(0))
+            net_XML = ElementTree.fromstring(inventory.devices[device])
             #print "net_XML:" , net_XML
             #obtain the parent
             parent = net_XML.find('parent')
@@ -1156,7 +1255,7 @@ def get_nic_information(ssh_conn, virsh_conn, nic_topology):
             mac = net_XML.find('capability/address').text
             
             #Get the pci XML
-            pci_XML = ElementTree.fromstring(virsh_conn.nodeDeviceLookupByName(parent.text).XMLDesc(0))
+            pci_XML = ElementTree.fromstring(inventory.devices[parent.text])
             #print pci_XML
             #Get pci
             name = pci_XML.find('name').text.split('_')
@@ -1201,13 +1300,12 @@ def get_nic_information(ssh_conn, virsh_conn, nic_topology):
             #Only for non virtual interfaces: Obtain speed and if link is detected (this must be done using ethtool)
             if not virtual:
                 command = 'sudo ethtool '+interface+' | grep -e Speed -e "Link detected"'
-                (_, stdout, stderr) = ssh_conn.exec_command(command)
-                error = stderr.read()
-                if len(error) >0:
-                    print 'Error running '+command+'\n'+error
+                (ethtool_lines, ethtool_errors) = ethtool.get(interface, ((), ['no ethtool output for '+interface]))
+                if len(ethtool_errors) >0:
+                    print 'Error running '+command+'\n'+'\n'.join(ethtool_errors)
                     #Error. continue?-------------------------------------------------------------
                     continue
-                for line in stdout.readlines():
+                for line in ethtool_lines:
                     line = line.strip().rstrip('\n').split(': ')
                     if line[0] == 'Speed':
                         if line[1].endswith('Mb/s'):
@@ -1359,7 +1457,7 @@ def get_nic_information_old(ssh_conn, nic_topology):
                 
     return (True, "")
 
-def get_os_information(ssh_conn, os):
+def get_os_information(inventory, os):
     warning_text=""
 #    command = 'lsb_release -a'
 #    (stdin, stdout, stderr) = ssh_conn.exec_command(command)
@@ -1380,31 +1478,17 @@ def get_os_information(ssh_conn, os):
 #    id_ = distributor+'-'+release+'-'+codename
 
 
-    command = 'cat /etc/redhat-release'
-    (_, stdout, _) = ssh_conn.exec_command(command)
-    id_text= stdout.read()
+    id_text= inventory.section('redhat_release')
     if len(id_text)==0:
         #try with Ubuntu
-        command = 'lsb_release -d -s'
-        (_, stdout, _) = ssh_conn.exec_command(command)
-        id_text= stdout.read()
+        id_text= inventory.section('lsb_release')
     if len(id_text)==0:
         raise paramiko.ssh_exception.SSHException("Can not determinte release neither with 'lsb_release' nor with 'cat /etc/redhat-release'")
     id_ = id_text.rstrip('\n')
    
-    command = 'uname -o'
-    (_, stdout, stderr) = ssh_conn.exec_command(command)
-    error = stderr.read()
-    if len(error)>0:
-        raise paramiko.ssh_exception.SSHException(command +' : '+ error)
-    type_ = stdout.read().rstrip('\n')
+    type_ = inventory.section('os_type', check_error=True).rstrip('\n')
     
-    command = 'uname -i'
-    (_, stdout, stderr) = ssh_conn.exec_command(command)
-    error = stderr.read()
-    if len(error)>0:
-        raise paramiko.ssh_exception.SSHException(command +' : '+ error)
-    bit_architecture = stdout.read().rstrip('\n')
+    bit_architecture = inventory.section('architecture', check_error=True).rstrip('\n')
     
     (return_status, code) = os.set(id_, type_, bit_architecture)
     if not return_status:
@@ -1412,13 +1496,13 @@ def get_os_information(ssh_conn, os):
     warning_text += code
     return (True, warning_text) 
 
-def get_hypervisor_information(virsh_conn, hypervisor):
-    type_ = virsh_conn.getType().rstrip('\n')
-    version = virsh_conn.getVersion()
-    lib_version = virsh_conn.getLibVersion()
+def get_hypervisor_information(inventory, hypervisor):
+    type_ = inventory.hypervisor_type.rstrip('\n')
+    version = inventory.hypervisor_version
+    lib_version = inventory.hypervisor_lib_version
     
     domains = list()
-    tree=ElementTree.fromstring(virsh_conn.getCapabilities())
+    tree=ElementTree.fromstring(inventory.capabilities)
     for target in tree.findall("guest"):
         os_type = target.find("os_type").text
         #We only allow full virtualization
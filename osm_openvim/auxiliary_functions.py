@@ -34,7 +34,9 @@ import paramiko
 from definitionsClass import definitionsClass
 from definitionsClass import Units
 import random
-from jsonschema import validate as js_v, exceptions as js_e
+from jsonschema import exceptions as js_e
+from schema_validator import validate as js_v
+from vim_schema import id_schema
 
 def check_and_convert_units(value, value_type):
     """TODO: Update description
@@ -188,7 +190,6 @@ def get_next_2pow(var):
     return v        
 
 def check_valid_uuid(uuid):
-    id_schema = {"type" : "string", "pattern": "^[a-fA-F0-9]{8}(-[a-fA-F0-9]{4}){3}-[a-fA-F0-9]{12}$"}
     try:
         js_v(uuid, id_schema)
         return True
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+Coordination of several openvimd instances that share the same database. Each instance owns a part of the compute
+nodes ('host'), openflow controllers ('ofc'), the dhcp server ('dhcp') and the ovs port tasks of the openvim
+controller ('controller') through lease rows at the 'cluster_leases' table, that it renews at every heartbeat. Only
+the owner runs the thread of a resource. The other instances keep a RemoteThread in its place, that sends the tasks to
+the owner through the 'cluster_tasks' table. Resources are shared out evenly among the alive instances; when an
+instance stops renewing its leases the others take its resources once the leases expire.
+'''
+__date__ = "$19-oct-2026 10:00:00$"
+
+import threading
+import logging
+import time
+import json
+import math
+
+
+class RemoteThread(object):
+    """
+    Placeholder of a host, openflow, dhcp or openvim controller thread run by another openvim instance. It offers the
+    insert_task method of these threads, sending the task to the owner. Attributes assigned to it, as the name, user
+    and ip of a host changed by the http server, are assigned to the thread at the owner too
+    """
+    _local_attributes = ("member", "resource_type", "resource_id", "owner", "OF_connector")
+
+    def __init__(self, member, resource_type, resource_id, name=None, owner=None):
+        object.__setattr__(self, "member", member)
+        object.__setattr__(self, "resource_type", resource_type)
+        object.__setattr__(self, "resource_id", resource_id)
+        object.__setattr__(self, "name", name or resource_id)
+        object.__setattr__(self, "owner", owner)
+        object.__setattr__(self, "OF_connector", None)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name not in self._local_attributes:
+            self.member.route(self.resource_type, self.resource_id, ("cluster-setattr", name, value))
+
+    def insert_task(self, task, *aditional):
+        return self.member.route(self.resource_type, self.resource_id, (task,) + aditional)
+
+    def reset_net_status(self, net_id):
+        self.member.route(self.resource_type, self.resource_id, ("cluster-reset-net-status", net_id))
+
+    def join(self, timeout=None):
+        pass
+
+
+class ClusterMember(threading.Thread):
+    def __init__(self, instance_id, db, get_resources, start_resource, attach_resource, endpoint=None,
+                 lease_time=30, heartbeat=None, task_poll=0.5, invalidate_caches=None, logger_name="openvim.cluster",
+                 debug=None):
+        """
+        Thread that keeps the leases of this openvim instance and delivers the tasks routed to it
+        :param instance_id: identifier of this instance, unique among the instances sharing the database
+        :param db: database connection for the exclusive use of the cluster
+        :param get_resources: function returning a dictionary {(resource_type, resource_id): info} with all the
+            resources to share out
+        :param start_resource: function (resource_type, resource_id, info) that creates and starts the thread of a
+            resource, and returns it
+        :param attach_resource: function (resource_type, resource_id, thread, info) that places the thread, a local
+            thread or a RemoteThread, where the rest of openvim looks for it. thread is None if the resource is removed
+        :param endpoint: http address of this instance, informative
+        :param lease_time: seconds a lease is valid without being renewed
+        :param heartbeat: seconds between heartbeats. By default a third of lease_time
+        :param task_poll: seconds between checks of routed tasks
+        :param invalidate_caches: function that discards the per process copies of database rows, called at every
+            heartbeat while there are other instances, as their writes are not seen by the vim_db change listeners
+        :param logger_name: logger name
+        :param debug: logger level
+        """
+        threading.Thread.__init__(self, name="cluster")
+        self.instance_id = instance_id
+        self.db = db
+        self.get_resources = get_resources
+        self.start_resource = start_resource
+        self.attach_resource = attach_resource
+        self.endpoint = endpoint
+        self.lease_time = lease_time
+        self.heartbeat_time = heartbeat or lease_time / 3.0
+        self.task_poll = task_poll
+        self.invalidate_caches = invalidate_caches
+        self.logger = logging.getLogger(logger_name)
+        if debug:
+            self.logger.setLevel(getattr(logging, debug))
+        self.lock = threading.RLock()   # protects owned and remote
+        self.owned = {}     # (resource_type, resource_id): local thread
+        self.stopped = {}   # (resource_type, resource_id): local thread told to exit, whose lease is kept until it ends
+        self.remote = {}    # (resource_type, resource_id): RemoteThread
+        self.info = {}      # (resource_type, resource_id): info of the resources known at last heartbeat
+        self.members = 1
+        self.last_renew = None
+        self.stopping = threading.Event()
+        self.stats = {"routed": 0, "delivered": 0, "acquired": 0, "released": 0, "lost": 0}
+
+    def run(self):
+        self.logger.debug("starting cluster member '%s'", self.instance_id)
+        next_heartbeat = time.time() + self.heartbeat_time
+        while not self.stopping.is_set():
+            try:
+                if time.time() >= next_heartbeat:
+                    next_heartbeat = time.time() + self.heartbeat_time
+                    self.heartbeat()
+                self.deliver_tasks()
+            except Exception as e:
+                self.logger.critical("Unexpected exception at run: " + str(e), exc_info=True)
+            self.stopping.wait(self.task_poll)
+        self.logger.debug("exiting cluster member '%s'", self.instance_id)
+
+    def stop(self, timeout=None):
+        """
+        Stop the heartbeats and the owned threads, and release the leases so that other instances take them at once
+        :param timeout: maximum seconds to wait for the threads
+        :return: None
+        """
+        self.stopping.set()
+        if self.is_alive():
+            self.join(timeout)
+        with self.lock:
+            for key in self.owned.keys():
+                self._stop_local(key)
+        self._join_stopped(timeout or self.lease_time)
+        with self.lock:
+            r, c = self.db.cluster_release_leases(self.instance_id)
+            if r < 0:
+                self.logger.error("Cannot release leases: %s", c)
+            self.db.delete_row_by_key("cluster_members", "instance_id", self.instance_id)
+
+    def heartbeat(self):
+        """
+        Renew the leases, stop the resources taken by other instances or removed, and take free resources or give
+        away owned ones until owning a fair share of them. Threads told to exit are waited for out of the lock
+        :return: None
+        """
+        with self.lock:
+            self._heartbeat()
+        # a thread in the middle of a long task must not delay the renewal of the other leases
+        released = self._join_stopped(self.heartbeat_time)
+        if released:
+            r, c = self.db.cluster_release_leases(self.instance_id, released)
+            if r < 0:
+                self.logger.error("Cannot release leases: %s", c)
+
+    def _heartbeat(self):
+        start = time.time()
+        r, leases = self.db.cluster_heartbeat(self.instance_id, self.endpoint, self.lease_time)
+        if r < 0:
+            self.logger.error("Cannot renew leases: %s", leases)
+            if self.owned and (self.last_renew is None or
+                               start - self.last_renew >= self.lease_time - 2 * self.heartbeat_time):
+                # leases expire before next heartbeat and may be taken by other instances. Stop before running twice
+                self.logger.critical("Leases not renewed for %d seconds, stopping the owned resources",
+                                     start - self.last_renew if self.last_renew else 0)
+                for key in self.owned.keys():
+                    self._stop_local(key)
+                    self.stats["lost"] += 1
+                    self._attach_remote(key, None)
+            return
+        self.last_renew = start
+        self.members = max(r, 1)
+        if self.members > 1 and self.invalidate_caches:
+            self.invalidate_caches()
+        leases = dict(((lease["resource_type"], lease["resource_id"]), lease) for lease in leases)
+        self.info = self.get_resources()
+
+        # leases of threads not running, kept from a previous run of this instance or after losing the database
+        orphans = [key for key, lease in leases.items()
+                   if lease["owner"] == self.instance_id and key not in self.owned and key not in self.stopped]
+        if orphans:
+            r, c = self.db.cluster_release_leases(self.instance_id, orphans)
+            if r < 0:
+                self.logger.error("Cannot release leases: %s", c)
+            for key in orphans:
+                leases[key] = {"owner": None}
+
+        for key in self.owned.keys():
+            lease = leases.get(key)
+            if key not in self.info:
+                self._stop_local(key)
+                self.attach_resource(key[0], key[1], None, None)
+            elif not lease or lease["owner"] != self.instance_id:
+                self.logger.warning("Lease of %s '%s' taken by '%s'", key[0], key[1],
+                                    lease["owner"] if lease else None)
+                self._stop_local(key)
+                self.stats["lost"] += 1
+        for key in self.remote.keys():
+            if key not in self.info:
+                del self.remote[key]
+                self.attach_resource(key[0], key[1], None, None)
+        removed = [key for key in leases if key not in self.info]
+        if removed:
+            r, c = self.db.cluster_release_leases(self.instance_id, removed, delete=True)
+            if r < 0:
+                self.logger.error("Cannot delete leases of removed resources: %s", c)
+
+        target = int(math.ceil(float(len(self.info)) / self.members))
+        # give away the resources over the fair share, so that new instances take them
+        surplus = len(self.owned) - target
+        released = []
+        if surplus > 0:
+            released = sorted(self.owned)[-surplus:]
+            # their leases are released once the threads end
+            for key in released:
+                self._stop_local(key)
+            self.stats["released"] += len(released)
+        # take the free resources and the ones of dead instances
+        for key in sorted(self.info):
+            if len(self.owned) >= target:
+                break
+            lease = leases.get(key)
+            if key in self.owned or key in self.stopped or \
+                    (lease and lease["owner"] and lease["expired"] == "false"):
+                continue
+            self._acquire(key)
+        for key in self.info:
+            if key not in self.owned:
+                lease = leases.get(key)
+                self._attach_remote(key, lease["owner"] if lease else None)
+
+    def add(self, resource_type, resource_id, info):
+        """
+        Take a resource just created, as a new host or openflow controller, or place a RemoteThread if it is already
+        owned by another instance
+        :param resource_type: 'host', 'ofc', 'dhcp' or 'controller'
+        :param resource_id: uuid of the resource
+        :param info: information needed to start its thread
+        :return: the local thread or the RemoteThread
+        """
+        key = (resource_type, resource_id)
+        with self.lock:
+            self.info[key] = info
+            if key not in self.owned and not self._acquire(key):
+                self._attach_remote(key, None)
+            return self.owned.get(key) or self.remote.get(key)
+
+    def route(self, resource_type, resource_id, task):
+        """
+        Send a task to the thread of a resource, wherever it is run
+        :param resource_type: 'host', 'ofc', 'dhcp' or 'controller'
+        :param resource_id: uuid of the resource
+        :param task: tuple with the task name and its parameters, that must be json serializable
+        :return: (1, None) or (negative, error text), as the insert_task of the threads
+        """
+        key = (resource_type, resource_id)
+        with self.lock:
+            thread = self.owned.get(key)
+            if thread:
+                return self._deliver(key, thread, task)
+        # if it is taken meanwhile by this instance, the task is delivered by deliver_tasks
+        r, c = self.db.cluster_new_task(resource_type, resource_id, json.dumps(task, default=str))
+        if r < 0:
+            return -1, "cannot route task '{}' to {} '{}': {}".format(task[0], resource_type, resource_id, c)
+        with self.lock:
+            self.stats["routed"] += 1
+        return 1, None
+
+    def deliver_tasks(self):
+        """
+        Pass the tasks routed by other instances to the owned threads
+        :return: number of tasks delivered
+        """
+        with self.lock:
+            # tasks of threads told to exit wait for the next owner
+            stopped = self.stopped.keys()
+        r, tasks = self.db.cluster_pop_tasks(self.instance_id, exclude=stopped)
+        if r < 0:
+            self.logger.error("Cannot get routed tasks: %s", tasks)
+            return 0
+        with self.lock:
+            for task in tasks:
+                key = (task["resource_type"], task["resource_id"])
+                thread = self.owned.get(key)
+                if not thread:
+                    self.logger.error("Discarding task for %s '%s' not owned: %s", key[0], key[1], task["task"][:200])
+                    continue
+                self._deliver(key, thread, json.loads(task["task"]))
+        return r
+
+    def get_status(self):
+        """
+        Information of the instances, leases and routed tasks of the cluster
+        :return: dictionary with this instance, its counters, and the members and leases at database
+        """
+        r, status = self.db.cluster_get_status()
+        if r < 0:
+            raise ValueError(status)
+        with self.lock:
+            status["instance_id"] = self.instance_id
+            status["owned"] = len(self.owned)
+            status["stats"] = dict(self.stats)
+        return status
+
+    def _deliver(self, key, thread, task):
+        if task[0] == "cluster-setattr":
+            setattr(thread, task[1], task[2])
+            r, c = 1, None
+        elif task[0] == "cluster-reset-net-status":
+            thread.reset_net_status(task[1])
+            r, c = 1, None
+        else:
+            if key[0] == "ofc" and task[0] == "update-net":
+                # net status may have been changed by other instances
+                thread.reset_net_status(task[1])
+            r, c = thread.insert_task(*task)
+        self.stats["delivered"] += 1
+        if r < 0:
+            self.logger.error("Cannot deliver task '%s' to %s '%s': %s", task[0], key[0], key[1], c)
+        return r, c
+
+    def _acquire(self, key):
+        r, c = self.db.cluster_acquire_lease(self.instance_id, key[0], key[1], self.lease_time)
+        if r < 0:
+            self.logger.error("Cannot acquire lease of %s '%s': %s", key[0], key[1], c)
+        if r <= 0:
+            return False
+        try:
+            thread = self.start_resource(key[0], key[1], self.info[key])
+        except Exception as e:
+            self.logger.error("Cannot start %s '%s': %s", key[0], key[1], str(e))
+            self.db.cluster_release_leases(self.instance_id, [key])
+            return False
+        self.logger.info("Acquired lease of %s '%s'", key[0], key[1])
+        self.owned[key] = thread
+        self.remote.pop(key, None)
+        self.attach_resource(key[0], key[1], thread, self.info[key])
+        self.stats["acquired"] += 1
+        return True
+
+    def _stop_local(self, key):
+        thread = self.owned.pop(key)
+        thread.insert_task("exit")
+        self.stopped[key] = thread
+        self.logger.info("Stopping %s '%s'", key[0], key[1])
+
+    def _join_stopped(self, timeout):
+        """
+        Wait for the threads told to exit, out of the lock
+        :param timeout: maximum seconds to wait for all of them
+        :return: list of (resource_type, resource_id) of the threads ended
+        """
+        with self.lock:
+            stopped = self.stopped.items()
+        deadline = time.time() + timeout
+        for key, thread in stopped:
+            thread.join(max(deadline - time.time(), 0))
+        ended = []
+        with self.lock:
+            for key, thread in stopped:
+                if not thread.is_alive() and self.stopped.get(key) is thread:
+                    del self.stopped[key]
+                    ended.append(key)
+                    self.logger.info("Stopped %s '%s'", key[0], key[1])
+        return ended
+
+    def _attach_remote(self, key, owner):
+        remote = self.remote.get(key)
+        if not remote:
+            info = self.info.get(key) or {}
+            remote = RemoteThread(self, key[0], key[1], name=info.get("name"), owner=owner)
+            self.remote[key] = remote
+            self.attach_resource(key[0], key[1], remote, info)
+        remote.owner = owner
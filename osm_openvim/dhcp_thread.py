@@ -36,6 +36,7 @@ import paramiko
 import random
 import subprocess
 import logging
+import metrics
 
 #TODO: insert a logging system
 
@@ -72,7 +73,7 @@ class dhcp_thread(threading.Thread):
             
         
         self.queueLock = threading.Lock()
-        self.taskQueue = Queue.Queue(2000)
+        self.taskQueue = metrics.TimedQueue(2000, "dhcp")
         
     def ssh_connect(self):
         try:
@@ -132,6 +133,7 @@ class dhcp_thread(threading.Thread):
                             time.sleep(1)
                         continue
 
+                    task_start = time.time()
                     if task[0] == 'add':
                         self.logger.debug("processing task add mac " + str(task[1]))
                         now=time.time()
@@ -147,6 +149,7 @@ class dhcp_thread(threading.Thread):
                         return 0
                     else:
                         self.logger.error("unknown task: " + str(task))
+                    metrics.observe("openvim_task_run_seconds", time.time() - task_start, thread="dhcp", task=task[0])
                 except Exception as e:
                     self.logger.critical("Unexpected exception at run: " + str(e), exc_info=True)
           
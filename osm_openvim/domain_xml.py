@@ -0,0 +1,411 @@
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+Rendering of the libvirt domain XML of a server. The fixed part of the document is compiled once per variant
+(hypervisor, windows os type and disk bus) into a format string, with a field for each section that depends on the
+server: name, memory, cpu pinning and numa, boot, topology and devices. These sections are rendered from the server
+data with the indentation level as a parameter, keeping no state out of the call, so that the domains of several
+servers can be rendered at once by different host threads. Golden files at test/domain_xml.
+'''
+__date__ = "$19-oct-2026 10:00:00$"
+
+_variants = {}      # (hypervisor, windows_os, bus_ide): _Variant
+_ADDRESS = "\n%s<address type='pci' domain='0x%s' bus='0x%s' slot='0x%s' function='0x%s'/>"
+
+
+def _tab(level):
+    return "\n" + "  " * level
+
+
+def pci2xml(pci, level):
+    """
+    Get the <address> element of a pci, allowing None
+    :param pci: text with format XXXX:XX:XX.X, or None
+    :param level: indentation level of the element
+    :return: text with the element preceded by a newline and indentation, or empty for None
+    """
+    if pci is None:
+        return ""
+    first_part = pci.split(':')
+    second_part = first_part[2].split('.')
+    return _ADDRESS % ("  " * level, first_part[0], first_part[1], second_part[0], second_part[1])
+
+
+class _Variant(object):
+    """Fixed part of the domain of a hypervisor, windows os type and disk bus"""
+
+    def __init__(self, hypervisor, windows_os, bus_ide):
+        self.hypervisor = hypervisor
+        self.windows_os = windows_os
+        # unikernel devices are one level less indented than the rest
+        self.devices_level = 1 if hypervisor == 'xen-unik' else 2
+        if bus_ide:
+            self.disk_target = "<target dev='hd{}' bus='ide'/>"
+        else:
+            self.disk_target = "<target dev='vd{}' bus='virtio'/>"
+
+        text = "<domain type='xen'>" if hypervisor[:3] == 'xen' else "<domain type='kvm'>"
+        text += _tab(1) + "<name>{name}</name>" + \
+            _tab(1) + "<uuid>{uuid}</uuid>" + \
+            _tab(1) + "<memory unit='KiB'>{memory}</memory>" + \
+            _tab(1) + "<currentMemory unit='KiB'>{memory}</currentMemory>" + \
+            "{memory_backing}{vcpu}" + \
+            _tab(1) + "<os>"
+        if hypervisor == 'xenhvm':
+            text += _tab(2) + "<type arch='x86_64' machine='xenfv'>hvm</type>" + \
+                _tab(2) + "<loader type='rom'>/usr/lib/xen/boot/hvmloader</loader>" + \
+                "{boot_cdrom}" + _tab(2) + "<boot dev='hd'/>"
+        elif hypervisor == 'xen-unik':
+            text += _tab(2) + "<type arch='x86_64' machine='xenpv'>xen</type>" + \
+                _tab(2) + "<kernel>{kernel}</kernel>"
+        else:
+            text += _tab(2) + "<type arch='x86_64' machine='pc'>hvm</type>" + \
+                "{boot_cdrom}" + _tab(2) + "<boot dev='hd'/>"
+        text += _tab(1) + "</os>" + \
+            _tab(1) + "<features>" + \
+            _tab(2) + "<acpi/>" + \
+            _tab(2) + "<apic/>" + \
+            _tab(2) + "<pae/>" + \
+            _tab(1) + "</features>" + \
+            "{cpu}" + \
+            _tab(1) + "<clock offset='utc'/>" + \
+            _tab(1) + "<on_poweroff>preserve</on_poweroff>" + \
+            _tab(1) + "<on_reboot>restart</on_reboot>" + \
+            _tab(1) + "<on_crash>restart</on_crash>" + \
+            _tab(1) + "<devices>"
+
+        level = self.devices_level
+        if hypervisor == 'xenhvm':
+            # In some libvirt version may be: <emulator>/usr/lib64/xen/bin/qemu-dm</emulator> (depends on distro)
+            text += _tab(level) + "<emulator>/usr/bin/qemu-system-i386</emulator>"
+        elif hypervisor != 'xen-unik':
+            text += _tab(level) + "<emulator>/usr/libexec/qemu-kvm</emulator>"
+        if hypervisor == 'xen-unik':
+            text += _tab(level) + "<console type='pty'>" + \
+                _tab(level + 1) + "<target type='xen' port='0'/>" + \
+                _tab(level) + "</console>"
+        else:
+            text += _tab(level) + "<serial type='pty'>" + \
+                _tab(level + 1) + "<target port='0'/>" + \
+                _tab(level) + "</serial>" + \
+                _tab(level) + "<console type='pty'>" + \
+                _tab(level + 1) + "<target type='serial' port='0'/>" + \
+                _tab(level) + "</console>"
+        if windows_os:
+            text += _tab(level) + "<controller type='usb' index='0'/>" + \
+                _tab(level) + "<controller type='ide' index='0'/>" + \
+                _tab(level) + "<input type='mouse' bus='ps2'/>" + \
+                _tab(level) + "<sound model='ich6'/>" + \
+                _tab(level) + "<video>" + \
+                _tab(level + 1) + "<model type='cirrus' vram='9216' heads='1'/>" + \
+                _tab(level) + "</video>" + \
+                _tab(level) + "<memballoon model='virtio'/>" + \
+                _tab(level) + "<input type='tablet' bus='usb'/>"
+        elif hypervisor != 'xen-unik':
+            text += _tab(level) + "<controller type='ide' index='0'/>" + \
+                _tab(level) + "<input type='mouse' bus='ps2'/>" + \
+                _tab(level) + "<input type='keyboard' bus='ps2'/>" + \
+                _tab(level) + "<video>" + \
+                _tab(level + 1) + "<model type='cirrus' vram='9216' heads='1'/>" + \
+                _tab(level) + "</video>"
+        if windows_os:
+            text += _tab(level) + "<graphics type='vnc' port='-1' autoport='yes'/>"
+        else:
+            text += _tab(level) + "<graphics type='vnc' port='-1' autoport='yes' listen='0.0.0.0'>" + \
+                _tab(level + 1) + "<listen type='address' address='0.0.0.0'/>" + \
+                _tab(level) + "</graphics>"
+        text += "{devices}" + _tab(level - 1) + "</devices>" + _tab(level - 2) + "</domain>"
+        self.skeleton = text
+
+
+def _get_variant(hypervisor, windows_os, bus_ide):
+    if hypervisor != 'xenhvm' and hypervisor != 'xen-unik':
+        hypervisor = 'xen' if hypervisor[:3] == 'xen' else 'kvm'
+    key = (hypervisor, windows_os, bus_ide)
+    variant = _variants.get(key)
+    if not variant:
+        # compiled again if several threads arrive at once; any of them is kept
+        variant = _variants[key] = _Variant(hypervisor, windows_os, bus_ide)
+    return variant
+
+
+def _render_cpu(server, numa, develop_mode):
+    """
+    Render the vcpu, cpu pinning and numa memory sections
+    :return: (vcpus, text) where vcpus is the number of vcpus, or (None, error text)
+    """
+    vcpus = int(server.get("vcpus", 0))
+    cpu_pinning = []
+    if 'cores-source' in numa:
+        cpu_pinning += zip(numa['cores-id'], numa['cores-source'])
+    if 'threads-source' in numa:
+        cpu_pinning += zip(numa['threads-id'], numa['threads-source'])
+    if 'paired-threads-source' in numa:
+        for ids, sources in zip(numa['paired-threads-id'], numa['paired-threads-source']):
+            cpu_pinning.append((ids[0], sources[0]))
+            cpu_pinning.append((ids[1], sources[1]))
+    vcpus += len(cpu_pinning)
+
+    if cpu_pinning and not develop_mode:
+        tab2 = _tab(2)
+        return vcpus, _tab(1) + "<vcpu placement='static'>" + str(len(cpu_pinning)) + "</vcpu>" + \
+            _tab(1) + "<cputune>" + \
+            "".join("%s<vcpupin vcpu='%s' cpuset='%s'/>" % (tab2, vcpu, cpuset) for vcpu, cpuset in cpu_pinning) + \
+            _tab(1) + "</cputune>" + \
+            _tab(1) + "<numatune>" + \
+            _tab(2) + "<memory mode='strict' nodeset='" + str(numa['source']) + "'/>" + \
+            _tab(1) + "</numatune>"
+    if vcpus == 0:
+        return None, "Instance without number of cpus"
+    return vcpus, _tab(1) + "<vcpu>" + str(vcpus) + "</vcpu>"
+
+
+def _render_disks(variant, dev_list):
+    """
+    Render the disk, cdrom and xml devices
+    :return: (0, text) or (-1, error text)
+    """
+    level = variant.devices_level
+    tab0 = _tab(level)
+    tab1 = _tab(level + 1)
+    tab2 = _tab(level + 2)
+    parts = []
+    vd_index = 'a'
+    for dev in dev_list:
+        if (dev['type'] == 'cdrom' or dev['type'] == 'disk') and variant.hypervisor != 'xen-unik':
+            parts.append(tab0 + "<disk type='file' device='" + dev['type'] + "'>")
+            if 'file format' in dev:
+                parts.append(tab1 + "<driver name='qemu' type='" + dev['file format'] +
+                             "' cache='writethrough'/>")
+            if 'source file' in dev:
+                parts.append(tab1 + "<source file='" + dev['source file'] + "'/>")
+            vpci = dev.get('vpci', None)
+            if vpci == None and 'metadata' in dev:
+                vpci = dev['metadata'].get('vpci', None)
+            parts.append(pci2xml(vpci, level + 1))
+            if dev['type'] == 'cdrom':
+                parts.append(tab1 + "<target dev='hd" + vd_index + "' bus='ide'/>")
+            else:
+                parts.append(tab1 + variant.disk_target.format(vd_index))
+            parts.append(tab0 + "</disk>")
+            vd_index = chr(ord(vd_index) + 1)
+        elif dev['type'] == 'xml':
+            dev_text = dev['xml']
+            if 'vpci' in dev:
+                dev_text = dev_text.replace('__vpci__', dev['vpci'])
+            if 'source file' in dev:
+                dev_text = dev_text.replace('__file__', dev['source file'])
+            if 'file format' in dev:
+                dev_text = dev_text.replace('__format__', dev['source file'])
+            if '__dev__' in dev_text:
+                dev_text = dev_text.replace('__dev__', vd_index)
+                vd_index = chr(ord(vd_index) + 1)
+            parts.append(dev_text)
+        elif variant.hypervisor != 'xen-unik':
+            return -1, 'Unknown device type ' + dev['type']
+    return 0, "".join(parts)
+
+
+def _render_bridge_interfaces(variant, networks, providers, iface_names):
+    """
+    Render the interfaces of the bridge, macvtap, ovs and 'default' networks
+    :return: (0, text) or (-1, error text)
+    """
+    level = variant.devices_level
+    tab0 = _tab(level)
+    tab1 = _tab(level + 1)
+    tab2 = _tab(level + 2)
+    windows_os = variant.windows_os
+    parts = []
+    for net_nb, v in enumerate(networks):
+        provider = providers.get(v['net_id'])
+        if provider is None:
+            return -1, "Network '{}' not found".format(v['net_id'])
+        model = v.get("model", None)
+        if provider == 'default':
+            parts.append(tab0 + "<interface type='network'>" +
+                         tab1 + "<source network='" + provider + "'/>")
+        elif provider[0:7] == 'macvtap':
+            parts.append(tab0 + "<interface type='direct'>" +
+                         tab1 + "<source dev='" + iface_names.get(provider[8:], provider[8:]) +
+                         "' mode='bridge'/>" +
+                         tab1 + "<target dev='macvtap0'/>")
+            if windows_os:
+                parts.append(tab1 + "<alias name='net" + str(net_nb) + "'/>")
+            elif model == None:
+                model = "virtio"
+        elif provider[0:6] == 'bridge':
+            parts.append(tab0 + "<interface type='bridge'>" +
+                         tab1 + "<source bridge='" + iface_names.get(provider[7:], provider[7:]) + "'/>")
+            if windows_os:
+                parts.append(tab1 + "<target dev='vnet" + str(net_nb) + "'/>" +
+                             tab1 + "<alias name='net" + str(net_nb) + "'/>")
+            elif model == None:
+                model = "virtio"
+        elif provider[0:3] == "OVS":
+            parts.append(tab0 + "<interface type='bridge'>" +
+                         tab1 + "<source bridge='ovim-" + provider.replace('OVS:', '') + "'/>")
+            if variant.hypervisor == 'xenhvm' or variant.hypervisor == 'xen-unik':
+                parts.append(tab1 + "<script path='vif-openvswitch'/>")
+        else:
+            return -1, 'Unknown Bridge net provider ' + provider
+        if model != None:
+            parts.append(tab1 + "<model type='" + model + "'/>")
+        if v.get('mac_address', None) != None:
+            parts.append(tab1 + "<mac address='" + v['mac_address'] + "'/>")
+        parts.append(pci2xml(v.get('vpci', None), level + 1))
+        parts.append(tab0 + "</interface>")
+    return 0, "".join(parts)
+
+
+def _render_dataplane_interfaces(variant, interfaces, develop_mode, develop_bridge_iface):
+    """
+    Render the passthrough and SR-IOV interfaces of the numa, or their bridges at development mode
+    :return: text
+    """
+    level = variant.devices_level
+    tab0 = _tab(level)
+    tab1 = _tab(level + 1)
+    tab2 = _tab(level + 2)
+    windows_os = variant.windows_os
+    parts = []
+    net_nb = 0
+    for v in interfaces:
+        if develop_mode:    # map these interfaces to bridges
+            parts.append(tab0 + "<interface type='bridge'>" +
+                         tab1 + "<source bridge='" + develop_bridge_iface + "'/>")
+            if windows_os:
+                parts.append(tab1 + "<target dev='vnet" + str(net_nb) + "'/>" +
+                             tab1 + "<alias name='net" + str(net_nb) + "'/>")
+            else:
+                parts.append(tab1 + "<model type='e1000'/>")  # more probable to be supported than virtio
+            if v.get('mac_address', None) != None:
+                parts.append(tab1 + "<mac address='" + v['mac_address'] + "'/>")
+            parts.append(pci2xml(v.get('vpci', None), level + 1))
+            parts.append(tab0 + "</interface>")
+        elif v['dedicated'] == 'yes':     # passthrough
+            parts.append(tab0 + "<hostdev mode='subsystem' type='pci' managed='yes'>" +
+                         tab1 + "<source>" +
+                         pci2xml(v['source'], level + 2) +
+                         tab1 + "</source>" +
+                         pci2xml(v.get('vpci', None), level + 1))
+            if windows_os:
+                parts.append(tab1 + "<alias name='hostdev" + str(net_nb) + "'/>")
+            parts.append(tab0 + "</hostdev>")
+            net_nb += 1
+        elif v.get("net_id") != None:     # sriov, skipping the not connected ones
+            parts.append(tab0 + "<interface type='hostdev' managed='yes'>")
+            if v.get('mac_address', None) != None:
+                parts.append(tab1 + "<mac address='" + v['mac_address'] + "'/>")
+            parts.append(tab1 + "<source>" +
+                         pci2xml(v['source'], level + 2) +
+                         tab1 + "</source>")
+            if v.get('vlan', None) != None:
+                parts.append(tab1 + "<vlan>   <tag id='" + str(v['vlan']) + "'/>   </vlan>")
+            parts.append(pci2xml(v.get('vpci', None), level + 1))
+            if windows_os:
+                parts.append(tab1 + "<alias name='hostdev" + str(net_nb) + "'/>")
+            parts.append(tab0 + "</interface>")
+    return "".join(parts)
+
+
+def render_domain(server, dev_list, server_metadata=None, providers=None, develop_mode=False,
+                  develop_bridge_iface=None, iface_names=None):
+    """
+    Render the libvirt domain XML of a server
+    :param server: dictionary with uuid, name, ram, vcpus, hypervisor, networks and extended.numas of the server
+    :param dev_list: disk, cdrom or xml devices, the main disk first. Its metadata may contain os_type, bus and
+        topology, used when not at server_metadata
+    :param server_metadata: dictionary with os_type, bus and topology of the server (Optional)
+    :param providers: dictionary net_id: provider of the nets of server networks
+    :param develop_mode: use bridges for the dataplane interfaces, no hugepages and no cpu pinning
+    :param develop_bridge_iface: bridge for the dataplane interfaces at develop_mode
+    :param iface_names: dictionary generic name: name at the compute node, of the bridge and macvtap interfaces
+    :return: (0, xml text) or (-1, error text)
+    """
+    server_metadata = server_metadata or {}
+    providers = providers or {}
+    iface_names = iface_names or {}
+    image_metadata = dev_list[0].get('metadata') or {}
+
+    os_type = server_metadata.get('os_type', None)
+    if os_type == None:
+        os_type = image_metadata.get('os_type', None)
+    windows_os = os_type != None and os_type.lower() == "windows"
+    bus_ide = windows_os
+    bus = server_metadata.get('bus', None)
+    if bus == None:
+        bus = image_metadata.get('bus', None)
+    if bus != None:
+        bus_ide = bus == 'ide'
+    topo = server_metadata.get('topology', None)
+    if topo == None:
+        topo = image_metadata.get('topology', None)
+    variant = _get_variant(server.get('hypervisor', 'kvm'), windows_os, bus_ide)
+
+    numa = {}
+    if server.get('extended') != None and 'numas' in server['extended']:
+        numa = server['extended']['numas'][0]
+
+    memory_backing = ""
+    memory = int(numa.get('memory', 0)) * 1024 * 1024     # in KiB
+    if memory == 0:
+        memory = int(server['ram']) * 1024
+    elif not develop_mode:
+        memory_backing = _tab(1) + "<memoryBacking>" + _tab(2) + "<hugepages/>" + _tab(1) + "</memoryBacking>"
+    if memory == 0:
+        return -1, 'No memory assigned to instance'
+
+    vcpus, vcpu = _render_cpu(server, numa, develop_mode)
+    if vcpus is None:
+        return -1, vcpu
+
+    if topo == "oneSocket:hyperthreading":
+        if vcpus % 2 != 0:
+            return -1, 'Cannot expose hyperthreading with an odd number of vcpus'
+        cpu = _tab(1) + "<cpu mode='host-model'> <topology sockets='1' cores='%d' threads='2' /> </cpu>" % (vcpus / 2)
+    elif windows_os or topo == "oneSocket":
+        cpu = _tab(1) + "<cpu mode='host-model'> <topology sockets='1' cores='%d' threads='1' /> </cpu>" % vcpus
+    else:
+        cpu = _tab(1) + "<cpu mode='host-model'></cpu>"
+
+    boot_cdrom = ""
+    if any(dev['type'] == 'cdrom' for dev in dev_list):
+        boot_cdrom = _tab(2) + "<boot dev='cdrom'/>"
+
+    result, disks = _render_disks(variant, dev_list)
+    if result < 0:
+        return result, disks
+    result, bridge_interfaces = _render_bridge_interfaces(variant, server.get('networks', []), providers,
+                                                          iface_names)
+    if result < 0:
+        return result, bridge_interfaces
+    dataplane_interfaces = _render_dataplane_interfaces(variant, numa.get('interfaces', []), develop_mode,
+                                                        develop_bridge_iface)
+
+    # qemu imposes a length limit of 59 chars or does not start. Using 58
+    name = server.get('name', '')[:28] + "_" + server['uuid'][:28]
+    return 0, variant.skeleton.format(name=name, uuid=server['uuid'], memory=memory, memory_backing=memory_backing,
+                                      vcpu=vcpu, boot_cdrom=boot_cdrom, kernel=dev_list[0].get('source file'),
+                                      cpu=cpu, devices=disks + bridge_interfaces + dataplane_interfaces)
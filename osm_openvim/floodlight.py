@@ -387,6 +387,29 @@ class OF_conn(openflow_conn.OpenflowConn):
             self.logger.error("del_flow " + error_text)
             raise openflow_conn.OpenflowconnUnexpectedResponse(error_text)
 
+    def _translate_actions(self, action_list):
+        """
+        Build the floodlight actions string from the generic action list
+        :param action_list: list of actions, composed by a pair tuples ('vlan', None/int), ('out', port) or
+            ('group', group_id). Groups are only available at version 1.X
+        :return: string with comma separated actions
+        """
+        actions = []
+        for action in action_list:
+            if action[0] == "vlan":
+                if action[1] == None:
+                    actions.append(self.ver_names["stripvlan"])
+                else:
+                    actions.append(self.ver_names["setvlan"] + "=" + str(action[1]))
+            elif action[0] == 'out':
+                actions.append("output=" + self.pp2ofi[action[1]])
+            elif action[0] == 'group':
+                if self.version[0] != "1":
+                    raise openflow_conn.OpenflowconnNotSupportedException("Groups not supported by floodlight " +
+                                                                          self.version)
+                actions.append("group=" + str(action[1]))
+        return ",".join(actions)
+
     def new_flow(self, data):
         """
         Insert a new static rule
@@ -399,6 +422,7 @@ class OF_conn(openflow_conn.OpenflowConn):
                         actions:      list of actions, composed by a pair tuples with these posibilities:
                             ('vlan', None/int): for stripping/setting a vlan tag
                             ('out', port):      send to this port
+                            ('group', group_id): send to this group (only version 1.X)
         :return: None if ok
                  Raise an openflowconnUnexpectedResponse exception if fails with text_error
         """
@@ -422,18 +446,7 @@ class OF_conn(openflow_conn.OpenflowConn):
                 raise openflow_conn.OpenflowconnUnexpectedResponse(error_text)
 
             sdata[self.ver_names["inport"]] = self.pp2ofi[data['ingress_port']]
-            sdata['actions'] = ""
-
-            for action in data['actions']:
-                if len(sdata['actions']) > 0:
-                    sdata['actions'] += ','
-                if action[0] == "vlan":
-                    if action[1] == None:
-                        sdata['actions'] += self.ver_names["stripvlan"]
-                    else:
-                        sdata['actions'] += self.ver_names["setvlan"] + "=" + str(action[1])
-                elif action[0] == 'out':
-                    sdata['actions'] += "output=" + self.pp2ofi[action[1]]
+            sdata['actions'] = self._translate_actions(data['actions'])
 
             of_response = requests.post(self.url + "/wm/%s/json" % self.ver_names["URLmodifier"],
                                         headers=self.headers, data=json.dumps(sdata))
@@ -448,12 +461,57 @@ class OF_conn(openflow_conn.OpenflowConn):
             error_text = type(e).__name__ + ": " + str(e)
             self.logger.error("new_flow " + error_text)
             raise openflow_conn.OpenflowconnConnectionException(error_text)
+        except openflow_conn.OpenflowconnNotSupportedException:
+            raise
         except Exception as e:
             # ValueError in the case that JSON can not be decoded
             error_text = type(e).__name__ + ": " + str(e)
             self.logger.error("new_flow " + error_text)
             raise openflow_conn.OpenflowconnUnexpectedResponse(error_text)
 
+    def new_group(self, data):
+        """
+        Insert or replace a static group of type all. Only available at version 1.X
+        :param data: dictionary with 'group_id' and 'buckets', a list of action lists. See new_flow
+        :return: None if ok
+                 Raise an openflowconnUnexpectedResponse exception if fails with text_error
+        """
+        # get translation, autodiscover version
+        if len(self.pp2ofi) == 0:
+            self.obtain_port_correspondence()
+        if self.version[0] != "1":
+            raise openflow_conn.OpenflowconnNotSupportedException("Groups not supported by floodlight " + self.version)
+
+        try:
+            sdata = {"switch": self.dpid, "name": "openvim-group-%d" % data["group_id"], "entry_type": "group",
+                     "active": "true", "group_type": "all", "group_id": str(data["group_id"]), "group_buckets": []}
+            for bucket_id, bucket_actions in enumerate(data["buckets"]):
+                sdata["group_buckets"].append({"bucket_id": str(bucket_id + 1), "bucket_watch_group": "any",
+                                               "bucket_watch_port": "any",
+                                               "bucket_actions": self._translate_actions(bucket_actions)})
+            of_response = requests.post(self.url + "/wm/%s/json" % self.ver_names["URLmodifier"],
+                                        headers=self.headers, data=json.dumps(sdata))
+            error_text = "Openflow response %d: %s" % (of_response.status_code, of_response.text)
+            if of_response.status_code != 200:
+                self.logger.warning("new_group " + error_text)
+                raise openflow_conn.OpenflowconnUnexpectedResponse(error_text)
+            self.logger.debug("new_group OK" + error_text)
+            return None
+
+        except requests.exceptions.RequestException as e:
+            error_text = type(e).__name__ + ": " + str(e)
+            self.logger.error("new_group " + error_text)
+            raise openflow_conn.OpenflowconnConnectionException(error_text)
+
+    def del_group(self, group_id):
+        """
+        Delete an existing group
+        :param group_id: group identifier
+        :return: None if ok
+                 Raise an openflowconnUnexpectedResponse exception if fails with text_error
+        """
+        return self.del_flow("openvim-group-%d" % group_id)
+
     def clear_all_flows(self):
         """
         Delete all existing rules
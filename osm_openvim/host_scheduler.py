@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+Scheduler that runs the host_thread objects of the compute nodes on a bounded pool of worker threads, instead of an
+operating system thread per compute node. Each host keeps its own state and ordered task queue; a host is run by at
+most one worker at a time, so that its tasks are processed in order as by its own thread. A host is run when it
+receives a task or when its periodic work (servers status polling, pending terminations) is due.
+A watchdog at the timer thread replaces the workers blocked on a host for longer than a timeout (for example by a
+compute node that does not answer), so that the rest of hosts keep being run by the same number of workers. The
+blocked worker exits when its host returns.
+'''
+__date__ = "$19-oct-2026 10:00:00$"
+
+import threading
+import logging
+import heapq
+import itertools
+import time
+import collections
+
+
+class HostScheduler(object):
+    def __init__(self, workers=20, name="hosts", logger_name="openvim.hosts", tasks_per_run=10, stall_timeout=30):
+        """
+        Creates the worker threads and the timer thread
+        :param workers: number of threads, that is, of hosts running concurrently
+        :param name: prefix of the thread names, that are '<name>-<index>' and '<name>-timer'
+        :param logger_name: logger name
+        :param tasks_per_run: maximum number of tasks of a host processed before giving way to other hosts
+        :param stall_timeout: seconds a host can keep a worker before another worker is started in its place.
+            0 disables the watchdog
+        """
+        self.name = name
+        self.tasks_per_run = tasks_per_run
+        self.stall_timeout = stall_timeout
+        self.logger = logging.getLogger(logger_name)
+        self.lock = threading.Lock()
+        self.work_cond = threading.Condition(self.lock)     # hosts ready to run
+        self.timer_cond = threading.Condition(self.lock)    # new timers
+        self.ready = collections.deque()    # hosts ready to run, in order
+        self.timers = []                    # heap of (time, sequence, host) to run a host at time
+        self.sequence = itertools.count()
+        self.hosts = set()
+        self.state = {}     # host: dictionary with 'queued', 'running', 'again', 'timer', 'started', 'stalled'
+        self.running = False
+        self.threads = []
+        self.worker_index = itertools.count()
+        for _ in range(0, workers):
+            self.threads.append(self._new_worker())
+        thread = threading.Thread(target=self._timer, name="{}-timer".format(name))
+        thread.daemon = True
+        self.threads.append(thread)
+
+    def _new_worker(self):
+        thread = threading.Thread(target=self._worker, name="{}-{}".format(self.name, next(self.worker_index)))
+        thread.daemon = True
+        return thread
+
+    def start(self):
+        self.running = True
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop the worker threads once they finish the host they are running. Pending tasks are not processed
+        :param timeout: maximum seconds to wait for each thread
+        :return: None
+        """
+        with self.lock:
+            self.running = False
+            self.work_cond.notify_all()
+            self.timer_cond.notify_all()
+        for thread in list(self.threads):
+            thread.join(timeout)
+
+    def add(self, host):
+        """
+        Add a host, that is run at once to load its information. A host removed while queued or running is added
+        back keeping its state, so that it is not run by two workers at once
+        :param host: host_thread object
+        :return: None
+        """
+        with self.lock:
+            self.hosts.add(host)
+            if host not in self.state:
+                self.state[host] = {"queued": False, "running": False, "again": False, "timer": None, "started": None,
+                                    "stalled": False}
+            self._make_ready(host)
+
+    def is_scheduled(self, host):
+        """
+        Tell if a host is added and has not exited
+        :param host: host_thread object
+        :return: True or False
+        """
+        with self.lock:
+            return host in self.hosts
+
+    def remove(self, host):
+        """
+        Remove a host. If it is being run or waiting for a worker, its state is removed by that worker. Normally hosts
+        are removed by themselves when they process the 'exit' task
+        :param host: host_thread object
+        :return: None
+        """
+        with self.lock:
+            self.hosts.discard(host)
+            state = self.state.get(host)
+            if state and not state["running"] and not state["queued"]:
+                del self.state[host]
+
+    def notify(self, host):
+        """
+        Inform that a host has new tasks, so that it is run as soon as a worker is free
+        :param host: host_thread object
+        :return: None
+        """
+        with self.lock:
+            if host in self.hosts:
+                self._make_ready(host)
+
+    def _make_ready(self, host):
+        state = self.state[host]
+        if state["running"]:
+            state["again"] = True
+        elif not state["queued"]:
+            state["queued"] = True
+            self.ready.append(host)
+            self.work_cond.notify()
+
+    def _watchdog(self, now):
+        """
+        Start a worker in place of each one blocked by a host for more than stall_timeout. Called with the lock
+        :param now: current time
+        :return: time of the next check, or None if no host is running
+        """
+        next_check = None
+        for host, state in self.state.items():
+            if not state["running"] or state["stalled"]:
+                continue
+            if state["started"] + self.stall_timeout <= now:
+                state["stalled"] = True
+                self.logger.warning("Host %s has been running for more than %s seconds; starting another worker",
+                                    host.name, self.stall_timeout)
+                thread = self._new_worker()
+                self.threads.append(thread)
+                thread.start()
+            elif next_check is None or state["started"] + self.stall_timeout < next_check:
+                next_check = state["started"] + self.stall_timeout
+        return next_check
+
+    def _timer(self):
+        with self.lock:
+            while self.running:
+                now = time.time()
+                while self.timers and self.timers[0][0] <= now:
+                    when, _, host = heapq.heappop(self.timers)
+                    state = self.state.get(host)
+                    # discard timers replaced by a later run of the host
+                    if host in self.hosts and state["timer"] == when:
+                        state["timer"] = None
+                        self._make_ready(host)
+                wake = self.timers[0][0] if self.timers else None
+                if self.stall_timeout:
+                    next_check = self._watchdog(now)
+                    if next_check is not None:
+                        # hosts that start running later are checked at most a timeout late
+                        next_check = min(next_check, now + self.stall_timeout)
+                    else:
+                        next_check = now + self.stall_timeout
+                    wake = min(wake, next_check) if wake else next_check
+                self.timer_cond.wait(wake - now if wake else None)
+
+    def _worker(self):
+        while True:
+            with self.lock:
+                while self.running and not self.ready:
+                    self.work_cond.wait()
+                if not self.running:
+                    return
+                host = self.ready.popleft()
+                state = self.state[host]
+                state["queued"] = False
+                if host not in self.hosts:
+                    # removed while waiting
+                    del self.state[host]
+                    continue
+                state["running"] = True
+                state["again"] = False
+                state["started"] = time.time()
+            try:
+                next_run = host.run_once(self.tasks_per_run)
+            except Exception as e:
+                self.logger.critical("Unexpected exception running host %s: %s", host.name, str(e), exc_info=True)
+                next_run = time.time() + 1
+            with self.lock:
+                state["running"] = False
+                stalled = state["stalled"]
+                state["stalled"] = False
+                if next_run is None or host not in self.hosts:
+                    # host has exited or has been removed
+                    self.hosts.discard(host)
+                    del self.state[host]
+                elif state["again"] or next_run <= time.time():
+                    self._make_ready(host)
+                else:
+                    state["timer"] = next_run
+                    if not self.timers or next_run < self.timers[0][0]:
+                        self.timer_cond.notify()
+                    heapq.heappush(self.timers, (next_run, next(self.sequence), host))
+                if stalled:
+                    # replaced by another worker
+                    self.threads.remove(threading.current_thread())
+                    return
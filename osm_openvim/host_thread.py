@@ -37,26 +37,50 @@ import paramiko
 import subprocess
 # import libvirt
 import imp
+import functools
 import random
 import os
 import logging
-from jsonschema import validate as js_v, exceptions as js_e
+import metrics
+import domain_xml
+from jsonschema import exceptions as js_e
+from schema_validator import validate as js_v
 from vim_schema import localinfo_schema, hostinfo_schema
 
 class RunCommandException(Exception):
     pass
 
+
+def ssh_serialized(method):
+    """Decorator of the host_thread methods that run several commands, as the edition of dnsmasq files, holding the
+    ssh lock. They are also called from the http and ovim threads, and must not be interleaved"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.ssh_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class host_thread(threading.Thread):
     lvirt_module = None
+    localinfo_compact_lines = 1000      # journal lines at which localinfo is saved as a new snapshot
+    localinfo_journal_mark = "#openvim-journal"
 
     def __init__(self, name, host, user, db, test, image_path, host_id, version, develop_mode,
-                 develop_bridge_iface, password=None, keyfile = None, logger_name=None, debug=None, hypervisors=None):
+                 develop_bridge_iface, password=None, keyfile = None, logger_name=None, debug=None, hypervisors=None,
+                 scheduler=None, manage_servers=True, metadata_cache=None, set_net_status=None):
         """Init a thread to communicate with compute node or ovs_controller.
         :param host_id: host identity
         :param name: name of the thread
         :param host: host ip or name to manage and user
         :param user, password, keyfile: user and credentials to connect to host
         :param db: database class, threading safe
+        :param scheduler: host_scheduler.HostScheduler where it is run instead of at its own thread (Optional)
+        :param manage_servers: False for the ovs_controller, that has neither servers nor localinfo and only processes
+            its tasks
+        :param metadata_cache: metadata_cache.MetadataCache used to get the images of the servers (Optional)
+        :param set_net_status: function (net_id, status, last_error) that writes the status of a net, informing the
+            openflow threads that cache it (Optional). By default it is written at database directly
         """
         threading.Thread.__init__(self)
         self.name = name
@@ -67,7 +91,12 @@ class host_thread(threading.Thread):
         self.password = password
         self.keyfile = keyfile
         self.localinfo_dirty = False
+        self.localinfo_journal = []         # changes of localinfo not saved yet, as json lines
+        self.localinfo_journal_lines = None     # lines at the journal of the host, None when a snapshot is needed
         self.connectivity = True
+        self.manage_servers = manage_servers
+        self.metadata_cache = metadata_cache
+        self.set_net_status = set_net_status
 
         if not test and not host_thread.lvirt_module:
             try:
@@ -91,12 +120,14 @@ class host_thread(threading.Thread):
         self.host_id = host_id
         self.version = version
         
-        self.xml_level = 0
         # self.pending ={}
         
         self.server_status = {} #dictionary with pairs server_uuid:server_status 
         self.pending_terminate_server =[] #list  with pairs (time,server_uuid) time to send a terminate for a server being destroyed
         self.next_update_server_status = 0 #time when must be check servers status
+        # result of the last update_servers_status: time, duration, domains and status changes
+        self.status_report = {"last_poll": None, "poll_duration": None, "domains": None, "changes": None,
+                              "total_changes": 0}
         
 #######        self.hypervisor = "kvm" #hypervisor flag (default: kvm)
         if hypervisors:
@@ -109,9 +140,14 @@ class host_thread(threading.Thread):
         self.hostinfo = None 
         
         self.queueLock = threading.Lock()
-        self.taskQueue = Queue.Queue(2000)
+        self.taskQueue = metrics.TimedQueue(2000, "host." + name)
+        self.scheduler = scheduler
+        self.loaded = False     # localinfo, hostinfo and servers loaded, when run by a scheduler
+        self.finished = threading.Event()
         self.ssh_conn = None
         self.run_command_session = None
+        # protects ssh_conn and run_command_session. Held by a keep_session command until the one that closes it
+        self.ssh_lock = threading.RLock()
         self.error = None
         self.localhost = True if host == 'localhost' else False
 
@@ -137,15 +173,28 @@ class host_thread(threading.Thread):
         :return: the output of the command if 'keep_session=False' or the <stdin> object if 'keep_session=True'
         :raises: RunCommandException if command fails
         """
-        if self.run_command_session and keep_session:
+        self.ssh_lock.acquire()
+        session = self.run_command_session
+        if session and keep_session:
+            self.ssh_lock.release()
             raise RunCommandException("Internal error. A command with keep_session=True must be followed by another "
                                       "command with keep_session=False to close session")
+        try:
+            return self._run_command(command, keep_session, ignore_exit_status)
+        finally:
+            if not (keep_session and self.run_command_session):
+                self.ssh_lock.release()
+                if session:
+                    self.ssh_lock.release()     # the one of the closed session
+
+    def _run_command(self, command, keep_session, ignore_exit_status):
         try:
             if self.localhost:
                 if self.run_command_session:
                     p = self.run_command_session
                     self.run_command_session = None
-                    (output, outerror) = p.communicate()
+                    with metrics.timer("openvim_ssh_command_seconds"):
+                        (output, outerror) = p.communicate()
                     returncode = p.returncode
                     p.stdin.close()
                 elif keep_session:
@@ -155,28 +204,36 @@ class host_thread(threading.Thread):
                     return p.stdin
                 else:
                     if not ignore_exit_status:
-                        output = subprocess.check_output(('bash', "-c", command))
+                        with metrics.timer("openvim_ssh_command_seconds"):
+                            output = subprocess.check_output(('bash', "-c", command))
                         returncode = 0
                     else:
                         out = None
-                        p = subprocess.Popen(('bash', "-c", command), stdout=subprocess.PIPE)
-                        out, err = p.communicate()
+                        with metrics.timer("openvim_ssh_command_seconds"):
+                            p = subprocess.Popen(('bash', "-c", command), stdout=subprocess.PIPE)
+                            out, err = p.communicate()
                         return out
             else:
                 if self.run_command_session:
                     (i, o, e) = self.run_command_session
                     self.run_command_session = None
-                    i.channel.shutdown_write()
+                    with metrics.timer("openvim_ssh_command_seconds"):
+                        i.channel.shutdown_write()
+                        returncode = o.channel.recv_exit_status()
+                        output = o.read()
+                        outerror = e.read()
                 else:
                     if not self.ssh_conn:
                         self.ssh_connect()
-                    (i, o, e) = self.ssh_conn.exec_command(command, timeout=10)
                     if keep_session:
+                        (i, o, e) = self.ssh_conn.exec_command(command, timeout=10)
                         self.run_command_session = (i, o, e)
                         return i
-                returncode = o.channel.recv_exit_status()
-                output = o.read()
-                outerror = e.read()
+                    with metrics.timer("openvim_ssh_command_seconds"):
+                        (i, o, e) = self.ssh_conn.exec_command(command, timeout=10)
+                        returncode = o.channel.recv_exit_status()
+                        output = o.read()
+                        outerror = e.read()
             if returncode != 0 and not ignore_exit_status:
                 text = "run_command='{}' Error='{}'".format(command, outerror)
                 self.logger.error(text)
@@ -195,6 +252,7 @@ class host_thread(threading.Thread):
         self.run_command_session = None
         raise RunCommandException(text)
 
+    @ssh_serialized
     def ssh_connect(self):
         try:
             # Connect SSH
@@ -221,15 +279,31 @@ class host_thread(threading.Thread):
                 self.logger.error("check_connectivity Exception: " + str(e))
 
     def load_localinfo(self):
+        """
+        Load localinfo from the snapshot .openvim.yaml and the journal .openvim.journal of the image path, replaying
+        the changes of the journal over the snapshot. Both files are read with a single command. The snapshot is json,
+        that is also valid yaml, so that files written by older versions are read with the yaml parser
+        """
+        self.localinfo_journal = []
         if not self.test:
             try:
                 self.run_command('sudo mkdir -p ' + self.image_path)
-                result = self.run_command('cat {}/.openvim.yaml'.format(self.image_path))
-                self.localinfo = yaml.load(result)
+                result = self.run_command("cat {path}/.openvim.yaml && echo && echo '{mark}' && "
+                                          "(cat {path}/.openvim.journal 2>/dev/null; true)".format(
+                                              path=self.image_path, mark=self.localinfo_journal_mark))
+                snapshot, _, journal = result.partition("\n{}\n".format(self.localinfo_journal_mark))
+                try:
+                    self.localinfo = json.loads(snapshot)
+                except ValueError:
+                    self.localinfo = yaml.load(snapshot)
+                    self.localinfo_journal_lines = None     # rewrite it as json
+                else:
+                    self.localinfo_journal_lines = 0
                 js_v(self.localinfo, localinfo_schema)
                 self.localinfo_dirty = False
                 if 'server_files' not in self.localinfo:
                     self.localinfo['server_files'] = {}
+                self._replay_localinfo_journal(journal)
                 self.logger.debug("localinfo loaded from host")
                 return
             except RunCommandException as e:
@@ -251,8 +325,9 @@ class host_thread(threading.Thread):
                 text = str(e)
                 self.logger.error("load_localinfo Exception: " + text)
         
-        # not loaded, insert a default data and force saving by activating dirty flag
+        # not loaded, insert a default data, written as a new snapshot at first save
         self.localinfo = {'files':{}, 'server_files':{} } 
+        self.localinfo_journal_lines = None
         # self.localinfo_dirty=True
         self.localinfo_dirty=False
 
@@ -287,21 +362,89 @@ class host_thread(threading.Thread):
         #not loaded, insert a default data 
         self.hostinfo = None 
         
+    def _replay_localinfo_journal(self, journal):
+        """
+        Apply to localinfo the changes of the journal read from host. Lines that cannot be parsed, as the last one of an
+        interrupted append, are skipped and the snapshot is rewritten at next save
+        :param journal: text with a json change per line, as written by save_localinfo
+        :return: None
+        """
+        for line in journal.splitlines():
+            if not line:
+                continue
+            try:
+                change = json.loads(line)
+                if change[0] == "set":
+                    self.localinfo[change[1]][change[2]] = change[3]
+                else:
+                    self.localinfo[change[1]].pop(change[2], None)
+            except (ValueError, IndexError, KeyError, TypeError) as e:
+                self.logger.warning("load_localinfo skipping journal line '%s': %s", line, e)
+                self.localinfo_journal_lines = None
+                continue
+            if self.localinfo_journal_lines is not None:
+                self.localinfo_journal_lines += 1
+
+    def set_localinfo(self, section, key, value):
+        """
+        Set an entry of localinfo, recording the change at the journal to be saved
+        :param section: 'files' or 'server_files'
+        :param key: remote file or server uuid
+        :param value: content of the entry
+        :return: None
+        """
+        self.localinfo[section][key] = value
+        self.localinfo_journal.append(json.dumps(("set", section, key, value), separators=(',', ':')))
+        self.localinfo_dirty = True
+
+    def del_localinfo(self, section, key):
+        """
+        Delete an entry of localinfo, recording the change at the journal to be saved
+        :param section: 'files' or 'server_files'
+        :param key: remote file or server uuid
+        :return: None
+        """
+        del self.localinfo[section][key]
+        self.localinfo_journal.append(json.dumps(("del", section, key), separators=(',', ':')))
+        self.localinfo_dirty = True
+
     def save_localinfo(self, tries=3):
+        """
+        Save the changes of localinfo done since the last save. They are appended in a batch to the journal with a
+        single command. The whole localinfo is written instead as a new snapshot, removing the journal, when the
+        journal reaches localinfo_compact_lines, when the snapshot is missing or legacy, or after a failed append
+        :param tries: number of retries of a failed write. Changes not saved are kept for the next call
+        :return: None
+        """
         if self.test:
+            self.localinfo_journal = []
             self.localinfo_dirty = False
             return
-        
+
         while tries>=0:
             tries-=1
-            
+
             try:
-                command = 'cat > {}/.openvim.yaml'.format(self.image_path)
-                in_stream = self.run_command(command, keep_session=True)
-                yaml.safe_dump(self.localinfo, in_stream, explicit_start=True, indent=4, default_flow_style=False,
-                               tags=False, encoding='utf-8', allow_unicode=True)
-                result = self.run_command(command, keep_session=False)   # to end session
+                journal = self.localinfo_journal
+                lines = self.localinfo_journal_lines
+                # a failed write may leave the journal with a broken line, or be unknown whether the snapshot was
+                # replaced; write a snapshot at next try
+                self.localinfo_journal_lines = None
+                if lines is None or lines + len(journal) > self.localinfo_compact_lines:
+                    command = 'cat > {path}/.openvim.yaml.new && mv -f {path}/.openvim.yaml.new {path}/.openvim.yaml' \
+                              ' && rm -f {path}/.openvim.journal'.format(path=self.image_path)
+                    in_stream = self.run_command(command, keep_session=True)
+                    in_stream.write(json.dumps(self.localinfo, indent=1, separators=(',', ': ')))
+                    self.run_command(command, keep_session=False)   # to end session
+                    self.localinfo_journal_lines = 0
+                else:
+                    command = 'cat >> {}/.openvim.journal'.format(self.image_path)
+                    in_stream = self.run_command(command, keep_session=True)
+                    in_stream.write("".join(line + "\n" for line in journal))
+                    self.run_command(command, keep_session=False)   # to end session
+                    self.localinfo_journal_lines = lines + len(journal)
 
+                self.localinfo_journal = []
                 self.localinfo_dirty = False
                 break #while tries
 
@@ -310,12 +453,6 @@ class host_thread(threading.Thread):
             except host_thread.lvirt_module.libvirtError as e:
                 text = e.get_error_message()
                 self.logger.error("save_localinfo libvirt Exception: " + text)
-            except yaml.YAMLError as exc:
-                text = ""
-                if hasattr(exc, 'problem_mark'):
-                    mark = exc.problem_mark
-                    text = " at position: (%s:%s)" % (mark.line+1, mark.column+1)
-                self.logger.error("save_localinfo yaml format Exception " + text)
             except Exception as e:
                 text = str(e)
                 self.logger.error("save_localinfo Exception: " + text)
@@ -339,6 +476,7 @@ class host_thread(threading.Thread):
                 self.localinfo['server_files'][ server['uuid'] ] = { server['image_id'] : server_files_dict }
         if 'inc_files' in self.localinfo:
             del self.localinfo['inc_files']
+            self.localinfo_journal_lines = None     # converted in place, write a new snapshot
             self.localinfo_dirty = True
     
     def delete_unused_files(self):
@@ -356,95 +494,198 @@ class host_thread(threading.Thread):
                         self.delete_file(localfile['source file'])
                     except RunCommandException as e:
                         self.logger.error("Exception deleting file '%s': %s", localfile['source file'], str(e))
-                del self.localinfo['server_files'][uuid]
-                self.localinfo_dirty = True
+                self.del_localinfo('server_files', uuid)
    
     def insert_task(self, task, *aditional):
         try:
             self.queueLock.acquire()
             task = self.taskQueue.put( (task,) + aditional, timeout=5) 
             self.queueLock.release()
+            if self.scheduler:
+                self.scheduler.notify(self)
             return 1, None
         except Queue.Full:
             return -1, "timeout inserting a task over host " + self.name
 
+    def start(self):
+        if self.scheduler:
+            self.scheduler.add(self)
+        else:
+            threading.Thread.start(self)
+
+    def join(self, timeout=None):
+        if self.scheduler:
+            self.finished.wait(timeout)
+        else:
+            threading.Thread.join(self, timeout)
+
+    def is_alive(self):
+        if self.scheduler:
+            return self.scheduler.is_scheduled(self)
+        return threading.Thread.is_alive(self)
+
+    isAlive = is_alive
+
+    def _load(self):
+        if not self.manage_servers:
+            return
+        self.load_localinfo()
+        self.load_hostinfo()
+        self.load_servers_from_db()
+        self.delete_unused_files()
+
+    def _get_task(self):
+        self.queueLock.acquire()
+        if not self.taskQueue.empty():
+            task = self.taskQueue.get()
+        else:
+            task = None
+        self.queueLock.release()
+        return task
+
+    def _do_pending_work(self):
+        """
+        Do the work pending when there are no tasks: saving localinfo, polling servers status, terminating servers
+        :return: True if something has been done, False if there was nothing to do
+        """
+        if not self.manage_servers:
+            return False
+        now = time.time()
+        if self.localinfo_dirty:
+            self.save_localinfo()
+        elif self.next_update_server_status < now:
+            self.update_servers_status()
+            self.next_update_server_status = now + 5
+        elif len(self.pending_terminate_server)>0 and self.pending_terminate_server[0][0]<now:
+            self.server_forceoff()
+        else:
+            return False
+        return True
+
     def run(self):
         while True:
-            self.load_localinfo()
-            self.load_hostinfo()
-            self.load_servers_from_db()
-            self.delete_unused_files()
+            self._load()
             while True:
                 try:
-                    self.queueLock.acquire()
-                    if not self.taskQueue.empty():
-                        task = self.taskQueue.get()
-                    else:
-                        task = None
-                    self.queueLock.release()
-
+                    task = self._get_task()
                     if task is None:
-                        now=time.time()
-                        if self.localinfo_dirty:
-                            self.save_localinfo()
-                        elif self.next_update_server_status < now:
-                            self.update_servers_status()
-                            self.next_update_server_status = now + 5
-                        elif len(self.pending_terminate_server)>0 and self.pending_terminate_server[0][0]<now:
-                            self.server_forceoff()
-                        else:
+                        if not self._do_pending_work():
                             time.sleep(1)
                         continue
 
-                    if task[0] == 'instance':
-                        self.logger.debug("processing task instance " + str(task[1]['action']))
-                        retry = 0
-                        while retry < 2:
-                            retry += 1
-                            r = self.action_on_server(task[1], retry==2)
-                            if r >= 0:
-                                break
-                    elif task[0] == 'image':
-                        pass
-                    elif task[0] == 'exit':
-                        self.logger.debug("processing task exit")
-                        self.terminate()
+                    r = self._process_task(task)
+                    if r == 'exit':
                         return 0
-                    elif task[0] == 'reload':
-                        self.logger.debug("processing task reload terminating and relaunching")
-                        self.terminate()
+                    elif r == 'reload':
                         break
-                    elif task[0] == 'edit-iface':
-                        self.logger.debug("processing task edit-iface port={}, old_net={}, new_net={}".format(
-                                          task[1], task[2], task[3]))
-                        self.edit_iface(task[1], task[2], task[3])
-                    elif task[0] == 'restore-iface':
-                        self.logger.debug("processing task restore-iface={} mac={}".format(task[1], task[2]))
-                        self.restore_iface(task[1], task[2])
-                    elif task[0] == 'new-ovsbridge':
-                        self.logger.debug("Creating compute OVS bridge")
-                        self.create_ovs_bridge()
-                    elif task[0] == 'new-vxlan':
-                        self.logger.debug("Creating vxlan tunnel='{}', remote ip='{}'".format(task[1], task[2]))
-                        self.create_ovs_vxlan_tunnel(task[1], task[2])
-                    elif task[0] == 'del-ovsbridge':
-                        self.logger.debug("Deleting OVS bridge")
-                        self.delete_ovs_bridge()
-                    elif task[0] == 'del-vxlan':
-                        self.logger.debug("Deleting vxlan {} tunnel".format(task[1]))
-                        self.delete_ovs_vxlan_tunnel(task[1])
-                    elif task[0] == 'create-ovs-bridge-port':
-                        self.logger.debug("Adding port ovim-{} to OVS bridge".format(task[1]))
-                        self.create_ovs_bridge_port(task[1])
-                    elif task[0] == 'del-ovs-port':
-                        self.logger.debug("Delete bridge attached to ovs port vlan {} net {}".format(task[1], task[2]))
-                        self.delete_bridge_port_attached_to_ovs(task[1], task[2])
-                    else:
-                        self.logger.debug("unknown task " + str(task))
-
                 except Exception as e:
                     self.logger.critical("Unexpected exception at run: " + str(e), exc_info=True)
 
+    def run_once(self, max_tasks=10):
+        """
+        Process pending tasks and work when run by a scheduler. Work is done only once per call and tasks are
+        processed up to a limit, so that the worker is given to other hosts
+        :param max_tasks: maximum number of tasks to process
+        :return: time when it must be run again, even if there are no new tasks; or None when exited
+        """
+        if not self.loaded:
+            self._load()
+            self.loaded = True
+        for _ in range(0, max_tasks):
+            task = self._get_task()
+            if task is None:
+                break
+            try:
+                r = self._process_task(task)
+            except Exception as e:
+                self.logger.critical("Unexpected exception at run: " + str(e), exc_info=True)
+                continue
+            if r == 'exit':
+                self.finished.set()
+                return None
+            elif r == 'reload':
+                self.loaded = False
+                return 0
+        else:
+            return 0    # there may be more tasks
+        if not self.manage_servers:
+            return time.time() + 3600   # nothing to do until new tasks
+        try:
+            # each kind of work once, as run() would do in consecutive loops
+            for _ in range(0, 3):
+                if not self._do_pending_work():
+                    break
+        except Exception as e:
+            self.logger.critical("Unexpected exception at run: " + str(e), exc_info=True)
+        next_run = self.next_update_server_status
+        if self.pending_terminate_server:
+            next_run = min(next_run, self.pending_terminate_server[0][0])
+        if self.localinfo_dirty:
+            next_run = min(next_run, time.time() + 1)   # retry saving
+        return next_run
+
+    def _process_task(self, task):
+        """
+        Process a task from the queue
+        :param task: tuple with the task name and its parameters
+        :return: 'exit' or 'reload' for these tasks, None otherwise
+        """
+        task_start = time.time()
+        if task[0] == 'instance':
+            self.logger.debug("processing task instance " + str(task[1]['action']))
+            retry = 0
+            while retry < 2:
+                retry += 1
+                r = self.action_on_server(task[1], retry==2)
+                if r >= 0:
+                    break
+        elif task[0] == 'image':
+            pass
+        elif task[0] == 'exit':
+            self.logger.debug("processing task exit")
+            self.terminate()
+            return 'exit'
+        elif task[0] == 'reload':
+            self.logger.debug("processing task reload terminating and relaunching")
+            self.terminate()
+            return 'reload'
+        elif task[0] == 'edit-iface':
+            self.logger.debug("processing task edit-iface port={}, old_net={}, new_net={}".format(
+                              task[1], task[2], task[3]))
+            self.edit_iface(task[1], task[2], task[3])
+        elif task[0] == 'restore-iface':
+            self.logger.debug("processing task restore-iface={} mac={}".format(task[1], task[2]))
+            self.restore_iface(task[1], task[2])
+        elif task[0] == 'new-ovsbridge':
+            self.logger.debug("Creating compute OVS bridge")
+            self.create_ovs_bridge()
+        elif task[0] == 'new-vxlan':
+            self.logger.debug("Creating vxlan tunnel='{}', remote ip='{}'".format(task[1], task[2]))
+            self.create_ovs_vxlan_tunnel(task[1], task[2])
+        elif task[0] == 'del-ovsbridge':
+            self.logger.debug("Deleting OVS bridge")
+            self.delete_ovs_bridge()
+        elif task[0] == 'del-vxlan':
+            self.logger.debug("Deleting vxlan {} tunnel".format(task[1]))
+            self.delete_ovs_vxlan_tunnel(task[1])
+        elif task[0] == 'create-ovs-bridge-port':
+            self.logger.debug("Adding port ovim-{} to OVS bridge".format(task[1]))
+            self.create_ovs_bridge_port(task[1])
+        elif task[0] == 'del-ovs-port':
+            self.logger.debug("Delete bridge attached to ovs port vlan {} net {}".format(task[1], task[2]))
+            self.delete_bridge_port_attached_to_ovs(task[1], task[2])
+        elif task[0] == 'ovs-port-up':
+            self.logger.debug("processing task ovs-port-up vlan={} mac={}".format(task[1]['vlan'], task[1]['mac']))
+            self.launch_ovs_port(task[1])
+        elif task[0] == 'ovs-port-down':
+            self.logger.debug("processing task ovs-port-down vlan={} fixed ips={}".format(task[1]['vlan'],
+                                                                                       task[1]['fixed_ips']))
+            self.delete_ovs_port(task[1])
+        else:
+            self.logger.debug("unknown task " + str(task))
+        metrics.observe("openvim_task_run_seconds", time.time() - task_start, thread="host." + self.name,
+                        task=task[0])
+
     def server_forceoff(self, wait_until_finished=False):
         while len(self.pending_terminate_server)>0:
             now = time.time()
@@ -467,7 +708,8 @@ class host_thread(threading.Thread):
             if self.localinfo_dirty:
                 self.save_localinfo()
             if not self.test:
-                self.ssh_conn.close()
+                with self.ssh_lock:
+                    self.ssh_conn.close()
         except Exception as e:
             text = str(e)
             self.logger.error("terminate Exception: " + text)
@@ -482,365 +724,20 @@ class host_thread(threading.Thread):
         """Function that implements the generation of the VM XML definition.
         Additional devices are in dev_list list
         The main disk is upon dev_list[0]"""
-        
-    #get if operating system is Windows        
-        windows_os = False
-        os_type = server_metadata.get('os_type', None)
-        if os_type == None and 'metadata' in dev_list[0]:
-            os_type = dev_list[0]['metadata'].get('os_type', None)
-        if os_type != None and os_type.lower() == "windows":
-            windows_os = True
-    #get type of hard disk bus  
-        bus_ide = True if windows_os else False   
-        bus = server_metadata.get('bus', None)
-        if bus == None and 'metadata' in dev_list[0]:
-            bus = dev_list[0]['metadata'].get('bus', None)
-        if bus != None:
-            bus_ide = True if bus=='ide' else False
-            
-        self.xml_level = 0
-        hypervisor = server.get('hypervisor', 'kvm')
-        os_type_img = server.get('os_image_type', 'other')
-
-        if hypervisor[:3] == 'xen':
-            text = "<domain type='xen'>"
-        else:
-            text = "<domain type='kvm'>"
-    #get topology
-        topo = server_metadata.get('topology', None)
-        if topo == None and 'metadata' in dev_list[0]:
-            topo = dev_list[0]['metadata'].get('topology', None)
-    #name
-        name = server.get('name', '')[:28] + "_" + server['uuid'][:28] #qemu impose a length  limit of 59 chars or not start. Using 58
-        text += self.inc_tab() + "<name>" + name+ "</name>"
-    #uuid
-        text += self.tab() + "<uuid>" + server['uuid'] + "</uuid>" 
-        
-        numa={}
-        if 'extended' in server and server['extended']!=None and 'numas' in server['extended']:
-            numa = server['extended']['numas'][0]
-    #memory
-        use_huge = False
-        memory = int(numa.get('memory',0))*1024*1024 #in KiB
-        if memory==0:
-            memory = int(server['ram'])*1024;
-        else:
-            if not self.develop_mode:
-                use_huge = True
-        if memory==0:
-            return -1, 'No memory assigned to instance'
-        memory = str(memory)
-        text += self.tab() + "<memory unit='KiB'>" +memory+"</memory>" 
-        text += self.tab() + "<currentMemory unit='KiB'>" +memory+ "</currentMemory>"
-        if use_huge:
-            text += self.tab()+'<memoryBacking>'+ \
-                self.inc_tab() + '<hugepages/>'+ \
-                self.dec_tab()+ '</memoryBacking>'
-
-    #cpu
-        use_cpu_pinning=False
-        vcpus = int(server.get("vcpus",0))
-        cpu_pinning = []
-        if 'cores-source' in numa:
-            use_cpu_pinning=True
-            for index in range(0, len(numa['cores-source'])):
-                cpu_pinning.append( [ numa['cores-id'][index], numa['cores-source'][index] ] )
-                vcpus += 1
-        if 'threads-source' in numa:
-            use_cpu_pinning=True
-            for index in range(0, len(numa['threads-source'])):
-                cpu_pinning.append( [ numa['threads-id'][index], numa['threads-source'][index] ] )
-                vcpus += 1
-        if 'paired-threads-source' in numa:
-            use_cpu_pinning=True
-            for index in range(0, len(numa['paired-threads-source'])):
-                cpu_pinning.append( [numa['paired-threads-id'][index][0], numa['paired-threads-source'][index][0] ] )
-                cpu_pinning.append( [numa['paired-threads-id'][index][1], numa['paired-threads-source'][index][1] ] )
-                vcpus += 2
-        
-        if use_cpu_pinning and not self.develop_mode:
-            text += self.tab()+"<vcpu placement='static'>" +str(len(cpu_pinning)) +"</vcpu>" + \
-                self.tab()+'<cputune>'
-            self.xml_level += 1
-            for i in range(0, len(cpu_pinning)):
-                text += self.tab() + "<vcpupin vcpu='" +str(cpu_pinning[i][0])+ "' cpuset='" +str(cpu_pinning[i][1]) +"'/>"
-            text += self.dec_tab()+'</cputune>'+ \
-                self.tab() + '<numatune>' +\
-                self.inc_tab() + "<memory mode='strict' nodeset='" +str(numa['source'])+ "'/>" +\
-                self.dec_tab() + '</numatune>'
-        else:
-            if vcpus==0:
-                return -1, "Instance without number of cpus"
-            text += self.tab()+"<vcpu>" + str(vcpus)  + "</vcpu>"
-
-    #boot
-        boot_cdrom = False
-        for dev in dev_list:
-            if dev['type']=='cdrom' :
-                boot_cdrom = True
-                break
-        if hypervisor == 'xenhvm':
-            text += self.tab()+ '<os>' + \
-                self.inc_tab() + "<type arch='x86_64' machine='xenfv'>hvm</type>"
-            text += self.tab() + "<loader type='rom'>/usr/lib/xen/boot/hvmloader</loader>"
-            if boot_cdrom:
-                text +=  self.tab() + "<boot dev='cdrom'/>" 
-            text +=  self.tab() + "<boot dev='hd'/>" + \
-                self.dec_tab()+'</os>'
-        elif hypervisor == 'xen-unik':
-            text += self.tab()+ '<os>' + \
-                self.inc_tab() + "<type arch='x86_64' machine='xenpv'>xen</type>"
-            text +=  self.tab() + "<kernel>" + str(dev_list[0]['source file']) + "</kernel>" + \
-                self.dec_tab()+'</os>'
-        else:
-            text += self.tab()+ '<os>' + \
-                self.inc_tab() + "<type arch='x86_64' machine='pc'>hvm</type>"
-            if boot_cdrom:
-                text +=  self.tab() + "<boot dev='cdrom'/>" 
-            text +=  self.tab() + "<boot dev='hd'/>" + \
-                self.dec_tab()+'</os>'
-    #features
-        text += self.tab()+'<features>'+\
-            self.inc_tab()+'<acpi/>' +\
-            self.tab()+'<apic/>' +\
-            self.tab()+'<pae/>'+ \
-            self.dec_tab() +'</features>'
-        if topo == "oneSocket:hyperthreading":
-            if vcpus % 2 != 0:
-                return -1, 'Cannot expose hyperthreading with an odd number of vcpus'
-            text += self.tab() + "<cpu mode='host-model'> <topology sockets='1' cores='%d' threads='2' /> </cpu>" % (vcpus/2)
-        elif windows_os or topo == "oneSocket":
-            text += self.tab() + "<cpu mode='host-model'> <topology sockets='1' cores='%d' threads='1' /> </cpu>" % vcpus
-        else:
-            text += self.tab() + "<cpu mode='host-model'></cpu>"
-        text += self.tab() + "<clock offset='utc'/>" +\
-            self.tab() + "<on_poweroff>preserve</on_poweroff>" + \
-            self.tab() + "<on_reboot>restart</on_reboot>" + \
-            self.tab() + "<on_crash>restart</on_crash>"
-        if hypervisor == 'xenhvm':
-            text += self.tab() + "<devices>" + \
-                self.inc_tab() + "<emulator>/usr/bin/qemu-system-i386</emulator>" + \
-                self.tab() + "<serial type='pty'>" +\
-                self.inc_tab() + "<target port='0'/>" + \
-                self.dec_tab() + "</serial>" +\
-                self.tab() + "<console type='pty'>" + \
-                self.inc_tab()+ "<target type='serial' port='0'/>" + \
-                self.dec_tab()+'</console>' #In some libvirt version may be: <emulator>/usr/lib64/xen/bin/qemu-dm</emulator> (depends on distro)
-        elif hypervisor == 'xen-unik':
-            text += self.tab() + "<devices>" + \
-                self.tab() + "<console type='pty'>" + \
-                self.inc_tab()+ "<target type='xen' port='0'/>" + \
-                self.dec_tab()+'</console>'
-        else:
-            text += self.tab() + "<devices>" + \
-                self.inc_tab() + "<emulator>/usr/libexec/qemu-kvm</emulator>" + \
-                self.tab() + "<serial type='pty'>" +\
-                self.inc_tab() + "<target port='0'/>" + \
-                self.dec_tab() + "</serial>" +\
-                self.tab() + "<console type='pty'>" + \
-                self.inc_tab()+ "<target type='serial' port='0'/>" + \
-                self.dec_tab()+'</console>'
-        if windows_os:
-            text += self.tab() + "<controller type='usb' index='0'/>" + \
-                self.tab() + "<controller type='ide' index='0'/>" + \
-                self.tab() + "<input type='mouse' bus='ps2'/>" + \
-                self.tab() + "<sound model='ich6'/>" + \
-                self.tab() + "<video>" + \
-                self.inc_tab() + "<model type='cirrus' vram='9216' heads='1'/>" + \
-                self.dec_tab() + "</video>" + \
-                self.tab() + "<memballoon model='virtio'/>" + \
-                self.tab() + "<input type='tablet' bus='usb'/>" #TODO revisar
-        elif hypervisor == 'xen-unik':
-            pass
-        else:
-            text += self.tab() + "<controller type='ide' index='0'/>" + \
-                self.tab() + "<input type='mouse' bus='ps2'/>" + \
-                self.tab() + "<input type='keyboard' bus='ps2'/>" + \
-                self.tab() + "<video>" + \
-                self.inc_tab() + "<model type='cirrus' vram='9216' heads='1'/>" + \
-                self.dec_tab() + "</video>"
-
-#>             self.tab()+'<alias name=\'hostdev0\'/>\n' +\
-#>             self.dec_tab()+'</hostdev>\n' +\
-#>             self.tab()+'<input type=\'tablet\' bus=\'usb\'/>\n'
-        if windows_os:
-            text += self.tab() + "<graphics type='vnc' port='-1' autoport='yes'/>"
-        else:
-            #If image contains 'GRAPH' include graphics
-            #if 'GRAPH' in image:
-            text += self.tab() + "<graphics type='vnc' port='-1' autoport='yes' listen='0.0.0.0'>" +\
-                self.inc_tab() + "<listen type='address' address='0.0.0.0'/>" +\
-                self.dec_tab() + "</graphics>"
-
-        vd_index = 'a'
-        for dev in dev_list:
-            bus_ide_dev = bus_ide
-            if (dev['type']=='cdrom' or dev['type']=='disk') and hypervisor != 'xen-unik':
-                if dev['type']=='cdrom':
-                    bus_ide_dev = True
-                text += self.tab() + "<disk type='file' device='"+dev['type']+"'>"
-                if 'file format' in dev:
-                    text += self.inc_tab() + "<driver name='qemu' type='"  +dev['file format']+ "' cache='writethrough'/>"
-                if 'source file' in dev:
-                    text += self.tab() + "<source file='" +dev['source file']+ "'/>"
-                #elif v['type'] == 'block':
-                #    text += self.tab() + "<source dev='" + v['source'] + "'/>"
-                #else:
-                #    return -1, 'Unknown disk type ' + v['type']
-                vpci = dev.get('vpci',None)
-                if vpci == None and 'metadata' in dev:
-                    vpci = dev['metadata'].get('vpci',None)
-                text += self.pci2xml(vpci)
-               
-                if bus_ide_dev:
-                    text += self.tab() + "<target dev='hd" +vd_index+ "' bus='ide'/>"   #TODO allows several type of disks
-                else:
-                    text += self.tab() + "<target dev='vd" +vd_index+ "' bus='virtio'/>" 
-                text += self.dec_tab() + '</disk>'
-                vd_index = chr(ord(vd_index)+1)
-            elif dev['type']=='xml':
-                dev_text = dev['xml']
-                if 'vpci' in dev:
-                    dev_text = dev_text.replace('__vpci__', dev['vpci'])
-                if 'source file' in dev:
-                    dev_text = dev_text.replace('__file__', dev['source file'])
-                if 'file format' in dev:
-                    dev_text = dev_text.replace('__format__', dev['source file'])
-                if '__dev__' in dev_text:
-                    dev_text = dev_text.replace('__dev__', vd_index)
-                    vd_index = chr(ord(vd_index)+1)
-                text += dev_text
-            elif hypervisor == 'xen-unik':
-                pass
-            else:
-                return -1, 'Unknown device type ' + dev['type']
-
-        net_nb=0
-        bridge_interfaces = server.get('networks', [])
-        for v in bridge_interfaces:
-            #Get the brifge name
-            result, content = self.db.get_table(FROM='nets', SELECT=('provider',),WHERE={'uuid':v['net_id']} )
-            if result <= 0:
+        providers = {}
+        net_ids = [v['net_id'] for v in server.get('networks', [])]
+        if net_ids:
+            result, content = self.db.get_table(FROM='nets', SELECT=('uuid', 'provider'), WHERE={'uuid': net_ids})
+            if result < 0:
                 self.logger.error("create_xml_server ERROR %d getting nets %s", result, content)
                 return -1, content
-            #ALF: Allow by the moment the 'default' bridge net because is confortable for provide internet to VM
-            #I know it is not secure    
-            #for v in sorted(desc['network interfaces'].itervalues()):
-            model = v.get("model", None)
-            if content[0]['provider']=='default':
-                text += self.tab() + "<interface type='network'>" + \
-                    self.inc_tab() + "<source network='" +content[0]['provider']+ "'/>"
-            elif content[0]['provider'][0:7]=='macvtap':
-                text += self.tab()+"<interface type='direct'>" + \
-                    self.inc_tab() + "<source dev='" + self.get_local_iface_name(content[0]['provider'][8:]) + "' mode='bridge'/>" + \
-                    self.tab() + "<target dev='macvtap0'/>"
-                if windows_os:
-                    text += self.tab() + "<alias name='net" + str(net_nb) + "'/>"
-                elif model==None:
-                    model = "virtio"
-            elif content[0]['provider'][0:6]=='bridge':
-                text += self.tab() + "<interface type='bridge'>" +  \
-                    self.inc_tab()+"<source bridge='" +self.get_local_iface_name(content[0]['provider'][7:])+ "'/>"
-                if windows_os:
-                    text += self.tab() + "<target dev='vnet" + str(net_nb)+ "'/>" +\
-                        self.tab() + "<alias name='net" + str(net_nb)+ "'/>"
-                elif model==None:
-                    model = "virtio"
-            elif content[0]['provider'][0:3] == "OVS":
-                vlan = content[0]['provider'].replace('OVS:', '')
-                text += self.tab() + "<interface type='bridge'>" + \
-                        self.inc_tab() + "<source bridge='ovim-" + str(vlan) + "'/>"
-                if hypervisor == 'xenhvm' or hypervisor == 'xen-unik':
-                    text += self.tab() + "<script path='vif-openvswitch'/>"
-            else:
-                return -1, 'Unknown Bridge net provider ' + content[0]['provider']
-            if model!=None:
-                text += self.tab() + "<model type='" +model+ "'/>"
-            if v.get('mac_address', None) != None:
-                text+= self.tab() +"<mac address='" +v['mac_address']+ "'/>"
-            text += self.pci2xml(v.get('vpci',None))
-            text += self.dec_tab()+'</interface>'
-            
-            net_nb += 1
-
-        interfaces = numa.get('interfaces', [])
-
-        net_nb=0
-        for v in interfaces:
-            if self.develop_mode: #map these interfaces to bridges
-                text += self.tab() + "<interface type='bridge'>" +  \
-                    self.inc_tab()+"<source bridge='" +self.develop_bridge_iface+ "'/>"
-                if windows_os:
-                    text += self.tab() + "<target dev='vnet" + str(net_nb)+ "'/>" +\
-                        self.tab() + "<alias name='net" + str(net_nb)+ "'/>"
-                else:
-                    text += self.tab() + "<model type='e1000'/>" #e1000 is more probable to be supported than 'virtio'
-                if v.get('mac_address', None) != None:
-                    text+= self.tab() +"<mac address='" +v['mac_address']+ "'/>"
-                text += self.pci2xml(v.get('vpci',None))
-                text += self.dec_tab()+'</interface>'
-                continue
-                
-            if v['dedicated'] == 'yes':  #passthrought
-                text += self.tab() + "<hostdev mode='subsystem' type='pci' managed='yes'>" + \
-                    self.inc_tab() + "<source>"
-                self.inc_tab()
-                text += self.pci2xml(v['source'])
-                text += self.dec_tab()+'</source>'
-                text += self.pci2xml(v.get('vpci',None))
-                if windows_os:
-                    text += self.tab() + "<alias name='hostdev" + str(net_nb) + "'/>"
-                text += self.dec_tab()+'</hostdev>'
-                net_nb += 1
-            else:        #sriov_interfaces
-                #skip not connected interfaces
-                if v.get("net_id") == None:
-                    continue
-                text += self.tab() + "<interface type='hostdev' managed='yes'>"
-                self.inc_tab()
-                if v.get('mac_address', None) != None:
-                    text+= self.tab() + "<mac address='" +v['mac_address']+ "'/>"
-                text+= self.tab()+'<source>'
-                self.inc_tab()
-                text += self.pci2xml(v['source'])
-                text += self.dec_tab()+'</source>'
-                if v.get('vlan',None) != None:
-                    text += self.tab() + "<vlan>   <tag id='" + str(v['vlan']) + "'/>   </vlan>"
-                text += self.pci2xml(v.get('vpci',None))
-                if windows_os:
-                    text += self.tab() + "<alias name='hostdev" + str(net_nb) + "'/>"
-                text += self.dec_tab()+'</interface>'
-
-            
-        text += self.dec_tab()+'</devices>'+\
-        self.dec_tab()+'</domain>'
-        return 0, text
-    
-    def pci2xml(self, pci):
-        '''from a pci format text XXXX:XX:XX.X generates the xml content of <address>
-        alows an empty pci text'''
-        if pci is None:
-            return ""
-        first_part = pci.split(':')
-        second_part = first_part[2].split('.')
-        return self.tab() + "<address type='pci' domain='0x" + first_part[0] + \
-                    "' bus='0x" + first_part[1] + "' slot='0x" + second_part[0] + \
-                    "' function='0x" + second_part[1] + "'/>" 
-    
-    def tab(self):
-        """Return indentation according to xml_level"""
-        return "\n" + ('  '*self.xml_level)
-    
-    def inc_tab(self):
-        """Increment and return indentation according to xml_level"""
-        self.xml_level += 1
-        return self.tab()
-    
-    def dec_tab(self):
-        """Decrement and return indentation according to xml_level"""
-        self.xml_level -= 1
-        return self.tab()
+            for net in content:
+                providers[net['uuid']] = net['provider']
+        iface_names = self.hostinfo.get("iface_names") if self.hostinfo else None
+        return domain_xml.render_domain(server, dev_list, server_metadata, providers, self.develop_mode,
+                                        self.develop_bridge_iface, iface_names)
 
+    @ssh_serialized
     def create_ovs_bridge(self):
         """
         Create a bridge in compute OVS to allocate VMs
@@ -878,6 +775,7 @@ class host_thread(threading.Thread):
             self.logger.error("delete_port_to_ovs_bridge ssh Exception: {}".format(str(e)))
             return False
 
+    @ssh_serialized
     def delete_dhcp_server(self, vlan, net_uuid, dhcp_path):
         """
         Delete dhcp server process lining in namespace
@@ -958,6 +856,7 @@ class host_thread(threading.Thread):
             self.logger.error("add_port_to_ovs_bridge Exception: " + str(e))
             return False
 
+    @ssh_serialized
     def delete_dhcp_port(self, vlan, net_uuid, dhcp_path):
         """
         Delete from an existing OVS bridge a linux bridge port attached and the linux bridge itself.
@@ -974,6 +873,7 @@ class host_thread(threading.Thread):
         self.delete_dhcp_interfaces(vlan, dhcp_path)
         return True
 
+    @ssh_serialized
     def delete_bridge_port_attached_to_ovs(self, vlan, net_uuid):
         """
         Delete from an existing OVS bridge a linux bridge port attached and the linux bridge itself.
@@ -1049,6 +949,7 @@ class host_thread(threading.Thread):
             self.logger.error("remove_link_bridge_to_ovs Exception: {}".format(str(e)))
             return False
 
+    @ssh_serialized
     def create_ovs_bridge_port(self, vlan):
         """
         Generate a linux bridge and attache the port to a OVS bridge
@@ -1087,6 +988,7 @@ class host_thread(threading.Thread):
             self.logger.error("create_linux_bridge ssh Exception: {}".format(str(e)))
             return False
 
+    @ssh_serialized
     def set_mac_dhcp_server(self, ip, mac, vlan, netmask, first_ip, dhcp_path):
         """
         Write into dhcp conf file a rule to assigned a fixed ip given to an specific MAC address
@@ -1139,6 +1041,7 @@ class host_thread(threading.Thread):
             self.logger.error("set_mac_dhcp_server ssh Exception: " + str(e))
             return False
 
+    @ssh_serialized
     def delete_mac_dhcp_server(self, ip, mac, vlan, dhcp_path):
         """
         Delete into dhcp conf file the ip  assigned to a specific MAC address
@@ -1170,6 +1073,7 @@ class host_thread(threading.Thread):
             self.logger.error("delete_mac_dhcp_server Exception: " + str(e))
             return False
 
+    @ssh_serialized
     def launch_dhcp_server(self, vlan, ip_range, netmask, dhcp_path, gateway, dns_list=None, routes=None):
         """
         Generate a linux bridge and attache the port to a OVS bridge
@@ -1282,6 +1186,7 @@ class host_thread(threading.Thread):
             self.logger.error("delete_dhcp_interfaces ssh Exception: {}".format(str(e)))
             return False
 
+    @ssh_serialized
     def create_dhcp_interfaces(self, vlan, ip_listen_address, netmask):
         """
         Create a linux bridge with STP active
@@ -1577,6 +1482,97 @@ class host_thread(threading.Thread):
             self.logger.error("create_link_bridge_to_ovs, Error creating link to ovs, {}".format(str(e)))
             return False
 
+    @ssh_serialized
+    def create_links_to_ovs(self, vlan, gateway, dhcp_cidr, links=None, routes=None):
+        """
+        Create the connections (veth) between user bridges (links) and OVS, and the qrouter of the nat links
+        :param vlan: segmentation id
+        :param gateway: net gateway
+        :param dhcp_cidr: net cidr
+        :param links: list of links, each one with 'iface' or 'nat'
+        :param routes: routes to add at the dhcp namespace
+        :return: None
+        """
+        if not links:
+            return
+        for link in links:
+            if 'iface' in link and 'nat' not in link:
+                self.create_link_bridge_to_ovs(vlan, link['iface'])
+            elif 'nat' in link:
+                self.create_qrouter_ovs_connection(vlan, gateway, dhcp_cidr)
+                self.create_qrouter_br_connection(vlan, dhcp_cidr, link)
+        if routes:
+            self.add_ns_routes(vlan, routes)
+
+    @ssh_serialized
+    def delete_links_to_ovs(self, vlan, links=None):
+        """
+        Delete the connections (veth) between user bridges (links) and OVS
+        :param vlan: segmentation id
+        :param links: list of links, each one with 'iface' or 'nat'
+        :return: None
+        """
+        if not links:
+            return
+        for link in links:
+            if 'iface' in link and 'nat' not in link:
+                self.remove_link_bridge_to_ovs(vlan, link['iface'])
+            elif 'nat' in link:
+                self.delete_qrouter_connection(vlan, link['iface'])
+
+    @ssh_serialized
+    def launch_ovs_port(self, port):
+        """
+        Set up the dhcp server and links of the ovs network of a new server port, and the fixed ip of the port at the
+        dhcp server. Run as the 'ovs-port-up' task, so that it is ordered with the deletion of the port
+        :param port: dictionary with net_id, vlan, mac, ip_address (None if out of the dhcp range), dhcp_path; and the
+            net enable_dhcp, dhcp_first_ip, dhcp_last_ip, netmask, cidr, gateway_ip and the yaml texts dns, routes, links
+        :return: None. On error the net is set to ERROR status
+        """
+        vlan = port['vlan']
+        try:
+            dns = yaml.safe_load(port['dns']) if port.get('dns') else None
+            routes = yaml.safe_load(port['routes']) if port.get('routes') else None
+            links = yaml.safe_load(port['links']) if port.get('links') else None
+            if port.get('enable_dhcp'):
+                self.create_dhcp_interfaces(vlan, port['dhcp_first_ip'], port['netmask'])
+                self.launch_dhcp_server(vlan, [port['dhcp_first_ip'], port['dhcp_last_ip']], port['netmask'],
+                                        port['dhcp_path'], port['gateway_ip'], dns, routes)
+                self.set_mac_dhcp_server(port['ip_address'], port['mac'], vlan, port['netmask'],
+                                         port['dhcp_first_ip'], port['dhcp_path'])
+            self.create_links_to_ovs(vlan, port['gateway_ip'], port['cidr'], links, routes)
+        except Exception as e:
+            self.logger.error("launch_ovs_port net_id='%s' mac='%s' Exception: %s", port['net_id'], port['mac'],
+                              str(e), exc_info=True)
+            last_error = "Fail at launching dhcp server: " + str(e)
+            if self.set_net_status:
+                self.set_net_status(port['net_id'], "ERROR", last_error)
+            else:
+                self.db.update_rows("nets", UPDATE={"status": "ERROR", "last_error": last_error},
+                                    WHERE={"uuid": port['net_id']})
+
+    @ssh_serialized
+    def delete_ovs_port(self, port):
+        """
+        Delete the dhcp server, the fixed ips and the links of the ovs network of deleted server ports. Run as the
+        'ovs-port-down' task
+        :param port: dictionary with net_id, vlan, fixed_ips as a list of (ip_address, mac), dhcp_path and the yaml
+            text links of the net
+        :return: None
+        """
+        vlan = port['vlan']
+        try:
+            self.delete_dhcp_server(vlan, port['net_id'], port['dhcp_path'])
+            self.delete_dhcp_port(vlan, port['net_id'], port['dhcp_path'])
+            for ip_address, mac in port['fixed_ips']:
+                self.delete_mac_dhcp_server(ip_address, mac, vlan, port['dhcp_path'])
+            if port.get('links'):
+                self.delete_links_to_ovs(vlan, yaml.safe_load(port['links']))
+        except Exception as e:
+            self.logger.error("delete_ovs_port net_id='%s' fixed ips='%s' Exception: %s", port['net_id'],
+                              port['fixed_ips'], str(e), exc_info=True)
+
+    @ssh_serialized
     def create_ovs_vxlan_tunnel(self, vxlan_interface, remote_ip):
         """
         Create a vlxn tunnel between to computes with an OVS installed. STP is also active at port level
@@ -1603,6 +1599,7 @@ class host_thread(threading.Thread):
             self.logger.error("create_ovs_vxlan_tunnel, error creating vxlan tunnel, {}".format(str(e)))
             return False
 
+    @ssh_serialized
     def delete_ovs_vxlan_tunnel(self, vxlan_interface):
         """
         Delete a vlxan tunnel  port from a OVS brdige.
@@ -1619,6 +1616,7 @@ class host_thread(threading.Thread):
             self.logger.error("delete_ovs_vxlan_tunnel, error deleting vxlan tunenl, {}".format(str(e)))
             return False
 
+    @ssh_serialized
     def delete_ovs_bridge(self):
         """
         Delete a OVS bridge from  a compute.
@@ -1779,7 +1777,7 @@ class host_thread(threading.Thread):
                 #TODO DELETE local file if this file is not used by any active virtual machine
                 try:
                     self.delete_file(local_file)
-                    del self.localinfo['files'][remote_file]
+                    self.del_localinfo('files', remote_file)
                 except Exception:
                     pass
                 local_file = None
@@ -1796,7 +1794,7 @@ class host_thread(threading.Thread):
             self.copy_file(remote_file, local_file, use_incremental_out)
 
             if use_incremental_out:
-                self.localinfo['files'][remote_file] = local_file
+                self.set_localinfo('files', remote_file, local_file)
             if new_backing_file:
                 self.qemu_change_backing(local_file, new_backing_file)
             qemu_info = self.qemu_get_info(local_file)
@@ -1860,8 +1858,11 @@ class host_thread(threading.Thread):
 
                     continue
                 else:
-                    result, content = self.db.get_table(FROM='images', SELECT=('path', 'metadata'),
-                                                        WHERE={'uuid': image_id})
+                    if self.metadata_cache:
+                        result, content = self.metadata_cache.get_image(self.db, image_id)
+                    else:
+                        result, content = self.db.get_table(FROM='images', SELECT=('path', 'metadata'),
+                                                            WHERE={'uuid': image_id})
                     if result <= 0:
                         error_text = "ERROR", result, content, "when getting image", dev['image_id']
                         self.logger.error("launch_server " + error_text)
@@ -1899,8 +1900,7 @@ class host_thread(threading.Thread):
                 dev['source file'] = local_file 
                 dev['file format'] = qemu_info['file format']
 
-            self.localinfo['server_files'][ server['uuid'] ] = server_host_files
-            self.localinfo_dirty = True
+            self.set_localinfo('server_files', server['uuid'], server_host_files)
 
         #3 Create XML
             result, xml = self.create_xml_server(server_data, devices, server_metadata)  #local_file
@@ -1913,7 +1913,8 @@ class host_thread(threading.Thread):
             if not rebuild: #ensures that any pending destroying server is done
                 self.server_forceoff(True)
             #self.logger.debug("launching instance " + xml)
-            conn.createXML(xml, atribute)
+            with metrics.timer("openvim_libvirt_call_seconds", call="createXML"):
+                conn.createXML(xml, atribute)
             #self.server_status[server_id] = 'PAUSED' if paused == "yes" else 'ACTIVE'
 
             return 0, 'Success'
@@ -1945,9 +1946,12 @@ class host_thread(threading.Thread):
         if self.test or len(self.server_status)==0:
             return
 
+        poll_start = time.time()
         try:
-            conn = host_thread.lvirt_module.open(self.lvirt_conn_uri)
-            domains=  conn.listAllDomains() 
+            with metrics.timer("openvim_libvirt_call_seconds", call="open"):
+                conn = host_thread.lvirt_module.open(self.lvirt_conn_uri)
+            with metrics.timer("openvim_libvirt_call_seconds", call="listAllDomains"):
+                domains = conn.listAllDomains()
             domain_dict={}
             for domain in domains:
                 uuid = domain.UUIDString() ;
@@ -1969,6 +1973,8 @@ class host_thread(threading.Thread):
             self.logger.error("get_state() Exception " + e.get_error_message())
             return
 
+        # collect the changes and write them with a single statement
+        changes = {}
         for server_id, current_status in self.server_status.iteritems():
             new_status = None
             if server_id in domain_dict:
@@ -1982,12 +1988,20 @@ class host_thread(threading.Thread):
                 continue #keep ERROR status, because obviously this machine is not running
             #change status
             self.logger.debug("server id='%s' status change from '%s' to '%s'", server_id, current_status, new_status)
-            STATUS={'progress':100, 'status':new_status}
+            STATUS={'status':new_status}
             if new_status == 'ERROR':
                 STATUS['last_error'] = 'machine has crashed'
-            r,_ = self.db.update_rows('instances', STATUS, {'uuid':server_id}, log=False)
-            if r>=0:
-                self.server_status[server_id] = new_status
+            changes[server_id] = STATUS
+        if changes:
+            r, c = self.db.update_rows_by_key('instances', 'uuid', changes, UPDATE={'progress': 100})
+            if r >= 0:
+                for server_id, STATUS in changes.items():
+                    self.server_status[server_id] = STATUS['status']
+            else:
+                self.logger.error("update_servers_status cannot update %d servers: %s", len(changes), c)
+        self.status_report = {"last_poll": poll_start, "poll_duration": time.time() - poll_start,
+                              "domains": len(domain_dict), "changes": len(changes),
+                              "total_changes": self.status_report["total_changes"] + len(changes)}
                         
     def action_on_server(self, req, last_retry=True):
         '''Perform an action on a req
@@ -2033,9 +2047,11 @@ class host_thread(threading.Thread):
                 self.create_image(None, req)
         else:
             try:
-                conn = host_thread.lvirt_module.open(self.lvirt_conn_uri)
+                with metrics.timer("openvim_libvirt_call_seconds", call="open"):
+                    conn = host_thread.lvirt_module.open(self.lvirt_conn_uri)
                 try:
-                    dom = conn.lookupByUUIDString(server_id)
+                    with metrics.timer("openvim_libvirt_call_seconds", call="lookupByUUIDString"):
+                        dom = conn.lookupByUUIDString(server_id)
                 except host_thread.lvirt_module.libvirtError as e:
                     text = e.get_error_message()
                     if 'LookupByUUIDString' in text or 'Domain not found' in text or 'No existe un dominio coincidente' in text:
@@ -2095,8 +2111,7 @@ class host_thread(threading.Thread):
                                     self.delete_file(file_['source file'])
                                 except Exception:
                                     pass
-                            del self.localinfo['server_files'][ req['uuid'] ]
-                            self.localinfo_dirty = True
+                            self.del_localinfo('server_files', req['uuid'])
 
                 elif 'shutoff' in req['action'] or 'shutdown' in req['action']:
                     try:
@@ -2291,6 +2306,8 @@ class host_thread(threading.Thread):
                 #TODO insert a last_error at database
         self.db.update_rows('images', {'status':image_status, 'progress': 100, 'path':file_dst},
                 {'uuid':req['new_image']['uuid']}, log=True)
+        if self.metadata_cache:
+            self.metadata_cache.invalidate('images', req['new_image']['uuid'])
 
     def edit_iface(self, port_id, old_net, new_net):
         #This action imply remove and insert interface to put proper parameters
@@ -2312,10 +2329,9 @@ class host_thread(threading.Thread):
                 return
             #create xml detach file
             xml=[]
-            self.xml_level = 2
             xml.append("<interface type='hostdev' managed='yes'>")
             xml.append("  <mac address='" +port['mac']+ "'/>")
-            xml.append("  <source>"+ self.pci2xml(port['pci'])+"\n  </source>")
+            xml.append("  <source>"+ domain_xml.pci2xml(port['pci'], 2)+"\n  </source>")
             xml.append('</interface>')
 
             
@@ -2329,8 +2345,7 @@ class host_thread(threading.Thread):
                     dom.detachDeviceFlags(text, flags=host_thread.lvirt_module.VIR_DOMAIN_AFFECT_LIVE)
                 if new_net:
                     xml[-1] ="  <vlan>   <tag id='" + str(port['vlan']) + "'/>   </vlan>"
-                    self.xml_level = 1
-                    xml.append(self.pci2xml(port.get('vpci',None)) )
+                    xml.append(domain_xml.pci2xml(port.get('vpci',None), 1))
                     xml.append('</interface>')                
                     text="\n".join(xml)
                     self.logger.debug("edit_iface attaching SRIOV interface " + text)
@@ -31,25 +31,36 @@ __date__ ="$10-jul-2014 12:07:15$"
 
 import bottle
 import urlparse
+import urllib
 import yaml
 import json
 import threading
+import itertools
 import datetime
 import hashlib
 import os
 import imp
 import socket
+import functools
+import SocketServer
+import wsgiref.simple_server
 from netaddr import IPNetwork, IPAddress, all_matching_cidrs
 #import only if needed because not needed in test mode. To allow an easier installation   import RADclass
-from jsonschema import validate as js_v, exceptions as js_e
+from jsonschema import exceptions as js_e
+from schema_validator import validate as js_v
 import host_thread as ht
+import auxiliary_functions as af
 from vim_schema import host_new_schema, host_edit_schema, tenant_new_schema, \
     tenant_edit_schema, \
     flavor_new_schema, flavor_update_schema, \
     image_new_schema, image_update_schema, \
-    server_new_schema, server_action_schema, network_new_schema, network_update_schema, \
+    server_new_schema, server_action_schema, server_delete_schema, network_new_schema, network_update_schema, \
     port_new_schema, port_update_schema, openflow_controller_schema, of_port_map_new_schema
 import ovim
+import vim_db
+import cluster
+import metrics
+import job_pool
 import logging
 
 global my
@@ -201,6 +212,12 @@ def delete_nulls(var):
     return False
 
 
+class _ThreadingWSGIServer(SocketServer.ThreadingMixIn, wsgiref.simple_server.WSGIServer):
+    """WSGI server that attends each request at a new thread"""
+    daemon_threads = True
+    request_queue_size = 128    # connections waiting to be accepted, when many clients poll at once
+
+
 class httpserver(threading.Thread):
     def __init__(self, ovim, name="http", host='localhost', port=8080, admin=False, config_=None):
         '''
@@ -241,10 +258,45 @@ class httpserver(threading.Thread):
         self.daemon = True      
         self.setDaemon(True)
         self.logger = logging.getLogger("openvim.http")
+        self.host_jobs = None
+        self.openflow_jobs = None
+        self.jobs_lock = threading.Lock()
+        self.write_lock = threading.RLock()    # also taken by the jobs that write, as host registration
          
     def run(self):
-        bottle.run(host=self.host, port=self.port, debug=True) #quiet=True
+        bottle.run(app=self.serve, host=self.host, port=self.port, debug=True,
+                   server_class=_ThreadingWSGIServer) #quiet=True
+
+    def serve(self, environ, start_response):
+        """WSGI application, run at a thread per request. The thread takes the name of this server, as handlers find
+        their server with it. GET requests run concurrently, and the rest one at a time as in a single thread server"""
+        threading.current_thread().name = self.name
+        if environ.get('REQUEST_METHOD') in ('GET', 'HEAD'):
+            return bottle.default_app()(environ, start_response)
+        with self.write_lock:
+            return bottle.default_app()(environ, start_response)
            
+    def get_host_jobs(self):
+        """Return the pool of host-discovery jobs, created at first use"""
+        return self._get_job_pool("host_jobs", config_dic.get('host_discovery_workers', 8), "-discovery")
+
+    def get_openflow_jobs(self):
+        """Return the pool of openflow-reinstall jobs, created at first use. One worker is enough, as each job
+        already sends the requests to the openflow controllers concurrently"""
+        return self._get_job_pool("openflow_jobs", 1, "-openflow")
+
+    def _get_job_pool(self, attribute, workers, suffix):
+        """Return the pool of jobs stored at an attribute, created at first use. Worker threads are registered as
+        this http thread, so that handler functions find their http server with the thread name"""
+        with self.jobs_lock:
+            if not getattr(self, attribute):
+                jobs = job_pool.JobPool(workers, name=self.name + suffix, logger_name="openvim.http")
+                for thread_name in jobs.thread_names:
+                    config_dic['http_threads'][thread_name] = self
+                jobs.start()
+                setattr(self, attribute, jobs)
+            return getattr(self, attribute)
+
     def gethost(self, host_id):
         result, content = self.db.get_host(host_id)
         if result < 0:
@@ -291,16 +343,94 @@ def change_keys_http2db(data, http_db, reverse=False):
 
 
 
+def is_compact_output():
+    '''Check if the client requests a compact (not indented) json output, either with the query string 'compact' or
+    with the header 'X-Output-Format: compact' '''
+    compact = bottle.request.query.get('compact')
+    if compact is not None:
+        return compact.lower() not in ('false', 'no', '0')
+    return bottle.request.headers.get('X-Output-Format', '').lower() == 'compact'
+
 def format_out(data):
     '''return string of dictionary data according to requested json, yaml, xml. By default json'''
-    if 'application/yaml' in bottle.request.headers.get('Accept'):
+    if 'application/yaml' in bottle.request.headers.get('Accept', ''):
         bottle.response.content_type='application/yaml'
         return yaml.safe_dump(data, explicit_start=True, indent=4, default_flow_style=False, tags=False, encoding='utf-8', allow_unicode=True) #, canonical=True, default_style='"'
     else: #by default json
         bottle.response.content_type='application/json'
-        #return data #json no style
+        if is_compact_output():
+            return json.dumps(data, separators=(',', ':')) + "\n"
         return json.dumps(data, indent=4) + "\n"
 
+def coalesce_get(*tables):
+    '''Decorator of GET handlers polled by many clients. Identical requests, with the same server, path, query string
+    and output format headers, share the response while it is computed and for a short time after, see response_cache.
+    Attributes:
+        'tables': database tables read by the handler. A write to any of them discards the shared response
+    '''
+    def decorator(handler):
+        @functools.wraps(handler)
+        def coalesced_handler(*args, **kwargs):
+            cache = config_dic.get('response_cache')
+            if not cache:
+                return handler(*args, **kwargs)
+            request = bottle.request
+            key = (threading.current_thread().name, request.path, request.query_string,
+                   request.headers.get('Accept', ''), request.headers.get('X-Output-Format', ''))
+            status, content_type, body = cache.get(key, tables,
+                                                   lambda: _compute_response(handler, args, kwargs, cache.max_body),
+                                                   lambda response: isinstance(response[2], basestring))
+            bottle.response.status = status
+            bottle.response.content_type = content_type
+            return body
+        return coalesced_handler
+    return decorator
+
+def conditional_get(*tables):
+    '''Decorator of GET handlers that answers with an ETag, derived from the change counters of the database tables read
+    by the handler, see vim_db.get_table_versions. A request whose If-None-Match header contains it is answered with
+    304 Not Modified, without running the handler. Not used with cluster, as changes by other instances are not counted
+    Attributes:
+        'tables': database tables read by the handler, including the ones read to check the tenant
+    '''
+    def decorator(handler):
+        @functools.wraps(handler)
+        def conditional_handler(*args, **kwargs):
+            if config_dic.get('cluster_member'):
+                return handler(*args, **kwargs)
+            request = bottle.request
+            # counters are read before the handler, so that a change while it runs gives a new ETag at next request
+            etag = '"' + hashlib.md5(repr((vim_db.get_table_versions(tables), threading.current_thread().name,
+                                           request.path, request.query_string, request.headers.get('Accept', ''),
+                                           request.headers.get('X-Output-Format', '')))).hexdigest() + '"'
+            if_none_match = request.headers.get('If-None-Match')
+            if if_none_match and (if_none_match.strip() == "*" or etag in
+                                  [tag.strip().replace("W/", "", 1) for tag in if_none_match.split(",")]):
+                bottle.response.status = 304
+                bottle.response.set_header('ETag', etag)
+                return ""
+            body = handler(*args, **kwargs)
+            bottle.response.set_header('ETag', etag)
+            return body
+        return conditional_handler
+    return decorator
+
+def _compute_response(handler, args, kwargs, max_body):
+    '''Run a handler, reading the body when it is streamed up to max_body bytes. Return the status, content type and
+    body; the body is a text that can be shared, or the rest of the stream for larger ones, that keep streaming'''
+    body = handler(*args, **kwargs)
+    if not isinstance(body, basestring):
+        chunks = []
+        size = 0
+        body = iter(body)
+        for chunk in body:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > max_body:
+                return bottle.response.status_line, bottle.response.content_type, itertools.chain(chunks, body)
+        body = "".join(chunks)
+    return bottle.response.status_line, bottle.response.content_type, body
+
 def format_in(schema):
     try:
         error_text = "Invalid header format "
@@ -353,6 +483,7 @@ def filter_query_string(qs, http2db, allowed):
         select: list of items to retrieve, filtered by query string 'field=token'. If no 'field' is present, allowed list is returned
         where: dictionary with key, value, taken from the query string token=value. Empty if nothing is provided
         limit: limit dictated by user with the query string 'limit'. 100 by default
+    The pagination token 'marker' and the output token 'compact' are skipped, see get_marker and is_compact_output
     abort if not permitted, using bottel.abort
     '''
     where = {}
@@ -373,6 +504,8 @@ def filter_query_string(qs, http2db, allowed):
                     limit = int(qs[k])
                 except:
                     bottle.abort(HTTP_Bad_Request, "Invalid query string at 'limit=" + qs[k] + "'")
+            elif k == 'marker' or k == 'compact':
+                continue
             else:
                 if k not in allowed:
                     bottle.abort(HTTP_Bad_Request, "Invalid query string at '" + k + "=" + qs[k] + "'")
@@ -391,6 +524,109 @@ def filter_query_string(qs, http2db, allowed):
 
     return select, where, limit
 
+def get_marker(qs):
+    '''Obtain the pagination marker from the query string 'marker=<uuid>'. The marker is the id of the last element of
+    the previous page; listings are ordered by uuid so the next page starts just after it
+    Attributes:
+        'qs': bottle.FormsDict variable to be processed
+    Return: the marker uuid or None if not present. abort if it is not a valid uuid, using bottle.abort
+    '''
+    marker = qs.get('marker')
+    if not marker:
+        return None
+    if not af.check_valid_uuid(marker):
+        bottle.abort(HTTP_Bad_Request, "Invalid query string at 'marker=" + marker + "'")
+    return marker
+
+def add_next_link(data, key, limit):
+    '''Adds to data a '<key>_links' list with the link to the next page when the listing data[key] has been truncated
+    by limit. The link keeps the current query string, replacing the 'marker' with the id of the last element
+    Attributes:
+        'data': dictionary with the listing to return
+        'key': key of data that contains the list of elements, with an 'id' field each
+        'limit': limit used at the database query
+    Return:
+        None
+    '''
+    rows = data.get(key)
+    if not limit or not rows or len(rows) < limit or 'id' not in rows[-1]:
+        return
+    data[key + '_links'] = [{'href': next_link_prefix() + str(rows[-1]['id']), 'rel': 'next'}]
+
+def next_link_prefix():
+    '''Return the url of the current request, keeping the query string but the 'marker', and ending with 'marker='
+    so that appending the id of the last element gives the link to the next page'''
+    my = config_dic['http_threads'][threading.current_thread().name]
+    qs = urllib.urlencode([(k, v) for k, v in bottle.request.query.allitems() if k != 'marker'])
+    return my.url_preffix + bottle.request.path[len(url_base):] + '?' + qs + ('&' if qs else '') + 'marker='
+
+def format_out_list(key, chunks, convert_row, limit):
+    '''Streaming version of format_out for large listings. Rows are encoded and sent one by one as they are read
+    from the database, so the first byte is sent as soon as the first chunk is read and memory is bounded
+    Attributes:
+        'key': name of the list at the output document, e.g. 'servers'
+        'chunks': iterable of (result, rows) as returned by vim_db.get_table_by_chunks. An error (result < 0) after
+            the response has started can not be reported, the listing is truncated and the error logged
+        'convert_row': function applied to each row before encoding it (key translation, links, ...)
+        'limit': limit used at the query, for building the 'next' link
+    Return: a generator with the json or yaml text
+    '''
+    if 'application/yaml' in bottle.request.headers.get('Accept', ''):
+        bottle.response.content_type = 'application/yaml'
+        yaml_format = True
+        compact = False
+    else:
+        bottle.response.content_type = 'application/json'
+        yaml_format = False
+        compact = is_compact_output()
+    link_prefix = next_link_prefix()
+    logger = config_dic['http_threads'][threading.current_thread().name].logger
+    return _stream_list(key, chunks, convert_row, limit, yaml_format, compact, link_prefix, logger)
+
+def _stream_list(key, chunks, convert_row, limit, yaml_format, compact, link_prefix, logger):
+    count = 0
+    last_row = None
+    if yaml_format:
+        yield "---\n"
+    elif compact:
+        yield '{"' + key + '":['
+    else:
+        yield '{\n    "' + key + '": ['
+    for result, rows in chunks:
+        if result < 0:
+            logger.error("format_out_list Error %d %s", result, rows)
+            break
+        for row in rows:
+            convert_row(row)
+            if yaml_format:
+                text = yaml.safe_dump([row], indent=4, default_flow_style=False, tags=False, encoding='utf-8',
+                                      allow_unicode=True)
+                if count == 0:
+                    text = key + ":\n" + text
+            elif compact:
+                text = ("," if count else "") + json.dumps(row, separators=(',', ':'))
+            else:
+                text = ("," if count else "") + "\n        " + json.dumps(row, indent=4).replace("\n", "\n        ")
+            count += 1
+            last_row = row
+            yield text
+    links = None
+    if limit and count >= limit and 'id' in last_row:
+        links = [{'href': link_prefix + str(last_row['id']), 'rel': 'next'}]
+    if yaml_format:
+        if count == 0:
+            yield key + ": []\n"
+        if links:
+            yield yaml.safe_dump({key + '_links': links}, indent=4, default_flow_style=False, tags=False,
+                                 encoding='utf-8', allow_unicode=True)
+    elif compact:
+        yield "]" + ((',"' + key + '_links":' + json.dumps(links, separators=(',', ':'))) if links else "") + "}\n"
+    else:
+        text = "\n    ]" if count else "]"
+        if links:
+            text += ',\n    "' + key + '_links": ' + json.dumps(links, indent=4).replace("\n", "\n    ")
+        yield text + "\n}\n"
+
 def convert_bandwidth(data, reverse=False):
     '''Check the field bandwidth recursively and when found, it removes units and convert to number 
     It assumes that bandwidth is well formed
@@ -467,7 +703,7 @@ def check_valid_tenant(my, tenant_id):
         if not my.admin:
             return HTTP_Unauthorized, "Needed admin privileges"
     else:
-        result, _ = my.db.get_table(FROM='tenants', SELECT=('uuid',), WHERE={'uuid': tenant_id})
+        result, _ = config_dic['metadata_cache'].get_tenant(my.db, tenant_id)
         if result<=0:
             return HTTP_Not_Found, "tenant '%s' not found" % tenant_id
     return 0, None
@@ -507,16 +743,38 @@ def enable_cors():
 #
 
 @bottle.route(url_base + '/hosts', method='GET')
+@conditional_get('hosts')
+@coalesce_get('hosts')
 def http_get_hosts():
-    return format_out(get_hosts())
+    select_, where_, limit_ = filter_query_string(bottle.request.query, http2db_host,
+                                                  ('id', 'name', 'description', 'status', 'admin_state_up', 'ip_name', 'hypervisors'))  #Unikernels extension
+    marker_ = get_marker(bottle.request.query)
+
+    my = config_dic['http_threads'][ threading.current_thread().name ]
+    chunks = my.db.get_table_by_chunks(FROM='hosts', SELECT=select_, WHERE=where_, LIMIT=limit_,
+                                       WHERE_GREATER={'uuid': marker_} if marker_ else None)
+    result, content = next(chunks)
+    if result < 0:
+        print "http_get_hosts Error", content
+        bottle.abort(-result, content)
+
+    def convert_row(row):
+        convert_boolean(row, ('admin_state_up',))
+        change_keys_http2db(row, http2db_host, reverse=True)
+        row['links'] = ({'href': my.url_preffix + '/hosts/' + str(row['id']), 'rel': 'bookmark'},)
+
+    return format_out_list('hosts', itertools.chain(((result, content),), chunks), convert_row, limit_)
 
 
 def get_hosts():
     select_, where_, limit_ = filter_query_string(bottle.request.query, http2db_host,
                                                   ('id', 'name', 'description', 'status', 'admin_state_up', 'ip_name', 'hypervisors'))  #Unikernels extension
     
+    marker_ = get_marker(bottle.request.query)
+
     myself = config_dic['http_threads'][ threading.current_thread().name ]
-    result, content = myself.db.get_table(FROM='hosts', SELECT=select_, WHERE=where_, LIMIT=limit_)
+    result, content = myself.db.get_table(FROM='hosts', SELECT=select_, WHERE=where_, LIMIT=limit_,
+                                          WHERE_GREATER={'uuid': marker_} if marker_ else None, ORDER_BY='uuid')
     if result < 0:
         print "http_get_hosts Error", content
         bottle.abort(-result, content)
@@ -526,16 +784,20 @@ def get_hosts():
         for row in content:
             row['links'] = ( {'href': myself.url_preffix + '/hosts/' + str(row['id']), 'rel': 'bookmark'}, )
         data={'hosts' : content}
+        add_next_link(data, 'hosts', limit_)
         return data
 
 @bottle.route(url_base + '/hosts/<host_id>', method='GET')
+@conditional_get('hosts', 'numas', 'resources_core', 'resources_mem', 'resources_port')
 def http_get_host_id(host_id):
     my = config_dic['http_threads'][ threading.current_thread().name ]
     return my.gethost(host_id)
 
 @bottle.route(url_base + '/hosts', method='POST')
 def http_post_hosts():
-    '''insert a host into the database. All resources are got and inserted'''
+    '''insert a host into the database. All resources are got and inserted.
+    When autodiscover is set, the resources are obtained at a background job and 202 is returned with the job
+    identifier, that can be followed at /hosts/jobs/<job_id>'''
     global RADclass_module
     my = config_dic['http_threads'][ threading.current_thread().name ]
     #check permissions
@@ -554,83 +816,104 @@ def http_post_hosts():
             host.update(http_content['host-data'])
     else:
         host = http_content['host-data']
-    warning_text = ""
-    ip_name = host['ip_name']
-    user = host['user']
-    password = host.get('password')
     if host.get('autodiscover'):
         if not RADclass_module:
             try:
-                RADclass_module = imp.find_module("RADclass")
+                RADclass_module = imp.load_module("RADclass", *imp.find_module("RADclass"))
             except (IOError, ImportError) as e:
                 raise ImportError("Cannot import RADclass.py Openvim not properly installed" +str(e))
+        job = my.get_host_jobs().submit("host-discovery", _discover_and_register_host, host)
+        bottle.response.status = 202
+        return format_out({'job': format_host_job(job)})
+    try:
+        return format_out(_register_host(host))
+    except ovim.ovimException as e:
+        my.logger.error(str(e), exc_info=True)
+        bottle.abort(e.http_code, str(e))
 
-        #fill rad info
-        rad = RADclass_module.RADclass()
-        (return_status, code) = rad.obtain_RAD(user, password, ip_name)
-        
-        #return 
-        if not return_status:
-            print 'http_post_hosts ERROR obtaining RAD', code
-            bottle.abort(HTTP_Bad_Request, code)
-            return
-        warning_text=code
-        rad_structure = yaml.load(rad.to_text())
-        print 'rad_structure\n---------------------'
-        print json.dumps(rad_structure, indent=4)
-        print '---------------------'
+
+def _discover_host(host):
+    """
+    Obtain the host resources with RADclass and fill the host dictionary with them. It takes a long time, as it runs
+    many commands at the compute node, so it is run at a host-discovery job
+    :param host: host dictionary, with at least ip_name and user
+    :return: warning text
+    :raise: ovimException if the host resources cannot be obtained
+    """
+    my = config_dic['http_threads'][threading.current_thread().name]
+    rad = RADclass_module.RADclass()
+    (return_status, code) = rad.obtain_RAD(host['user'], host.get('password'), host['ip_name'])
+    if not return_status:
+        raise ovim.ovimException("Error obtaining host '{}' resources: {}".format(host['ip_name'], code),
+                                 HTTP_Bad_Request)
+    warning_text = code
+    rad_structure = yaml.load(rad.to_text())
+    my.logger.debug("host '%s' resources: %s", host['ip_name'], json.dumps(rad_structure, indent=4))
+    WHERE_={"family":rad_structure['processor']['family'], 'manufacturer':rad_structure['processor']['manufacturer'], 'version':rad_structure['processor']['version']} 
+    result, content = my.db.get_table(FROM='host_ranking', 
+                SELECT=('ranking',),
+                WHERE=WHERE_)
+    if result > 0:
+        host['ranking'] = content[0]['ranking']
+    else:
+        #error_text= "Host " + str(WHERE_)+ " not found in ranking table. Not valid for VIM management"
+        #bottle.abort(HTTP_Bad_Request, error_text)
         #return
-        WHERE_={"family":rad_structure['processor']['family'], 'manufacturer':rad_structure['processor']['manufacturer'], 'version':rad_structure['processor']['version']} 
-        result, content = my.db.get_table(FROM='host_ranking', 
-                    SELECT=('ranking',),
-                    WHERE=WHERE_)
-        if result > 0:
-            host['ranking'] = content[0]['ranking']
-        else:
-            #error_text= "Host " + str(WHERE_)+ " not found in ranking table. Not valid for VIM management"
-            #bottle.abort(HTTP_Bad_Request, error_text)
-            #return
-            warning_text += "Host " + str(WHERE_)+ " not found in ranking table. Assuming lowest value 100\n"
-            host['ranking'] = 100 #TODO: as not used in this version, set the lowest value
+        warning_text += "Host " + str(WHERE_)+ " not found in ranking table. Assuming lowest value 100\n"
+        host['ranking'] = 100 #TODO: as not used in this version, set the lowest value
+
+    features = rad_structure['processor'].get('features', ())
+    host['features'] = ",".join(features)
+    host['numas'] = [] 
     
-        features = rad_structure['processor'].get('features', ())
-        host['features'] = ",".join(features)
-        host['numas'] = [] 
-        
-        for node in (rad_structure['resource topology']['nodes'] or {}).itervalues():
-            interfaces= []
-            cores = []
-            eligible_cores=[]
-            count = 0
-            for core in node['cpu']['eligible_cores']:
-                eligible_cores.extend(core)
-            for core in node['cpu']['cores']:
-                for thread_id in core:
-                    c={'core_id': count, 'thread_id': thread_id}
-                    if thread_id not in eligible_cores: c['status'] = 'noteligible'
-                    cores.append(c)
-                count = count+1 
-
-            if 'nics' in node:    
-                for port_k, port_v in node['nics']['nic 0']['ports'].iteritems():
-                    if port_v['virtual']:
-                        continue
-                    else:
-                        sriovs = []
-                        for port_k2, port_v2 in node['nics']['nic 0']['ports'].iteritems():
-                            if port_v2['virtual'] and port_v2['PF_pci_id']==port_k:
-                                sriovs.append({'pci':port_k2, 'mac':port_v2['mac'], 'source_name':port_v2['source_name']})
-                        if len(sriovs)>0:
-                            #sort sriov according to pci and rename them to the vf number
-                            new_sriovs = sorted(sriovs, key=lambda k: k['pci'])
-                            index=0 
-                            for sriov in new_sriovs:
-                                sriov['source_name'] = index
-                                index += 1
-                            interfaces.append  ({'pci':str(port_k), 'Mbps': port_v['speed']/1000000, 'sriovs': new_sriovs, 'mac':port_v['mac'], 'source_name':port_v['source_name']})
-            memory=node['memory']['node_size'] / (1024*1024*1024)
-            #memory=get_next_2pow(node['memory']['hugepage_nr'])
-            host['numas'].append( {'numa_socket': node['id'], 'hugepages': node['memory']['hugepage_nr'], 'memory':memory, 'interfaces': interfaces, 'cores': cores } )
+    for node in (rad_structure['resource topology']['nodes'] or {}).itervalues():
+        interfaces= []
+        cores = []
+        eligible_cores=[]
+        count = 0
+        for core in node['cpu']['eligible_cores']:
+            eligible_cores.extend(core)
+        for core in node['cpu']['cores']:
+            for thread_id in core:
+                c={'core_id': count, 'thread_id': thread_id}
+                if thread_id not in eligible_cores: c['status'] = 'noteligible'
+                cores.append(c)
+            count = count+1 
+
+        if 'nics' in node:    
+            for port_k, port_v in node['nics']['nic 0']['ports'].iteritems():
+                if port_v['virtual']:
+                    continue
+                else:
+                    sriovs = []
+                    for port_k2, port_v2 in node['nics']['nic 0']['ports'].iteritems():
+                        if port_v2['virtual'] and port_v2['PF_pci_id']==port_k:
+                            sriovs.append({'pci':port_k2, 'mac':port_v2['mac'], 'source_name':port_v2['source_name']})
+                    if len(sriovs)>0:
+                        #sort sriov according to pci and rename them to the vf number
+                        new_sriovs = sorted(sriovs, key=lambda k: k['pci'])
+                        index=0 
+                        for sriov in new_sriovs:
+                            sriov['source_name'] = index
+                            index += 1
+                        interfaces.append  ({'pci':str(port_k), 'Mbps': port_v['speed']/1000000, 'sriovs': new_sriovs, 'mac':port_v['mac'], 'source_name':port_v['source_name']})
+        memory=node['memory']['node_size'] / (1024*1024*1024)
+        #memory=get_next_2pow(node['memory']['hugepage_nr'])
+        host['numas'].append( {'numa_socket': node['id'], 'hugepages': node['memory']['hugepage_nr'], 'memory':memory, 'interfaces': interfaces, 'cores': cores } )
+    return warning_text
+
+
+def _register_host(host, warning_text=""):
+    """
+    Insert the host at database and launch its host thread
+    :param host: host dictionary
+    :param warning_text: warning to be added at the response
+    :return: dictionary with the created host in http format
+    :raise: ovimException if host cannot be inserted
+    """
+    my = config_dic['http_threads'][threading.current_thread().name]
+    ip_name = host['ip_name']
+    user = host['user']
     # print json.dumps(host, indent=4)
     # insert in data base
     if "created_at" in host:
@@ -643,23 +926,27 @@ def http_post_hosts():
                 del core["instance_id"]
             if "v_thread_id" in core:
                 del core["v_thread_id"]
-    result, content = my.db.new_host(host)
-    if result >= 0:
-        if content['admin_state_up']:
-            #create thread
-            host_test_mode = True if config_dic['mode']=='test' or config_dic['mode']=="OF only" else False
-            host_develop_mode = True if config_dic['mode']=='development' else False
-            host_develop_bridge_iface = config_dic.get('development_bridge', None)
-            thread = ht.host_thread(name=host.get('name',ip_name), user=user, host=ip_name,
-                                    password=host.get('password'),
-                                    keyfile=host.get('keyfile', config_dic["host_ssh_keyfile"]),
-                                    db=config_dic['db'],
-                                    test=host_test_mode, image_path=config_dic['host_image_path'],
-                                    version=config_dic['version'], host_id=content['uuid'],
-                                    develop_mode=host_develop_mode, develop_bridge_iface=host_develop_bridge_iface,
-                                    hypervisors=host.get('hypervisors', None))  #Unikernels extension
-
-            thread.start()
+    # host threads, config_dic and the vxlan mesh are changed one host at a time, also by the discovery jobs
+    with my.write_lock:
+        result, content = my.db.new_host(host)
+        if result < 0:
+            raise ovim.ovimException(str(content), HTTP_Bad_Request)
+        if content['admin_state_up'] and config_dic.get('cluster_member'):
+            # run by this instance, or by another one if it does not get the lease
+            config_dic['cluster_member'].add("host", content['uuid'], {
+                'name': host.get('name', ip_name), 'ip_name': ip_name, 'user': user, 'uuid': content['uuid'],
+                'password': host.get('password'), 'keyfile': host.get('keyfile', config_dic["host_ssh_keyfile"]),
+                'hypervisors': host.get('hypervisors', None)})
+            if config_dic['network_type'] == 'ovs':
+                create_dhcp_ovs_bridge()
+                config_dic['host_threads'][content['uuid']].insert_task("new-ovsbridge")
+                create_vxlan_mesh(content['uuid'], my.logger)
+        elif content['admin_state_up']:
+            #create thread, as ovim does at start
+            thread = my.ovim.start_host_thread({
+                'name': host.get('name', ip_name), 'ip_name': ip_name, 'user': user, 'uuid': content['uuid'],
+                'password': host.get('password'), 'keyfile': host.get('keyfile', config_dic["host_ssh_keyfile"]),
+                'hypervisors': host.get('hypervisors', None)})  #Unikernels extension
             config_dic['host_threads'][content['uuid']] = thread
 
             if config_dic['network_type'] == 'ovs':
@@ -669,86 +956,80 @@ def http_post_hosts():
                 # create vlxan bwt OVS controller and computes
                 create_vxlan_mesh(content['uuid'], my.logger)
 
-        # return host data
-        change_keys_http2db(content, http2db_host, reverse=True)
-        if len(warning_text)>0:
-            content["warning"]= warning_text
-        data={'host' : content}
-        return format_out(data)
-    else:
-        bottle.abort(HTTP_Bad_Request, content)
-        return
-
+    # return host data
+    change_keys_http2db(content, http2db_host, reverse=True)
+    if len(warning_text)>0:
+        content["warning"]= warning_text
+    return {'host' : content}
 
-def delete_dhcp_ovs_bridge(vlan, net_uuid):
-    """
-    Delete bridges and port created during dhcp launching at openvim controller
-    :param vlan: net vlan id
-    :param net_uuid: network identifier
-    :return:
-    """
-    dhcp_path = config_dic['ovs_controller_file_path']
 
-    http_controller = config_dic['http_threads'][threading.current_thread().name]
-    dhcp_controller = http_controller.ovim.get_dhcp_controller()
+def _discover_and_register_host(job, host):
+    """Body of the host-discovery job"""
+    job['progress'] = "discovering"
+    warning_text = _discover_host(host)
+    job['progress'] = "registering"
+    return _register_host(host, warning_text)
 
-    dhcp_controller.delete_dhcp_server(vlan, net_uuid, dhcp_path)
-    dhcp_controller.delete_dhcp_port(vlan, net_uuid, dhcp_path)
 
+def format_host_job(job):
+    """Prepare a host-discovery job to be returned by the API, adding the self link"""
+    my = config_dic['http_threads'][threading.current_thread().name]
+    job['links'] = ({'href': my.url_preffix + '/hosts/jobs/' + job['id'], 'rel': 'self'},)
+    return job
 
-def create_dhcp_ovs_bridge():
-    """
-    Initialize bridge to allocate the dhcp server at openvim controller
-    :return:
-    """
-    http_controller = config_dic['http_threads'][threading.current_thread().name]
-    dhcp_controller = http_controller.ovim.get_dhcp_controller()
 
-    dhcp_controller.create_ovs_bridge()
+@bottle.route(url_base + '/hosts/jobs', method='GET')
+def http_get_host_jobs():
+    '''get the status of the host-discovery jobs'''
+    my = config_dic['http_threads'][threading.current_thread().name]
+    if not my.admin:
+        bottle.abort(HTTP_Unauthorized, "Needed admin privileges")
+    jobs = my.get_host_jobs().get_jobs("host-discovery")
+    return format_out({'jobs': [format_host_job(job) for job in jobs]})
 
 
-def set_mac_dhcp(vm_ip, vlan, first_ip, last_ip, cidr, mac):
-    """"
-    Launch a dhcpserver base on dnsmasq attached to the net base on vlan id across the the openvim computes
-    :param vm_ip: IP address asigned to a VM
-    :param vlan: Segmentation id
-    :param first_ip: First dhcp range ip
-    :param last_ip: Last dhcp range ip
-    :param cidr: net cidr
-    :param mac: VM vnic mac to be macthed with the IP received
-    """
-    if not vm_ip:
-        return
-    ip_tools = IPNetwork(cidr)
-    cidr_len = ip_tools.prefixlen
-    dhcp_netmask = str(ip_tools.netmask)
-    dhcp_path = config_dic['ovs_controller_file_path']
-
-    new_cidr = [first_ip + '/' + str(cidr_len)]
-    if not len(all_matching_cidrs(vm_ip, new_cidr)):
-        vm_ip = None
+@bottle.route(url_base + '/hosts/jobs/<job_id>', method='GET')
+def http_get_host_job_id(job_id):
+    '''get the status of a host-discovery job. When done, its result contains the created host'''
+    my = config_dic['http_threads'][threading.current_thread().name]
+    if not my.admin:
+        bottle.abort(HTTP_Unauthorized, "Needed admin privileges")
+    job = my.get_host_jobs().get_job(job_id)
+    if not job:
+        bottle.abort(HTTP_Not_Found, "Job '{}' not found".format(job_id))
+    return format_out({'job': format_host_job(job)})
 
-    http_controller = config_dic['http_threads'][threading.current_thread().name]
-    dhcp_controller = http_controller.ovim.get_dhcp_controller()
 
-    dhcp_controller.set_mac_dhcp_server(vm_ip, mac, vlan, dhcp_netmask, first_ip, dhcp_path)
+@bottle.route(url_base + '/hosts/status_report', method='GET')
+def http_get_hosts_status_report():
+    '''get, per host, the result of the last reconciliation of the servers status with libvirt: time and duration
+    of the poll, number of domains found and number of status changes written'''
+    my = config_dic['http_threads'][threading.current_thread().name]
+    if not my.admin:
+        bottle.abort(HTTP_Unauthorized, "Needed admin privileges")
+    report = []
+    for host_id, thread in config_dic['host_threads'].items():
+        if isinstance(thread, cluster.RemoteThread):
+            # reported by the openvim instance that runs it
+            report.append({'id': host_id, 'name': thread.name, 'owner': thread.owner})
+            continue
+        host_report = dict(thread.status_report)
+        host_report['id'] = host_id
+        host_report['name'] = thread.name
+        host_report['servers'] = len(thread.server_status)
+        report.append(host_report)
+    return format_out({'hosts': report})
 
 
-def delete_mac_dhcp(vm_ip, vlan, mac):
+def create_dhcp_ovs_bridge():
     """
-    Delete into dhcp conf file the ip  assigned to a specific MAC address
-    :param vm_ip: IP address asigned to a VM
-    :param vlan: Segmentation id
-    :param mac:  VM vnic mac to be macthed with the IP received
+    Initialize bridge to allocate the dhcp server at openvim controller
     :return:
     """
-
-    dhcp_path = config_dic['ovs_controller_file_path']
-
     http_controller = config_dic['http_threads'][threading.current_thread().name]
     dhcp_controller = http_controller.ovim.get_dhcp_controller()
 
-    dhcp_controller.delete_mac_dhcp_server(vm_ip, mac, vlan, dhcp_path)
+    dhcp_controller.create_ovs_bridge()
 
 
 def create_vxlan_mesh(host_id, logger=None):
@@ -1042,7 +1323,9 @@ def http_get_flavors(tenant_id):
     else:
         from_  ='tenants_flavors inner join flavors on tenants_flavors.flavor_id=flavors.uuid'
         where_['tenant_id'] = tenant_id
-    result, content = my.db.get_table(FROM=from_, SELECT=select_, WHERE=where_, LIMIT=limit_)
+    marker_ = get_marker(bottle.request.query)
+    result, content = my.db.get_table(FROM=from_, SELECT=select_, WHERE=where_, LIMIT=limit_,
+                                      WHERE_GREATER={'uuid': marker_} if marker_ else None, ORDER_BY='uuid')
     if result < 0:
         print "http_get_flavors Error", content
         bottle.abort(-result, content)
@@ -1051,6 +1334,7 @@ def http_get_flavors(tenant_id):
         for row in content:
             row['links']=[ {'href': "/".join( (my.url_preffix, tenant_id, 'flavors', str(row['id']) ) ), 'rel':'bookmark' } ]
         data={'flavors' : content}
+        add_next_link(data, 'flavors', limit_)
         return format_out(data)
 
 @bottle.route(url_base + '/<tenant_id>/flavors/<flavor_id>', method='GET')
@@ -1116,6 +1400,7 @@ def http_post_flavors(tenant_id):
     #insert in data base
     result, content = my.db.new_flavor(http_content['flavor'], tenant_id)
     if result >= 0:
+        my.ovim.invalidate_metadata_cache('flavors', content)
         return http_get_flavor_id(tenant_id, content)
     else:
         print "http_psot_flavors error %d %s" % (result, content)
@@ -1132,6 +1417,7 @@ def http_delete_flavor_id(tenant_id, flavor_id):
         bottle.abort(result, content)
         return
     result, content = my.db.delete_image_flavor('flavor', flavor_id, tenant_id)
+    my.ovim.invalidate_metadata_cache('flavors', flavor_id)
     if result == 0:
         bottle.abort(HTTP_Not_Found, content)
     elif result >0:
@@ -1180,6 +1466,7 @@ def http_attach_detach_flavors(tenant_id, flavor_id, action):
                 return
             #insert in data base
             result, content = my.db.new_row('tenants_flavors', {'flavor_id':flavor_id, 'tenant_id': tenant_id})
+            my.ovim.invalidate_metadata_cache('flavors', flavor_id)
             if result >= 0:
                 return http_get_flavor_id(tenant_id, flavor_id)
         else: #detach
@@ -1190,6 +1477,7 @@ def http_attach_detach_flavors(tenant_id, flavor_id, action):
                 if flavor['public']=='no':
                     #try to delete the flavor completely to avoid orphan flavors, IGNORE error
                     my.db.delete_row_by_dict(FROM='flavors', WHERE={'uuid':flavor_id})
+                my.ovim.invalidate_metadata_cache('flavors', flavor_id)
                 data={'result' : "flavor detached"}
                 return format_out(data)
     
@@ -1242,6 +1530,7 @@ def http_put_flavor_id(tenant_id, flavor_id):
             return
         #insert in data base
         result, content = my.db.update_rows('flavors', http_content['flavor'], {'uuid': flavor_id})
+        my.ovim.invalidate_metadata_cache('flavors', flavor_id)
 
     if result < 0:
         print "http_put_flavor_id error %d %s" % (result, content)
@@ -1272,7 +1561,9 @@ def http_get_images(tenant_id):
     else:
         from_  ='tenants_images right join images on tenants_images.image_id=images.uuid'
         where_or_ = {'tenant_id': tenant_id, 'public': 'yes'}
-    result, content = my.db.get_table(SELECT=select_, DISTINCT=True, FROM=from_, WHERE=where_, WHERE_OR=where_or_, WHERE_AND_OR="AND", LIMIT=limit_)
+    marker_ = get_marker(bottle.request.query)
+    result, content = my.db.get_table(SELECT=select_, DISTINCT=True, FROM=from_, WHERE=where_, WHERE_OR=where_or_, WHERE_AND_OR="AND", LIMIT=limit_,
+                                      WHERE_GREATER={'uuid': marker_} if marker_ else None, ORDER_BY='uuid')
     if result < 0:
         print "http_get_images Error", content
         bottle.abort(-result, content)
@@ -1280,6 +1571,7 @@ def http_get_images(tenant_id):
         change_keys_http2db(content, http2db_image, reverse=True)
         #for row in content: row['links']=[ {'href': "/".join( (my.url_preffix, tenant_id, 'images', str(row['id']) ) ), 'rel':'bookmark' } ]
         data={'images' : content}
+        add_next_link(data, 'images', limit_)
         return format_out(data)
 
 @bottle.route(url_base + '/<tenant_id>/images/<image_id>', method='GET')
@@ -1363,6 +1655,7 @@ def http_post_images(tenant_id):
     #insert in data base
     result, content = my.db.new_image(http_content['image'], tenant_id)
     if result >= 0:
+        my.ovim.invalidate_metadata_cache('images', content)
         return http_get_image_id(tenant_id, content)
     else:
         print "http_post_images error %d %s" % (result, content)
@@ -1378,6 +1671,7 @@ def http_delete_image_id(tenant_id, image_id):
     if result != 0:
         bottle.abort(result, content)
     result, content = my.db.delete_image_flavor('image', image_id, tenant_id)
+    my.ovim.invalidate_metadata_cache('images', image_id)
     if result == 0:
         bottle.abort(HTTP_Not_Found, content)
     elif result >0:
@@ -1426,6 +1720,7 @@ def http_attach_detach_images(tenant_id, image_id, action):
                 return
             #insert in data base
             result, content = my.db.new_row('tenants_images', {'image_id':image_id, 'tenant_id': tenant_id})
+            my.ovim.invalidate_metadata_cache('images', image_id)
             if result >= 0:
                 return http_get_image_id(tenant_id, image_id)
         else: #detach
@@ -1436,6 +1731,7 @@ def http_attach_detach_images(tenant_id, image_id, action):
                 if image['public']=='no':
                     #try to delete the image completely to avoid orphan images, IGNORE error
                     my.db.delete_row_by_dict(FROM='images', WHERE={'uuid':image_id})
+                my.ovim.invalidate_metadata_cache('images', image_id)
                 data={'result' : "image detached"}
                 return format_out(data)
     
@@ -1482,6 +1778,7 @@ def http_put_image_id(tenant_id, image_id):
             return
         #insert in data base
         result, content = my.db.update_rows('images', http_content['image'], {'uuid': image_id})
+        my.ovim.invalidate_metadata_cache('images', image_id)
 
     if result < 0:
         print "http_put_image_id error %d %s" % (result, content)
@@ -1496,6 +1793,8 @@ def http_put_image_id(tenant_id, image_id):
 #
 
 @bottle.route(url_base + '/<tenant_id>/servers', method='GET')
+@conditional_get('instances', 'tenants')
+@coalesce_get('instances', 'tenants')
 def http_get_servers(tenant_id):
     my = config_dic['http_threads'][ threading.current_thread().name ]
     result,content = check_valid_tenant(my, tenant_id)
@@ -1507,19 +1806,24 @@ def http_get_servers(tenant_id):
             ('id','name','description','hostId','imageRef','flavorRef','status', 'tenant_id') )
     if tenant_id!='any':
         where_['tenant_id'] = tenant_id
-    result, content = my.db.get_table(SELECT=select_, FROM='instances', WHERE=where_, LIMIT=limit_)
+    marker_ = get_marker(bottle.request.query)
+    chunks = my.db.get_table_by_chunks(SELECT=select_, FROM='instances', WHERE=where_, LIMIT=limit_,
+                                       WHERE_GREATER={'uuid': marker_} if marker_ else None)
+    result, content = next(chunks)
     if result < 0:
         print "http_get_servers Error", content
         bottle.abort(-result, content)
-    else:
-        change_keys_http2db(content, http2db_server, reverse=True)
-        for row in content:
-            tenant_id = row.pop('tenant_id')
-            row['links']=[ {'href': "/".join( (my.url_preffix, tenant_id, 'servers', str(row['id']) ) ), 'rel':'bookmark' } ]
-        data={'servers' : content}
-        return format_out(data)
+
+    def convert_row(row):
+        change_keys_http2db(row, http2db_server, reverse=True)
+        row_tenant_id = row.pop('tenant_id')
+        row['links']=[ {'href': "/".join( (my.url_preffix, row_tenant_id, 'servers', str(row['id']) ) ), 'rel':'bookmark' } ]
+
+    return format_out_list('servers', itertools.chain(((result, content),), chunks), convert_row, limit_)
 
 @bottle.route(url_base + '/<tenant_id>/servers/<server_id>', method='GET')
+@conditional_get('instances', 'instance_devices', 'ports', 'numas', 'resources_core', 'resources_mem', 'resources_port',
+                 'tenants')
 def http_get_server_id(tenant_id, server_id):
     my = config_dic['http_threads'][ threading.current_thread().name ]
     #check valid tenant_id
@@ -1589,19 +1893,13 @@ def http_post_server_id(tenant_id):
     server_start = server.get('start', 'yes')
     server['tenant_id'] = tenant_id
     #check flavor valid and take info
-    result, content = my.db.get_table(FROM='tenants_flavors as tf join flavors as f on tf.flavor_id=f.uuid',
-             SELECT=('ram','vcpus','extended'), WHERE={'uuid':server['flavor_id'], 'tenant_id':tenant_id})
+    result, content = config_dic['metadata_cache'].get_tenant_flavor(my.db, tenant_id, server['flavor_id'])
     if result<=0:
         bottle.abort(HTTP_Not_Found, 'flavor_id %s not found' % server['flavor_id'])
         return
     server['flavor']=content[0]
     #check image valid and take info
-    result, content = my.db.get_table(FROM='tenants_images as ti right join images as i on ti.image_id=i.uuid',
-                                      SELECT=('path', 'metadata', 'image_id'),
-                                      WHERE={'uuid':server['image_id'], "status":"ACTIVE"},
-                                      WHERE_OR={'tenant_id':tenant_id, 'public': 'yes'},
-                                      WHERE_AND_OR="AND",
-                                      DISTINCT=True)
+    result, content = config_dic['metadata_cache'].get_tenant_image(my.db, tenant_id, server['image_id'])
     if result<=0:
         bottle.abort(HTTP_Not_Found, 'image_id %s not found or not ACTIVE' % server['image_id'])
         return
@@ -1611,6 +1909,7 @@ def http_post_server_id(tenant_id):
     else:
         # insert in data base tenants_images
         r2, c2 = my.db.new_row('tenants_images', {'image_id': server['image_id'], 'tenant_id': tenant_id})
+        my.ovim.invalidate_metadata_cache('images', server['image_id'])
         if r2<=0:
             bottle.abort(HTTP_Not_Found, 'image_id %s cannot be used. Error %s' % (server['image_id'], c2))
             return
@@ -1632,11 +1931,6 @@ def http_post_server_id(tenant_id):
         print
         if server_start == 'no':
             content['status'] = 'INACTIVE'
-        dhcp_nets_id = []
-        for net in http_content['server']['networks']:
-            if net['type'] == 'instance:ovs':
-                dhcp_nets_id.append(get_network_id(net['net_id']))
-
         ports_to_free = []
         new_instance_result, new_instance = my.db.new_instance(content, nets, ports_to_free)
         if new_instance_result < 0:
@@ -1652,15 +1946,17 @@ def http_post_server_id(tenant_id):
             r,c = config_dic['host_threads'][ server['host_id'] ].insert_task( 'restore-iface',*port )
             if r < 0:
                 print ' http_post_servers ERROR RESTORE IFACE!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!' +  c
-        # update nets
+        r2, c2 = my.db.get_table(FROM="ports", SELECT=["mac", "ip_address", "net_id", "switch_port"],
+                                 WHERE={"instance_id": new_instance})
+        # update nets, only the flows of the new ports
         for net_id in nets:
             try:
-                my.ovim.net_update_ofc_thread(net_id)
+                my.ovim.net_update_ofc_thread(net_id, changed_ports=get_changed_switch_ports(c2, net_id) if r2 > 0
+                                              else None)
             except ovim.ovimException as e:
                 my.logger.error("http_post_servers, Error updating network with id '{}', '{}'".format(net_id, str(e)))
 
         # look for dhcp ip address
-        r2, c2 = my.db.get_table(FROM="ports", SELECT=["mac", "ip_address", "net_id"], WHERE={"instance_id": new_instance})
         if r2 >0:
             for iface in c2:
                 if config_dic.get("dhcp_server") and iface["net_id"] in config_dic["dhcp_nets"]:
@@ -1669,37 +1965,24 @@ def http_post_server_id(tenant_id):
                     if r < 0:
                         print ':http_post_servers ERROR UPDATING dhcp_server !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!' +  c
 
-                #ensure compute contain the bridge for ovs networks:
-                if iface.get("net_id"):
-                    server_net = get_network_id(iface['net_id'])
-                    if server_net["network"].get('provider:physical', "")[:3] == 'OVS':
-                        vlan = str(server_net['network']['provider:vlan'])
-                        dhcp_enable = bool(server_net['network']['enable_dhcp'])
-                        vm_dhcp_ip = c2[0]["ip_address"]
-                        config_dic['host_threads'][server['host_id']].insert_task("create-ovs-bridge-port", vlan)
-                        dns = server_net['network'].get("dns")
-                        if dns:
-                            dns = yaml.safe_load(server_net['network'].get("dns"))
-                        routes = server_net['network'].get("routes")
-                        if routes:
-                            routes = yaml.safe_load(server_net['network'].get("routes"))
-                        links = server_net['network'].get("links")
-                        if links:
-                            links = yaml.safe_load(server_net['network'].get("links"))
-                        if dhcp_enable:
-                            dhcp_firt_ip = str(server_net['network']['dhcp_first_ip'])
-                            dhcp_last_ip = str(server_net['network']['dhcp_last_ip'])
-                            dhcp_cidr = str(server_net['network']['cidr'])
-                            gateway = str(server_net['network']['gateway_ip'])
-
-                            http_controller = config_dic['http_threads'][threading.current_thread().name]
-                            http_controller.ovim.launch_dhcp_server(vlan, dhcp_firt_ip, dhcp_last_ip,
-                                                                    dhcp_cidr, gateway, dns, routes)
-                            set_mac_dhcp(vm_dhcp_ip, vlan, dhcp_firt_ip, dhcp_last_ip, dhcp_cidr, c2[0]['mac'])
-
-                        if links:
-                            http_controller.ovim.launch_link_bridge_to_ovs(vlan, gateway, dhcp_cidr, links, routes)
-
+            # ensure compute contain the bridge for ovs networks. The dhcp server, links and fixed ip are set up at
+            # the openvim controller by its own thread
+            ovs_nets = {}
+            net_ids = list(set(iface["net_id"] for iface in c2 if iface.get("net_id")))
+            if net_ids:
+                r, nets_data = my.db.get_table(FROM='nets', WHERE={'uuid': net_ids})
+                if r > 0:
+                    ovs_nets = {net["uuid"]: net for net in nets_data if (net.get("provider") or "")[:3] == 'OVS'}
+            for iface in c2:
+                net = ovs_nets.get(iface.get("net_id"))
+                if not net:
+                    continue
+                config_dic['host_threads'][server['host_id']].insert_task("create-ovs-bridge-port", str(net['vlan']))
+                try:
+                    my.ovim.launch_ovs_port(net, iface['mac'], iface['ip_address'])
+                except ovim.ovimException as e:
+                    my.logger.error("http_post_servers, Error setting up ovs port of network '{}', '{}'".format(
+                        net['uuid'], str(e)))
 
         #Start server
         server['uuid'] = new_instance
@@ -1720,6 +2003,90 @@ def http_post_server_id(tenant_id):
         return
 
 
+def get_changed_switch_ports(ports, net_id):
+    """
+    Get the switch ports of the ports of a net, used to update only the openflow rules affected by them
+    :param ports: list of port dictionaries with 'net_id' and 'switch_port'
+    :param net_id: network id
+    :return: list of switch ports, None if any port of this net has no switch port
+    """
+    switch_ports = []
+    for port in ports:
+        if port["net_id"] == net_id:
+            if not port.get("switch_port"):
+                return None
+            switch_ports.append(port["switch_port"])
+    return switch_ports or None
+
+
+def delete_servers_resources(my, server_ids, tenant_id):
+    """
+    Delete from database some servers, whose 'terminate' task has been queued, and release their resources in one
+    transaction. Then update once each affected network and queue once each host and dhcp task, even if shared by
+    several of the servers
+    :param my: http server
+    :param server_ids: list of server uuids
+    :param tenant_id: tenant of the servers, 'any' or None for any
+    :return: (list of the deleted server uuids, warning text)
+    """
+    warn_text = ""
+    nets = []
+    ports_to_free = []
+    net_ovs_list = []
+    #look for dhcp ip address
+    r2, c2 = my.db.get_table(FROM="ports", SELECT=["mac", "net_id", "switch_port"],
+                             WHERE={"instance_id": server_ids})
+    r, deleted = my.db.delete_instances(server_ids, tenant_id if tenant_id != 'any' else None, nets, ports_to_free,
+                                        net_ovs_list, "requested by http")
+    if r < 0:
+        my.logger.error("delete_servers_resources error deleting servers: %s", deleted)
+        return [], "; Error deleting servers '{}'".format(deleted)
+    for source_name, mac, host_id in set(ports_to_free):
+        r1, c1 = config_dic['host_threads'][host_id].insert_task('restore-iface', source_name, mac)
+        if r1 < 0:
+            my.logger.error("http_post_server_action server deletion ERROR at resore-iface!!!! " + c1)
+            warn_text += "; Error iface '{}' cannot be restored '{}'".format(source_name, c1)
+    for net_id in nets:
+        try:
+            my.ovim.net_update_ofc_thread(net_id, changed_ports=get_changed_switch_ports(c2, net_id) if r2 > 0
+                                          else None)
+        except ovim.ovimException as e:
+            my.logger.error("http_server_action, Error updating network with id '{}', '{}'".format(net_id, str(e)))
+            warn_text += "; Error openflow rules of network '{}' cannot be restore '{}'".format(net_id, str(e))
+
+    # look for dhcp ip address
+    if r2 > 0 and config_dic.get("dhcp_server"):
+        for mac in set(iface["mac"] for iface in c2 if iface["net_id"] in config_dic["dhcp_nets"]):
+            r, c = config_dic['dhcp_thread'].insert_task("del", mac)
+            if r < 0:
+                my.logger.error("delete_servers_resources error updating dhcp server: %s", c)
+
+    # delete ovs-port and linux bridge, contains a list of tuple (net_id, vlan, vm_ip, mac, host_id), with a task
+    # per net at the openvim controller and per net and host at the hosts
+    ovs_nets = {}
+    net_ids = list(set(net[0] for net in net_ovs_list))
+    if net_ids:
+        r3, nets_data = my.db.get_table(FROM='nets', SELECT=('uuid', 'vlan', 'links'), WHERE={'uuid': net_ids})
+        if r3 > 0:
+            ovs_nets = {net["uuid"]: net for net in nets_data}
+    ovs_ports = {}  # net_id: (vlan, list of (vm_ip, mac))
+    host_ovs_ports = set()
+    for net_id, vlan, vm_ip, mac, host_id in net_ovs_list:
+        fixed_ips = ovs_ports.setdefault(net_id, (str(vlan), []))[1]
+        if mac:
+            fixed_ips.append((str(vm_ip), str(mac)))
+        host_ovs_ports.add((host_id, str(vlan), net_id))
+    for net_id, (vlan, fixed_ips) in ovs_ports.items():
+        try:
+            my.ovim.delete_ovs_port(ovs_nets.get(net_id, {'uuid': net_id, 'vlan': vlan}), fixed_ips=fixed_ips)
+        except ovim.ovimException as e:
+            my.logger.error("http_server_action, Error deleting ovs port of network '{}', '{}'".format(net_id, str(e)))
+            warn_text += "; Error ovs port of network '{}' cannot be deleted '{}'".format(net_id, str(e))
+    for host_id, vlan, net_id in host_ovs_ports:
+        config_dic['host_threads'][host_id].insert_task('del-ovs-port', vlan, net_id)
+    return deleted, warn_text
+
+
 def http_server_action(server_id, tenant_id, action):
     '''Perform actions over a server as resume, reboot, terminate, ...'''
     my = config_dic['http_threads'][ threading.current_thread().name ]
@@ -1791,12 +2158,11 @@ def http_server_action(server_id, tenant_id, action):
                 else: #result==1
                     image_id = content[0]['image_id']    
                 
-        result, content = my.db.get_table(FROM='tenants_images as ti right join images as i on ti.image_id=i.uuid',
-            SELECT=('path','metadata'), WHERE={'uuid':image_id, "status":"ACTIVE"},
-            WHERE_OR={'tenant_id':tenant_id, 'public': 'yes'}, WHERE_AND_OR="AND", DISTINCT=True)
+        result, content = config_dic['metadata_cache'].get_tenant_image(my.db, tenant_id, image_id)
         if result<=0:
             bottle.abort(HTTP_Not_Found, 'image_id %s not found or not ACTIVE' % image_id)
             return
+        content[0].pop('image_id', None)    # tenant association, not needed
         if content[0]['metadata'] is not None:
             try:
                 metadata = json.loads(content[0]['metadata'])
@@ -1844,50 +2210,7 @@ def http_server_action(server_id, tenant_id, action):
     data={'result' : 'deleting in process'}
     warn_text=""
     if new_status != None and new_status == 'DELETING':
-        nets=[]
-        ports_to_free=[]
-
-        net_ovs_list = []
-        #look for dhcp ip address
-        r2, c2 = my.db.get_table(FROM="ports", SELECT=["mac", "net_id"], WHERE={"instance_id": server_id})
-        r, c = my.db.delete_instance(server_id, tenant_id, nets, ports_to_free, net_ovs_list, "requested by http")
-        for port in ports_to_free:
-            r1,c1 = config_dic['host_threads'][ server['host_id'] ].insert_task( 'restore-iface',*port )
-            if r1 < 0:
-                my.logger.error("http_post_server_action server deletion ERROR at resore-iface!!!! " + c1)
-                warn_text += "; Error iface '{}' cannot be restored '{}'".format(str(port), str(e))
-        for net_id in nets:
-            try:
-                my.ovim.net_update_ofc_thread(net_id)
-            except ovim.ovimException as e:
-                my.logger.error("http_server_action, Error updating network with id '{}', '{}'".format(net_id, str(e)))
-                warn_text += "; Error openflow rules of network '{}' cannot be restore '{}'".format(net_id, str (e))
-
-        # look for dhcp ip address
-        if r2 >0 and config_dic.get("dhcp_server"):
-            for iface in c2:
-                if iface["net_id"] in config_dic["dhcp_nets"]:
-                    r,c = config_dic['dhcp_thread'].insert_task("del", iface["mac"])
-                    #print "dhcp insert del task"
-                    if r < 0:
-                        print ':http_post_servers ERROR UPDATING dhcp_server !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!' +  c 
-        # delete ovs-port and linux bridge, contains a list of tuple (net_id,vlan, vm_ip, mac)
-
-        for net in net_ovs_list:
-            mac = str(net[3])
-            vm_ip = str(net[2])
-            vlan = str(net[1])
-            net_id = net[0]
-
-            delete_dhcp_ovs_bridge(vlan, net_id)
-            delete_mac_dhcp(vm_ip, vlan, mac)
-
-            net_data = my.ovim.show_network(net_id)
-            if net_data.get('links'):
-                links = yaml.load(net_data.get('links'))
-                my.ovim.delete_link_bridge_to_ovs(vlan, links)
-
-            config_dic['host_threads'][server['host_id']].insert_task('del-ovs-port', vlan, net_id)
+        _, warn_text = delete_servers_resources(my, [server_id], tenant_id)
     if warn_text:
         data["result"] += warn_text
     return format_out(data)
@@ -1906,7 +2229,55 @@ def http_delete_server_id(tenant_id, server_id):
 
     return http_server_action(server_id, tenant_id, {"terminate":None} )
 
-    
+
+@bottle.route(url_base + '/<tenant_id>/servers/delete', method='POST')
+def http_post_servers_delete(tenant_id):
+    '''delete several servers, given by a list of uuids and/or a name prefix, releasing their resources at once'''
+    my = config_dic['http_threads'][ threading.current_thread().name ]
+    #check valid tenant_id
+    result,content = check_valid_tenant(my, tenant_id)
+    if result != 0:
+        bottle.abort(result, content)
+        return
+    http_content = format_in( server_delete_schema )
+    where = {}
+    where_like = {}
+    if tenant_id != 'any':
+        where['tenant_id'] = tenant_id
+    if 'servers' in http_content:
+        where['uuid'] = http_content['servers']
+    if 'name_prefix' in http_content:
+        # escape the LIKE wildcards, and the backslashes again as the pattern is placed inside a string literal
+        where_like['name'] = http_content['name_prefix'].replace("\\", "\\\\").replace("%", "\\%").\
+            replace("_", "\\_").replace("\\", "\\\\") + "%"
+    result, servers = my.db.get_table(FROM='instances', WHERE=where, WHERE_LIKE=where_like)
+    if result < 0:
+        my.logger.error("http_post_servers_delete error getting servers %d %s", result, servers)
+        bottle.abort(-result, servers)
+        return
+    if result == 0:
+        bottle.abort(HTTP_Not_Found, "servers not found")
+        return
+
+    warn_text = ""
+    server_ids = []
+    for server in servers:
+        server["action"] = {"terminate": None}
+        r, c = config_dic['host_threads'][server['host_id']].insert_task('instance', server)
+        if r < 0:
+            my.logger.error("http_post_servers_delete task queue full at host %s", server['host_id'])
+            warn_text += "; Error server '{}' cannot be deleted '{}'".format(server['uuid'], c)
+            continue
+        server_ids.append(server['uuid'])
+    not_found = set(http_content.get('servers', ())).difference(server['uuid'] for server in servers)
+    if not_found:
+        warn_text += "; Servers not found '{}'".format(",".join(not_found))
+    deleted, text = delete_servers_resources(my, server_ids, tenant_id)
+    data = {'servers': [{'id': server_id} for server_id in deleted],
+            'result': "{} servers deleting in process".format(len(deleted)) + warn_text + text}
+    return format_out(data)
+
+
 @bottle.route(url_base + '/<tenant_id>/servers/<server_id>/action', method='POST')
 def http_post_server_action(tenant_id, server_id):
     '''take an action over a server'''
@@ -1928,6 +2299,8 @@ def http_post_server_action(tenant_id, server_id):
 
 
 @bottle.route(url_base + '/networks', method='GET')
+@conditional_get('nets')
+@coalesce_get('nets')
 def http_get_networks():
     """
     Get all networks available
@@ -1944,11 +2317,12 @@ def http_get_networks():
         if "tenant_id" in where_:
             del where_["tenant_id"]
 
-        content = my.ovim.get_networks(select_, where_, limit_)
+        content = my.ovim.get_networks(select_, where_, limit_, get_marker(bottle.request.query))
 
         delete_nulls(content)
         change_keys_http2db(content, http2db_network, reverse=True)
         data = {'networks': content}
+        add_next_link(data, 'networks', limit_)
         return format_out(data)
 
     except ovim.ovimException as e:
@@ -1960,6 +2334,7 @@ def http_get_networks():
 
 
 @bottle.route(url_base + '/networks/<network_id>', method='GET')
+@conditional_get('nets', 'ports', 'of_flows', 'tenants')
 def http_get_network_id(network_id):
     """
     Get a network data by id
@@ -2084,10 +2459,11 @@ def http_get_openflow_controller():
     try:
         select_, where_, limit_ = filter_query_string(bottle.request.query, http2db_ofc,
                                                       ('id', 'name', 'dpid', 'ip', 'port', 'type',
-                                                       'version', 'user', 'password'))
+                                                       'version', 'user', 'password', 'broadcast_groups'))
 
         content = my.ovim.get_of_controllers(select_, where_)
         delete_nulls(content)
+        convert_boolean(content, ('broadcast_groups',))
         change_keys_http2db(content, http2db_ofc, reverse=True)
         data = {'ofcs': content}
         return format_out(data)
@@ -2110,6 +2486,7 @@ def http_get_openflow_controller_id(uuid):
 
         content = my.ovim.show_of_controller(uuid)
         delete_nulls(content)
+        convert_boolean(content, ('broadcast_groups',))
         change_keys_http2db(content, http2db_ofc, reverse=True)
         data = {'ofc': content}
         return format_out(data)
@@ -2135,6 +2512,7 @@ def http_post_openflow_controller():
         uuid = my.ovim.new_of_controller(of_c)
         content = my.ovim.show_of_controller(uuid)
         delete_nulls(content)
+        convert_boolean(content, ('broadcast_groups',))
         change_keys_http2db(content, http2db_ofc, reverse=True)
         data = {'ofc': content}
         return format_out(data)
@@ -2161,6 +2539,7 @@ def http_put_openflow_controller_by_id(of_controller_id):
 
         content = my.ovim.edit_of_controller(of_controller_id, of_c)
         delete_nulls(content)
+        convert_boolean(content, ('broadcast_groups',))
         change_keys_http2db(content, http2db_ofc, reverse=True)
         data = {'ofc': content}
         return format_out(data)
@@ -2222,7 +2601,7 @@ def http_get_openflow_id(network_id):
 def http_put_openflow_id(network_id):
     """
     To make actions over the net. The action is to reinstall the openflow rules
-    network_id can be 'all'
+    network_id can be 'all', that launches an openflow-reinstall job returned with 202 status
     :param network_id: network id
     :return:
     """
@@ -2232,7 +2611,9 @@ def http_put_openflow_id(network_id):
         bottle.abort(HTTP_Unauthorized, "Needed admin privileges")
 
     if network_id == 'all':
-        network_id = None
+        job = my.get_openflow_jobs().submit("openflow-reinstall", _reinstall_openflow_rules, my.ovim)
+        bottle.response.status = 202
+        return format_out({'job': format_openflow_job(job)})
 
     try:
         result = my.ovim.edit_openflow_rules(network_id)
@@ -2246,6 +2627,44 @@ def http_put_openflow_id(network_id):
     data = {'result': str(result) + " nets updates"}
     return format_out(data)
 
+
+def _reinstall_openflow_rules(job, ovim_):
+    """Body of the openflow-reinstall job. Its progress has the progress of each openflow controller"""
+    job['progress'] = {}
+    result = ovim_.reinstall_openflow_rules(job['progress'])
+    return {'result': str(result) + " nets updates"}
+
+
+def format_openflow_job(job):
+    """Prepare an openflow-reinstall job to be returned by the API, adding the self link"""
+    my = config_dic['http_threads'][threading.current_thread().name]
+    job['links'] = ({'href': my.url_preffix + '/networks/openflow/jobs/' + job['id'], 'rel': 'self'},)
+    return job
+
+
+@bottle.route(url_base + '/networks/openflow/jobs', method='GET')
+def http_get_openflow_jobs():
+    """get the status of the openflow-reinstall jobs, launched by PUT /networks/all/openflow"""
+    my = config_dic['http_threads'][threading.current_thread().name]
+    if not my.admin:
+        bottle.abort(HTTP_Unauthorized, "Needed admin privileges")
+    jobs = my.get_openflow_jobs().get_jobs("openflow-reinstall")
+    return format_out({'jobs': [format_openflow_job(job) for job in jobs]})
+
+
+@bottle.route(url_base + '/networks/openflow/jobs/<job_id>', method='GET')
+def http_get_openflow_job_id(job_id):
+    """get the status of an openflow-reinstall job, with the flows installed and deleted at each openflow
+    controller as progress"""
+    my = config_dic['http_threads'][threading.current_thread().name]
+    if not my.admin:
+        bottle.abort(HTTP_Unauthorized, "Needed admin privileges")
+    job = my.get_openflow_jobs().get_job(job_id)
+    if not job:
+        bottle.abort(HTTP_Not_Found, "Job '{}' not found".format(job_id))
+    return format_out({'job': format_openflow_job(job)})
+
+
 @bottle.route(url_base + '/networks/clear/openflow/<ofc_id>', method='DELETE')
 @bottle.route(url_base + '/networks/clear/openflow', method='DELETE')
 def http_clear_openflow_rules(ofc_id=None):
@@ -2302,11 +2721,17 @@ def http_get_ports():
             ('id','name','tenant_id','network_id','vpci','mac_address','device_owner','device_id',
              'binding:switch_port','binding:vlan','bandwidth','status','admin_state_up','ip_address') )
     try:
-        ports = my.ovim.get_ports(columns=select_, filter=where_, limit=limit_)
-        delete_nulls(ports)
-        change_keys_http2db(ports, http2db_port, reverse=True)
-        data={'ports' : ports}
-        return format_out(data)
+        chunks = my.ovim.get_ports_by_chunks(columns=select_, filter=where_, limit=limit_,
+                                             marker=get_marker(bottle.request.query))
+        result, ports = next(chunks)
+        if result < 0:
+            raise ovim.ovimException(str(ports), -result)
+
+        def convert_row(row):
+            delete_nulls(row)
+            change_keys_http2db(row, http2db_port, reverse=True)
+
+        return format_out_list('ports', itertools.chain(((result, ports),), chunks), convert_row, limit_)
     except ovim.ovimException as e:
         my.logger.error(str(e), exc_info=True)
         bottle.abort(e.http_code, str(e))
@@ -2415,7 +2840,10 @@ def http_delete_port_id(port_id):
 @bottle.route(url_base + '/openflow/mapping', method='POST')
 def http_of_port_mapping():
     """
-    Create new compute port mapping entry
+    Create new compute port mapping entries. All the entries are validated and inserted at once. Optional 'mode' is
+    'insert' (default), 'upsert' to replace entries of the same region, compute_node and pci, or 'replace' to
+    delete first all the entries of the regions present. On conflict nothing is inserted and 409 is returned with
+    the list of conflicting entries
     :return:
     """
     my = config_dic['http_threads'][threading.current_thread().name]
@@ -2427,7 +2855,12 @@ def http_of_port_mapping():
             my.logger.error("http_of_port_mapping: Warning: remove extra items " + str(r), exc_info=True)
 
         # insert in data base
-        port_mapping = my.ovim.set_of_port_mapping(http_content['of_port_mapings'])
+        content = my.ovim.import_of_port_mappings(http_content['of_port_mapings'],
+                                                  http_content.get('mode', 'insert'))
+        if content['conflicts']:
+            bottle.response.status = HTTP_Conflict
+            return format_out({'conflicts': content['conflicts']})
+        port_mapping = content['of_port_mappings']
         change_keys_http2db(port_mapping, http2db_id, reverse=True)
         delete_nulls(port_mapping)
         data = {'of_port_mappings': port_mapping}
@@ -2487,3 +2920,105 @@ def delete_of_port_mapping(region):
         my.logger.error(str(e), exc_info=True)
         bottle.abort(HTTP_Bad_Request, str(e))
 
+
+#
+# METRICS
+#
+
+
+@bottle.route(url_base + '/metrics', method='GET')
+def http_get_metrics():
+    """
+    Get queue depths, task, libvirt, ssh, database and openflow controller latencies in Prometheus text format.
+    Only available at the admin port
+    :return:
+    """
+    my = config_dic['http_threads'][threading.current_thread().name]
+    if not my.admin:
+        bottle.abort(HTTP_Unauthorized, "Needed admin privileges")
+    bottle.response.content_type = 'text/plain; version=0.0.4'
+    return metrics.render()
+
+
+@bottle.route(url_base + '/db/profile', method='GET')
+def http_get_db_profile():
+    """
+    Get the statistics of the SQL profiler per call site, sorted by total time. Query string 'top' limits the number
+    of entries, 20 by default. Only available at the admin port and when 'db_profile' is enabled
+    :return:
+    """
+    my = config_dic['http_threads'][threading.current_thread().name]
+    if not my.admin:
+        bottle.abort(HTTP_Unauthorized, "Needed admin privileges")
+    try:
+        top = int(bottle.request.query.get('top', 20))
+    except ValueError:
+        bottle.abort(HTTP_Bad_Request, "Invalid value for 'top', integer expected")
+    try:
+        profile = my.ovim.get_db_profile(top)
+        return format_out({"profile": profile})
+    except ovim.ovimException as e:
+        my.logger.error(str(e), exc_info=True)
+        bottle.abort(e.http_code, str(e))
+
+
+@bottle.route(url_base + '/db/profile', method='DELETE')
+def http_delete_db_profile():
+    """
+    Clear the statistics of the SQL profiler. Only available at the admin port
+    :return:
+    """
+    my = config_dic['http_threads'][threading.current_thread().name]
+    if not my.admin:
+        bottle.abort(HTTP_Unauthorized, "Needed admin privileges")
+    try:
+        my.ovim.reset_db_profile()
+        return format_out({"result": "database profile cleared"})
+    except ovim.ovimException as e:
+        my.logger.error(str(e), exc_info=True)
+        bottle.abort(e.http_code, str(e))
+
+
+#
+# CLUSTER
+#
+
+
+@bottle.route(url_base + '/cluster', method='GET')
+def http_get_cluster():
+    """
+    Get the openvim instances sharing the database, and per host, ofc and dhcp server its owner instance, lease
+    expiration and tasks pending to be delivered. Only available at the admin port and when 'cluster' is enabled
+    :return:
+    """
+    my = config_dic['http_threads'][threading.current_thread().name]
+    if not my.admin:
+        bottle.abort(HTTP_Unauthorized, "Needed admin privileges")
+    try:
+        return format_out({"cluster": my.ovim.get_cluster_status()})
+    except ovim.ovimException as e:
+        my.logger.error(str(e), exc_info=True)
+        bottle.abort(e.http_code, str(e))
+
+
+#
+# CACHES
+#
+
+
+@bottle.route(url_base + '/cache', method='GET')
+def http_get_metadata_cache():
+    """
+    Get the size, time to live and per kind hit rates of the cache of tenant, flavor and image rows used at server
+    creation, and of the cache of GET responses. Only available at the admin port
+    :return:
+    """
+    my = config_dic['http_threads'][threading.current_thread().name]
+    if not my.admin:
+        bottle.abort(HTTP_Unauthorized, "Needed admin privileges")
+    try:
+        return format_out({"cache": my.ovim.get_metadata_cache_status(),
+                           "response_cache": my.ovim.get_response_cache_status()})
+    except ovim.ovimException as e:
+        my.logger.error(str(e), exc_info=True)
+        bottle.abort(e.http_code, str(e))
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+Pool of worker threads that run long operations in background, as the autodiscovery of compute nodes, so that the
+http server can answer at once with a job identifier. The status of each job is kept in memory for a while after
+finishing, to be consulted through the API.
+'''
+__date__ = "$19-oct-2026 10:00:00$"
+
+import threading
+import Queue
+import logging
+import time
+import uuid as myUuid
+import traceback
+
+
+class JobPool(object):
+    def __init__(self, workers=8, name="jobs", logger_name="openvim.jobs", keep_time=3600):
+        """
+        Creates and starts the worker threads
+        :param workers: number of threads, that is, of jobs running concurrently
+        :param name: prefix of the thread names, that are '<name>-<index>'
+        :param logger_name: logger name
+        :param keep_time: seconds that a finished job is kept
+        """
+        self.name = name
+        self.keep_time = keep_time
+        self.logger = logging.getLogger(logger_name)
+        self.queue = Queue.Queue()
+        self.lock = threading.Lock()
+        self.jobs = {}      # job_id: job dictionary
+        self.threads = []
+        for index in range(0, workers):
+            thread = threading.Thread(target=self._worker, name="{}-{}".format(name, index))
+            thread.daemon = True
+            self.threads.append(thread)
+
+    @property
+    def thread_names(self):
+        return [thread.name for thread in self.threads]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, job_type, function, *args):
+        """
+        Queue a new job
+        :param job_type: text describing the job, e.g. 'host-discovery'
+        :param function: callable invoked as function(job, *args) at a worker thread. It can update job['progress'].
+            The returned value is stored at job['result']; an exception sets the job in 'error' status
+        :param args: additional arguments for function
+        :return: copy of the job dictionary
+        """
+        self._purge()
+        job = {"id": str(myUuid.uuid4()), "type": job_type, "status": "queued", "created_at": time.time(),
+               "started_at": None, "finished_at": None, "progress": None, "result": None, "error": None}
+        with self.lock:
+            self.jobs[job["id"]] = job
+        self.queue.put((job, function, args))
+        return dict(job)
+
+    def get_job(self, job_id):
+        """
+        Get the status of a job
+        :param job_id: job identifier
+        :return: copy of the job dictionary or None if not found
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def get_jobs(self, job_type=None):
+        """
+        Get the status of all jobs, sorted by creation time
+        :param job_type: if provided, only jobs of this type are returned
+        :return: list of job dictionaries
+        """
+        with self.lock:
+            jobs = [dict(job) for job in self.jobs.values() if not job_type or job["type"] == job_type]
+        return sorted(jobs, key=lambda job: job["created_at"])
+
+    def _purge(self):
+        limit = time.time() - self.keep_time
+        with self.lock:
+            for job_id, job in self.jobs.items():
+                if job["finished_at"] and job["finished_at"] < limit:
+                    del self.jobs[job_id]
+
+    def _worker(self):
+        while True:
+            job, function, args = self.queue.get()
+            job["started_at"] = time.time()
+            job["status"] = "running"
+            try:
+                job["result"] = function(job, *args)
+                job["status"] = "done"
+            except Exception as e:
+                self.logger.error("Job %s %s failed: %s", job["type"], job["id"], str(e))
+                self.logger.debug(traceback.format_exc())
+                job["error"] = str(e)
+                job["http_code"] = getattr(e, "http_code", 500)
+                job["status"] = "error"
+            finally:
+                job["finished_at"] = time.time()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+Read-through cache of the tenant, flavor and image rows, and of their tenant associations, looked up when servers are
+created and acted on. Entries expire after a time to live and are invalidated by the http handlers that change these
+tables, and by any committed write to them through the vim_db change listener. Only rows that are found are cached,
+so that a new row is seen at once. It is shared by the http and host threads; each caller passes its own database
+connection, used on misses.
+'''
+__date__ = "$19-oct-2026 10:00:00$"
+
+import threading
+import time
+
+KINDS = ("tenants", "tenants_flavors", "tenants_images", "images")
+
+
+class MetadataCache(object):
+    def __init__(self, ttl=60, max_entries=10000):
+        """
+        :param ttl: seconds an entry is valid. 0 disables the cache
+        :param max_entries: maximum number of entries. Expired ones are purged when reached, and all if not enough
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = {}       # (kind, id, ...): (expiration time, rows)
+        self.generation = 0     # increased at every invalidation, to discard loads that overlap with it
+        self.stats = dict((kind, {"hits": 0, "misses": 0}) for kind in KINDS)
+        self.invalidations = 0
+
+    def _get(self, key, load):
+        """
+        Get the rows of an entry, loading them on miss
+        :param key: tuple with the kind as first element
+        :param load: function that returns the (result, content) of the database query
+        :return: (result, content) as vim_db.get_table. content is a copy that can be modified
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > now:
+                self.stats[key[0]]["hits"] += 1
+                return len(entry[1]), [dict(row) for row in entry[1]]
+            self.stats[key[0]]["misses"] += 1
+            generation = self.generation
+        result, content = load()
+        if result > 0 and self.ttl:
+            rows = [dict(row) for row in content]
+            with self.lock:
+                if generation == self.generation:
+                    if len(self.entries) >= self.max_entries:
+                        self._purge(now)
+                    self.entries[key] = (now + self.ttl, rows)
+        return result, content
+
+    def _purge(self, now):
+        for key in [key for key, entry in self.entries.items() if entry[0] <= now]:
+            del self.entries[key]
+        if len(self.entries) >= self.max_entries:
+            self.entries.clear()
+
+    def get_tenant(self, db, tenant_id):
+        """Get the uuid of a tenant, to check that it exists"""
+        return self._get(("tenants", tenant_id),
+                         lambda: db.get_table(FROM='tenants', SELECT=('uuid',), WHERE={'uuid': tenant_id}))
+
+    def get_tenant_flavor(self, db, tenant_id, flavor_id):
+        """Get ram, vcpus and extended of a flavor attached to a tenant"""
+        return self._get(("tenants_flavors", tenant_id, flavor_id),
+                         lambda: db.get_table(FROM='tenants_flavors as tf join flavors as f on tf.flavor_id=f.uuid',
+                                              SELECT=('ram', 'vcpus', 'extended'),
+                                              WHERE={'uuid': flavor_id, 'tenant_id': tenant_id}))
+
+    def get_tenant_image(self, db, tenant_id, image_id):
+        """Get path, metadata and image_id (None when not attached to the tenant) of an ACTIVE image, attached to the
+        tenant or public"""
+        return self._get(("tenants_images", tenant_id, image_id),
+                         lambda: db.get_table(FROM='tenants_images as ti right join images as i on ti.image_id=i.uuid',
+                                              SELECT=('path', 'metadata', 'image_id'),
+                                              WHERE={'uuid': image_id, "status": "ACTIVE"},
+                                              WHERE_OR={'tenant_id': tenant_id, 'public': 'yes'},
+                                              WHERE_AND_OR="AND", DISTINCT=True))
+
+    def get_image(self, db, image_id):
+        """Get path and metadata of an image"""
+        return self._get(("images", image_id),
+                         lambda: db.get_table(FROM='images', SELECT=('path', 'metadata'), WHERE={'uuid': image_id}))
+
+    def invalidate(self, table=None, uuid=None):
+        """
+        Remove the entries of a changed row
+        :param table: 'tenants', 'flavors' or 'images'. None for all the entries
+        :param uuid: id of the changed row. None for all the entries of the table
+        :return: None
+        """
+        with self.lock:
+            self.generation += 1
+            self.invalidations += 1
+            if not table or table == "tenants":
+                # deleting a tenant also deletes its flavors and images
+                self.entries.clear()
+                return
+            if table == "flavors":
+                kinds = {"tenants_flavors": 2}      # kind: position of the id at the key
+            else:
+                kinds = {"tenants_images": 2, "images": 1}
+            for key in self.entries.keys():
+                if key[0] in kinds and (uuid is None or key[kinds[key[0]]] == uuid):
+                    del self.entries[key]
+
+    def on_change(self, tables):
+        """
+        vim_db change listener. Remove the entries of the written tables
+        :param tables: set of changed tables
+        :return: None
+        """
+        if "tenants" in tables:
+            self.invalidate()
+            return
+        if "flavors" in tables or "tenants_flavors" in tables:
+            self.invalidate("flavors")
+        if "images" in tables or "tenants_images" in tables:
+            self.invalidate("images")
+
+    def get_status(self):
+        """
+        Get the size and hit rate of the cache
+        :return: dictionary with ttl, entries, invalidations and per kind hits, misses and hit_rate
+        """
+        with self.lock:
+            status = {"ttl": self.ttl, "entries": len(self.entries), "invalidations": self.invalidations}
+            for kind, stats in self.stats.items():
+                total = stats["hits"] + stats["misses"]
+                status[kind] = {"hits": stats["hits"], "misses": stats["misses"],
+                                "hit_rate": float(stats["hits"]) / total if total else None}
+        return status
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+In process metrics of openvim, rendered in the Prometheus text exposition format by the admin http server.
+Histograms use fixed buckets and a single lock held only to add one sample, so instrumentation can be left on.
+Task queues of the host, openflow and dhcp threads are TimedQueue instances that record how long each task waited
+and report their depth at scrape time.
+'''
+__date__ = "$19-oct-2026 10:00:00$"
+
+import time
+import threading
+import weakref
+import Queue
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+HELP = {
+    "openvim_task_queue_depth": ("gauge", "Number of tasks waiting at the thread queue"),
+    "openvim_task_queue_capacity": ("gauge", "Maximum number of tasks of the thread queue"),
+    "openvim_task_wait_seconds": ("histogram", "Time a task waited at the queue before being processed"),
+    "openvim_task_run_seconds": ("histogram", "Time spent processing a task"),
+    "openvim_ssh_command_seconds": ("histogram", "Latency of commands run at compute nodes"),
+    "openvim_libvirt_call_seconds": ("histogram", "Latency of libvirt calls"),
+    "openvim_db_query_seconds": ("histogram", "Latency of database statements by vim_db method"),
+    "openvim_ofc_request_seconds": ("histogram", "Latency of openflow controller requests"),
+}
+
+_lock = threading.Lock()
+_histograms = {}    # name: {labels_tuple: [bucket_counts, sum, count]}
+_queues = weakref.WeakValueDictionary()     # thread name: TimedQueue
+
+
+def observe(name, value, **labels):
+    """
+    Add a sample to a histogram
+    :param name: metric name
+    :param value: sample, in seconds for latencies
+    :param labels: metric labels
+    :return: None
+    """
+    key = tuple(sorted(labels.items()))
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        entry = series.get(key)
+        if entry is None:
+            entry = series[key] = [[0] * len(BUCKETS), 0.0, 0]
+        buckets = entry[0]
+        for index in range(len(BUCKETS) - 1, -1, -1):
+            if value > BUCKETS[index]:
+                break
+            buckets[index] += 1
+        entry[1] += value
+        entry[2] += 1
+
+
+class timer(object):
+    """Context manager that observes the elapsed time of the block, e.g.:
+        with metrics.timer("openvim_libvirt_call_seconds", call="open"):
+            conn = libvirt.open(uri)
+    """
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        observe(self.name, time.time() - self.start, **self.labels)
+        return False
+
+
+class TimedQueue(Queue.Queue):
+    """Queue.Queue that records the time each item waits at the queue. Items must be tuples with the task type as
+    first element, as used by insert_task of the openvim threads"""
+
+    def __init__(self, maxsize, thread_name):
+        Queue.Queue.__init__(self, maxsize)
+        self.thread_name = thread_name
+        _queues[thread_name] = self
+
+    def _put(self, item):
+        self.queue.append((time.time(), item))
+
+    def _get(self):
+        enqueued, item = self.queue.popleft()
+        observe("openvim_task_wait_seconds", time.time() - enqueued, thread=self.thread_name, task=str(item[0]))
+        return item
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                          for k, v in labels) + "}"
+
+
+def _header(lines, name):
+    metric_type, text = HELP.get(name, ("untyped", ""))
+    lines.append("# HELP {} {}".format(name, text))
+    lines.append("# TYPE {} {}".format(name, metric_type))
+
+
+def render():
+    """
+    Obtain all the metrics in Prometheus text format
+    :return: text
+    """
+    lines = []
+    queues = _queues.items()
+    for name, attr in (("openvim_task_queue_depth", "qsize"), ("openvim_task_queue_capacity", None)):
+        _header(lines, name)
+        for thread_name, queue in queues:
+            value = queue.qsize() if attr else queue.maxsize
+            lines.append("{}{} {}".format(name, _format_labels((("thread", thread_name),)), value))
+    with _lock:
+        snapshot = [(name, [(key, list(entry[0]), entry[1], entry[2]) for key, entry in series.items()])
+                    for name, series in sorted(_histograms.items())]
+    for name, series in snapshot:
+        _header(lines, name)
+        for key, buckets, total, count in series:
+            for index, bound in enumerate(BUCKETS):
+                lines.append("{}_bucket{} {}".format(name, _format_labels(key + (("le", str(bound)),)),
+                                                     buckets[index]))
+            lines.append("{}_bucket{} {}".format(name, _format_labels(key + (("le", "+Inf"),)), count))
+            lines.append("{}_sum{} {}".format(name, _format_labels(key), repr(total)))
+            lines.append("{}_count{} {}".format(name, _format_labels(key), count))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+In memory copy of the of_port_mappings table, indexed by compute node port, by switch port and by switch mac, so that
+port to switch resolution does not need database access. It is loaded by ovim.start_service and reloaded from the
+database at the first search after any write to the table, as told by the vim_db change listener, or after the
+cluster heartbeat discards it, as rows may be written by other openvim instances. Values are compared case
+insensitively, as the database collation does.
+'''
+__date__ = "$19-oct-2026 10:00:00$"
+
+import threading
+
+COLUMNS = ("uuid", "ofc_id", "region", "compute_node", "pci", "switch_dpid", "switch_port", "switch_mac")
+
+
+def _fold(value):
+    if isinstance(value, basestring):
+        return value.lower()
+    return value
+
+
+class OfPortMappingIndex(object):
+    def __init__(self, rows=(), loader=None):
+        """
+        :param rows: initial list of of_port_mappings rows
+        :param loader: function returning all the rows of the table, used to reload it (Optional). Without it the
+            content is only changed by the load, add and remove methods
+        """
+        self.lock = threading.Lock()
+        self.loader = loader
+        self.version = 0            # increased at every invalidation
+        self.loaded_version = 0     # version of the content
+        self.by_uuid = {}
+        self.by_compute_pci = {}    # (compute_node, pci): list of rows
+        self.by_switch_port = {}    # (switch_dpid, switch_port): list of rows
+        self.by_switch_mac = {}     # switch_mac: list of rows
+        self.load(rows)
+
+    def __len__(self):
+        return len(self.by_uuid)
+
+    @staticmethod
+    def _keys(row):
+        return ((_fold(row["compute_node"]), _fold(row["pci"])), (_fold(row["switch_dpid"]), _fold(row["switch_port"])),
+                _fold(row["switch_mac"]))
+
+    def _indexes(self):
+        return self.by_compute_pci, self.by_switch_port, self.by_switch_mac
+
+    def _add(self, row):
+        row = dict((column, row.get(column)) for column in COLUMNS)
+        self._remove(row["uuid"])
+        self.by_uuid[row["uuid"]] = row
+        for index, key in zip(self._indexes(), self._keys(row)):
+            index.setdefault(key, []).append(row)
+
+    def _remove(self, uuid):
+        row = self.by_uuid.pop(uuid, None)
+        if not row:
+            return
+        for index, key in zip(self._indexes(), self._keys(row)):
+            rows = index[key]
+            rows.remove(row)
+            if not rows:
+                del index[key]
+
+    def load(self, rows, version=None):
+        """
+        Replace the content with a new one
+        :param rows: list of of_port_mappings rows
+        :param version: version read before getting the rows, internal use
+        :return: None
+        """
+        with self.lock:
+            self.by_uuid = {}
+            self.by_compute_pci = {}
+            self.by_switch_port = {}
+            self.by_switch_mac = {}
+            for row in rows:
+                self._add(row)
+            self.loaded_version = self.version if version is None else version
+
+    def reload(self):
+        """
+        Load the content from the database with the loader. Invalidations done meanwhile are kept
+        :return: None
+        """
+        version = self.version
+        self.load(self.loader(), version)
+
+    def invalidate(self, tables=None):
+        """
+        Discard the content, that is reloaded at the next search. It is a vim_db change listener
+        :param tables: set of changed tables; nothing is done unless it contains of_port_mappings. None for all
+        :return: None
+        """
+        if tables is None or "of_port_mappings" in tables:
+            with self.lock:
+                self.version += 1
+
+    def add(self, rows):
+        """
+        Add or replace (by uuid) entries
+        :param rows: list of of_port_mappings rows, with uuid
+        :return: None
+        """
+        with self.lock:
+            for row in rows:
+                self._add(row)
+
+    def remove(self, **db_filter):
+        """
+        Remove the entries that match a filter, as clear_of_port_mapping does at database
+        :param db_filter: column=value pairs, as the WHERE of the DELETE statement. Value can be a list of values
+        :return: number of entries removed
+        """
+        with self.lock:
+            uuids = [row["uuid"] for row in self._find(db_filter)]
+            for uuid in uuids:
+                self._remove(uuid)
+        return len(uuids)
+
+    def _find(self, db_filter):
+        db_filter = dict((column, set(_fold(v) for v in value) if isinstance(value, (list, tuple, set)) else
+                          _fold(value)) for column, value in db_filter.items())
+        if isinstance(db_filter.get("uuid"), set):
+            candidates = [self.by_uuid[uuid] for uuid in db_filter["uuid"] if uuid in self.by_uuid]
+        elif "uuid" in db_filter:
+            candidates = [self.by_uuid[db_filter["uuid"]]] if db_filter["uuid"] in self.by_uuid else []
+        elif "compute_node" in db_filter and "pci" in db_filter:
+            candidates = self.by_compute_pci.get((db_filter["compute_node"], db_filter["pci"]), ())
+        elif "switch_dpid" in db_filter and "switch_port" in db_filter:
+            candidates = self.by_switch_port.get((db_filter["switch_dpid"], db_filter["switch_port"]), ())
+        elif "switch_mac" in db_filter:
+            candidates = self.by_switch_mac.get(db_filter["switch_mac"], ())
+        else:
+            candidates = self.by_uuid.values()
+        found = []
+        for row in candidates:
+            for column, value in db_filter.items():
+                if isinstance(value, set):
+                    if _fold(row.get(column)) not in value:
+                        break
+                elif _fold(row.get(column)) != value:
+                    break
+            else:
+                found.append(row)
+        return found
+
+    def find(self, columns=None, **db_filter):
+        """
+        Get the entries that match a filter, as the database would do. The content is reloaded first if it has been
+        invalidated
+        :param columns: list of columns to return, all by default
+        :param db_filter: column=value pairs, e.g. compute_node=<id>, pci=<pci>. Value can be a list of values
+        :return: list of new dictionaries
+        """
+        if self.loader and self.loaded_version != self.version:
+            self.reload()
+        with self.lock:
+            rows = self._find(db_filter)
+        if columns:
+            return [dict((column, row[column]) for column in columns) for row in rows]
+        return [dict(row) for row in rows]
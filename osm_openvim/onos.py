@@ -304,6 +304,8 @@ class OF_conn(openflow_conn.OpenflowConn):
                         actions.append( ('vlan', 'None') )
                     if instruction['type'] == "L2MODIFICATION" and instruction['subtype'] == "VLAN_ID":
                         actions.append( ('vlan', instruction['vlanId']) )
+                    if instruction['type'] == "GROUP":
+                        actions.append( ('group', instruction['groupId']) )
 
                 rule['actions'] = actions
                 rules[flow['id']] = dict(rule)
@@ -344,6 +346,40 @@ class OF_conn(openflow_conn.OpenflowConn):
             self.logger.error("del_flow " + error_text)
             raise openflow_conn.OpenflowconnConnectionException(error_text)
 
+    def _translate_actions(self, action_list):
+        """
+        Build the ONOS treatment instructions from the generic action list
+        :param action_list: list of actions, composed by a pair tuples ('vlan', None/int), ('out', port) or
+            ('group', group_id)
+        :return: list of instructions. Raise a openflowconnUnexpectedResponse exception if unknown
+        """
+        instructions = []
+        for action in action_list:
+            new_action = dict()
+            if  action[0] == "vlan":
+                new_action['type'] = "L2MODIFICATION"
+                if action[1] == None:
+                    new_action['subtype'] = "VLAN_POP"
+                else:
+                    new_action['subtype'] = "VLAN_ID"
+                    new_action['vlanId'] = int(action[1])
+            elif action[0] == 'out':
+                new_action['type'] = "OUTPUT"
+                if not action[1] in self.pp2ofi:
+                    error_msj = 'Port '+ action[1] + ' is not present in the switch'
+                    raise openflow_conn.OpenflowconnUnexpectedResponse(error_msj)
+                new_action['port'] = self.pp2ofi[action[1]]
+            elif action[0] == 'group':
+                new_action['type'] = "GROUP"
+                new_action['groupId'] = int(action[1])
+            else:
+                error_msj = "Unknown item '%s' in action list" % action[0]
+                self.logger.error("new_flow " + error_msj)
+                raise openflow_conn.OpenflowconnUnexpectedResponse(error_msj)
+
+            instructions.append(new_action)
+        return instructions
+
     def new_flow(self, data):
         """
         Insert a new static rule
@@ -356,6 +392,7 @@ class OF_conn(openflow_conn.OpenflowConn):
                 actions:      list of actions, composed by a pair tuples with these posibilities:
                     ('vlan', None/int): for stripping/setting a vlan tag
                     ('out', port):      send to this port
+                    ('group', group_id): send to this group
         :return: Raise a openflowconnUnexpectedResponse expection in case of failure
         """
         try:
@@ -399,31 +436,9 @@ class OF_conn(openflow_conn.OpenflowConn):
 
             # Flow rule treatment
             flow['treatment'] = dict()
-            flow['treatment']['instructions'] = list()
+            flow['treatment']['instructions'] = self._translate_actions(data['actions'])
             flow['treatment']['deferred'] = list()
 
-            for action in data['actions']:
-                new_action = dict()
-                if  action[0] == "vlan":
-                    new_action['type'] = "L2MODIFICATION"
-                    if action[1] == None:
-                        new_action['subtype'] = "VLAN_POP"
-                    else:
-                        new_action['subtype'] = "VLAN_ID"
-                        new_action['vlanId'] = int(action[1])
-                elif action[0] == 'out':
-                    new_action['type'] = "OUTPUT"
-                    if not action[1] in self.pp2ofi:
-                        error_msj = 'Port '+ action[1] + ' is not present in the switch'
-                        raise openflow_conn.OpenflowconnUnexpectedResponse(error_msj)
-                    new_action['port'] = self.pp2ofi[action[1]]
-                else:
-                    error_msj = "Unknown item '%s' in action list" % action[0]
-                    self.logger.error("new_flow " + error_msj)
-                    raise openflow_conn.OpenflowconnUnexpectedResponse(error_msj)
-
-                flow['treatment']['instructions'].append(new_action)
-
             self.headers['content-type'] = 'application/json'
             path = self.url + "flows/" + self.id
             of_response = requests.post(path, headers=self.headers, data=json.dumps(flow) )
@@ -445,6 +460,119 @@ class OF_conn(openflow_conn.OpenflowConn):
             self.logger.error("new_flow " + error_text)
             raise openflow_conn.OpenflowconnConnectionException(error_text)
 
+    @staticmethod
+    def _bucket_key(bucket):
+        """Comparable form of the instructions of a group bucket, as sent or as returned by ONOS"""
+        return tuple(tuple(sorted((k, str(v)) for k, v in instruction.items()))
+                     for instruction in bucket['treatment']['instructions'])
+
+    def new_group(self, data):
+        """
+        Insert or modify a group of type ALL. The application cookie of the group is its identifier. An existing
+        group is modified adding and removing buckets, so that the flows that use it keep forwarding meanwhile
+        :param data: dictionary with 'group_id' and 'buckets', a list of action lists. See new_flow
+        :return: Raise a openflowconnUnexpectedResponse expection in case of failure
+        """
+        try:
+            if len(self.pp2ofi) == 0:
+                self.obtain_port_correspondence()
+
+            group = {'type': "ALL", 'groupId': data['group_id'], 'appCookie': hex(data['group_id']),
+                     'buckets': [{'treatment': {'instructions': self._translate_actions(bucket_actions)}}
+                                 for bucket_actions in data['buckets']]}
+            path = self.url + "groups/" + self.id + "/" + group['appCookie']
+            self.headers['content-type'] = None
+            of_response = requests.get(path, headers=self.headers)
+            error_text = "Openflow response %d: %s" % (of_response.status_code, of_response.text)
+            if of_response.status_code == 404:
+                return self._post_group(group)
+            elif of_response.status_code != 200:
+                self.logger.warning("new_group " + error_text)
+                raise openflow_conn.OpenflowconnUnexpectedResponse(error_text)
+
+            info = of_response.json()
+            current = info.get('groups', [info])[0].get('buckets', [])
+            current_keys = set(self._bucket_key(bucket) for bucket in current)
+            new_keys = set(self._bucket_key(bucket) for bucket in group['buckets'])
+            added = [bucket for bucket in group['buckets'] if self._bucket_key(bucket) not in current_keys]
+            removed = [bucket.get('bucketId') for bucket in current if self._bucket_key(bucket) not in new_keys]
+            if None in removed:
+                # buckets without identifier, from ONOS versions that cannot remove them one by one
+                return self._replace_group(group)
+            if added:
+                self.headers['content-type'] = 'application/json'
+                of_response = requests.post(path + "/buckets", headers=self.headers,
+                                            data=json.dumps({'buckets': added}))
+                error_text = "Openflow response %d: %s" % (of_response.status_code, of_response.text)
+                if of_response.status_code not in (200, 201, 204):
+                    self.logger.warning("new_group " + error_text)
+                    raise openflow_conn.OpenflowconnUnexpectedResponse(error_text)
+            if removed:
+                self.headers['content-type'] = None
+                of_response = requests.delete(path + "/buckets/" + ",".join(str(bucket_id) for bucket_id in removed),
+                                              headers=self.headers)
+                error_text = "Openflow response %d: %s" % (of_response.status_code, of_response.text)
+                if of_response.status_code != 204:
+                    self.logger.warning("new_group " + error_text)
+                    raise openflow_conn.OpenflowconnUnexpectedResponse(error_text)
+            self.logger.debug("new_group OK modified, %d buckets added, %d removed", len(added), len(removed))
+            return None
+
+        except requests.exceptions.RequestException as e:
+            error_text = type(e).__name__ + ": " + str(e)
+            self.logger.error("new_group " + error_text)
+            raise openflow_conn.OpenflowconnConnectionException(error_text)
+
+    def _replace_group(self, group):
+        """
+        Delete an existing group and create it again with new buckets
+        :param group: ONOS group, as built by new_group
+        :return: Raise a openflowconnUnexpectedResponse expection in case of failure
+        """
+        self.headers['content-type'] = None
+        of_response = requests.delete(self.url + "groups/" + self.id + "/" + group['appCookie'], headers=self.headers)
+        if of_response.status_code != 204 and of_response.status_code != 404:
+            error_text = "Openflow response %d: %s" % (of_response.status_code, of_response.text)
+            self.logger.warning("new_group " + error_text)
+            raise openflow_conn.OpenflowconnUnexpectedResponse(error_text)
+        return self._post_group(group)
+
+    def _post_group(self, group):
+        """
+        Create a group
+        :param group: ONOS group, as built by new_group
+        :return: Raise a openflowconnUnexpectedResponse expection in case of failure
+        """
+        self.headers['content-type'] = 'application/json'
+        of_response = requests.post(self.url + "groups/" + self.id, headers=self.headers, data=json.dumps(group))
+        error_text = "Openflow response %d: %s" % (of_response.status_code, of_response.text)
+        if of_response.status_code != 201:
+            self.logger.warning("new_group " + error_text)
+            raise openflow_conn.OpenflowconnUnexpectedResponse(error_text)
+        self.logger.debug("new_group OK " + error_text)
+        return None
+
+    def del_group(self, group_id):
+        """
+        Delete an existing group
+        :param group_id: group identifier
+        :return: Raise a openflowconnUnexpectedResponse expection in case of failure
+        """
+        try:
+            self.headers['content-type'] = None
+            of_response = requests.delete(self.url + "groups/" + self.id + "/" + hex(group_id), headers=self.headers)
+            error_text = "Openflow response %d: %s" % (of_response.status_code, of_response.text)
+            if of_response.status_code != 204:
+                self.logger.warning("del_group " + error_text)
+                raise openflow_conn.OpenflowconnUnexpectedResponse(error_text)
+            self.logger.debug("del_group OK " + error_text)
+            return None
+
+        except requests.exceptions.RequestException as e:
+            error_text = type(e).__name__ + ": " + str(e)
+            self.logger.error("del_group " + error_text)
+            raise openflow_conn.OpenflowconnConnectionException(error_text)
+
     def clear_all_flows(self):
         """
         Delete all existing rules
@@ -165,6 +165,26 @@ class OpenflowConn:
                 actions:      list of actions, composed by a pair tuples with these posibilities:
                     ('vlan', None/int): for stripping/setting a vlan tag
                     ('out', port):      send to this port
+                    ('group', group_id): send to this group, see new_group
+        :return: None if ok, text_error if fails
+        """
+        raise OpenflowconnNotImplemented("Should have implemented this")
+
+    def new_group(self, data):
+        """
+        Insert or replace a group of type ALL, that sends a copy of the packet to each bucket. It is used for
+        broadcast traffic. Packets are not sent back by the ingress port
+        :param data: dictionary with the following content:
+                group_id: group identifier, integer
+                buckets:  list of buckets, each one a list of actions as the ones of new_flow, without 'group'
+        :return: None if ok, text_error if fails
+        """
+        raise OpenflowconnNotImplemented("Should have implemented this")
+
+    def del_group(self, group_id):
+        """
+        Delete an existing group
+        :param group_id: group identifier
         :return: None if ok, text_error if fails
         """
         raise OpenflowconnNotImplemented("Should have implemented this")
@@ -190,6 +210,7 @@ class OfTestConnector(OpenflowConn):
         self.name = name
         self.dpid = params.get("dpid")
         self.rules = {}
+        self.groups = {}
         self.logger = logging.getLogger('vim.OF.TEST')
         self.logger.setLevel(getattr(logging, params.get("of_debug", "ERROR")))
         self.pp2ofi = {}
@@ -214,6 +235,20 @@ class OfTestConnector(OpenflowConn):
         self.logger.debug("new_flow OK")
         return None
 
+    def new_group(self, data):
+        self.groups[data["group_id"]] = data
+        self.logger.debug("new_group OK")
+        return None
+
+    def del_group(self, group_id):
+        if group_id in self.groups:
+            self.logger.debug("del_group OK")
+            del self.groups[group_id]
+            return None
+        else:
+            self.logger.warning("del_group not found")
+            raise OpenflowconnUnexpectedResponse("group {} not found".format(group_id))
+
     def get_of_rules(self, translate_of_ports=True):
         return self.rules
 
@@ -37,6 +37,7 @@ import Queue
 import requests
 import logging
 import openflow_conn
+import metrics
 
 OFC_STATUS_ACTIVE = 'ACTIVE'
 OFC_STATUS_INACTIVE = 'INACTIVE'
@@ -84,21 +85,37 @@ def change_db2of(flow):
                     raise FlowBadFormat("Expected integer after vlan= at 'actions'")
         elif action_tuple[0].strip().lower()=="out":
             actions.append( ("out", str(action_tuple[1])) )
+        elif action_tuple[0].strip().lower()=="group":
+            try:
+                actions.append( ("group", int(action_tuple[1])) )
+            except:
+                raise FlowBadFormat("Expected integer after group= at 'actions'")
         else:
             raise FlowBadFormat("Unexpected '%s' at 'actions'"%action_tuple[0])
     flow['actions'] = actions
 
 
+def new_reinstall_progress(nets=0):
+    """Dictionary with the progress of a 'reinstall-nets' task, updated by openflow_thread.reinstall_flows. All the
+    keys are created here so that it can be read by other threads while updated"""
+    return {"status": "queued", "phase": None, "nets": nets, "nets_error": 0, "flows_to_install": 0,
+            "flows_installed": 0, "flows_to_delete": 0, "flows_deleted": 0, "errors": 0, "last_error": None}
+
+
 class openflow_thread(threading.Thread):
     """
     This thread interacts with a openflow controller to create dataplane connections
     """
     def __init__(self, of_uuid, of_connector, db, of_test, pmp_with_same_vlan=False, logger_name=None,
-                 debug=None):
+                 debug=None, broadcast_groups=False, reinstall_workers=8):
         threading.Thread.__init__(self)
         self.of_uuid = of_uuid
+        self.reinstall_workers = reinstall_workers   # concurrent controller requests when reinstalling all nets
         self.db = db
         self.pmp_with_same_vlan = pmp_with_same_vlan
+        self.broadcast_groups = broadcast_groups
+        self.groups = None      # group_id: list of buckets installed at controller, None if unknown. Loaded lazily
+        self.group_ids = {}     # (net_id, ingress tagged): group_id
         self.test = of_test
         self.OF_connector = of_connector
         if logger_name:
@@ -109,7 +126,12 @@ class openflow_thread(threading.Thread):
         if debug:
             self.logger.setLevel(getattr(logging, debug))
         self.queueLock = threading.Lock()
-        self.taskQueue = Queue.Queue(2000)
+        self.taskQueue = metrics.TimedQueue(2000, "ofc." + of_uuid)
+        # status written at database, to write only when it changes
+        self.ofc_status = None  # (status, last_error) of the ofc
+        self.nets_status = {}   # net_id: (status, last_error) written by this thread
+        self.nets_status_reset = set()  # nets whose status has been changed by others, protected by queueLock
+        self.pending_nets_status = {}  # net_id: (status, last_error) to be written at the end of a burst of tasks
 
     @staticmethod
     def _format_error_msg(error_text, max_length=1024):
@@ -137,24 +159,42 @@ class openflow_thread(threading.Thread):
                     task = self.taskQueue.get()
                 else:
                     task = None
+                for net_id in self.nets_status_reset:
+                    self.nets_status.pop(net_id, None)
+                self.nets_status_reset.clear()
                 self.queueLock.release()
 
                 if task is None:
+                    self.write_nets_status()
                     time.sleep(1)
                     continue
 
+                task_start = time.time()
                 if task[0] == 'update-net':
-                    r, c = self.update_of_flows(task[1])
+                    r, c = self.update_of_flows(task[1], task[2] if len(task) > 2 else None)
                     # update database status
                     if r<0:
-                        UPDATE={'status':'ERROR', 'last_error': self._format_error_msg(str(c), 255)}
+                        net_status = ('ERROR', self._format_error_msg(str(c), 255))
                         self.logger.error("processing task 'update-net' %s: %s", str(task[1]), c)
                         self.set_openflow_controller_status(OFC_STATUS_ERROR, "Error updating net {}".format(task[1]))
                     else:
-                        UPDATE={'status':'ACTIVE', 'last_error': None}
+                        net_status = ('ACTIVE', None)
                         self.logger.debug("processing task 'update-net' %s: OK", str(task[1]))
                         self.set_openflow_controller_status(OFC_STATUS_ACTIVE)
-                    self.db.update_rows('nets', UPDATE, WHERE={'uuid': task[1]})
+                    self.set_net_status(task[1], *net_status)
+
+                elif task[0] == 'reinstall-nets':
+                    r, c = self.reinstall_flows(task[1], task[2] if len(task) > 2 else None)
+                    if r < 0:
+                        self.logger.error("processing task 'reinstall-nets': %s", c)
+                        self.set_openflow_controller_status(OFC_STATUS_ERROR, "Error reinstalling nets")
+                    elif r > 0:
+                        self.logger.error("processing task 'reinstall-nets': %d nets with errors", r)
+                        self.set_openflow_controller_status(OFC_STATUS_ERROR,
+                                                            "Error reinstalling {} nets".format(r))
+                    else:
+                        self.logger.debug("processing task 'reinstall-nets' %d nets: OK", len(task[1]))
+                        self.set_openflow_controller_status(OFC_STATUS_ACTIVE)
 
                 elif task[0] == 'clear-all':
                     r,c = self.clear_all_flows()
@@ -166,11 +206,14 @@ class openflow_thread(threading.Thread):
                         self.logger.debug("processing task 'clear-all': OK")
                 elif task[0] == 'exit':
                     self.logger.debug("exit from openflow_thread")
+                    self.write_nets_status()
                     self.terminate()
                     self.set_openflow_controller_status(OFC_STATUS_INACTIVE, "Ofc with thread killed")
                     return 0
                 else:
                     self.logger.error("unknown task %s", str(task))
+                metrics.observe("openvim_task_run_seconds", time.time() - task_start, thread="ofc." + self.of_uuid,
+                                task=task[0])
             except openflow_conn.OpenflowconnException as e:
                 self.logger.error("OpenflowconnException: " + str(e))
                 self.set_openflow_controller_status(OFC_STATUS_ERROR, str(e))
@@ -181,7 +224,15 @@ class openflow_thread(threading.Thread):
         pass
         # print self.name, ": exit from openflow_thread"
 
-    def update_of_flows(self, net_id):
+    def update_of_flows(self, net_id, changed_ports=None):
+        """
+        Compute the flows of a net and all its bound nets and update them at database and openflow controller
+        :param net_id: net uuid
+        :param changed_ports: optional list of switch port names of the ports added to or removed from the net. If
+            provided, only the flows affected by these ports are updated when possible. See _update_changed_flows
+        :return: (0, 'Success') or (-1, error text)
+        """
+        requested_net_id = net_id
         ports=()
         select_= ('type','admin_state_up', 'vlan', 'provider', 'bind_net','bind_type','uuid')
         result, nets = self.db.get_table(FROM='nets', SELECT=select_, WHERE={'uuid':net_id} )
@@ -216,15 +267,8 @@ class openflow_thread(threading.Thread):
                     return -1, "DB error getting ports from net '%s': %s" % (net_id, net_ports)
                 
                 #add the binding as an external port
-                if net['provider'] and net['provider'][:9]=="openflow:":
-                    external_port={"type":"external","mac":None}
-                    external_port['uuid'] = net_id + ".1" #fake uuid
-                    if net['provider'][-5:]==":vlan":
-                        external_port["vlan"] = net["vlan"]
-                        external_port["switch_port"] = net['provider'][9:-5]
-                    else:
-                        external_port["vlan"] = None
-                        external_port["switch_port"] = net['provider'][9:]
+                external_port = self._get_external_port(net)
+                if external_port:
                     net_ports = net_ports + (external_port,)
                     nb_ports += 1
                 net['ports'] = net_ports
@@ -245,14 +289,152 @@ class openflow_thread(threading.Thread):
             return -1, error_msg
         database_flows += database_net_flows
 
+        if changed_ports:
+            result, content = self._update_changed_flows(nets, database_flows, changed_ports)
+            if result >= 0:
+                return result, content
+            self.logger.debug("update_of_flows net '%s' needs a full recompute: %s", requested_net_id, content)
+            return self.update_of_flows(requested_net_id)
+
         # Get the existing flows at openflow controller
         try:
-            of_flows = self.OF_connector.get_of_rules()
+            with metrics.timer("openvim_ofc_request_seconds", ofc=self.of_uuid, request="get_of_rules"):
+                of_flows = self.OF_connector.get_of_rules()
             # print self.name, ": update_of_flows() ERROR getting flows from controller", of_flows
         except openflow_conn.OpenflowconnException as e:
             # self.set_openflow_controller_status(OFC_STATUS_ERROR, "OF error {} getting flows".format(str(e)))
             return -1, "OF error {} getting flows".format(str(e))
 
+        # check the requested net with the ports of all the bound nets
+        ports = [port for net in nets for port in net['ports']]
+        for net in [net for net in nets if net['uuid'] == requested_net_id] or nets[-1:]:
+            result, content = self._check_nets_type(net, ifaces_nb, ports)
+            if result < 0:
+                return result, content
+
+        # calculate new flows to be inserted
+        groups = {}
+        result, new_flows = self._compute_net_flows(nets, groups=groups)
+        if result < 0:
+            return result, new_flows
+
+        #modify database flows format and get the used names
+        used_names=set()
+        database_flow_keys = {}
+        for flow in database_flows:
+            try:
+                change_db2of(flow)
+            except FlowBadFormat as e:
+                self.logger.error("Exception FlowBadFormat: '%s', flow: '%s'",str(e), str(flow))
+                continue
+            used_names.add(flow['name'])
+            database_flow_keys.setdefault(self._flow_key(flow), flow)
+            if flow['name'] not in of_flows and self.groups:
+                # flow lost at controller, its group may have been lost too
+                for action in flow['actions']:
+                    if action[0] == 'group' and action[1] in self.groups:
+                        self.groups[action[1]] = None
+
+        # groups must exist before the flows that use them
+        result, content = self._install_groups(groups)
+        if result < 0:
+            return result, content
+        name_index=0
+        # insert at database the new flows, change actions to human text
+        for flow in new_flows:
+            # 1 check if an equal flow is already present
+            database_flow = database_flow_keys.get(self._flow_key(flow))
+            if database_flow:
+                database_flow["not delete"]=True
+                self.logger.debug("Skipping already present flow %s", str(flow))
+                continue
+            # 2 look for a non used name
+            flow_name=flow["net_id"]+"."+str(name_index)
+            while flow_name in used_names or flow_name in of_flows:         
+                name_index += 1   
+                flow_name=flow["net_id"]+"."+str(name_index)
+            used_names.add(flow_name)
+            flow['name'] = flow_name
+            # 3 insert at openflow
+
+            try:
+                with metrics.timer("openvim_ofc_request_seconds", ofc=self.of_uuid, request="new_flow"):
+                    self.OF_connector.new_flow(flow)
+            except openflow_conn.OpenflowconnException as e:
+                return -1, "Error creating new flow {}".format(str(e))
+
+            # 4 insert at database
+            try:
+                change_of2db(flow)
+            except FlowBadFormat as e:
+                # print self.name, ": Error Exception FlowBadFormat '%s'" % str(e), flow
+                return -1, str(e)
+            result, content = self.db.new_row('of_flows', flow)
+            if result < 0:
+                # print self.name, ": Error '%s' at database insertion" % content, flow
+                return -1, content
+
+        #delete not needed old flows from openflow and from DDBB, 
+        #check that the needed flows at DDBB are present in controller or insert them otherwise
+        deleted_groups = set()
+        for flow in database_flows:
+            if "not delete" in flow:
+                if flow["name"] not in of_flows:
+                    # not in controller, insert it
+                    try:
+                        with metrics.timer("openvim_ofc_request_seconds", ofc=self.of_uuid, request="new_flow"):
+                            self.OF_connector.new_flow(flow)
+                    except openflow_conn.OpenflowconnException as e:
+                        return -1, "Error creating new flow {}".format(str(e))
+
+                continue
+            # Delete flow
+            if flow["name"] in of_flows:
+                try:
+                    with metrics.timer("openvim_ofc_request_seconds", ofc=self.of_uuid, request="del_flow"):
+                        self.OF_connector.del_flow(flow['name'])
+                except openflow_conn.OpenflowconnException as e:
+                    self.logger.error("cannot delete flow '%s' from OF: %s", flow['name'], str(e))
+                    # skip deletion from database
+                    continue
+
+            # delete from database
+            result, content = self.db.delete_row_by_key('of_flows', 'id', flow['id'])
+            if result<0:
+                self.logger.error("cannot delete flow '%s' from DB: %s", flow['name'], content )
+            elif isinstance(flow['actions'], list):
+                deleted_groups.update(action[1] for action in flow['actions'] if action[0] == 'group')
+
+        self._delete_groups(deleted_groups.difference(groups))
+        return 0, 'Success'
+
+    @staticmethod
+    def _get_external_port(net):
+        """
+        Get the external port of a net bound to a switch port with provider 'openflow:<port>[:vlan]'
+        :param net: net with 'uuid', 'provider' and 'vlan'
+        :return: port dictionary or None if the net is not bound to a switch port
+        """
+        if not net['provider'] or net['provider'][:9] != "openflow:":
+            return None
+        external_port = {"type": "external", "mac": None}
+        external_port['uuid'] = net['uuid'] + ".1"  # fake uuid
+        if net['provider'][-5:] == ":vlan":
+            external_port["vlan"] = net["vlan"]
+            external_port["switch_port"] = net['provider'][9:-5]
+        else:
+            external_port["vlan"] = None
+            external_port["switch_port"] = net['provider'][9:]
+        return external_port
+
+    def _check_nets_type(self, net, ifaces_nb, ports):
+        """
+        Check that a net, and the nets bound to it, can be connected with openflow rules
+        :param net: net, whose type is checked
+        :param ifaces_nb: number of ports of the net and its bound nets
+        :param ports: ports to check when flag 'of_controller_nets_with_same_vlan' is True
+        :return: (0, None) or (-1, error text)
+        """
         if ifaces_nb < 2:
             pass
         elif net['type'] == 'ptp':
@@ -301,89 +483,263 @@ class openflow_thread(threading.Thread):
         else:
             return -1, 'Only ptp and data networks are supported for openflow'
             
-        # calculate new flows to be inserted
-        result, new_flows = self._compute_net_flows(nets)
+        return 0, None
+
+    def reinstall_flows(self, net_ids, progress=None):
+        """
+        Compute the flows of a list of nets and update them at database and openflow controller, as update_of_flows
+        does net by net, but reading the nets, ports and flows with a few bulk queries, comparing with a single
+        snapshot of the controller flows and sending the changes with up to reinstall_workers concurrent requests.
+        The flows of a net with errors are left as they are. The status of every net is set
+        :param net_ids: list of net uuids. The nets bound between them must be all in the list
+        :param progress: optional dictionary, as created by new_reinstall_progress, updated along the operation
+        :return: (number of nets with errors, None) or (-1, error text) if no net could be updated
+        """
+        if progress is None:
+            progress = new_reinstall_progress()
+        progress.update(status="running", phase="reading", nets=len(net_ids))
+        result, content = self._reinstall_flows(net_ids, progress)
+        progress["phase"] = "done"
         if result < 0:
-            return result, new_flows
+            progress["status"] = "error"
+            progress["last_error"] = content
+        else:
+            progress["status"] = "done"
+        return result, content
 
-        #modify database flows format and get the used names
-        used_names=[]
+    def _reinstall_flows(self, net_ids, progress):
+        if not net_ids:
+            return 0, None
+        select_ = ('type', 'admin_state_up', 'vlan', 'provider', 'bind_net', 'bind_type', 'uuid')
+        result, nets = self.db.get_table(FROM='nets', SELECT=select_, WHERE={'uuid': net_ids})
+        if result < 0:
+            return -1, "DB error getting nets: {}".format(nets)
+        result, ports = self.db.get_table(FROM='ports',
+                                          SELECT=('net_id', 'switch_port', 'vlan', 'uuid', 'mac', 'type', 'model'),
+                                          WHERE={'net_id': net_ids, 'admin_state_up': 'true', 'status': 'ACTIVE'})
+        if result < 0:
+            return -1, "DB error getting ports: {}".format(ports)
+        result, database_flows = self.db.get_table(FROM='of_flows', WHERE={'net_id': net_ids})
+        if result < 0:
+            return -1, "DB error getting flows: {}".format(database_flows)
+        # flows where net_id==NULL, of deleted nets (At DB foreign key: On delete set null)
+        result, database_net_flows = self.db.get_table(FROM='of_flows', WHERE={'net_id': None})
+        if result < 0:
+            return -1, "DB error getting flows from net 'null': {}".format(database_net_flows)
+        database_flows = list(database_flows) + list(database_net_flows)
+
+        # compute the flows of each net and the nets bound to it
+        progress["phase"] = "computing"
+        nets_ports = {}
+        for port in ports:
+            nets_ports.setdefault(port.pop('net_id'), []).append(port)
+        bound_nets = {}
+        for net in nets:
+            bound_nets.setdefault(net['bind_net'] or net['uuid'], []).append(net)
+        failed_nets = {}    # net_id: error text
+        new_flows = []
+        groups = {}
+        for bind_id, bind_nets in bound_nets.items():
+            ifaces_nb = 0
+            bind_ports = []
+            for net in bind_nets:
+                if net['admin_state_up'] == 'false':
+                    net['ports'] = ()
+                    continue
+                net['ports'] = nets_ports.get(net['uuid'], [])
+                external_port = self._get_external_port(net)
+                if external_port:
+                    net['ports'].append(external_port)
+                ifaces_nb += len(net['ports'])
+                bind_ports += net['ports']
+            # all the nets of the group are requested; check each one as update_of_flows does
+            for net in bind_nets:
+                result, content = self._check_nets_type(net, ifaces_nb, bind_ports)
+                if result < 0:
+                    break
+            if result >= 0:
+                result, content = self._compute_net_flows(bind_nets, groups=groups)
+            if result < 0:
+                for net in bind_nets:
+                    failed_nets[net['uuid']] = content
+                continue
+            new_flows += content
+
+        # Get the existing flows at openflow controller, a copy as the test connector returns its own dictionary
+        try:
+            with metrics.timer("openvim_ofc_request_seconds", ofc=self.of_uuid, request="get_of_rules"):
+                of_flows = set(self.OF_connector.get_of_rules())
+        except openflow_conn.OpenflowconnException as e:
+            return -1, "OF error {} getting flows".format(str(e))
+
+        # compare with the flows at database, that are left as they are for the nets with errors
+        used_names = set()
+        database_flow_keys = {}
+        current_flows = []
         for flow in database_flows:
+            used_names.add(flow['name'])
+            if flow['net_id'] in failed_nets:
+                continue
             try:
                 change_db2of(flow)
             except FlowBadFormat as e:
-                self.logger.error("Exception FlowBadFormat: '%s', flow: '%s'",str(e), str(flow))
+                self.logger.error("Exception FlowBadFormat: '%s', flow: '%s'", str(e), str(flow))
                 continue
-            used_names.append(flow['name'])
-        name_index=0
-        # insert at database the new flows, change actions to human text
+            current_flows.append(flow)
+            database_flow_keys.setdefault(self._flow_key(flow), flow)
+            if flow['name'] not in of_flows and self.groups:
+                # flow lost at controller, its group may have been lost too
+                for action in flow['actions']:
+                    if action[0] == 'group' and action[1] in self.groups:
+                        self.groups[action[1]] = None
+        name_indexes = {}   # net_id: first index of the flow names that can be free
+        flows_to_install = []
         for flow in new_flows:
-            # 1 check if an equal flow is already present
-            index = self._check_flow_already_present(flow, database_flows)
-            if index>=0:
-                database_flows[index]["not delete"]=True
-                self.logger.debug("Skipping already present flow %s", str(flow))
+            database_flow = database_flow_keys.get(self._flow_key(flow))
+            if database_flow:
+                database_flow["not delete"] = True
                 continue
-            # 2 look for a non used name
-            flow_name=flow["net_id"]+"."+str(name_index)
-            while flow_name in used_names or flow_name in of_flows:         
-                name_index += 1   
-                flow_name=flow["net_id"]+"."+str(name_index)
-            used_names.append(flow_name)
+            name_index = name_indexes.get(flow["net_id"], 0)
+            flow_name = flow["net_id"] + "." + str(name_index)
+            while flow_name in used_names or flow_name in of_flows:
+                name_index += 1
+                flow_name = flow["net_id"] + "." + str(name_index)
+            name_indexes[flow["net_id"]] = name_index + 1
+            used_names.add(flow_name)
             flow['name'] = flow_name
-            # 3 insert at openflow
-
-            try:
-                self.OF_connector.new_flow(flow)
-            except openflow_conn.OpenflowconnException as e:
-                return -1, "Error creating new flow {}".format(str(e))
+            flows_to_install.append(flow)
+        flows_to_reinstall = []     # needed flows at database not present in controller
+        flows_to_delete = []
+        for flow in current_flows:
+            if "not delete" not in flow:
+                flows_to_delete.append(flow)
+            elif flow["name"] not in of_flows:
+                flows_to_reinstall.append(flow)
+        progress.update(flows_to_install=len(flows_to_install) + len(flows_to_reinstall),
+                        flows_to_delete=len(flows_to_delete))
 
-            # 4 insert at database
+        # groups must exist before the flows that use them
+        result, content = self._install_groups(groups)
+        if result < 0:
+            return -1, content
+        # insert first the new flows and then delete the old ones, as update_of_flows does
+        progress["phase"] = "installing"
+        errors = self._send_flow_requests("new_flow", flows_to_install + flows_to_reinstall, progress,
+                                          "flows_installed")
+        new_rows = []
+        for flow in flows_to_install + flows_to_reinstall:
+            if flow['name'] in errors:
+                failed_nets[flow['net_id']] = "Error creating new flow {}".format(errors[flow['name']])
+        for flow in flows_to_install:
+            if flow['name'] in errors:
+                continue
             try:
                 change_of2db(flow)
             except FlowBadFormat as e:
-                # print self.name, ": Error Exception FlowBadFormat '%s'" % str(e), flow
-                return -1, str(e)
-            result, content = self.db.new_row('of_flows', flow)
+                failed_nets[flow['net_id']] = str(e)
+                continue
+            new_rows.append(flow)
+
+        progress["phase"] = "deleting"
+        flows_to_delete = [flow for flow in flows_to_delete if flow['net_id'] not in failed_nets]
+        errors = self._send_flow_requests("del_flow", [flow for flow in flows_to_delete if flow['name'] in of_flows],
+                                          progress, "flows_deleted")
+        deleted_ids = []
+        deleted_groups = set()
+        for flow in flows_to_delete:
+            if flow['name'] in errors:
+                self.logger.error("cannot delete flow '%s' from OF: %s", flow['name'], errors[flow['name']])
+                # skip deletion from database
+                continue
+            if flow['name'] not in of_flows:
+                progress["flows_deleted"] += 1
+            deleted_ids.append(flow['id'])
+            deleted_groups.update(action[1] for action in flow['actions'] if action[0] == 'group')
+
+        # update the database in one transaction
+        progress["phase"] = "writing"
+        if new_rows or deleted_ids:
+            result, content = self.db.new_rows('of_flows', new_rows,
+                                               DELETE_WHERE={'id': deleted_ids} if deleted_ids else None)
             if result < 0:
-                # print self.name, ": Error '%s' at database insertion" % content, flow
-                return -1, content
+                return -1, "DB error updating flows: {}".format(content)
+        self._delete_groups(deleted_groups.difference(groups))
 
-        #delete not needed old flows from openflow and from DDBB, 
-        #check that the needed flows at DDBB are present in controller or insert them otherwise
-        for flow in database_flows:
-            if "not delete" in flow:
-                if flow["name"] not in of_flows:
-                    # not in controller, insert it
-                    try:
-                        self.OF_connector.new_flow(flow)
-                    except openflow_conn.OpenflowconnException as e:
-                        return -1, "Error creating new flow {}".format(str(e))
+        for net in nets:
+            if net['uuid'] in failed_nets:
+                self.set_net_status(net['uuid'], 'ERROR', self._format_error_msg(str(failed_nets[net['uuid']]), 255))
+            else:
+                self.set_net_status(net['uuid'], 'ACTIVE')
+        self.write_nets_status()
+        progress["nets_error"] = len(failed_nets)
+        if failed_nets:
+            progress["last_error"] = str(failed_nets.values()[-1])
+        self.logger.debug("reinstall_flows %d nets, %d with errors: %d flows inserted, %d deleted", len(nets),
+                          len(failed_nets), progress["flows_installed"], progress["flows_deleted"])
+        return len(failed_nets), None
 
-                continue
-            # Delete flow
-            if flow["name"] in of_flows:
+    def _send_flow_requests(self, request, flows, progress, counter):
+        """
+        Send a new_flow or del_flow request per flow to the controller, with up to reinstall_workers concurrent ones
+        :param request: 'new_flow' or 'del_flow'
+        :param flows: list of flows, in openflow format for new_flow
+        :param progress: dictionary where the counter of done requests and the errors are updated
+        :param counter: key of progress increased after each succeeded request
+        :return: dictionary flow name: error text of the failed requests
+        """
+        errors = {}
+        pending = Queue.Queue()
+        for flow in flows:
+            pending.put(flow)
+        lock = threading.Lock()
+
+        def send_requests():
+            while True:
                 try:
-                    self.OF_connector.del_flow(flow['name'])
-                except openflow_conn.OpenflowconnException as e:
-                    self.logger.error("cannot delete flow '%s' from OF: %s", flow['name'], str(e))
-                    # skip deletion from database
+                    flow = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    with metrics.timer("openvim_ofc_request_seconds", ofc=self.of_uuid, request=request):
+                        if request == "new_flow":
+                            self.OF_connector.new_flow(flow)
+                        else:
+                            self.OF_connector.del_flow(flow['name'])
+                except Exception as e:
+                    if not isinstance(e, openflow_conn.OpenflowconnException):
+                        self.logger.error("Unexpected exception at %s '%s': %s", request, flow['name'], str(e),
+                                          exc_info=True)
+                    with lock:
+                        errors[flow['name']] = str(e)
+                        progress["errors"] += 1
+                        progress["last_error"] = self._format_error_msg(str(e), 255)
                     continue
+                with lock:
+                    progress[counter] += 1
 
-            # delete from database
-            result, content = self.db.delete_row_by_key('of_flows', 'id', flow['id'])
-            if result<0:
-                self.logger.error("cannot delete flow '%s' from DB: %s", flow['name'], content )
-        
-        return 0, 'Success'
+        workers = [threading.Thread(target=send_requests, name="{}-{}".format(self.name, index))
+                   for index in range(1, min(self.reinstall_workers, len(flows)))]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        send_requests()
+        for worker in workers:
+            worker.join()
+        return errors
 
     def clear_all_flows(self):
         try:
             if not self.test:
-                self.OF_connector.clear_all_flows()
+                with metrics.timer("openvim_ofc_request_seconds", ofc=self.of_uuid, request="clear_all_flows"):
+                    self.OF_connector.clear_all_flows()
+                if self.groups is None:
+                    self._load_groups()
+                self._delete_groups(list(self.groups or ()))
 
             # remove from database
             self.db.delete_row_by_key('of_flows', None, None) #this will delete all lines
+            self.groups = {}
+            self.group_ids = {}
             return 0, None
         except openflow_conn.OpenflowconnException as e:
             return -1, self.logger.error("Error deleting all flows {}", str(e))
@@ -405,22 +761,237 @@ class openflow_thread(threading.Thread):
                 return index
             index += 1
         return -1
-        
-    def _compute_net_flows(self, nets):
+
+    def _flow_key(self, flow):
+        """Hashable key of a flow made of flow_fields, so that two flows are equal, as _check_flow_already_present
+        considers, if their keys are equal"""
+        return tuple(tuple(flow.get(f)) if f == 'actions' else flow.get(f) for f in self.flow_fields)
+
+    def _update_changed_flows(self, nets, database_flows, changed_ports):
+        """
+        Update only the flows of a net affected by some added or removed ports: the unicast flows with any of their
+        switch ports as ingress or output port, and the broadcast flows. The rest of flows do not change.
+        It is only possible for a multipoint net without bindings where every port has a mac and a different switch
+        port and vlan, as there are no repeated nor point to point flows. Otherwise, or if the database flows are not
+        consistent, nothing is done and an error is returned, so that the caller recomputes all the flows
+        :param nets: list with the net and its 'ports', as obtained by update_of_flows
+        :param database_flows: flows at database, in database format
+        :param changed_ports: list of switch port names of the added or removed ports
+        :return: (0, 'Success') or (-1, reason to recompute all the flows)
+        """
+        if len(nets) != 1 or nets[0]['type'] != 'data' or self.pmp_with_same_vlan:
+            return -1, "not a multipoint net without bindings"
+        net = nets[0]
+        switch_ports = set(str(switch_port) for switch_port in changed_ports)
+        port_keys = set()
+        unchanged_ports = 0
+        for port in net['ports']:
+            port_key = (str(port['switch_port']), port['vlan'])
+            if port['mac'] is None or port_key in port_keys:
+                return -1, "there are ports without mac or sharing switch port and vlan"
+            port_keys.add(port_key)
+            if port_key[0] not in switch_ports:
+                unchanged_ports += 1
+        if unchanged_ports <= 2:
+            return -1, "net has or had two ports or less"
+
+        # database flows affected, the ones with the switch ports as ingress or output (actions 'out=<port>')
+        used_names = set()
+        old_flows = {}
+        out_actions = set("out=" + switch_port for switch_port in switch_ports)
+        for flow in database_flows:
+            used_names.add(flow['name'])
+            if flow['net_id'] != net['uuid']:
+                continue
+            if not flow.get('dst_mac'):
+                return -1, "there are point to point flows at database"
+            if flow['dst_mac'] != 'ff:ff:ff:ff:ff:ff' and flow['ingress_port'] not in switch_ports and \
+                    out_actions.isdisjoint(str(flow['actions']).split(",")):
+                continue
+            flow = dict(flow)
+            try:
+                change_db2of(flow)
+            except FlowBadFormat as e:
+                return -1, "wrong flow '{}' at database: {}".format(flow['name'], str(e))
+            flow_key = self._flow_key(flow)
+            if flow_key in old_flows:
+                return -1, "there are repeated flows at database"
+            old_flows[flow_key] = flow
+
+        groups = {}
+        result, new_flows = self._compute_net_flows(nets, switch_ports, groups)
+        if result < 0:
+            return result, new_flows
+        flows_to_insert = []
+        for flow in new_flows:
+            if not flow.get('dst_mac'):
+                return -1, "net needs point to point flows"
+            if not old_flows.pop(self._flow_key(flow), None):
+                flows_to_insert.append(flow)
+
+        # insert first the groups and new flows and then delete the old ones, as update_of_flows does
+        result, content = self._install_groups(groups)
+        if result < 0:
+            return result, content
+        name_index = 0
+        for flow in flows_to_insert:
+            flow_name = flow["net_id"] + "." + str(name_index)
+            while flow_name in used_names:
+                name_index += 1
+                flow_name = flow["net_id"] + "." + str(name_index)
+            used_names.add(flow_name)
+            flow['name'] = flow_name
+            try:
+                with metrics.timer("openvim_ofc_request_seconds", ofc=self.of_uuid, request="new_flow"):
+                    self.OF_connector.new_flow(flow)
+            except openflow_conn.OpenflowconnException as e:
+                return -1, "Error creating new flow {}".format(str(e))
+            try:
+                change_of2db(flow)
+            except FlowBadFormat as e:
+                return -1, str(e)
+            result, content = self.db.new_row('of_flows', flow)
+            if result < 0:
+                return -1, content
+        deleted_groups = set()
+        for flow in old_flows.values():
+            try:
+                with metrics.timer("openvim_ofc_request_seconds", ofc=self.of_uuid, request="del_flow"):
+                    self.OF_connector.del_flow(flow['name'])
+            except openflow_conn.OpenflowconnException as e:
+                return -1, "cannot delete flow '{}' from OF: {}".format(flow['name'], str(e))
+            result, content = self.db.delete_row_by_key('of_flows', 'id', flow['id'])
+            if result < 0:
+                self.logger.error("cannot delete flow '%s' from DB: %s", flow['name'], content)
+            else:
+                deleted_groups.update(action[1] for action in flow['actions'] if action[0] == 'group')
+        self._delete_groups(deleted_groups.difference(groups))
+        self.logger.debug("update_of_flows net '%s' changed ports %s: %d flows inserted, %d deleted", net['uuid'],
+                          ",".join(switch_ports), len(flows_to_insert), len(old_flows))
+        return 0, 'Success'
+
+    def _load_groups(self):
+        """
+        Load the identifiers of the groups in use from the flows at database. Their buckets are unknown, so they are
+        installed again at controller the first time they are used
+        :return: (0, None) or (-1, error text)
+        """
+        result, content = self.db.get_table(FROM='of_flows', SELECT=('net_id', 'vlan_id', 'actions'),
+                                            WHERE_LIKE={'actions': 'group=%'})
+        if result < 0:
+            return -1, "DB error getting groups: {}".format(content)
+        self.groups = {}
+        self.group_ids = {}
+        for flow in content:
+            try:
+                group_id = int(flow['actions'][6:])
+            except ValueError:
+                self.logger.error("Wrong group action at flow '%s'", str(flow))
+                continue
+            self.groups[group_id] = None
+            if flow['net_id']:
+                self.group_ids[(flow['net_id'], flow['vlan_id'] is not None)] = group_id
+        return 0, None
+
+    def _get_group_id(self, key):
+        """Get the group identifier of a (net_id, ingress tagged) key, allocating a new one if needed"""
+        if key not in self.group_ids:
+            used_ids = set(self.groups).union(self.group_ids.values())
+            self.group_ids[key] = max(used_ids) + 1 if used_ids else 1
+        return self.group_ids[key]
+
+    @staticmethod
+    def _get_group_buckets(net, tagged):
+        """
+        Compute the buckets of the broadcast group of a net, one per port. The controller does not send the packet
+        back through the ingress port, so the same group is valid for all the ingress ports with the same tagging
+        :param net: net with its 'ports'
+        :param tagged: True for the packets received with vlan tag, False for the untagged ones
+        :return: sorted list of buckets, each one a list of actions
+        """
+        buckets = []
+        for port in net['ports']:
+            if port['vlan'] is not None:
+                bucket = [('vlan', port['vlan'])]
+            elif tagged:
+                bucket = [('vlan', None)]
+            else:
+                bucket = []
+            bucket.append(('out', str(port['switch_port'])))
+            buckets.append(bucket)
+        return sorted(buckets)
+
+    def _install_groups(self, groups):
+        """
+        Insert or replace at controller the groups whose buckets have changed
+        :param groups: dictionary group_id: list of buckets, as computed by _compute_net_flows
+        :return: (0, None) or (-1, error text)
+        """
+        for group_id, buckets in groups.items():
+            if self.groups.get(group_id) == buckets:
+                continue
+            try:
+                with metrics.timer("openvim_ofc_request_seconds", ofc=self.of_uuid, request="new_group"):
+                    self.OF_connector.new_group({'group_id': group_id, 'buckets': buckets})
+            except openflow_conn.OpenflowconnException as e:
+                return -1, "Error creating group {}: {}".format(group_id, str(e))
+            self.groups[group_id] = buckets
+        return 0, None
+
+    def _delete_groups(self, group_ids):
+        """
+        Delete groups not used any more. Errors are only logged
+        :param group_ids: list of group identifiers
+        :return: None
+        """
+        for group_id in group_ids:
+            try:
+                with metrics.timer("openvim_ofc_request_seconds", ofc=self.of_uuid, request="del_group"):
+                    self.OF_connector.del_group(group_id)
+            except openflow_conn.OpenflowconnException as e:
+                self.logger.error("cannot delete group '%s' from OF: %s", group_id, str(e))
+            if self.groups:
+                self.groups.pop(group_id, None)
+            for key, value in self.group_ids.items():
+                if value == group_id:
+                    del self.group_ids[key]
+
+    def _compute_net_flows(self, nets, switch_ports=None, groups=None):
+        """
+        Compute the flows of a list of nets bound between them
+        :param nets: list of nets with their 'ports'
+        :param switch_ports: if provided, set of switch port names. Only the unicast flows with any of these ports as
+            ingress or output port are computed, apart from the broadcast flows
+        :param groups: if provided and broadcast_groups is enabled, dictionary where the broadcast groups needed by
+            the flows are stored as group_id: list of buckets. The broadcast flows send to these groups instead of
+            to every port. Only used for a single net with more than two ports at different switch ports
+        :return: (0, list of flows) or (-1, error text)
+        """
         new_flows=[]
+        new_flow_keys=set()
         new_broadcast_flows={}
         nb_ports = 0
 
         # Check switch_port information is right
         self.logger.debug("_compute_net_flows nets: %s", str(nets))
+        net_switch_ports = set()
         for net in nets:
             for port in net['ports']:
                 nb_ports += 1
+                net_switch_ports.add(str(port['switch_port']))
                 if not self.test and str(port['switch_port']) not in self.OF_connector.pp2ofi:
                     error_text= "switch port name '%s' is not valid for the openflow controller" % str(port['switch_port'])
                     # print self.name, ": ERROR " + error_text
                     return -1, error_text
 
+        # a group cannot send back through the ingress port, needed when several ports share a switch port
+        use_groups = groups is not None and self.broadcast_groups and len(nets) == 1 and nb_ports > 2 and \
+            not self.pmp_with_same_vlan and len(net_switch_ports) == nb_ports
+        if use_groups and self.groups is None:
+            result, content = self._load_groups()
+            if result < 0:
+                return result, content
+
         for net_src in nets:
             net_id = net_src["uuid"]
             for net_dst in nets:
@@ -458,11 +1029,12 @@ class openflow_thread(threading.Thread):
                             'net_id':  net_id,
                             'dst_mac': 'ff:ff:ff:ff:ff:ff',
                             "ingress_port": str(src_port['switch_port']),
-                            'actions': [] 
+                            'actions': set()  # converted to a sorted list at the end
                         }
                         new_broadcast_flows[broadcast_key] = flow_broadcast
                         if vlan_in is not None:
                             flow_broadcast['vlan_id'] = str(vlan_in)
+                    src_port_changed = switch_ports is None or str(src_port['switch_port']) in switch_ports
 
                     for dst_port in net_dst['ports']:
                         vlan_out = vlan_net_out 
@@ -476,6 +1048,11 @@ class openflow_thread(threading.Thread):
                         #    continue
                         if src_port['switch_port'] == dst_port['switch_port'] and vlan_in == vlan_out:
                             continue
+                        if not src_port_changed and str(dst_port['switch_port']) not in switch_ports:
+                            # unicast flow not affected by the changed switch ports, only the broadcast one is needed
+                            if nb_ports > 2:
+                                flow_broadcast['actions'].add((vlan_out, str(dst_port['switch_port'])))
+                            continue
                         flow = {
                             "priority": priority,
                             'net_id':  net_id,
@@ -497,24 +1074,31 @@ class openflow_thread(threading.Thread):
                             flow['actions'].append( ('vlan', vlan_out ) )
                         flow['actions'].append( ('out', str(dst_port['switch_port'])) )
             
-                        if self._check_flow_already_present(flow, new_flows) >= 0:
+                        flow_key = self._flow_key(flow)
+                        if flow_key in new_flow_keys:
                             self.logger.debug("Skipping repeated flow '%s'", str(flow))
                             continue
-                        
+                        new_flow_keys.add(flow_key)
                         new_flows.append(flow)
                     
                         # BROADCAST:
                         if nb_ports <= 2:  # point to multipoint or nets with more than 2 elements
                             continue
-                        out = (vlan_out, str(dst_port['switch_port']))
-                        if out not in flow_broadcast['actions']:
-                            flow_broadcast['actions'].append( out )
+                        flow_broadcast['actions'].add((vlan_out, str(dst_port['switch_port'])))
 
         #BROADCAST
         for flow_broadcast in new_broadcast_flows.values():      
             if len(flow_broadcast['actions'])==0:
                 continue #nothing to do, skip
-            flow_broadcast['actions'].sort()
+            if use_groups:
+                tagged = 'vlan_id' in flow_broadcast
+                group_id = self._get_group_id((flow_broadcast['net_id'], tagged))
+                if group_id not in groups:
+                    groups[group_id] = self._get_group_buckets(nets[0], tagged)
+                flow_broadcast['actions'] = [('group', group_id)]
+                new_flows.append(flow_broadcast)
+                continue
+            flow_broadcast['actions'] = sorted(flow_broadcast['actions'])
             if 'vlan_id' in flow_broadcast:
                 previous_vlan = 0  # indicates that a packet contains a vlan, and the vlan
             else:
@@ -531,9 +1115,11 @@ class openflow_thread(threading.Thread):
                 final_actions.append( ('out', action[1]) )
             flow_broadcast['actions'] = final_actions
 
-            if self._check_flow_already_present(flow_broadcast, new_flows) >= 0:
+            flow_key = self._flow_key(flow_broadcast)
+            if flow_key in new_flow_keys:
                 self.logger.debug("Skipping repeated flow '%s'", str(flow_broadcast))
                 continue
+            new_flow_keys.add(flow_key)
             
             new_flows.append(flow_broadcast)        
         
@@ -578,12 +1164,70 @@ class openflow_thread(threading.Thread):
         ofc = {}
         ofc['status'] = status
         ofc['last_error'] = self._format_error_msg(error_text, 255)
+        if self.ofc_status == (ofc['status'], ofc['last_error']):
+            return True
         result, content = self.db.update_rows('ofcs', ofc, WHERE={'uuid': self.of_uuid}, log=False)
         if result >= 0:
+            self.ofc_status = (ofc['status'], ofc['last_error'])
             return True
         else:
+            self.ofc_status = None
             return False
 
+    def reset_net_status(self, net_id):
+        """
+        Inform that the status of a net has been changed at database by other, e.g. to BUILD, so that the next status
+        computed by this thread is written even if equal to the last one written. Call before inserting the task
+        :param net_id: net uuid
+        :return:
+        """
+        with self.queueLock:
+            self.nets_status_reset.add(net_id)
+
+    def set_net_status(self, net_id, status, error_text=None):
+        """
+        Set the status of a net after an update. It is written at database by write_nets_status, together with the
+        ones of the rest of nets updated in the same burst of tasks, and only if it has changed
+        :param net_id: net uuid
+        :param status: net status ('ACTIVE','ERROR')
+        :param error_text: error text
+        :return:
+        """
+        net_status = (status, error_text)
+        if self.nets_status.get(net_id) == net_status:
+            self.pending_nets_status.pop(net_id, None)
+        else:
+            self.pending_nets_status[net_id] = net_status
+        if len(self.pending_nets_status) >= 100:
+            self.write_nets_status()
+
+    def write_nets_status(self):
+        """
+        Write at database the pending nets status, with a statement per different status and error text
+        :return: True if ok, False if any error
+        """
+        if not self.pending_nets_status:
+            return True
+        nets_by_status = {}
+        for net_id, net_status in self.pending_nets_status.items():
+            nets_by_status.setdefault(net_status, []).append(net_id)
+        self.pending_nets_status = {}
+        if len(self.nets_status) > 10000:
+            self.nets_status = {}   # forget deleted nets
+        ok = True
+        for net_status, net_ids in nets_by_status.items():
+            result, content = self.db.update_rows('nets', {'status': net_status[0], 'last_error': net_status[1]},
+                                                  WHERE={'uuid': net_ids})
+            if result < 0:
+                self.logger.error("cannot update status of nets %s: %s", ",".join(net_ids), content)
+                ok = False
+                for net_id in net_ids:
+                    self.nets_status.pop(net_id, None)
+            else:
+                for net_id in net_ids:
+                    self.nets_status[net_id] = net_status
+        return ok
+
 
 
 
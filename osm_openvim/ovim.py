@@ -28,24 +28,33 @@ Two thread will be launched, with normal and administrative permissions.
 """
 
 import threading
+import time
 import yaml
 import vim_db
 import logging
 # import imp
 import os.path
 import argparse
-from netaddr import IPNetwork
-from jsonschema import validate as js_v, exceptions as js_e
+from netaddr import IPNetwork, all_matching_cidrs
+from jsonschema import exceptions as js_e
+from schema_validator import validate as js_v
+from vim_schema import id_schema
 import host_thread as ht
+import host_scheduler
+import cluster
+import socket
 import dhcp_thread as dt
 import openflow_thread as oft
 import openflow_conn
+import of_port_mappings
+import metadata_cache
+import response_cache
 
 __author__ = "Alfonso Tierno, Leonardo Mirabal"
 __date__ = "$06-Feb-2017 12:07:15$"
 __version__ = "0.5.29-r549"
 version_date = "Sep 2018"
-database_version = 23      #needed database schema version
+database_version = 25      #needed database schema version
 
 HTTP_Bad_Request =          400
 HTTP_Unauthorized =         401
@@ -100,6 +109,8 @@ class ovim():
         self.logger_name = configuration.get("logger_name", "openvim")
         self.logger = logging.getLogger(self.logger_name)
         self.db = None
+        if self.config.get('db_profile'):
+            vim_db.enable_profiler(self.config.get('db_slow_query_threshold', 1.0))
         self.db = self._create_database_connection()
         self.of_test_mode = False
 
@@ -115,6 +126,31 @@ class ovim():
                                                                                 self.config['db_host']) )
         return db
 
+    @staticmethod
+    def get_db_profile(top=20):
+        """
+        Obtain the statistics of the SQL profiler, sorted by total time
+        :param top: maximum number of call sites to return
+        :return: dictionary with the slow query threshold and the list of call sites
+        """
+        profiler = vim_db.get_profiler()
+        if not profiler:
+            raise ovimException("Database profiler is not enabled. Set 'db_profile: true' at configuration file",
+                                HTTP_Not_Found)
+        return {"slow_query_threshold": profiler.slow_query_threshold, "statements": profiler.get_top(top)}
+
+    @staticmethod
+    def reset_db_profile():
+        """
+        Clear the statistics of the SQL profiler
+        :return: None
+        """
+        profiler = vim_db.get_profiler()
+        if not profiler:
+            raise ovimException("Database profiler is not enabled. Set 'db_profile: true' at configuration file",
+                                HTTP_Not_Found)
+        profiler.reset()
+
     @staticmethod
     def get_version():
         return __version__
@@ -155,7 +191,6 @@ class ovim():
 
     @staticmethod
     def _check_valid_uuid(uuid):
-        id_schema = {"type": "string", "pattern": "^[a-fA-F0-9]{8}(-[a-fA-F0-9]{4}){3}-[a-fA-F0-9]{12}$"}
         try:
             js_v(uuid, id_schema)
             return True
@@ -189,42 +224,32 @@ class ovim():
             self.get_version(), self.get_version_date(), self.get_database_version()))
         # create database connection for openflow threads
         self.config["db"] = self._create_database_connection()
+        # in memory index of of_port_mappings, shared by the http and admin engines and the openflow threads
+        self.config["of_port_mappings"] = of_port_mappings.OfPortMappingIndex(self.get_of_port_mappings(),
+                                                                              self.get_of_port_mappings)
+        vim_db.add_change_listener(self.config["of_port_mappings"].invalidate)
+        # tenant, flavor and image rows used at server creation, shared by the http engines and the host threads
+        self.config["metadata_cache"] = metadata_cache.MetadataCache(self.config.get('metadata_cache_ttl', 60))
+        vim_db.add_change_listener(self.config["metadata_cache"].on_change)
+        # responses of the GET listings polled by many clients, discarded at any write to the tables they read
+        self.config["response_cache"] = response_cache.ResponseCache(self.config.get('response_cache_ttl', 0.5))
+        vim_db.add_change_listener(self.config["response_cache"].invalidate)
 
         self.of_test_mode = False if self.config['mode'] == 'normal' or self.config['mode'] == "OF only" else True
 
-        # Create one thread for each host
-        host_test_mode = True if self.config['mode'] == 'test' or self.config['mode'] == "OF only" else False
-        host_develop_mode = True if self.config['mode'] == 'development' else False
-        host_develop_bridge_iface = self.config.get('development_bridge', None)
-
-        # get host list from data base before starting threads
-        r, hosts = self.db.get_table(SELECT=('name', 'ip_name', 'user', 'uuid', 'hypervisors', 'password', 'keyfile'),
-                                     FROM='hosts', WHERE={'status': 'ok'}) #Unikernels extension
-        if r < 0:
-            raise ovimException("Cannot get hosts from database {}".format(hosts))
-
         self.config['host_threads'] = {}
-
-        for host in hosts:
-            thread = ht.host_thread(name=host['name'], user=host['user'], host=host['ip_name'], db=self.config["db"],
-                                    password=host['password'],
-                                    keyfile=host.get('keyfile', self.config["host_ssh_keyfile"]),
-                                    test=host_test_mode,
-                                    image_path=self.config['host_image_path'],
-                                    version=self.config['version'], host_id=host['uuid'],
-                                    develop_mode=host_develop_mode,
-                                    develop_bridge_iface=host_develop_bridge_iface,
-                                    hypervisors=host['hypervisors'],  #Unikernels extension
-                                    logger_name=self.logger_name + ".host." + host['name'],
-                                    debug=self.config.get('log_level_host'))
-
-            try:
-                thread.check_connectivity()
-            except Exception as e:
-                self.logger.critical('Error detected for compute = {} with ip = {}'
-                                     .format(host['name'], host['ip_name']))
-            thread.start()
-            self.config['host_threads'][host['uuid']] = thread
+        # hosts are run at a pool of threads unless host_workers is 0, that means a thread per host
+        host_workers = self.config.get('host_workers', 20)
+        if host_workers and not self.config.get('host_scheduler'):
+            self.config['host_scheduler'] = host_scheduler.HostScheduler(
+                host_workers, logger_name=self.logger_name + ".hosts",
+                stall_timeout=self.config.get('host_stall_timeout', 30))
+            self.config['host_scheduler'].start()
+
+        # Create one thread for each host. With cluster, only for the hosts owned by this instance, later
+        if not self.config.get('cluster'):
+            for host in self._get_hosts_to_run():
+                self.config['host_threads'][host['uuid']] = self.start_host_thread(host)
 
         # precreate interfaces; [bridge:<host_bridge_name>, VLAN used at Host, uuid of network camping in this bridge,
         # speed in Gbit/s
@@ -256,23 +281,19 @@ class ovim():
                 if r > 0:
                     self.config['dhcp_nets'].append(nets[0]['uuid'])
 
-        # OFC default
-        self._start_ofc_default_task()
-
-        # OFC per tenant in DB
-        self._start_of_db_tasks()
+        if self.config.get('cluster'):
+            # hosts, ofcs and dhcp server are shared out among the openvim instances
+            self._start_cluster()
+        else:
+            # OFC default
+            self._start_ofc_default_task()
 
-        # create dhcp_server thread
-        host_test_mode = True if self.config['mode'] == 'test' or self.config['mode'] == "OF only" else False
-        dhcp_params = self.config.get("dhcp_server")
-        if dhcp_params:
-            thread = dt.dhcp_thread(dhcp_params=dhcp_params, test=host_test_mode, dhcp_nets=self.config["dhcp_nets"],
-                                    db=self.config["db"],
-                                    logger_name=self.logger_name + ".dhcp",
-                                    debug=self.config.get('log_level_of'))
-            thread.start()
-            self.config['dhcp_thread'] = thread
+            # OFC per tenant in DB
+            self._start_of_db_tasks()
 
+            # create dhcp_server thread
+            if self.config.get("dhcp_server"):
+                self.config['dhcp_thread'] = self._start_dhcp_thread()
 
 
         # create ovs dhcp thread
@@ -311,14 +332,232 @@ class ovim():
                                                 routes)
                     self.launch_link_bridge_to_ovs(net['vlan'], net.get('gateway_ip'), net.get('cidr'), links, routes)
                     if net["status"] == "ERROR":
-                        self.db.update_rows("nets", UPDATE={"status": "ACTIVE", "last_error": None},
-                                            WHERE={"uuid": net["uuid"]})
+                        self._write_net_status(net["uuid"], "ACTIVE")
                 except Exception as e:
                     self.logger.error("Fail at launching dhcp server for net_id='%s' net_name='%s': %s",
                                       net["uuid"], net["name"], str(e))
-                    self.db.update_rows("nets", UPDATE={"status": "ERROR",
-                                                 "last_error": "Fail at launching dhcp server: " + str(e)},
-                                        WHERE={"uuid": net["uuid"]})
+                    self._write_net_status(net["uuid"], "ERROR", "Fail at launching dhcp server: " + str(e))
+
+    def _get_hosts_to_run(self):
+        """
+        Get from database the hosts whose thread must be run
+        :return: list of hosts
+        """
+        r, hosts = self.db.get_table(SELECT=('name', 'ip_name', 'user', 'uuid', 'hypervisors', 'password', 'keyfile'),
+                                     FROM='hosts', WHERE={'status': 'ok'}) #Unikernels extension
+        if r < 0:
+            raise ovimException("Cannot get hosts from database {}".format(hosts))
+        return hosts
+
+    def start_host_thread(self, host):
+        """
+        Create and launch the thread of a compute node. Used at start, by the cluster and when a host is added
+        :param host: host dictionary with name, ip_name, user, uuid, hypervisors, password and keyfile
+        :return: thread obj
+        """
+        host_test_mode = True if self.config['mode'] == 'test' or self.config['mode'] == "OF only" else False
+        host_develop_mode = True if self.config['mode'] == 'development' else False
+        host_develop_bridge_iface = self.config.get('development_bridge', None)
+
+        thread = ht.host_thread(name=host['name'], user=host['user'], host=host['ip_name'], db=self.config["db"],
+                                password=host['password'],
+                                keyfile=host.get('keyfile', self.config["host_ssh_keyfile"]),
+                                test=host_test_mode,
+                                image_path=self.config['host_image_path'],
+                                version=self.config['version'], host_id=host['uuid'],
+                                develop_mode=host_develop_mode,
+                                develop_bridge_iface=host_develop_bridge_iface,
+                                hypervisors=host['hypervisors'],  #Unikernels extension
+                                logger_name=self.logger_name + ".host." + host['name'],
+                                debug=self.config.get('log_level_host'),
+                                scheduler=self.config.get('host_scheduler'),
+                                metadata_cache=self.config.get('metadata_cache'),
+                                set_net_status=self._write_net_status)
+
+        try:
+            thread.check_connectivity()
+        except Exception as e:
+            self.logger.critical('Error detected for compute = {} with ip = {}'
+                                 .format(host['name'], host['ip_name']))
+        thread.start()
+        return thread
+
+    def _start_dhcp_thread(self):
+        """
+        Create and launch the dhcp_server thread
+        :return: thread obj
+        """
+        host_test_mode = True if self.config['mode'] == 'test' or self.config['mode'] == "OF only" else False
+        thread = dt.dhcp_thread(dhcp_params=self.config["dhcp_server"], test=host_test_mode,
+                                dhcp_nets=self.config["dhcp_nets"], db=self.config["db"],
+                                logger_name=self.logger_name + ".dhcp",
+                                debug=self.config.get('log_level_of'))
+        thread.start()
+        return thread
+
+    def _start_cluster(self):
+        """
+        Join the openvim instances sharing the database, taking the leases of a fair share of the hosts, ofcs and
+        dhcp server and running their threads. The rest are reached through cluster.RemoteThread objects
+        """
+        cluster_config = self.config['cluster']
+        instance_id = cluster_config.get('instance_id') or "{}:{}".format(socket.gethostname(),
+                                                                          self.config['http_port'])
+        member = cluster.ClusterMember(instance_id, self._create_database_connection(),
+                                       self._get_cluster_resources, self._start_cluster_resource,
+                                       self._attach_cluster_resource,
+                                       endpoint="http://{}:{}".format(self.config['http_host'],
+                                                                      self.config['http_port']),
+                                       lease_time=cluster_config.get('lease_time', 30),
+                                       heartbeat=cluster_config.get('heartbeat'),
+                                       task_poll=cluster_config.get('task_poll', 0.5),
+                                       invalidate_caches=self._invalidate_caches,
+                                       logger_name=self.logger_name + ".cluster")
+        self.config['cluster_member'] = member
+        # take the leases before serving requests
+        member.heartbeat()
+        member.start()
+        self.logger.info("Cluster instance '%s' owns %d of %d resources, %d instances", instance_id,
+                         len(member.owned), len(member.info), member.members)
+
+    def _invalidate_caches(self):
+        """
+        Discard the in memory copies of database rows, changed by other openvim instances without this one knowing
+        :return: None
+        """
+        if self.config.get("metadata_cache"):
+            self.config["metadata_cache"].invalidate()
+        if self.config.get("of_port_mappings") is not None:
+            self.config["of_port_mappings"].invalidate()
+
+    def _get_cluster_resources(self):
+        """
+        Get the resources shared out among the openvim instances
+        :return: dictionary {(resource_type, resource_id): info}
+        """
+        resources = {}
+        for host in self._get_hosts_to_run():
+            resources[("host", host['uuid'])] = host
+        ofc_default = self._get_ofc_default_config()
+        if ofc_default:
+            resources[("ofc", "Default")] = ofc_default
+        for ofc in self.get_of_controllers():
+            resources[("ofc", ofc['uuid'])] = ofc
+        if self.config.get("dhcp_server"):
+            resources[("dhcp", "dhcp")] = {"name": "dhcp"}
+        if self.config.get("network_type") == "ovs":
+            # runs the 'ovs-port-up' and 'ovs-port-down' tasks of all the instances, in order
+            resources[("controller", "openvim_controller")] = {"name": "openvim_controller"}
+        return resources
+
+    def _start_cluster_resource(self, resource_type, resource_id, info):
+        """
+        Start the thread of a resource whose lease has been acquired
+        :return: thread obj
+        """
+        if resource_type == "host":
+            return self.start_host_thread(info)
+        elif resource_type == "ofc":
+            of_conn = self._load_of_module(info)
+            return self._create_ofc_thread(of_conn, resource_id,
+                                           broadcast_groups=info.get('broadcast_groups') in (True, 'true'))
+        elif resource_type == "dhcp":
+            return self._start_dhcp_thread()
+        elif resource_type == "controller":
+            return self.get_dhcp_controller()
+        raise ovimException("Unknown cluster resource type '{}'".format(resource_type), HTTP_Internal_Server_Error)
+
+    def _attach_cluster_resource(self, resource_type, resource_id, thread, info):
+        """
+        Place the thread of a resource, local or remote, where the rest of openvim looks for it
+        :param thread: thread obj, cluster.RemoteThread, or None if the resource has been removed
+        """
+        if resource_type == "host":
+            if thread:
+                self.config['host_threads'][resource_id] = thread
+            else:
+                self.config['host_threads'].pop(resource_id, None)
+        elif resource_type == "dhcp":
+            if thread:
+                self.config['dhcp_thread'] = thread
+            else:
+                self.config.pop('dhcp_thread', None)
+        elif resource_type == "controller":
+            old_thread = self.config.pop('ovs_controller_thread', None)
+            if old_thread is not None and old_thread is not thread and \
+                    not isinstance(old_thread, cluster.RemoteThread) and \
+                    self.config['host_threads'].get('openvim_controller') is old_thread:
+                # it has been told to exit; get_dhcp_controller creates a new one for the direct calls
+                del self.config['host_threads']['openvim_controller']
+            if thread:
+                self.config['ovs_controller_thread'] = thread
+        elif resource_type == "ofc":
+            if isinstance(thread, cluster.RemoteThread):
+                # the connector is used locally for reading the controller ports
+                try:
+                    thread.OF_connector = self._load_of_module(info)
+                except ovimException:
+                    pass
+            ofcs_threads = self.config.setdefault('ofcs_thread', {})
+            old_thread = ofcs_threads.pop(resource_id, None)
+            # replace the list instead of modifying it, as it can be iterated by other threads
+            ofcs_thread_dpid = [ofc_th for ofc_th in self.config.get('ofcs_thread_dpid', [])
+                                if old_thread is None or old_thread not in ofc_th.values()]
+            if thread:
+                ofcs_threads[resource_id] = thread
+                ofcs_thread_dpid.append({info['dpid']: thread})
+            self.config['ofcs_thread_dpid'] = ofcs_thread_dpid
+            if resource_id == "Default":
+                if thread:
+                    self.config['of_thread'] = thread
+                else:
+                    self.config.pop('of_thread', None)
+
+    def get_cluster_status(self):
+        """
+        Get the openvim instances sharing the database and the leases of the hosts, ofcs, dhcp server and openvim
+        controller
+        :return: dictionary with this instance, the members and the leases
+        """
+        member = self.config.get('cluster_member')
+        if not member:
+            raise ovimException("Cluster is not enabled. Set 'cluster' at configuration file", HTTP_Not_Found)
+        try:
+            return member.get_status()
+        except ValueError as e:
+            raise ovimException("Cannot get cluster status: {}".format(e), HTTP_Internal_Server_Error)
+
+    def get_metadata_cache_status(self):
+        """
+        Get the size and hit rates of the cache of tenant, flavor and image rows
+        :return: dictionary with ttl, entries, invalidations and per kind hits, misses and hit_rate
+        """
+        cache = self.config.get('metadata_cache')
+        if not cache:
+            raise ovimException("Metadata cache is not running", HTTP_Not_Found)
+        return cache.get_status()
+
+    def get_response_cache_status(self):
+        """
+        Get the size and hit rate of the cache of GET responses
+        :return: dictionary with ttl, entries, in_flight, hits, coalesced, misses, invalidations and hit_rate
+        """
+        cache = self.config.get('response_cache')
+        if not cache:
+            raise ovimException("Response cache is not running", HTTP_Not_Found)
+        return cache.get_status()
+
+    def invalidate_metadata_cache(self, table=None, uuid=None):
+        """
+        Remove from the metadata cache the entries of a changed tenant, flavor or image. To be called after any change
+        of these tables or their tenant associations
+        :param table: 'tenants', 'flavors' or 'images'. None for all the entries
+        :param uuid: id of the changed row. None for all the entries of the table
+        :return: None
+        """
+        cache = self.config.get('metadata_cache')
+        if cache:
+            cache.invalidate(table, uuid)
 
     def _start_of_db_tasks(self):
         """
@@ -331,14 +570,16 @@ class ovim():
         for ofc in ofcs:
             of_conn = self._load_of_module(ofc)
             # create ofc thread per of controller
-            self._create_ofc_task(ofc['uuid'], ofc['dpid'], of_conn)
+            self._create_ofc_task(ofc['uuid'], ofc['dpid'], of_conn,
+                                  broadcast_groups=ofc.get('broadcast_groups') == 'true')
 
-    def _create_ofc_task(self, ofc_uuid, dpid, of_conn):
+    def _create_ofc_task(self, ofc_uuid, dpid, of_conn, broadcast_groups=False):
         """
         Create an ofc thread for handle each sdn controllers
         :param ofc_uuid: sdn controller uuid
         :param dpid:  sdn controller dpid
         :param of_conn: OF_conn module
+        :param broadcast_groups: use openflow groups for the broadcast traffic of the nets
         :return:
         """
         if 'ofcs_thread' not in self.config and 'ofcs_thread_dpid' not in self.config:
@@ -349,7 +590,7 @@ class ovim():
             ofcs_thread_dpid = self.config['ofcs_thread_dpid']
 
         if ofc_uuid not in ofcs_threads:
-            ofc_thread = self._create_ofc_thread(of_conn, ofc_uuid)
+            ofc_thread = self._create_ofc_thread(of_conn, ofc_uuid, broadcast_groups)
             if ofc_uuid == "Default":
                 self.config['of_thread'] = ofc_thread
 
@@ -359,31 +600,42 @@ class ovim():
             ofcs_thread_dpid.append({dpid: ofc_thread})
             self.config['ofcs_thread_dpid'] = ofcs_thread_dpid
 
-    def _start_ofc_default_task(self):
+    def _get_ofc_default_config(self):
         """
-        Create default ofc thread
+        Get the default ofc from the configuration file
+        :return: dictionary in the ofcs table format, or None if there is not default ofc
         """
         if 'of_controller' not in self.config \
                 and 'of_controller_ip' not in self.config \
                 and 'of_controller_port' not in self.config \
                 and 'of_controller_dpid' not in self.config:
-            return
+            return None
 
-        # OF THREAD
         db_config = {}
+        db_config['name'] = "Default"
         db_config['ip'] = self.config.get('of_controller_ip')
         db_config['port'] = self.config.get('of_controller_port')
         db_config['dpid'] = self.config.get('of_controller_dpid')
         db_config['type'] = self.config.get('of_controller')
         db_config['user'] = self.config.get('of_user')
         db_config['password'] = self.config.get('of_password')
+        db_config['broadcast_groups'] = self.config.get('of_controller_broadcast_groups', False)
+        return db_config
+
+    def _start_ofc_default_task(self):
+        """
+        Create default ofc thread
+        """
+        db_config = self._get_ofc_default_config()
+        if not db_config:
+            return
 
         # create connector to the openflow controller
         # load other parameters starting by of_ from config dict in a temporal dict
 
         of_conn = self._load_of_module(db_config)
         # create openflow thread
-        self._create_ofc_task("Default", db_config['dpid'], of_conn)
+        self._create_ofc_task("Default", db_config['dpid'], of_conn, broadcast_groups=db_config['broadcast_groups'])
 
     def _load_of_module(self, db_config):
         """
@@ -437,7 +689,7 @@ class ovim():
             raise ovimException("Cannot open the Openflow controller '{}': '{}'".format(type(e).__name__, str(e)),
                                 HTTP_Internal_Server_Error)
 
-    def _create_ofc_thread(self, of_conn, ofc_uuid="Default"):
+    def _create_ofc_thread(self, of_conn, ofc_uuid="Default", broadcast_groups=False):
         """
         Create and launch a of thread
         :return: thread obj
@@ -453,7 +705,9 @@ class ovim():
         thread = oft.openflow_thread(ofc_uuid, of_conn, of_test=self.of_test_mode, db=self.config["db"],
                                      pmp_with_same_vlan=ofc_net_same_vlan,
                                      logger_name=self.logger_name + ".ofc." + ofc_uuid,
-                                     debug=self.config.get('log_level_of'))
+                                     debug=self.config.get('log_level_of'),
+                                     broadcast_groups=broadcast_groups,
+                                     reinstall_workers=self.config.get('openflow_reinstall_workers', 8))
         #r, c = thread.OF_connector.obtain_port_correspondence()
         #if r < 0:
         #    raise ovimException("Cannot get openflow information %s", c)
@@ -461,6 +715,15 @@ class ovim():
         return thread
 
     def stop_service(self):
+        if self.config.get('response_cache'):
+            vim_db.remove_change_listener(self.config['response_cache'].invalidate)
+        if self.config.get('of_port_mappings') is not None:
+            vim_db.remove_change_listener(self.config['of_port_mappings'].invalidate)
+        if self.config.get('metadata_cache'):
+            vim_db.remove_change_listener(self.config['metadata_cache'].on_change)
+        if self.config.get('cluster_member'):
+            # stops the owned threads and releases their leases
+            self.config['cluster_member'].stop()
         threads = self.config.get('host_threads', {})
         if 'of_thread' in self.config:
             threads['of'] = (self.config['of_thread'])
@@ -473,23 +736,28 @@ class ovim():
             threads['dhcp'] = (self.config['dhcp_thread'])
 
         for thread_id, thread in threads.items():
-            if thread_id == 'openvim_controller':
+            if isinstance(thread, cluster.RemoteThread):
                 continue
             thread.insert_task("exit")
         for thread_id, thread in threads.items():
-            if thread_id == 'openvim_controller':
+            if isinstance(thread, cluster.RemoteThread):
                 continue
             thread.join()
+        if self.config.get('host_scheduler'):
+            self.config['host_scheduler'].stop()
+            self.config['host_scheduler'] = None
 
-    def get_networks(self, columns=None, db_filter={}, limit=None):
+    def get_networks(self, columns=None, db_filter={}, limit=None, marker=None):
         """
         Retreive networks available
         :param columns: List with select query parameters
         :param db_filter: List with where query parameters
         :param limit: Query limit result
+        :param marker: uuid of the last network of the previous page. Networks are ordered by uuid
         :return:
         """
-        result, content = self.db.get_table(SELECT=columns, FROM='nets', WHERE=db_filter, LIMIT=limit)
+        result, content = self.db.get_table(SELECT=columns, FROM='nets', WHERE=db_filter, LIMIT=limit,
+                                            WHERE_GREATER={'uuid': marker} if marker else None, ORDER_BY='uuid')
 
         if result < 0:
             raise ovimException(str(content), -result)
@@ -807,15 +1075,8 @@ class ovim():
                 self.config["dhcp_nets"].remove(network_id)
 
             if net_data.get('enable_dhcp'):
-                dhcp_path = self.config['ovs_controller_file_path']
-                dhcp_controller = self.get_dhcp_controller()
-                dhcp_controller.delete_dhcp_server(net_data['vlan'], network_id, dhcp_path)
-                dhcp_controller.delete_dhcp_port(net_data['vlan'], network_id, dhcp_path)
-                links = yaml.load(net_data.get('links'))
-                if links:
-                    links = yaml.load(net_data.get('links'))
-                    self.delete_link_bridge_to_ovs(net_data['vlan'], links)
-
+                # queued after the set up of the ports of the net
+                self.delete_ovs_port(net_data)
                 return content
         else:
             raise ovimException("Error deleting network '{}': {}".format(network_id, content), -result)
@@ -874,6 +1135,76 @@ class ovim():
 
         return result
 
+    def reinstall_openflow_rules(self, progress=None):
+        """
+        Reinstall the openflow rules of all the ptp and data nets with a single 'reinstall-nets' task per openflow
+        controller, that reads all the nets and flows at once, compares them with one snapshot of the controller flows
+        and sends the changes concurrently. See openflow_thread.reinstall_flows. It waits until the tasks of the
+        controllers run by this instance finish; the ones of other cluster instances are only routed
+        :param progress: optional dictionary where the progress of the task of each controller is stored at
+            'ofcs': {ofc_id: progress}, and the number of nets without controller at 'nets_without_ofc'
+        :return: number of nets updated without error
+        """
+        if progress is None:
+            progress = {}
+        result, content = self.db.get_table(SELECT=("uuid", "type", "bind_net"), FROM='nets')
+        if result < 0:
+            raise ovimException(str(content), -result)
+        # nets bound between them are updated together, by the controller of any of them
+        bound_nets = {}
+        for net in content:
+            bound_nets.setdefault(net['bind_net'] or net['uuid'], []).append(net)
+        bound_nets = [nets for nets in bound_nets.values() if any(net['type'] in ('ptp', 'data') for net in nets)]
+        net_ids = [net['uuid'] for nets in bound_nets for net in nets]
+        nets_ofc = {}   # net_id: (ofc_id, switch_dpid) of the first port with ofc_id, as net_update_ofc_thread
+        if net_ids:
+            result, content = self.db.get_table(SELECT=("net_id", "ofc_id", "switch_dpid"), FROM='ports',
+                                                WHERE={'net_id': net_ids})
+            if result < 0:
+                raise ovimException(str(content), -result)
+            for port in content:
+                if port['ofc_id'] and port['net_id'] not in nets_ofc:
+                    nets_ofc[port['net_id']] = (port['ofc_id'], port['switch_dpid'])
+
+        ofcs_ids = dict((id(ofc_thread), ofc_id) for ofc_id, ofc_thread in self.config['ofcs_thread'].items())
+        ofcs_nets = {}  # ofc_id: (ofc thread, list of net ids)
+        nets_without_ofc = 0
+        for nets in bound_nets:
+            ofc = next((nets_ofc[net['uuid']] for net in nets if net['uuid'] in nets_ofc), (None, None))
+            ofc_thread = self._get_ofc_thread(*ofc)
+            if not ofc_thread:
+                self.logger.error("Cannot reinstall the openflow rules of nets %s: no valid ofc_id or switch_dpid",
+                                  ",".join(net['uuid'] for net in nets))
+                nets_without_ofc += len(nets)
+                continue
+            ofc_id = ofcs_ids.get(id(ofc_thread), ofc_thread.name)
+            ofcs_nets.setdefault(ofc_id, (ofc_thread, []))[1].extend(net['uuid'] for net in nets)
+
+        ofcs_progress = {}
+        for ofc_id, (ofc_thread, net_ids) in ofcs_nets.items():
+            ofc_progress = oft.new_reinstall_progress(len(net_ids))
+            if isinstance(ofc_thread, cluster.RemoteThread):
+                r, c = ofc_thread.insert_task("reinstall-nets", net_ids)
+                ofc_progress["status"] = "routed to {}".format(ofc_thread.owner)
+            else:
+                r, c = ofc_thread.insert_task("reinstall-nets", net_ids, ofc_progress)
+            if r < 0:
+                self.logger.error("Cannot insert a task for reinstalling the nets of ofc '%s': %s", ofc_id, c)
+                ofc_progress.update(status="error", last_error=c)
+            ofcs_progress[ofc_id] = ofc_progress
+        progress.update(ofcs=ofcs_progress, nets_without_ofc=nets_without_ofc)
+
+        nets_updated = 0
+        for ofc_id, (ofc_thread, net_ids) in ofcs_nets.items():
+            ofc_progress = ofcs_progress[ofc_id]
+            if isinstance(ofc_thread, cluster.RemoteThread):
+                continue
+            while ofc_progress["status"] in ("queued", "running") and ofc_thread.is_alive():
+                time.sleep(0.5)
+            if ofc_progress["status"] == "done":
+                nets_updated += ofc_progress["nets"] - ofc_progress["nets_error"]
+        return nets_updated
+
     def delete_openflow_rules(self, ofc_id=None):
         """
         To make actions over the net. The action is to delete ALL openflow rules
@@ -913,9 +1244,10 @@ class ovim():
             raise ovimException("Openflow controller not found with ofc_id={}".format(ofc_id), HTTP_Not_Found)
         return conn.pp2ofi
 
-    def get_ports(self, columns=None, filter={}, limit=None):
+    def get_ports(self, columns=None, filter={}, limit=None, marker=None):
         # result, content = my.db.get_ports(where_)
-        result, content = self.db.get_table(SELECT=columns, WHERE=filter, FROM='ports', LIMIT=limit)
+        result, content = self.db.get_table(SELECT=columns, WHERE=filter, FROM='ports', LIMIT=limit,
+                                            WHERE_GREATER={'uuid': marker} if marker else None, ORDER_BY='uuid')
         if result < 0:
             self.logger.error("http_get_ports Error %d %s", result, content)
             raise ovimException(str(content), -result)
@@ -923,6 +1255,23 @@ class ovim():
             convert_boolean(content, ('admin_state_up',))
             return content
 
+    def get_ports_by_chunks(self, columns=None, filter={}, limit=None, marker=None):
+        """
+        Generator version of get_ports for large listings. Ports are ordered by uuid
+        :param columns: List with select query parameters
+        :param filter: List with where query parameters
+        :param limit: Total number of ports to retrieve
+        :param marker: uuid of the last port of the previous page
+        :return: yields (result, ports) tuples as vim_db.get_table_by_chunks
+        """
+        for result, content in self.db.get_table_by_chunks(SELECT=columns, WHERE=filter, FROM='ports', LIMIT=limit,
+                                                           WHERE_GREATER={'uuid': marker} if marker else None):
+            if result < 0:
+                self.logger.error("get_ports_by_chunks Error %d %s", result, content)
+            else:
+                convert_boolean(content, ('admin_state_up',))
+            yield result, content
+
     def new_port(self, port_data):
         port_data['type'] = 'external'
         if port_data.get('net_id'):
@@ -981,7 +1330,13 @@ class ovim():
             db_filter['compute_node'] = port_data['compute_node']
 
         columns = ['ofc_id', 'switch_dpid', 'switch_port', 'switch_mac', 'pci']
-        port_mapping_data = self.get_of_port_mappings(columns, db_filter)
+        of_port_mapping_index = self.config.get("of_port_mappings")
+        if of_port_mapping_index is not None:
+            if db_filter.get('pci'):
+                db_filter['pci'] = db_filter['pci'].lower()
+            port_mapping_data = of_port_mapping_index.find(columns, **db_filter)
+        else:
+            port_mapping_data = self.get_of_port_mappings(columns, db_filter)
 
         if not len(port_mapping_data):
             raise ovimException("No port mapping found for '{}'".format(str(db_filter)),
@@ -1005,10 +1360,11 @@ class ovim():
 
         result, uuid = self.db.new_row('ports', port_data, True, True)
         # set net status to BUILD
-        self.db.update_rows('nets', {"status": "BUILD"}, WHERE={'uuid': port_data['net_id']})
+        self._set_net_status_build(port_data['net_id'])
         if result > 0:
             try:
-                self.net_update_ofc_thread(port_data['net_id'], port_data['ofc_id'])
+                self.net_update_ofc_thread(port_data['net_id'], port_data['ofc_id'],
+                                           changed_ports=[port_data['switch_port']])
             except ovimException as e:
                 raise ovimException("Cannot insert a task for updating network '{}' {}".
                                     format(port_data['net_id'], str(e)), HTTP_Internal_Server_Error)
@@ -1019,12 +1375,65 @@ class ovim():
         else:
             raise ovimException(str(uuid), -result)
 
-    def net_update_ofc_thread(self, net_id, ofc_id=None, switch_dpid=None):
+    def _set_net_status_build(self, net_id):
+        """
+        Set net status to BUILD before inserting an update task. The ofc threads are informed, as they only write
+        the net status when it changes
+        :param net_id: net uuid
+        :return:
+        """
+        self._write_net_status(net_id, "BUILD")
+
+    def _write_net_status(self, net_id, status, last_error=None):
+        """
+        Write the status of a net at database, out of the ofc threads. These are informed, as they only write the net
+        status when it changes and would keep the one written here otherwise. Called from other threads too
+        :param net_id: net uuid
+        :param status: net status
+        :param last_error: error text, or None to keep the current one
+        :return: None
+        """
+        update = {"status": status}
+        if last_error is not None or status == "ACTIVE":
+            update["last_error"] = last_error
+        self.db.update_rows('nets', update, WHERE={'uuid': net_id})
+        for ofc_thread in self.config.get('ofcs_thread', {}).values():
+            ofc_thread.reset_net_status(net_id)
+
+    def _get_ofc_thread(self, ofc_id=None, switch_dpid=None):
+        """
+        Get the thread of the openflow controller of a net, given by the ofc_id or switch_dpid of its ports
+        :param ofc_id: openflow controller id
+        :param switch_dpid: switch dpid
+        :return: ofc thread or None if not found
+        """
+        #TODO if not ofc_id: look at database table ofcs
+        if not ofc_id and switch_dpid and self.config.get("of_port_mappings") is not None:
+            for of_map in self.config["of_port_mappings"].find(("ofc_id",), switch_dpid=switch_dpid):
+                if of_map["ofc_id"] in self.config.get('ofcs_thread', ()):
+                    ofc_id = of_map["ofc_id"]
+                    break
+
+        # If no ofc_id found it, default ofc_id is used.
+        if not ofc_id and not switch_dpid:
+            ofc_id = "Default"
+
+        if ofc_id and ofc_id in self.config['ofcs_thread']:
+            return self.config['ofcs_thread'][ofc_id]
+        elif switch_dpid:
+            for ofc_t in self.config['ofcs_thread_dpid']:
+                if switch_dpid in ofc_t:
+                    return ofc_t[switch_dpid]
+        return None
+
+    def net_update_ofc_thread(self, net_id, ofc_id=None, switch_dpid=None, changed_ports=None):
         """
         Insert a update net task by net id or ofc_id for each ofc thread
         :param net_id: network id
         :param ofc_id: openflow controller id
         :param switch_dpid: switch dpid
+        :param changed_ports: optional list of switch ports of the ports added to or removed from the net, so that
+            only the affected flows are updated. If not provided all the flows of the net are recomputed
         :return:
         """
         if not net_id:
@@ -1041,21 +1450,9 @@ class ovim():
                     ofc_id = port['ofc_id']
                     switch_dpid = port['switch_dpid']
                     break
-        #TODO if not ofc_id: look at database table ofcs
-
-
-        # If no ofc_id found it, default ofc_id is used.
-        if not ofc_id and not switch_dpid:
-            ofc_id = "Default"
-
-        if ofc_id and ofc_id in self.config['ofcs_thread']:
-            r, c = self.config['ofcs_thread'][ofc_id].insert_task("update-net", net_id)
-        elif switch_dpid:
-
-            ofcs_dpid_list = self.config['ofcs_thread_dpid']
-            for ofc_t in ofcs_dpid_list:
-                if switch_dpid in ofc_t:
-                    r, c = ofc_t[switch_dpid].insert_task("update-net", net_id)
+        ofc_thread = self._get_ofc_thread(ofc_id, switch_dpid)
+        if ofc_thread:
+            r, c = ofc_thread.insert_task("update-net", net_id, changed_ports)
 
         if r < 0:
             message = "Cannot insert a task for updating network '{}', {}".format(net_id, c)
@@ -1081,9 +1478,11 @@ class ovim():
             # change of net.
 
             # set net status to BUILD
-            self.db.update_rows('nets', {"status": "BUILD"}, WHERE={'uuid': net_id})
+            self._set_net_status_build(net_id)
             try:
-                self.net_update_ofc_thread(net_id, ofc_id=ports[0]["ofc_id"], switch_dpid=ports[0]["switch_dpid"])
+                changed_ports = [ports[0]["switch_port"]] if ports[0]["switch_port"] else None
+                self.net_update_ofc_thread(net_id, ofc_id=ports[0]["ofc_id"], switch_dpid=ports[0]["switch_dpid"],
+                                           changed_ports=changed_ports)
             except ovimException as e:
                 raise ovimException("Cannot insert a task for delete network '{}' {}".format(net_id, str(e)),
                                     HTTP_Internal_Server_Error)
@@ -1141,9 +1540,11 @@ class ovim():
 
         # Insert task to complete actions
         if result > 0:
+            changed_ports = [port["switch_port"]] if port["switch_port"] else None
             for net_id in nets:
                 try:
-                    self.net_update_ofc_thread(net_id, port["ofc_id"], switch_dpid=port["switch_dpid"])
+                    self.net_update_ofc_thread(net_id, port["ofc_id"], switch_dpid=port["switch_dpid"],
+                                               changed_ports=changed_ports)
                 except ovimException as e:
                     raise ovimException("Error updating network'{}' {}".format(net_id, str(e)),
                                         HTTP_Internal_Server_Error)
@@ -1168,13 +1569,19 @@ class ovim():
         :return: openflow controller dpid
         """
 
+        if 'broadcast_groups' in ofc_data:
+            ofc_data['broadcast_groups'] = 'true' if ofc_data['broadcast_groups'] else 'false'
         result, ofc_uuid = self.db.new_row('ofcs', ofc_data, True, True)
         if result < 0:
             raise ovimException("New ofc Error %s" % ofc_uuid, HTTP_Internal_Server_Error)
 
         ofc_data['uuid'] = ofc_uuid
-        of_conn = self._load_of_module(ofc_data)
-        self._create_ofc_task(ofc_uuid, ofc_data['dpid'], of_conn)
+        if self.config.get('cluster_member'):
+            self.config['cluster_member'].add("ofc", ofc_uuid, ofc_data)
+        else:
+            of_conn = self._load_of_module(ofc_data)
+            self._create_ofc_task(ofc_uuid, ofc_data['dpid'], of_conn,
+                                  broadcast_groups=ofc_data.get('broadcast_groups') == 'true')
 
         return ofc_uuid
 
@@ -1189,8 +1596,13 @@ class ovim():
         old_of_controller = self.show_of_controller(of_id)
 
         if old_of_controller:
+            if 'broadcast_groups' in ofc_data:
+                ofc_data['broadcast_groups'] = 'true' if ofc_data['broadcast_groups'] else 'false'
             result, content = self.db.update_rows('ofcs', ofc_data, WHERE={'uuid': of_id}, log=False)
             if result >= 0:
+                # applied to the following net updates; the flows of the existing nets change when they are updated
+                if 'broadcast_groups' in ofc_data and of_id in self.config.get('ofcs_thread', {}):
+                    self.config['ofcs_thread'][of_id].broadcast_groups = ofc_data['broadcast_groups'] == 'true'
                 return ofc_data
             else:
                 raise ovimException("Error uptating OF contorller with uuid {}".format(of_id),
@@ -1213,6 +1625,9 @@ class ovim():
             raise ovimException("Cannot delete ofc from database: {}".format(content), http_code=-result)
         elif result == 0:
             raise ovimException("ofc {} not found ".format(content), http_code=HTTP_Not_Found)
+        # port mappings of this ofc are deleted on cascade
+        if self.config.get("of_port_mappings") is not None:
+            self.config["of_port_mappings"].remove(ofc_id=of_id)
 
         ofc_thread = self.config['ofcs_thread'][of_id]
         del self.config['ofcs_thread'][of_id]
@@ -1321,6 +1736,7 @@ class ovim():
             tenants_images = ()
 
         result, content = self.db.delete_row('tenants', tenant_id)
+        self.invalidate_metadata_cache('tenants', tenant_id)
         if result == 0:
             raise ovimException("tenant '%s' not found" % tenant_id, HTTP_Not_Found)
         elif result > 0:
@@ -1350,23 +1766,34 @@ class ovim():
 
         # insert in data base
         result, content = self.db.update_rows('tenants', tenant_data, WHERE={'uuid': tenant_id}, log=True)
+        self.invalidate_metadata_cache('tenants', tenant_id)
         if result >= 0:
             return content
         else:
             raise ovimException(str(content), -result)
 
-    def set_of_port_mapping(self, of_maps, ofc_id=None, switch_dpid=None, region=None):
+    # unique keys of of_port_mappings table. A key with any Null value never conflicts
+    of_port_mapping_keys = (("region", "compute_node", "pci"), ("switch_dpid", "switch_port", "pci"),
+                            ("switch_dpid", "switch_mac", "pci"))
+
+    def import_of_port_mappings(self, of_maps, mode="insert", ofc_id=None, switch_dpid=None, region=None):
         """
-        Create new port mapping entry
-        :param of_maps: List with port mapping information
-        # maps =[{"ofc_id": <ofc_id>,"region": datacenter region,"compute_node": compute uuid,"pci": pci adress,
-                "switch_dpid": swith dpid,"switch_port": port name,"switch_mac": mac}]
+        Bulk import of port mappings. The whole batch is validated against the database and against itself, and then
+        written in one transaction with multi-row inserts. If there is any conflict nothing is written
+        :param of_maps: List with port mapping information, as in set_of_port_mapping
+        :param mode: 'insert': only new entries are allowed.
+                     'upsert': an entry with the same region, compute_node and pci of an existing one replaces it,
+                               keeping its uuid.
+                     'replace': all the existing entries of the regions present at of_maps are deleted first
         :param ofc_id: ofc id
         :param switch_dpid: switch  dpid
         :param region: datacenter region id
-        :return:
+        :return: dictionary with 'of_port_mappings': the list of of_maps with their uuid (empty if conflicts)
+                 and 'conflicts': list of {"index": position at of_maps, "key": unique key, "value": key values,
+                                           "conflict_with": uuid of the existing entry or position at of_maps}
         """
-
+        if mode not in ("insert", "upsert", "replace"):
+            raise ovimException("Invalid port mapping import mode '{}'".format(mode), HTTP_Bad_Request)
         for map in of_maps:
             if ofc_id:
                 map['ofc_id'] = ofc_id
@@ -1377,13 +1804,89 @@ class ovim():
             if map.get("pci"):
                 map["pci"] = map["pci"].lower()
 
-        for of_map in of_maps:
-            result, uuid = self.db.new_row('of_port_mappings', of_map, True)
-            if result > 0:
-                of_map["uuid"] = uuid
-            else:
-                raise ovimException(str(uuid), -result)
-        return of_maps
+        # existing entries that can conflict: same region or same switch
+        existing = {}
+        of_port_mapping_index = self.config.get("of_port_mappings")
+        for field in ("region", "switch_dpid"):
+            for value in set(map.get(field) for map in of_maps):
+                if of_port_mapping_index is not None:
+                    rows = of_port_mapping_index.find(**{field: value})
+                else:
+                    rows = self.get_of_port_mappings(db_filter={field: value})
+                for row in rows:
+                    existing[row["uuid"]] = row
+        delete_where = None
+        if mode == "replace":
+            regions = set(map.get("region") for map in of_maps)
+            delete_where = [{"region": r} for r in regions]
+            existing = dict((uuid, row) for uuid, row in existing.items() if row.get("region") not in regions)
+        existing_index = []
+        for key_fields in self.of_port_mapping_keys:
+            index = {}
+            for uuid, row in existing.items():
+                key = tuple(row.get(f) for f in key_fields)
+                if None not in key:
+                    index[key] = uuid
+            existing_index.append(index)
+        if mode == "upsert":
+            # replaced entries are deleted and inserted again with the same uuid
+            replaced = []
+            for map in of_maps:
+                key = tuple(map.get(f) for f in self.of_port_mapping_keys[0])
+                uuid = existing_index[0].get(key) if None not in key else None
+                if uuid and uuid not in replaced:
+                    map["uuid"] = uuid
+                    replaced.append(uuid)
+                    for key_fields, index in zip(self.of_port_mapping_keys, existing_index):
+                        index.pop(tuple(existing[uuid].get(f) for f in key_fields), None)
+            if replaced:
+                delete_where = {"uuid": replaced}
+
+        conflicts = []
+        batch_index = [{} for _ in self.of_port_mapping_keys]
+        for position, map in enumerate(of_maps):
+            for key_fields, index, batch in zip(self.of_port_mapping_keys, existing_index, batch_index):
+                key = tuple(map.get(f) for f in key_fields)
+                if None in key:
+                    continue
+                conflict_with = index.get(key)
+                if conflict_with is None:
+                    conflict_with = batch.get(key)
+                if conflict_with is None:
+                    batch[key] = position
+                else:
+                    conflicts.append({"index": position, "key": ",".join(key_fields), "value": ",".join(key),
+                                      "conflict_with": conflict_with})
+        if conflicts:
+            return {"of_port_mappings": [], "conflicts": conflicts}
+
+        result, content = self.db.new_rows('of_port_mappings', of_maps, add_uuid=True, DELETE_WHERE=delete_where)
+        if result < 0:
+            raise ovimException(str(content), -result)
+        if of_port_mapping_index is not None:
+            if mode == "replace":
+                of_port_mapping_index.remove(region=list(regions))
+            of_port_mapping_index.add(of_maps)
+        return {"of_port_mappings": of_maps, "conflicts": []}
+
+    def set_of_port_mapping(self, of_maps, ofc_id=None, switch_dpid=None, region=None, mode="insert"):
+        """
+        Create new port mapping entry
+        :param of_maps: List with port mapping information
+        # maps =[{"ofc_id": <ofc_id>,"region": datacenter region,"compute_node": compute uuid,"pci": pci adress,
+                "switch_dpid": swith dpid,"switch_port": port name,"switch_mac": mac}]
+        :param ofc_id: ofc id
+        :param switch_dpid: switch  dpid
+        :param region: datacenter region id
+        :param mode: 'insert', 'upsert' or 'replace'. See import_of_port_mappings
+        :return: of_maps with their uuid
+        """
+        content = self.import_of_port_mappings(of_maps, mode, ofc_id, switch_dpid, region)
+        if content["conflicts"]:
+            raise ovimException("Port mapping conflicts: " + "; ".join(
+                "entry {index} {key}={value} conflicts with {conflict_with}".format(**c)
+                for c in content["conflicts"]), HTTP_Conflict)
+        return content["of_port_mappings"]
 
     def clear_of_port_mapping(self, db_filter={}):
         """
@@ -1394,6 +1897,8 @@ class ovim():
         result, content = self.db.delete_row_by_dict(FROM='of_port_mappings', WHERE=db_filter)
         # delete_row_by_key
         if result >= 0:
+            if self.config.get("of_port_mappings") is not None:
+                self.config["of_port_mappings"].remove(**db_filter)
             return content
         else:
             raise ovimException("Error deleting of_port_mappings with filter='{}'".format(str(db_filter)),
@@ -1416,7 +1921,8 @@ class ovim():
 
     def get_dhcp_controller(self):
         """
-        Create an host_thread object for manage openvim controller and not create a thread for itself
+        Create and start, if not done, the host_thread object that manages the openvim controller. It only runs the
+        tasks, as 'ovs-port-up' and 'ovs-port-down', that set up the dhcp servers and links of the ovs networks
         :return: dhcp_host openvim controller object
         """
 
@@ -1438,16 +1944,30 @@ class ovim():
                                    host_id='openvim_controller', develop_mode=host_develop_mode,
                                    develop_bridge_iface=bridge_ifaces,
                                    logger_name=self.logger_name + ".host.controller",
-                                   debug=self.config.get('log_level_host'))
-        # dhcp_host.start()
+                                   debug=self.config.get('log_level_host'),
+                                   scheduler=self.config.get('host_scheduler'), manage_servers=False,
+                                   set_net_status=self._write_net_status)
         self.config['host_threads']['openvim_controller'] = dhcp_host
         try:
             dhcp_host.check_connectivity()
         except Exception as e:
            pass
+        dhcp_host.start()
 
         return dhcp_host
 
+    def _get_ovs_port_controller(self):
+        """
+        Get the thread that runs the 'ovs-port-up' and 'ovs-port-down' tasks. In cluster mode it is the openvim
+        controller of the instance that owns its lease, a cluster.RemoteThread if it is another one, so that the tasks
+        of all the instances run in order and do not edit the dnsmasq files at the same time
+        :return: openvim controller thread
+        """
+        thread = self.config.get('ovs_controller_thread')
+        if thread is not None:
+            return thread
+        return self.get_dhcp_controller()
+
     def launch_dhcp_server(self, vlan, first_ip, last_ip, cidr, gateway, dns, routes):
         """
         Launch a dhcpserver base on dnsmasq attached to the net base on vlan id across the the openvim computes
@@ -1467,9 +1987,9 @@ class ovim():
         controller_host = self.get_dhcp_controller()
 
         # controller_host.create_linux_bridge(vlan)
-        controller_host.create_dhcp_interfaces(vlan, first_ip, dhcp_netmask)
-        dhcp_path = self.config['ovs_controller_file_path']
-        controller_host.launch_dhcp_server(vlan, ip_range, dhcp_netmask, dhcp_path, gateway, dns, routes)
+        with controller_host.ssh_lock:
+            controller_host.create_dhcp_interfaces(vlan, first_ip, dhcp_netmask)
+            controller_host.launch_dhcp_server(vlan, ip_range, dhcp_netmask, dhcp_path, gateway, dns, routes)
 
     def launch_link_bridge_to_ovs(self, vlan, gateway, dhcp_cidr, links=None, routes=None):
         """
@@ -1481,16 +2001,7 @@ class ovim():
         """
 
         if links:
-            controller_host = self.get_dhcp_controller()
-            for link in links:
-                if 'iface' in link and 'nat' not in link:
-                        controller_host.create_link_bridge_to_ovs(vlan, link['iface'])
-                elif 'nat' in link:
-                    controller_host.create_qrouter_ovs_connection(vlan, gateway, dhcp_cidr)
-                    controller_host.create_qrouter_br_connection(vlan, dhcp_cidr, link)
-
-            if len(routes):
-                controller_host.add_ns_routes(vlan, routes)
+            self.get_dhcp_controller().create_links_to_ovs(vlan, gateway, dhcp_cidr, links, routes)
 
     def delete_link_bridge_to_ovs(self, vlan,  links=None):
         """
@@ -1500,13 +2011,54 @@ class ovim():
         :return: 
         """
         if links:
-            controller_host = self.get_dhcp_controller()
+            self.get_dhcp_controller().delete_links_to_ovs(vlan, links)
+
+    def launch_ovs_port(self, net, mac, ip_address):
+        """
+        Queue at the openvim controller the set up of the dhcp server and links of an ovs network for a new port, and
+        of the fixed ip of the port. Nothing is done at the controller here, so that server creation does not wait
+        :param net: nets row from database
+        :param mac: port mac address
+        :param ip_address: port ip address or None
+        :return: None
+        """
+        dhcp_enable = net.get('enable_dhcp') in (True, 'true')
+        port = {'net_id': net['uuid'], 'vlan': str(net['vlan']), 'mac': mac, 'ip_address': None,
+                'dhcp_path': self.config['ovs_controller_file_path'], 'enable_dhcp': dhcp_enable,
+                'cidr': str(net['cidr']), 'gateway_ip': str(net['gateway_ip']), 'dns': net.get('dns'),
+                'routes': net.get('routes'), 'links': net.get('links')}
+        if dhcp_enable:
+            ip_tools = IPNetwork(net['cidr'])
+            port['netmask'] = str(ip_tools.netmask)
+            port['dhcp_first_ip'] = str(net['dhcp_first_ip'])
+            port['dhcp_last_ip'] = str(net['dhcp_last_ip'])
+            # the fixed ip is only set if it is at the dhcp range
+            if ip_address and all_matching_cidrs(ip_address, [port['dhcp_first_ip'] + '/' + str(ip_tools.prefixlen)]):
+                port['ip_address'] = ip_address
+        r, c = self._get_ovs_port_controller().insert_task("ovs-port-up", port)
+        if r < 0:
+            raise ovimException("Cannot set up ovs port of net '{}': {}".format(net['uuid'], c),
+                                HTTP_Internal_Server_Error)
 
-            for link in links:
-                if 'iface' in link and 'nat' not in link:
-                    controller_host.remove_link_bridge_to_ovs(vlan, link['iface'])
-                elif 'nat' in link:
-                    controller_host.delete_qrouter_connection(vlan,  link['iface'])
+    def delete_ovs_port(self, net, mac=None, ip_address=None, fixed_ips=()):
+        """
+        Queue at the openvim controller the deletion of the dhcp server and links of an ovs network, and of the fixed
+        ip of some ports, after any previous set up of the ports of the network
+        :param net: nets row from database, with uuid, vlan and links
+        :param mac: port mac address or None
+        :param ip_address: port ip address or None
+        :param fixed_ips: list of (ip_address, mac) of other ports of the network, deleted in the same task
+        :return: None
+        """
+        fixed_ips = list(fixed_ips)
+        if mac:
+            fixed_ips.insert(0, (ip_address, mac))
+        port = {'net_id': net['uuid'], 'vlan': str(net['vlan']), 'fixed_ips': fixed_ips,
+                'dhcp_path': self.config['ovs_controller_file_path'], 'links': net.get('links')}
+        r, c = self._get_ovs_port_controller().insert_task("ovs-port-down", port)
+        if r < 0:
+            raise ovimException("Cannot delete ovs port of net '{}': {}".format(net['uuid'], c),
+                                HTTP_Internal_Server_Error)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+Coalescing of the identical GET requests polled by many clients at once. A request that arrives while an identical
+one is being computed waits for it and shares its response (single flight), and responses are kept for a short time
+to live (micro cache). Each response depends on a set of database tables; any write to them, notified by vim_db,
+discards the cached responses and detaches the in-flight computations, so that later requests compute again.
+Writes done by other openvimd instances sharing the database are only seen after the time to live. Responses that are
+not shareable, as the listings streamed because of their size, are passed to their request only.
+'''
+__date__ = "$19-oct-2026 10:00:00$"
+
+import threading
+import time
+
+
+class _Flight(object):
+    """A computation in progress, waited by the identical requests that arrive meanwhile"""
+    def __init__(self, tables):
+        self.tables = tables
+        self.done = threading.Event()
+        self.response = None        # None when the computation fails; waiters compute by themselves then
+
+
+class ResponseCache(object):
+    def __init__(self, ttl=0.5, max_entries=1000, max_body=256*1024):
+        """
+        :param ttl: seconds a response is reused. 0 disables the micro cache, keeping the single flight
+        :param max_entries: maximum number of responses kept. Expired ones are purged when reached, and all if not
+            enough
+        :param max_body: bytes of the largest body to share, read by the callers. Larger ones are streamed uncached,
+            so that the cache holds at most max_entries * max_body bytes
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_body = max_body
+        self.lock = threading.Lock()
+        self.entries = {}       # key: (expiration time, tables, response)
+        self.flights = {}       # key: _Flight
+        self.versions = {}      # table: number of writes notified, to discard computations that overlap with them
+        self.stats = {"hits": 0, "coalesced": 0, "misses": 0, "invalidations": 0, "not_shared": 0}
+
+    def get(self, key, tables, compute, shareable=None):
+        """
+        Get the response of a request, computing it unless cached or already in flight
+        :param key: hashable that identifies identical requests
+        :param tables: tables read by the computation
+        :param compute: function that returns the response. Exceptions are raised to its caller only
+        :param shareable: function that tells if a response can be shared (Optional). The ones that cannot are
+            returned to the request that computed them only; the requests waiting for it compute by themselves
+        :return: the response, shared among the requests; it must not be modified
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time.time():
+                self.stats["hits"] += 1
+                return entry[2]
+            flight = self.flights.get(key)
+            leader = not flight
+            if leader:
+                self.stats["misses"] += 1
+                flight = self.flights[key] = _Flight(tables)
+                versions = [self.versions.get(table, 0) for table in tables]
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            flight.done.wait()
+            if flight.response is not None:
+                return flight.response
+            return compute()
+        try:
+            response = compute()
+            if shareable is None or shareable(response):
+                flight.response = response
+            else:
+                with self.lock:
+                    self.stats["not_shared"] += 1
+            return response
+        finally:
+            with self.lock:
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+                    if flight.response is not None and self.ttl and \
+                            versions == [self.versions.get(table, 0) for table in tables]:
+                        if len(self.entries) >= self.max_entries:
+                            self._purge(time.time())
+                        self.entries[key] = (time.time() + self.ttl, tables, flight.response)
+            flight.done.set()
+
+    def _purge(self, now):
+        for key in [key for key, entry in self.entries.items() if entry[0] <= now]:
+            del self.entries[key]
+        if len(self.entries) >= self.max_entries:
+            self.entries.clear()
+
+    def invalidate(self, tables):
+        """
+        Discard the responses that depend on written tables, and detach the computations in flight that read them
+        :param tables: names of the tables written
+        :return: None
+        """
+        with self.lock:
+            self.stats["invalidations"] += 1
+            for table in tables:
+                self.versions[table] = self.versions.get(table, 0) + 1
+            for key, entry in self.entries.items():
+                if any(table in entry[1] for table in tables):
+                    del self.entries[key]
+            for key, flight in self.flights.items():
+                if any(table in flight.tables for table in tables):
+                    del self.flights[key]
+
+    def get_status(self):
+        """
+        Get the size and hit rate of the cache
+        :return: dictionary with ttl, entries, in_flight, hits, coalesced, misses, invalidations, not_shared and
+            hit_rate, the ratio of requests served without computing
+        """
+        with self.lock:
+            status = dict(self.stats)
+            status.update({"ttl": self.ttl, "entries": len(self.entries), "in_flight": len(self.flights)})
+        total = status["hits"] + status["coalesced"] + status["misses"]
+        status["hit_rate"] = float(status["hits"] + status["coalesced"]) / total if total else None
+        return status
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+Registry of compiled jsonschema validators for the schemas of vim_schema.
+jsonschema.validate builds a new validator and checks the schema at every call, and the 'pattern' keyword relies on
+the small re module cache. Here one validator is built per schema at first use and reused everywhere, with the
+regular expressions compiled once.
+'''
+__date__ = "$19-oct-2026 10:00:00$"
+
+import re
+from jsonschema import validators, exceptions as js_e
+
+_validator_classes = {}     # jsonschema validator class: same class with compiled 'pattern' keyword
+_validators = {}            # id(schema): (schema, validator). schema is kept to avoid reusing the id
+_patterns = {}              # pattern text: compiled regular expression
+
+
+def _compiled_pattern(pattern):
+    regex = _patterns.get(pattern)
+    if regex is None:
+        regex = _patterns[pattern] = re.compile(pattern)
+    return regex
+
+
+def _pattern(validator, pattern, instance, schema):
+    """Same as the jsonschema 'pattern' keyword but using the compiled regular expression"""
+    if validator.is_type(instance, "string") and not _compiled_pattern(pattern).search(instance):
+        yield js_e.ValidationError("%r does not match %r" % (instance, pattern))
+
+
+def get_validator(schema):
+    """
+    Obtain the validator for a schema, creating and checking it at first use
+    :param schema: jsonschema dictionary, e.g. vim_schema.server_new_schema
+    :return: jsonschema validator instance
+    """
+    entry = _validators.get(id(schema))
+    if entry is not None and entry[0] is schema:
+        return entry[1]
+    base_class = validators.validator_for(schema)
+    validator_class = _validator_classes.get(base_class)
+    if validator_class is None:
+        validator_class = _validator_classes[base_class] = validators.extend(base_class, {"pattern": _pattern})
+    validator_class.check_schema(schema)
+    validator = validator_class(schema)
+    _validators[id(schema)] = (schema, validator)
+    return validator
+
+
+def validate(data, schema):
+    """
+    Validate data against a schema with the cached validator. Drop-in replacement of jsonschema.validate
+    :param data: content to validate
+    :param schema: jsonschema dictionary
+    :return: None
+    :raise: jsonschema.exceptions.ValidationError if data is not valid
+    """
+    get_validator(schema).validate(data)
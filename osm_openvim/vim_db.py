@@ -29,11 +29,18 @@ It is threading safe using a Lock
 """
 
 import MySQLdb as mdb
+import MySQLdb.cursors
+import MySQLdb.connections
 import uuid as myUuid
 import auxiliary_functions as af
 import json
 import logging
+import re
+import sys
+import time
+import metrics
 from netaddr import IPNetwork, IPAddress
+import threading
 from threading import Lock
 
 __author__ = "Alfonso Tierno"
@@ -49,6 +56,218 @@ HTTP_Service_Unavailable = 503
 HTTP_Internal_Server_Error = 500
 
 
+class SqlProfiler(object):
+    """Opt-in profiler of the statements run by vim_db. For each call site (vim_db method and line) it accumulates
+    number of calls, execution time, rows and time waited for the database lock. Statements slower than the
+    threshold are written to the 'openvim.db.slow' logger. Enabled with enable_profiler, it is shared by all the
+    vim_db instances of the process
+    """
+    MAX_STATEMENT_LENGTH = 1000
+
+    def __init__(self, slow_query_threshold=1.0):
+        self.slow_query_threshold = slow_query_threshold
+        self.lock = Lock()
+        self.stats = {}     # call_site: dict with counters
+        self.local = threading.local()
+        self.slow_logger = logging.getLogger("openvim.db.slow")
+
+    def lock_waited(self, seconds):
+        """Annotate the time this thread waited for the database lock. It is assigned to the next statement"""
+        self.local.lock_wait = seconds
+
+    def record(self, call_site, statement, elapsed, rows):
+        lock_wait = getattr(self.local, "lock_wait", 0.0)
+        self.local.lock_wait = 0.0
+        with self.lock:
+            stat = self.stats.get(call_site)
+            if stat is None:
+                stat = self.stats[call_site] = {"call_site": call_site, "count": 0, "total_time": 0.0,
+                                                "max_time": 0.0, "rows": 0, "lock_wait": 0.0}
+            stat["count"] += 1
+            stat["total_time"] += elapsed
+            stat["max_time"] = max(stat["max_time"], elapsed)
+            stat["rows"] += max(rows, 0)
+            stat["lock_wait"] += lock_wait
+            stat["statement"] = statement[:self.MAX_STATEMENT_LENGTH]
+        if self.slow_query_threshold is not None and elapsed >= self.slow_query_threshold:
+            self.slow_logger.warning("slow query %.3fs rows=%d lock_wait=%.3fs at %s: %s", elapsed, rows, lock_wait,
+                                     call_site, statement[:self.MAX_STATEMENT_LENGTH])
+
+    def get_top(self, top=20):
+        """Return the top statistics by total time, as a list of dictionaries"""
+        with self.lock:
+            stats = [dict(stat) for stat in self.stats.values()]
+        stats.sort(key=lambda x: x["total_time"], reverse=True)
+        for stat in stats:
+            stat["avg_time"] = stat["total_time"] / stat["count"]
+        return stats[:top]
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+
+
+_profiler = None
+
+
+def enable_profiler(slow_query_threshold=1.0):
+    """Enable the SQL profiler for all vim_db instances. Returns the profiler"""
+    global _profiler
+    if not _profiler:
+        _profiler = SqlProfiler(slow_query_threshold)
+    else:
+        _profiler.slow_query_threshold = slow_query_threshold
+    return _profiler
+
+
+def get_profiler():
+    """Return the SQL profiler, or None if it is not enabled"""
+    return _profiler
+
+
+_change_listeners = []
+_WRITE_STATEMENT = re.compile(r"\s*(INSERT|REPLACE|UPDATE|DELETE)\b", re.IGNORECASE)
+_STATEMENT_TABLES = re.compile(r"\b(?:INTO|UPDATE|FROM|JOIN)\s+`?(\w+)", re.IGNORECASE)
+# tables changed by the foreign keys ON DELETE/UPDATE of each table, see database_utils/vim_db_structure.sql
+_CASCADES = {"hosts": ("numas",), "numas": ("resources_core", "resources_mem", "resources_port"),
+             "instances": ("instance_devices", "ports", "resources_mem"), "ports": ("resources_port",),
+             "nets": ("of_flows",), "ofcs": ("of_flows", "of_port_mappings"),
+             "tenants": ("tenants_flavors", "tenants_images")}
+_table_versions = {}
+_table_versions_lock = Lock()
+# changes counters start at 0 at every run, this identifies the run
+_table_versions_epoch = myUuid.uuid4().hex[:8]
+
+
+def add_change_listener(listener):
+    """Register a function called with the set of tables written by every transaction committed by any vim_db
+    instance of the process. Tables are the ones named at its INSERT, REPLACE, UPDATE or DELETE statements, including
+    the ones only read at subqueries, and the ones changed by foreign key cascades"""
+    if listener not in _change_listeners:
+        _change_listeners.append(listener)
+
+
+def remove_change_listener(listener):
+    if listener in _change_listeners:
+        _change_listeners.remove(listener)
+
+
+def get_table_versions(tables):
+    """Return the change counters of tables, increased at every committed transaction that writes them, prefixed
+    with an identifier of this run. Only the changes done by this process are counted
+    :param tables: iterable of table names
+    :return: tuple (run identifier, counter of first table, ...)
+    """
+    with _table_versions_lock:
+        return (_table_versions_epoch,) + tuple(_table_versions.get(table, 0) for table in tables)
+
+
+def _get_written_tables(statement):
+    """Return the set of tables named at a write statement, None if it is not a write statement"""
+    if not _WRITE_STATEMENT.match(statement):
+        return None
+    return set(_STATEMENT_TABLES.findall(statement))
+
+
+def _notify_changes(tables):
+    pending = list(tables)
+    tables = set()
+    while pending:
+        table = pending.pop()
+        if table not in tables:
+            tables.add(table)
+            pending.extend(_CASCADES.get(table, ()))
+    # listeners discard what they computed from these tables before the counters change, so that what is computed
+    # after reading the new counters is never discarded
+    for listener in _change_listeners:
+        listener(tables)
+    with _table_versions_lock:
+        for table in tables:
+            _table_versions[table] = _table_versions.get(table, 0) + 1
+
+
+class _ProfiledLock(object):
+    """Wraps the database lock to annotate the time waited for it when the profiler is enabled"""
+    def __init__(self, lock):
+        self.lock = lock
+
+    def acquire(self, blocking=True):
+        if not _profiler:
+            return self.lock.acquire(blocking)
+        start = time.time()
+        result = self.lock.acquire(blocking)
+        _profiler.lock_waited(time.time() - start)
+        return result
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+
+class _MeteredCursorMixin(object):
+    """Reports the latency of every statement to metrics, labeled with the vim_db method that runs it, and to the
+    SQL profiler when enabled. The tables written are annotated at the connection, see MeteredConnection"""
+    def _record(self, statement, start):
+        elapsed = time.time() - start
+        caller = sys._getframe(2)
+        metrics.observe("openvim_db_query_seconds", elapsed, method=caller.f_code.co_name)
+        if _profiler:
+            _profiler.record("{}:{}".format(caller.f_code.co_name, caller.f_lineno), str(statement), elapsed,
+                             self.rowcount)
+
+    def execute(self, query, args=None):
+        start = time.time()
+        try:
+            result = super(_MeteredCursorMixin, self).execute(query, args)
+        finally:
+            self._record(query, start)
+        tables = _get_written_tables(str(query))
+        if tables:
+            self.connection.written_tables.update(tables)
+        return result
+
+    def callproc(self, procname, args=()):
+        start = time.time()
+        try:
+            return super(_MeteredCursorMixin, self).callproc(procname, args)
+        finally:
+            self._record("CALL {}{}".format(procname, tuple(args)), start)
+
+
+class MeteredCursor(_MeteredCursorMixin, mdb.cursors.Cursor):
+    pass
+
+
+class MeteredDictCursor(_MeteredCursorMixin, mdb.cursors.DictCursor):
+    pass
+
+
+class MeteredConnection(mdb.connections.Connection):
+    """Database connection that counts the tables written by each transaction once committed, and notifies them to the
+    change listeners"""
+    def __init__(self, *args, **kwargs):
+        super(MeteredConnection, self).__init__(*args, **kwargs)
+        self.written_tables = set()
+
+    def commit(self):
+        super(MeteredConnection, self).commit()
+        tables = self.written_tables
+        self.written_tables = set()
+        if tables:
+            _notify_changes(tables)
+
+    def rollback(self):
+        self.written_tables = set()
+        super(MeteredConnection, self).rollback()
+
+
 class vim_db():
     def __init__(self, vlan_range, logger_name=None, debug=None, lock=None):
         """vlan_range must be a tuple (vlan_ini, vlan_end) with available vlan values for networks
@@ -64,7 +283,7 @@ class vim_db():
         self.con = None
         self.cur = None
         self.debug = debug
-        self.lock = lock or Lock()
+        self.lock = _ProfiledLock(lock or Lock())
         if logger_name:
             self.logger_name = logger_name
         else:
@@ -103,7 +322,8 @@ class vim_db():
                             return 0
                     except Exception:
                         pass
-                self.con = mdb.connect(self.host, self.user, self.passwd, self.database)
+                self.con = MeteredConnection(self.host, self.user, self.passwd, self.database,
+                                             cursorclass=MeteredCursor)
                 self.logger.debug("connected to DB %s at %s@%s", self.database, self.user, self.host)
                 return 0
         except mdb.Error as e:
@@ -262,20 +482,30 @@ class vim_db():
         Atribure sql_dir: dictionary with the following key: value
             'SELECT': [list of fields to retrieve] (by default all)
             'FROM': string of table name (Mandatory)
-            'WHERE': dict of key:values, translated to key=value AND ... (Optional)
+            'WHERE': dict of key:values, translated to key=value AND ... A list value is translated to key IN (values)
+                (Optional)
             'WHERE_NOT': dict of key:values, translated to key!=value AND ... (Optional)
             'WHERE_OR': dict of key:values, translated to key=value OR ... (Optional)
             'WHERE_AND_OR: str 'AND' or 'OR'(by default) mark the priority to 'WHERE AND (WHERE_OR)' or (WHERE) OR
                 WHERE_OR' (Optional)
+            'WHERE_GREATER': dict of key:values, translated to key>'value' AND ... Used together with ORDER_BY for
+                cursor (marker) based pagination (Optional)
+            'ORDER_BY': field or list of fields to order by. Use an indexed field (e.g. uuid) for large tables (Optional)
             'LIMIT': limit of number of rows (Optional)
-            'DISTINCT': make a select distinct to remove repeated elements
+            'DISTINCT': make a select distinct to remove repeated elements. The ORDER_BY fields not at SELECT are
+                selected too, as needed by MySQL >= 5.7, and removed from the rows
         Return: a list with dictionarys at each row
         """
         # print sql_dict
         select_ = "SELECT "
+        order_extra = []
         if sql_dict.get("DISTINCT"):
             select_ += "DISTINCT "
-        select_ += ("*" if not sql_dict.get('SELECT') else ",".join(map(str, sql_dict['SELECT'])))
+            o = sql_dict.get('ORDER_BY')
+            if o and sql_dict.get('SELECT'):
+                selected = set(str(field).split(" as ")[0].split(" AS ")[0].strip() for field in sql_dict['SELECT'])
+                order_extra = [field for field in ([o] if isinstance(o, str) else o) if field not in selected]
+        select_ += ("*" if not sql_dict.get('SELECT') else ",".join(map(str, list(sql_dict['SELECT']) + order_extra)))
         # print 'select_', select_
         from_ = "FROM " + str(sql_dict['FROM'])
         # print 'from_', from_
@@ -284,7 +514,10 @@ class vim_db():
         where_or = None
         w = sql_dict.get('WHERE')
         if w:
-            where_and = " AND ".join(map(lambda x: str(x) + (" is Null" if w[x] is None else "='" + str(w[x]) + "'"),
+            where_and = " AND ".join(map(lambda x: str(x) + (" is Null" if w[x] is None else
+                                                             " IN (" + ",".join(self.__data2db_format(v) for v in w[x]) +
+                                                             ")" if isinstance(w[x], (list, tuple, set)) else
+                                                             "='" + str(w[x]) + "'"),
                                          w.keys()))
         w = sql_dict.get('WHERE_LIKE')  # Unikernels extension -START-
         if w:
@@ -302,6 +535,13 @@ class vim_db():
                 where_and += " AND " + where_and_not
             else:
                 where_and = where_and_not
+        w = sql_dict.get('WHERE_GREATER')
+        if w:
+            where_and_greater = " AND ".join(map(lambda x: str(x) + ">'" + str(w[x]) + "'", w.keys()))
+            if where_and:
+                where_and += " AND " + where_and_greater
+            else:
+                where_and = where_and_greater
         w = sql_dict.get('WHERE_OR')
         if w:
             where_or = " OR ".join(map(lambda x: str(x) + (" is Null" if w[x] is None else "='" + str(w[x]) + "'"),
@@ -319,22 +559,64 @@ class vim_db():
         else:
             where_ = ""
         # print 'where_', where_
+        order_ = ""
+        o = sql_dict.get('ORDER_BY')
+        if o:
+            order_ = "ORDER BY " + (str(o) if isinstance(o, str) else ",".join(map(str, o)))
         limit_ = "LIMIT " + str(sql_dict['LIMIT']) if sql_dict.get("LIMIT") else ""
         # print 'limit_', limit_
-        cmd = " ".join((select_, from_, where_, limit_))
+        cmd = " ".join((select_, from_, where_, order_, limit_))
         for retry_ in range(0, 2):
             try:
                 with self.lock, self.con:
-                    self.cur = self.con.cursor(mdb.cursors.DictCursor)
+                    self.cur = self.con.cursor(MeteredDictCursor)
                     self.logger.debug(cmd)
                     self.cur.execute(cmd)
                     rows = self.cur.fetchall()
+                    for row in rows:
+                        for field in order_extra:
+                            row.pop(field, None)
                     return self.cur.rowcount, rows
             except (mdb.Error, AttributeError) as e:
                 r, c = self.format_error(e, "get_table", cmd)
                 if r != -HTTP_Request_Timeout or retry_ == 1:
                     return r, c
 
+    def get_table_by_chunks(self, chunk_size=1000, **sql_dict):
+        """ Generator version of get_table for large listings. Rows are obtained ordered by uuid in chunks of
+        chunk_size, using the last uuid read as marker for the next query. This keeps memory bounded regardless of the
+        result size and the database lock is only held while each chunk is read, not while it is being consumed.
+        Atribure sql_dir: the same as get_table. 'LIMIT' is the total number of rows to retrieve; 'ORDER_BY' is
+            ignored, rows are always ordered by uuid. The table must contain a 'uuid' column
+        Yields: (result, rows) tuples as get_table. Iteration ends after an error (result < 0) or when there are no
+            more rows
+        """
+        limit = sql_dict.pop('LIMIT', None)
+        where_greater = dict(sql_dict.pop('WHERE_GREATER', None) or {})
+        sql_dict['ORDER_BY'] = 'uuid'
+        remove_uuid = False
+        if sql_dict.get('SELECT') and 'uuid' not in sql_dict['SELECT']:
+            # uuid is needed as marker
+            sql_dict['SELECT'] = list(sql_dict['SELECT']) + ['uuid']
+            remove_uuid = True
+        while True:
+            chunk = min(chunk_size, limit) if limit else chunk_size
+            result, rows = self.get_table(LIMIT=chunk, WHERE_GREATER=where_greater or None, **sql_dict)
+            if result < 0 or not rows:
+                yield result, rows
+                return
+            where_greater['uuid'] = rows[-1]['uuid']
+            if remove_uuid:
+                for row in rows:
+                    del row['uuid']
+            yield result, rows
+            if len(rows) < chunk:
+                return
+            if limit:
+                limit -= len(rows)
+                if limit <= 0:
+                    return
+
     def new_tenant(self, tenant_dict):
         """ Add one row into a table.
         Attribure 
@@ -466,6 +748,67 @@ class vim_db():
                 if r != -HTTP_Request_Timeout or retry_ == 1:
                     return r, c
 
+    def new_rows(self, table, INSERT, add_uuid=False, DELETE_WHERE=None, chunk_size=1000):
+        """ Add several rows into a table in one transaction, using multi-row INSERT statements.
+        Atributes
+            table: table where to insert
+            INSERT: list of dictionaries with the key: value to insert. Missing keys are inserted as Null
+            add_uuid: if True, it will create an uuid key entry at the rows without it, and insert it at uuids table.
+                Rows that already have an uuid keep it, e.g. when replacing a deleted row
+            DELETE_WHERE: dictionary or list of dictionaries of key:values, where value can be a list translated to
+                key IN (values). Rows matching any of them are deleted before inserting (Optional). With add_uuid,
+                their uuids table entries are deleted too, except the ones of rows inserted again
+            chunk_size: maximum number of rows of each INSERT statement
+        Return: (result, uuids) where result is the number of inserted rows and uuids the list of created uuids;
+            or (negative, error text) if error. Nothing is changed on error
+        """
+        if isinstance(DELETE_WHERE, dict):
+            DELETE_WHERE = (DELETE_WHERE,)
+        uuids = []
+        if add_uuid:
+            for row in INSERT:
+                if 'uuid' not in row:
+                    row['uuid'] = str(myUuid.uuid1())  # create_uuid
+                    uuids.append(row['uuid'])
+        commands = []
+        kept = set(row['uuid'] for row in INSERT if row.get('uuid')).difference(uuids) if add_uuid else ()
+        for w in (DELETE_WHERE or ()):
+            where_ = " AND ".join(
+                map(lambda x: str(x) + (" is Null" if w[x] is None else
+                                        " IN (" + ",".join(self.__data2db_format(v) for v in w[x]) + ")"
+                                        if isinstance(w[x], (list, tuple, set)) else "='" + str(w[x]) + "'"),
+                    w.keys()))
+            if add_uuid:
+                commands.append("DELETE FROM uuids WHERE uuid IN (SELECT uuid FROM " + table + " WHERE " + where_ +
+                                ")" + (" AND uuid NOT IN (" + ",".join(self.__data2db_format(uuid) for uuid in kept) +
+                                       ")" if kept else ""))
+            commands.append("DELETE FROM " + table + " WHERE " + where_)
+        for index in range(0, len(uuids), chunk_size):
+            commands.append("INSERT INTO uuids (uuid, used_at) VALUES " + ",".join(
+                "('%s','%s')" % (uuid, table) for uuid in uuids[index:index + chunk_size]))
+        if INSERT:
+            columns = sorted(set(key for row in INSERT for key in row))
+            for index in range(0, len(INSERT), chunk_size):
+                commands.append("INSERT INTO " + table + " (" + ",".join(map(str, columns)) + ") VALUES " + ",".join(
+                    "(" + ",".join(self.__data2db_format(row.get(column)) for column in columns) + ")"
+                    for row in INSERT[index:index + chunk_size]))
+        for retry_ in range(0, 2):
+            cmd = ""
+            try:
+                nb_rows = 0
+                with self.lock, self.con:
+                    self.cur = self.con.cursor()
+                    for cmd in commands:
+                        self.logger.debug(cmd if len(cmd) < 1000 else cmd[:1000] + "...")
+                        self.cur.execute(cmd)
+                        if cmd.startswith("INSERT INTO " + table):
+                            nb_rows += self.cur.rowcount
+                    return nb_rows, uuids
+            except (mdb.Error, AttributeError) as e:
+                r, c = self.format_error(e, "new_rows", cmd)
+                if r != -HTTP_Request_Timeout or retry_ == 1:
+                    return r, c
+
     @staticmethod
     def __remove_quotes(data):
         """remove single quotes ' of any string content of data dictionary"""
@@ -474,12 +817,20 @@ class vim_db():
                 if "'" in v:
                     data[k] = data[k].replace("'", "_")
 
-    def _update_rows_internal(self, table, UPDATE, WHERE=None):
+    def __update_cmd(self, table, UPDATE, WHERE=None):
+        """compose the UPDATE statement. WHERE values can be a list, translated to key IN (values)"""
         cmd = "UPDATE " + table + " SET " + \
               ",".join(map(lambda x: str(x) + '=' + self.__data2db_format(UPDATE[x]), UPDATE.keys()))
         if WHERE:
             cmd += " WHERE " + " and ".join(
-                map(lambda x: str(x) + (' is Null' if WHERE[x] is None else "='" + str(WHERE[x]) + "'"), WHERE.keys()))
+                map(lambda x: str(x) + (' is Null' if WHERE[x] is None else
+                                        " IN (" + ",".join(self.__data2db_format(v) for v in WHERE[x]) + ")"
+                                        if isinstance(WHERE[x], (list, tuple, set)) else
+                                        "='" + str(WHERE[x]) + "'"), WHERE.keys()))
+        return cmd
+
+    def _update_rows_internal(self, table, UPDATE, WHERE=None):
+        cmd = self.__update_cmd(table, UPDATE, WHERE)
         self.logger.debug(cmd)
         self.cur.execute(cmd)
         nb_rows = self.cur.rowcount
@@ -490,7 +841,7 @@ class vim_db():
         Atributes
             UPDATE: dictionary with the key-new_value pairs to change
             table: table to be modified
-            WHERE: dictionary to filter target rows, key-value
+            WHERE: dictionary to filter target rows, key-value. A list value is translated to key IN (values)
             log:   if true, a log entry is added at logs table
         Return: (result, None) where result indicates the number of updated files
         """
@@ -504,13 +855,8 @@ class vim_db():
 
                 with self.lock, self.con:
                     self.cur = self.con.cursor()
-                    cmd = "UPDATE " + table + " SET " + \
-                          ",".join(map(lambda x: str(x) + '=' + self.__data2db_format(UPDATE[x]), UPDATE.keys()))
-                    if WHERE:
-                        cmd += " WHERE " + " and ".join(
-                            map(lambda x: str(x) + (' is Null' if WHERE[x] is None else "='" + str(WHERE[x]) + "'"),
-                                WHERE.keys()))
-                    self.logger.debug(cmd)
+                    cmd = self.__update_cmd(table, UPDATE, WHERE)
+                    self.logger.debug(cmd if len(cmd) < 1000 else cmd[:1000] + "...")
                     self.cur.execute(cmd)
                     nb_rows = self.cur.rowcount
                     # if nb_rows > 0 and log:
@@ -528,6 +874,41 @@ class vim_db():
                 if r != -HTTP_Request_Timeout or retry_ == 1:
                     return r, c
 
+    def update_rows_by_key(self, table, key, UPDATES, UPDATE=None):
+        """ Update several rows, each one with its own values, with a single statement:
+            UPDATE table SET column=CASE key WHEN 'k1' THEN 'v1' ... ELSE column END, ... WHERE key IN ('k1', ...)
+        Atributes
+            table: table to be modified
+            key: column that identifies the rows, e.g. 'uuid'
+            UPDATES: dictionary key_value: dictionary with the column-new_value pairs to change at that row. A
+                column missing at a row keeps its value
+            UPDATE: dictionary with the column-new_value pairs to change at all the rows (Optional)
+        Return: (result, None) where result indicates the number of updated rows; or (negative, error text)
+        """
+        if not UPDATES:
+            return 0, None
+        columns = sorted(set(column for values in UPDATES.values() for column in values))
+        set_ = []
+        for column in columns:
+            set_.append(str(column) + "=CASE " + str(key) + " " + " ".join(
+                "WHEN " + self.__data2db_format(key_value) + " THEN " + self.__data2db_format(values[column])
+                for key_value, values in UPDATES.items() if column in values) + " ELSE " + str(column) + " END")
+        for column, value in (UPDATE or {}).items():
+            set_.append(str(column) + "=" + self.__data2db_format(value))
+        cmd = "UPDATE " + table + " SET " + ",".join(set_) + " WHERE " + str(key) + " IN (" + \
+            ",".join(self.__data2db_format(key_value) for key_value in UPDATES) + ")"
+        for retry_ in range(0, 2):
+            try:
+                with self.lock, self.con:
+                    self.cur = self.con.cursor()
+                    self.logger.debug(cmd if len(cmd) < 1000 else cmd[:1000] + "...")
+                    self.cur.execute(cmd)
+                    return self.cur.rowcount, None
+            except (mdb.Error, AttributeError) as e:
+                r, c = self.format_error(e, "update_rows_by_key", cmd)
+                if r != -HTTP_Request_Timeout or retry_ == 1:
+                    return r, c
+
     def get_host(self, host_id):
         if af.check_valid_uuid(host_id):
             where_filter = "uuid='" + host_id + "'"
@@ -537,7 +918,7 @@ class vim_db():
             cmd = ""
             try:
                 with self.lock, self.con:
-                    self.cur = self.con.cursor(mdb.cursors.DictCursor)
+                    self.cur = self.con.cursor(MeteredDictCursor)
                     # get HOST
                     cmd = "SELECT uuid, user, password, keyfile, name, ip_name, description, hypervisors, " \
                           "ranking, admin_state_up, DATE_FORMAT(created_at,'%Y-%m-%dT%H:%i:%s') as created_at " \
@@ -649,7 +1030,7 @@ class vim_db():
         try:
             cmd = "SELECT * FROM uuids where uuid='" + str(uuid) + "'"
             with self.lock, self.con:
-                self.cur = self.con.cursor(mdb.cursors.DictCursor)
+                self.cur = self.con.cursor(MeteredDictCursor)
                 self.logger.debug(cmd)
                 self.cur.execute(cmd)
                 rows = self.cur.fetchall()
@@ -1158,7 +1539,7 @@ class vim_db():
             cmd = ""
             try:
                 with self.lock, self.con:
-                    self.cur = self.con.cursor(mdb.cursors.DictCursor)
+                    self.cur = self.con.cursor(MeteredDictCursor)
                     # get INSTANCE
                     cmd = "SELECT uuid, name, description, progress, host_id, flavor_id, image_id, status, " \
                           "hypervisor, os_image_type, last_error, tenant_id, ram, vcpus, created_at " \
@@ -1307,7 +1688,7 @@ class vim_db():
                     #     self.cur.close()
 
                     # Find valid host for the ram and vcpus
-                    self.cur = self.con.cursor(mdb.cursors.DictCursor)
+                    self.cur = self.con.cursor(MeteredDictCursor)
                     cmd = "CALL GetHostByMemCpu(%s, %s)" % (str(requirements['ram']), str(requirements['vcpus']))
                     self.logger.debug(cmd)
                     self.cur.callproc('GetHostByMemCpu', (str(requirements['ram']), str(requirements['vcpus'])))
@@ -1338,7 +1719,7 @@ class vim_db():
 
                     # elif req_numa is not None:
                     # Find valid numa nodes for memory requirements
-                    self.cur = self.con.cursor(mdb.cursors.DictCursor)
+                    self.cur = self.con.cursor(MeteredDictCursor)
                     cmd = "CALL GetNumaByMemory(%s)" % str(requirements['numa']['memory'])
                     self.logger.debug(cmd)
                     self.cur.callproc('GetNumaByMemory', (requirements['numa']['memory'],))
@@ -1352,7 +1733,7 @@ class vim_db():
                         return -1, error_text
 
                     # Find valid numa nodes for processor requirements
-                    self.cur = self.con.cursor(mdb.cursors.DictCursor)
+                    self.cur = self.con.cursor(MeteredDictCursor)
                     if requirements['numa']['proc_req_type'] == 'threads':
                         cpu_requirement_text = 'cpu-threads'
                         cmd = "CALL GetNumaByThread(%s)" % str(requirements['numa']['proc_req_nb'])
@@ -1410,7 +1791,7 @@ class vim_db():
                     for numa_id in valid_numas:
                         # print 'Checking '+str(numa_id)
                         match_found = False
-                        self.cur = self.con.cursor(mdb.cursors.DictCursor)
+                        self.cur = self.con.cursor(MeteredDictCursor)
                         if only_of_ports:
                             cmd = "CALL GetAvailablePorts(%s)" % str(numa_id)
                             self.logger.debug(cmd)
@@ -1756,7 +2137,7 @@ class vim_db():
         WHERE = {'type': 'instance:ovs', 'net_id': net_id}
         for retry_ in range(0, 2):
             cmd = ""
-            self.cur = self.con.cursor(mdb.cursors.DictCursor)
+            self.cur = self.con.cursor(MeteredDictCursor)
             select_ = "SELECT uuid, ip_address FROM ports "
 
             if WHERE is None or len(WHERE) == 0:
@@ -1778,86 +2159,114 @@ class vim_db():
 
     def delete_instance(self, instance_id, tenant_id, net_dataplane_list, ports_to_free, net_ovs_list,
                         logcause="requested by http"):
+        """ Delete an instance and release its resources. See delete_instances
+        Attributes
+            ports_to_free: output list where (source_name, mac) of the freed dataplane interfaces are appended
+            net_ovs_list: output list where (net_id, vlan, ip_address, mac) of the ovs ports are appended
+        Return: (1, text) if deleted, (0, text) if not found or (negative, error text)
+        """
+        instance_ports = []
+        instance_ovs_ports = []
+        r, c = self.delete_instances((instance_id,), tenant_id, net_dataplane_list, instance_ports,
+                                     instance_ovs_ports, logcause)
+        if r < 0:
+            return r, c
+        elif r == 0:
+            return 0, "instance %s not found in tenant %s" % (instance_id, tenant_id)
+        ports_to_free += [port[:2] for port in instance_ports]
+        net_ovs_list += [port[:4] for port in instance_ovs_ports]
+        return 1, "instance %s from tenant %s DELETED" % (instance_id, tenant_id)
+
+    def delete_instances(self, instance_ids, tenant_id, net_dataplane_list, ports_to_free, net_ovs_list,
+                         logcause="requested by http"):
+        """ Delete several instances and release their resources in one transaction, with a statement for all of them
+        at each step
+        Attributes
+            instance_ids: list of instance uuids
+            tenant_id: tenant of the instances, None for any. Instances of other tenants are skipped
+            net_dataplane_list: output list where the distinct dataplane nets of the instances are appended
+            ports_to_free: output list where (source_name, mac, host_id) of the dataplane interfaces not used any more,
+                both PF and VF with no other VF in use, are appended
+            net_ovs_list: output list where the distinct (net_id, vlan, ip_address, mac, host_id) of the ovs ports are
+                appended
+        Return: (number of deleted instances, list of their uuids) or (negative, error text)
+        """
+        if not instance_ids:
+            return 0, []
         for retry_ in range(0, 2):
             cmd = ""
             try:
                 with self.lock, self.con:
                     self.cur = self.con.cursor()
-                    # get INSTANCE
-                    cmd = "SELECT uuid FROM instances WHERE uuid='%s' AND tenant_id='%s'" % (instance_id, tenant_id)
+                    # get INSTANCES
+                    cmd = "SELECT uuid FROM instances WHERE uuid IN ({})".format(
+                        ",".join(self.__data2db_format(instance_id) for instance_id in instance_ids))
+                    if tenant_id:
+                        cmd += " AND tenant_id=" + self.__data2db_format(tenant_id)
                     self.logger.debug(cmd)
                     self.cur.execute(cmd)
-                    if self.cur.rowcount == 0:
-                        return 0, "instance %s not found in tenant %s" % (instance_id, tenant_id)
+                    deleted = [row[0] for row in self.cur.fetchall()]
+                    if not deleted:
+                        return 0, []
+                    in_ = ",".join(self.__data2db_format(instance_id) for instance_id in deleted)
 
-                    # delete bridged ifaces, instace_devices, resources_mem; done by database: it is automatic by 
+                    # delete bridged ifaces, instace_devices, resources_mem; done by database: it is automatic by
                     # Database; FOREIGN KEY DELETE CASCADE
 
                     # get nets afected
-                    cmd = "SELECT DISTINCT net_id from ports WHERE instance_id = '%s' AND net_id is not Null AND " \
-                          "type='instance:data'" % instance_id
+                    cmd = "SELECT DISTINCT net_id FROM ports WHERE instance_id IN ({}) AND net_id is not Null AND " \
+                          "type='instance:data'".format(in_)
                     self.logger.debug(cmd)
                     self.cur.execute(cmd)
-                    net_list__ = self.cur.fetchall()
-                    for net in net_list__:
-                        net_dataplane_list.append(net[0])
+                    nets = [net[0] for net in self.cur.fetchall()]
 
-                    # get ovs manangement nets
-                    cmd = "SELECT DISTINCT net_id, vlan, ip_address, mac FROM ports WHERE instance_id='{}' AND " \
-                          "net_id is not Null AND type='instance:ovs'".format(instance_id)
+                    # get ovs manangement nets, with the host where the bridge port of each one is
+                    cmd = "SELECT DISTINCT p.net_id, p.vlan, p.ip_address, p.mac, i.host_id FROM ports AS p " \
+                          "JOIN instances AS i ON p.instance_id=i.uuid WHERE p.instance_id IN ({}) AND " \
+                          "p.net_id is not Null AND p.type='instance:ovs'".format(in_)
                     self.logger.debug(cmd)
                     self.cur.execute(cmd)
-                    net_ovs_list += self.cur.fetchall()
+                    ovs_ports = self.cur.fetchall()
 
-                    # get dataplane interfaces releases by this VM; both PF and VF with no other VF 
-                    cmd = "SELECT source_name, mac FROM (SELECT root_id, count(instance_id) as used " \
-                          "FROM resources_port WHERE instance_id='%s' GROUP BY root_id ) AS A" % instance_id \
+                    # get dataplane interfaces releases by these VMs; both PF and VF with no other VF of other VMs
+                    cmd = "SELECT C.source_name, C.mac, N.host_id FROM (SELECT root_id, count(instance_id) as used " \
+                          "FROM resources_port WHERE instance_id IN ({}) GROUP BY root_id) AS A".format(in_) \
                           + " JOIN (SELECT root_id, count(instance_id) as used FROM resources_port GROUP BY root_id) " \
-                            "AS B ON A.root_id=B.root_id AND A.used=B.used JOIN resources_port as C ON A.root_id=C.id"
-                    # cmd = "SELECT DISTINCT root_id FROM resources_port WHERE instance_id = '%s'" % instance_id
+                            "AS B ON A.root_id=B.root_id AND A.used=B.used JOIN resources_port as C ON A.root_id=C.id " \
+                            "JOIN numas AS N ON C.numa_id=N.id"
                     self.logger.debug(cmd)
                     self.cur.execute(cmd)
-                    ports_to_free += self.cur.fetchall()
+                    ports = self.cur.fetchall()
 
                     # update resources port
                     cmd = "UPDATE resources_port SET instance_id=Null, port_id=Null, Mbps_used='0' " \
-                          "WHERE instance_id = '%s'" % instance_id
+                          "WHERE instance_id IN ({})".format(in_)
                     self.logger.debug(cmd)
                     self.cur.execute(cmd)
 
-                    # #filter dataplane ports used by this VM that now are free
-                    # for port in ports_list__:
-                    #     cmd = "SELECT mac, count(instance_id) FROM resources_port WHERE root_id = '%s'" % port[0]
-                    #     self.logger.debug(cmd)
-                    #     self.cur.execute(cmd)
-                    #     mac_list__ = self.cur.fetchone()
-                    #     if mac_list__ and mac_list__[1]==0:
-                    #         ports_to_free.append(mac_list__[0])
-
                     # update resources core
                     cmd = "UPDATE resources_core SET instance_id=Null, v_thread_id=Null, paired='N' " \
-                          "WHERE instance_id = '%s'" % instance_id
+                          "WHERE instance_id IN ({})".format(in_)
                     self.logger.debug(cmd)
                     self.cur.execute(cmd)
 
                     # delete all related uuids
-                    cmd = "DELETE FROM uuids WHERE root_uuid='%s'" % instance_id
+                    cmd = "DELETE FROM uuids WHERE root_uuid IN ({})".format(in_)
                     self.logger.debug(cmd)
                     self.cur.execute(cmd)
 
-                    # #insert log
-                    # cmd = "INSERT INTO logs (related,level,uuid,description) VALUES 
-                    # ('instances','debug','%s','delete instance %s')" % (instance_id, logcause)
-                    # self.logger.debug(cmd)
-                    # self.cur.execute(cmd)                    
-
-                    # delete instance
-                    cmd = "DELETE FROM instances WHERE uuid='%s' AND tenant_id='%s'" % (instance_id, tenant_id)
+                    # delete instances
+                    cmd = "DELETE FROM instances WHERE uuid IN ({})".format(in_)
+                    self.logger.debug(cmd)
                     self.cur.execute(cmd)
-                    return 1, "instance %s from tenant %s DELETED" % (instance_id, tenant_id)
+                    # filled at the end, as the statements are retried on timeout
+                    net_dataplane_list += nets
+                    ports_to_free += ports
+                    net_ovs_list += ovs_ports
+                    return len(deleted), deleted
 
             except (mdb.Error, AttributeError) as e:
-                r, c = self.format_error(e, "delete_instance", cmd)
+                r, c = self.format_error(e, "delete_instances", cmd)
                 if r != -HTTP_Request_Timeout or retry_ == 1:
                     return r, c
 
@@ -1872,7 +2281,7 @@ class vim_db():
             try:
                 with self.lock, self.con:
 
-                    self.cur = self.con.cursor(mdb.cursors.DictCursor)
+                    self.cur = self.con.cursor(MeteredDictCursor)
                     select_ = "SELECT uuid,'ACTIVE' as status,admin_state_up,name,net_id,\
                         tenant_id,type,mac,vlan,switch_port,instance_id,Mbps FROM ports "
 
@@ -1911,7 +2320,7 @@ class vim_db():
             cmd = ""
             try:
                 with self.lock, self.con:
-                    self.cur = self.con.cursor(mdb.cursors.DictCursor)
+                    self.cur = self.con.cursor(MeteredDictCursor)
                     cmd = "SELECT * FROM nets WHERE uuid='%s'" % net_id
                     self.logger.debug(cmd)
                     self.cur.execute(cmd)
@@ -1945,6 +2354,207 @@ class vim_db():
 
         return 0, net
 
+    def cluster_heartbeat(self, instance_id, endpoint, lease_time):
+        """ Record that an openvim instance is alive and extend the leases it owns. Instances without heartbeat for
+        ten lease times are forgotten
+        Atributes
+            instance_id: identifier of the openvim instance
+            endpoint: http address of the instance, informative
+            lease_time: seconds, from now, that the leases are valid
+        Return: (number of alive instances, list of leases) where each lease is a dictionary with resource_type,
+            resource_id, owner and expired ('true' or 'false'); or (negative, error text)
+        """
+        for retry_ in range(0, 2):
+            cmd = ""
+            try:
+                with self.lock, self.con:
+                    self.cur = self.con.cursor(MeteredDictCursor)
+                    cmd = "INSERT INTO cluster_members (instance_id, endpoint, heartbeat_at) VALUES ({}, {}, NOW()) " \
+                          "ON DUPLICATE KEY UPDATE endpoint=VALUES(endpoint), heartbeat_at=NOW()".format(
+                              self.__data2db_format(instance_id), self.__data2db_format(endpoint))
+                    self.logger.debug(cmd)
+                    self.cur.execute(cmd)
+                    cmd = "UPDATE cluster_leases SET expires_at=NOW() + INTERVAL {} SECOND WHERE owner={}".format(
+                        int(lease_time), self.__data2db_format(instance_id))
+                    self.logger.debug(cmd)
+                    self.cur.execute(cmd)
+                    cmd = "DELETE FROM cluster_members WHERE heartbeat_at < NOW() - INTERVAL {} SECOND".format(
+                        int(lease_time) * 10)
+                    self.logger.debug(cmd)
+                    self.cur.execute(cmd)
+                    cmd = "SELECT COUNT(*) AS members FROM cluster_members WHERE heartbeat_at >= NOW() - " \
+                          "INTERVAL {} SECOND".format(int(lease_time))
+                    self.logger.debug(cmd)
+                    self.cur.execute(cmd)
+                    members = self.cur.fetchone()["members"]
+                    cmd = "SELECT resource_type, resource_id, owner, IF(expires_at < NOW(), 'true', 'false') AS " \
+                          "expired FROM cluster_leases"
+                    self.logger.debug(cmd)
+                    self.cur.execute(cmd)
+                    return members, self.cur.fetchall()
+            except (mdb.Error, AttributeError) as e:
+                r, c = self.format_error(e, "cluster_heartbeat", cmd)
+                if r != -HTTP_Request_Timeout or retry_ == 1:
+                    return r, c
+
+    def cluster_acquire_lease(self, instance_id, resource_type, resource_id, lease_time):
+        """ Take the lease of a resource if nobody owns it or the owner has not renewed it
+        Atributes
+            instance_id: identifier of the openvim instance
+            resource_type: 'host', 'ofc' or 'dhcp'
+            resource_id: uuid of the host or ofc
+            lease_time: seconds, from now, that the lease is valid
+        Return: (1, None) if acquired, (0, None) if owned by another instance; or (negative, error text)
+        """
+        where = "resource_type={} AND resource_id={}".format(self.__data2db_format(resource_type),
+                                                             self.__data2db_format(resource_id))
+        for retry_ in range(0, 2):
+            cmd = ""
+            try:
+                with self.lock, self.con:
+                    self.cur = self.con.cursor()
+                    cmd = "INSERT IGNORE INTO cluster_leases (resource_type, resource_id) VALUES ({}, {})".format(
+                        self.__data2db_format(resource_type), self.__data2db_format(resource_id))
+                    self.logger.debug(cmd)
+                    self.cur.execute(cmd)
+                    cmd = "UPDATE cluster_leases SET owner={}, acquired_at=NOW(), expires_at=NOW() + INTERVAL {} " \
+                          "SECOND WHERE {} AND (owner IS NULL OR expires_at IS NULL OR expires_at < NOW())".format(
+                              self.__data2db_format(instance_id), int(lease_time), where)
+                    self.logger.debug(cmd)
+                    self.cur.execute(cmd)
+                    return (1 if self.cur.rowcount > 0 else 0), None
+            except (mdb.Error, AttributeError) as e:
+                r, c = self.format_error(e, "cluster_acquire_lease", cmd)
+                if r != -HTTP_Request_Timeout or retry_ == 1:
+                    return r, c
+
+    def cluster_release_leases(self, instance_id, resources=None, delete=False):
+        """ Free the leases of an instance, so that other instances can take them at once
+        Atributes
+            instance_id: identifier of the openvim instance
+            resources: list of (resource_type, resource_id) to release. None for all the leases of the instance
+            delete: remove the leases, and their pending tasks, of resources that do not exist anymore. Leases of
+                other instances are removed only if expired
+        Return: (number of leases released, None); or (negative, error text)
+        """
+        if resources is not None and not resources:
+            return 0, None
+        owner = "owner=" + self.__data2db_format(instance_id)
+        if delete:
+            owner = "(" + owner + " OR owner IS NULL OR expires_at IS NULL OR expires_at < NOW())"
+        where = owner
+        if resources is not None:
+            where += " AND (resource_type, resource_id) IN (" + ",".join(
+                "({}, {})".format(self.__data2db_format(r_type), self.__data2db_format(r_id))
+                for r_type, r_id in resources) + ")"
+        for retry_ in range(0, 2):
+            cmd = ""
+            try:
+                with self.lock, self.con:
+                    self.cur = self.con.cursor()
+                    if delete:
+                        cmd = "DELETE FROM cluster_tasks WHERE (resource_type, resource_id) IN (SELECT " \
+                              "resource_type, resource_id FROM cluster_leases WHERE {})".format(where)
+                        self.logger.debug(cmd)
+                        self.cur.execute(cmd)
+                        cmd = "DELETE FROM cluster_leases WHERE " + where
+                    else:
+                        cmd = "UPDATE cluster_leases SET owner=NULL, expires_at=NULL WHERE " + where
+                    self.logger.debug(cmd)
+                    self.cur.execute(cmd)
+                    return self.cur.rowcount, None
+            except (mdb.Error, AttributeError) as e:
+                r, c = self.format_error(e, "cluster_release_leases", cmd)
+                if r != -HTTP_Request_Timeout or retry_ == 1:
+                    return r, c
+
+    def cluster_new_task(self, resource_type, resource_id, task):
+        """ Queue a task for the thread of a resource, to be run by the instance that owns it
+        Atributes
+            resource_type: 'host', 'ofc' or 'dhcp'
+            resource_id: uuid of the host or ofc
+            task: text with the task, json encoded
+        Return: (1, task id); or (negative, error text)
+        """
+        for retry_ in range(0, 2):
+            cmd = "INSERT INTO cluster_tasks (resource_type, resource_id, task) VALUES (%s, %s, %s)"
+            try:
+                with self.lock, self.con:
+                    self.cur = self.con.cursor()
+                    self.logger.debug(cmd + " " + task[:200])
+                    self.cur.execute(cmd, (resource_type, resource_id, task))
+                    return 1, self.cur.lastrowid
+            except (mdb.Error, AttributeError) as e:
+                r, c = self.format_error(e, "cluster_new_task", cmd)
+                if r != -HTTP_Request_Timeout or retry_ == 1:
+                    return r, c
+
+    def cluster_pop_tasks(self, instance_id, limit=100, exclude=None):
+        """ Get and remove, in order, the tasks of the resources owned by an instance
+        Atributes
+            instance_id: identifier of the openvim instance
+            limit: maximum number of tasks to get
+            exclude: list of (resource_type, resource_id) whose tasks are kept, as the ones of resources being released
+        Return: (number of tasks, list of dictionaries with id, resource_type, resource_id and task); or
+            (negative, error text)
+        """
+        for retry_ in range(0, 2):
+            cmd = ""
+            try:
+                with self.lock, self.con:
+                    self.cur = self.con.cursor(MeteredDictCursor)
+                    cmd = "SELECT t.id AS id, t.resource_type AS resource_type, t.resource_id AS resource_id, " \
+                          "t.task AS task FROM cluster_tasks AS t JOIN cluster_leases AS l ON " \
+                          "t.resource_type=l.resource_type AND t.resource_id=l.resource_id WHERE l.owner={}{} " \
+                          "ORDER BY t.id LIMIT {} FOR UPDATE".format(
+                              self.__data2db_format(instance_id),
+                              " AND (t.resource_type, t.resource_id) NOT IN (" + ",".join(
+                                  "({}, {})".format(self.__data2db_format(r_type), self.__data2db_format(r_id))
+                                  for r_type, r_id in exclude) + ")" if exclude else "",
+                              int(limit))
+                    self.logger.debug(cmd)
+                    self.cur.execute(cmd)
+                    tasks = self.cur.fetchall()
+                    if tasks:
+                        cmd = "DELETE FROM cluster_tasks WHERE id IN ({})".format(
+                            ",".join(str(int(task["id"])) for task in tasks))
+                        self.logger.debug(cmd)
+                        self.cur.execute(cmd)
+                    return len(tasks), tasks
+            except (mdb.Error, AttributeError) as e:
+                r, c = self.format_error(e, "cluster_pop_tasks", cmd)
+                if r != -HTTP_Request_Timeout or retry_ == 1:
+                    return r, c
+
+    def cluster_get_status(self):
+        """ Get the openvim instances, the leases and the number of pending tasks per resource
+        Return: (number of instances, dictionary with 'members' and 'leases' lists); or (negative, error text)
+        """
+        for retry_ in range(0, 2):
+            cmd = ""
+            try:
+                with self.lock, self.con:
+                    self.cur = self.con.cursor(MeteredDictCursor)
+                    cmd = "SELECT instance_id, endpoint, DATE_FORMAT(started_at,'%Y-%m-%dT%H:%i:%s') AS " \
+                          "started_at, TIMESTAMPDIFF(SECOND, heartbeat_at, NOW()) AS heartbeat_age FROM " \
+                          "cluster_members ORDER BY instance_id"
+                    self.logger.debug(cmd)
+                    self.cur.execute(cmd)
+                    members = self.cur.fetchall()
+                    cmd = "SELECT l.resource_type AS resource_type, l.resource_id AS resource_id, l.owner AS owner, " \
+                          "DATE_FORMAT(l.acquired_at,'%Y-%m-%dT%H:%i:%s') AS acquired_at, " \
+                          "TIMESTAMPDIFF(SECOND, NOW(), l.expires_at) AS expires_in, COUNT(t.id) AS pending_tasks " \
+                          "FROM cluster_leases AS l LEFT JOIN cluster_tasks AS t ON " \
+                          "t.resource_type=l.resource_type AND t.resource_id=l.resource_id " \
+                          "GROUP BY l.resource_type, l.resource_id ORDER BY l.resource_type, l.resource_id"
+                    self.logger.debug(cmd)
+                    self.cur.execute(cmd)
+                    return len(members), {"members": members, "leases": self.cur.fetchall()}
+            except (mdb.Error, AttributeError) as e:
+                r, c = self.format_error(e, "cluster_get_status", cmd)
+                if r != -HTTP_Request_Timeout or retry_ == 1:
+                    return r, c
+
 
 if __name__ == "__main__":
     print("Hello World")
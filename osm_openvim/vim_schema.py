@@ -80,6 +80,8 @@ config_schema = {
         "of_controller_port": port_schema,
         "of_controller_dpid": nameshort_schema,
         "of_controller_nets_with_same_vlan": {"type" : "boolean"},
+        "of_controller_broadcast_groups": {"type" : "boolean"},
+        "openflow_reinstall_workers": {"type": "integer", "minimum": 1},
         "of_controller": nameshort_schema, #{"type":"string", "enum":["floodlight", "opendaylight"]},
         "of_controller_module": {"type":"string"},
         "of_user": nameshort_schema,
@@ -91,6 +93,11 @@ config_schema = {
         "image_path": path_schema,      # leave for backward compatibility
         "host_image_path": path_schema,
         "host_ssh_keyfile": path_schema,
+        "host_discovery_workers": {"type": "integer", "minimum": 1},
+        "host_workers": {"type": "integer", "minimum": 0},
+        "host_stall_timeout": {"type": "number", "minimum": 0},
+        "metadata_cache_ttl": {"type": "integer", "minimum": 0},
+        "response_cache_ttl": {"type": "number", "minimum": 0},
         "network_vlan_range_start": vlan_schema,
         "network_vlan_range_end": vlan_schema,
         "bridge_ifaces": {
@@ -126,8 +133,19 @@ config_schema = {
             },
             "required": ['host', 'provider', 'user']
         },
+        "cluster": {
+            "type": "object",
+            "properties": {
+                "instance_id": nameshort_schema,
+                "lease_time": {"type": "integer", "minimum": 3},
+                "heartbeat": {"type": "number", "exclusiveMinimum": True, "minimum": 0},
+                "task_poll": {"type": "number", "exclusiveMinimum": True, "minimum": 0},
+            },
+        },
         "log_level": log_level_schema,
         "log_level_db": log_level_schema,
+        "db_profile": {"type": "boolean"},
+        "db_slow_query_threshold": {"type": "number", "minimum": 0},
         "log_level_of": log_level_schema,
         "network_type": {"type": "string", "enum": ["ovs", "bridge"]},
         "ovs_controller_file_path": path_schema,
@@ -597,6 +615,18 @@ server_action_schema = {
     "additionalProperties": False
 }
 
+server_delete_schema = {
+    "title":"servers bulk deletion information schema",
+    "$schema": "http://json-schema.org/draft-04/schema#",
+    "type":"object",
+    "properties":{
+        "servers": {"type": "array", "items": id_schema, "minItems": 1},
+        "name_prefix": name_schema,
+    },
+    "minProperties": 1,
+    "additionalProperties": False
+}
+
 network_new_schema = {
     "title": "network creation information schema",
     "$schema": "http://json-schema.org/draft-04/schema#",
@@ -762,7 +792,8 @@ openflow_controller_schema = {
                 "type": nameshort_schema,
                 "version": nametiny_schema,
                 "user": nameshort_schema,
-                "password": nameshort_schema
+                "password": nameshort_schema,
+                "broadcast_groups": {"type": "boolean"}
             },
             "required": ["dpid", "type", "ip", "port", "name"]
         }
@@ -792,6 +823,7 @@ of_port_map_new_schema = {
     "type": "object",
     "properties": {
         "of_port_mapings": {"type": "array", "items": of_port_new_schema, "minLenght":1},
+        "mode": {"type": "string", "enum": ["insert", "upsert", "replace"]},
     },
     "required": ["of_port_mapings"],
     "additionalProperties": False
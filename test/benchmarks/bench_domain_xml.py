@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+Micro-benchmark of the libvirt domain XML rendering of a large dataplane server: 64 pinned vcpus as 32 paired
+threads, hugepages and 16 interfaces (4 bridge, 4 passthrough and 8 SR-IOV), besides 2 disks. Run from the
+repository root:
+    python test/benchmarks/bench_domain_xml.py [-n iterations] [-c vcpus] [-i interfaces]
+'''
+
+__date__ = "$19-oct-2026 10:00:00$"
+
+import os
+import sys
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "osm_openvim"))
+
+import domain_xml
+
+
+def build_server(vcpus, interfaces):
+    """
+    Get the arguments of domain_xml.render_domain for a dataplane server
+    :param vcpus: number of vcpus, even, pinned as paired threads
+    :param interfaces: number of interfaces, a quarter of them bridge, a quarter passthrough and the rest SR-IOV
+    :return: (server, devices, server_metadata, providers)
+    """
+    bridges = interfaces // 4
+    passthrough = interfaces // 4
+    networks = [{"net_id": "net-{}".format(i), "mac_address": "52:54:00:00:00:{:02x}".format(i),
+                 "vpci": "0000:00:{:02x}.0".format(0x10 + i)} for i in range(0, bridges)]
+    providers = dict(("net-{}".format(i), "bridge:virbrMan{}".format(i)) for i in range(0, bridges))
+    numa_interfaces = []
+    for i in range(0, interfaces - bridges):
+        interface = {"dedicated": "yes" if i < passthrough else "no", "source": "0000:81:{:02x}.{}".format(i // 8, i % 8),
+                     "vpci": "0000:00:{:02x}.0".format(0x20 + i), "mac_address": "52:54:00:00:01:{:02x}".format(i)}
+        if i >= passthrough:
+            interface.update({"net_id": "net-sriov-{}".format(i), "vlan": 3000 + i})
+        numa_interfaces.append(interface)
+    server = {
+        "uuid": "9e0f1a2b-3c4d-4e5f-8a6b-7c8d9e0f1a2b",
+        "name": "bench-dataplane",
+        "ram": 0,
+        "vcpus": 0,
+        "networks": networks,
+        "extended": {"numas": [{
+            "source": 1,
+            "memory": 64,
+            "paired-threads-source": [[2 + i, 2 + i + vcpus] for i in range(0, vcpus // 2)],
+            "paired-threads-id": [[2 * i, 2 * i + 1] for i in range(0, vcpus // 2)],
+            "interfaces": numa_interfaces,
+        }]},
+    }
+    devices = [{"type": "disk", "source file": "/opt/VNF/images/dataplane.qcow2.inc", "file format": "qcow2",
+                "vpci": "0000:00:0a.0"},
+               {"type": "disk", "source file": "/opt/VNF/images/data.qcow2", "file format": "qcow2"}]
+    return server, devices, {"topology": "oneSocket:hyperthreading"}, providers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='domain XML rendering benchmark')
+    parser.add_argument("-n", "--iterations", type=int, default=10000, help="number of renderings")
+    parser.add_argument("-c", "--vcpus", type=int, default=64, help="number of vcpus, even")
+    parser.add_argument("-i", "--interfaces", type=int, default=16, help="number of interfaces")
+    args = parser.parse_args()
+
+    server, devices, server_metadata, providers = build_server(args.vcpus, args.interfaces)
+    result, xml = domain_xml.render_domain(server, devices, server_metadata, providers)
+    if result < 0:
+        print "render error: " + xml
+        sys.exit(1)
+
+    elapsed = min(timeit.repeat(lambda: domain_xml.render_domain(server, devices, server_metadata, providers),
+                                repeat=3, number=args.iterations))
+    print "{} vcpus, {} interfaces, {} bytes".format(args.vcpus, args.interfaces, len(xml))
+    print "{:<16} {:>12} {:>14}".format("", "us/domain", "domains/s")
+    print "{:<16} {:>12.1f} {:>14.0f}".format("render_domain", elapsed / args.iterations * 1e6,
+                                              args.iterations / elapsed)
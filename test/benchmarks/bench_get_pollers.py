@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+Measures throughput and latency of the GET listings polled by many clients at once, as dashboards and orchestrators
+do, against a running openvimd. Each poller is a thread with its own connection that requests the endpoints in turn
+for the given time. Run it with a populated database, with response_cache_ttl at 0 and at its default to compare.
+The hits of the response cache are read from the admin port GET /openvim/cache. Server is taken from
+OPENVIM_HOST/OPENVIM_ADMIN_PORT as the openvim client does:
+    python test/benchmarks/bench_get_pollers.py [-c 100] [-t 10] [hosts networks any/servers]
+'''
+
+__date__ = "$19-oct-2026 10:00:00$"
+
+import os
+import sys
+import time
+import threading
+import argparse
+import requests
+
+
+def poll(base, endpoints, end_time, latencies, errors):
+    """
+    GET the endpoints in turn until end_time
+    :param base: url prefix of the endpoints
+    :param endpoints: list of endpoints
+    :param end_time: time to stop
+    :param latencies: dictionary endpoint: list where the seconds of each request are appended
+    :param errors: list where the text of the failed requests is appended
+    :return: None
+    """
+    session = requests.Session()
+    index = 0
+    while time.time() < end_time:
+        endpoint = endpoints[index % len(endpoints)]
+        index += 1
+        start = time.time()
+        try:
+            response = session.get(base + endpoint, headers={'Accept': 'application/json'})
+            response.content
+            if response.status_code != 200:
+                errors.append("GET {} error {}".format(endpoint, response.status_code))
+                continue
+        except requests.exceptions.RequestException as e:
+            errors.append("GET {} {}".format(endpoint, e))
+            continue
+        latencies[endpoint].append(time.time() - start)
+
+
+def get_cache_status(base):
+    response = requests.get(base + "cache", headers={'Accept': 'application/json'})
+    if response.status_code != 200:
+        return None
+    return response.json().get("response_cache")
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='concurrent pollers benchmark of openvim list endpoints')
+    parser.add_argument("-c", "--clients", type=int, default=100, help="number of concurrent pollers")
+    parser.add_argument("-t", "--time", type=float, default=10, help="seconds to poll")
+    parser.add_argument("endpoints", nargs="*", default=["hosts", "networks", "any/servers"],
+                        help="endpoints to poll, relative to /openvim")
+    args = parser.parse_args()
+
+    base = "http://{}:{}/openvim/".format(os.getenv('OPENVIM_HOST', 'localhost'),
+                                          os.getenv('OPENVIM_ADMIN_PORT', '9085'))
+    latencies = dict((endpoint, []) for endpoint in args.endpoints)
+    errors = []
+    status_before = get_cache_status(base)
+    end_time = time.time() + args.time
+    pollers = [threading.Thread(target=poll, args=(base, args.endpoints[index % len(args.endpoints):] +
+                                                   args.endpoints[:index % len(args.endpoints)], end_time,
+                                                   latencies, errors))
+               for index in range(0, args.clients)]
+    start = time.time()
+    for poller in pollers:
+        poller.daemon = True
+        poller.start()
+    for poller in pollers:
+        poller.join()
+    elapsed = time.time() - start
+    status_after = get_cache_status(base)
+
+    print "{} pollers during {:.1f}s".format(args.clients, elapsed)
+    print "{:<16} {:>10} {:>10} {:>10} {:>10} {:>10}".format("endpoint", "requests", "req/s", "p50", "p99", "max")
+    total = 0
+    for endpoint in args.endpoints:
+        values = latencies[endpoint]
+        total += len(values)
+        if values:
+            print "{:<16} {:>10} {:>10.1f} {:>8.1f}ms {:>8.1f}ms {:>8.1f}ms".format(
+                endpoint, len(values), len(values) / elapsed, percentile(values, 50) * 1000,
+                percentile(values, 99) * 1000, max(values) * 1000)
+    print "{:<16} {:>10} {:>10.1f}".format("total", total, total / elapsed)
+    if errors:
+        print "{} errors, last: {}".format(len(errors), errors[-1])
+    if status_before and status_after:
+        print "response cache: " + ", ".join("{} {}".format(key, status_after[key] - status_before[key])
+                                              for key in ("hits", "coalesced", "misses", "invalidations", "not_shared"))
+    if errors:
+        sys.exit(1)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+Benchmark of the management of compute nodes with a thread per host versus the host_scheduler worker pool. It
+starts test mode host_thread objects, measures the memory, threads and CPU used while idle, the time to process a
+no-op task at every host and the time to remove all of them. Each mode is run in a separate process so that memory is
+not shared. Run from the repository root (Linux only, memory is read from /proc):
+    python test/benchmarks/bench_host_scheduler.py [-n 2000] [-w 20] [-t 10]
+'''
+
+__date__ = "$19-oct-2026 10:00:00$"
+
+import os
+import sys
+import time
+import json
+import argparse
+import subprocess
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "osm_openvim"))
+
+
+class EmptyDb(object):
+    """vim_db replacement for test mode hosts without servers"""
+
+    def get_table(self, **sql_dict):
+        return 0, ()
+
+    def update_rows(self, table, UPDATE, WHERE=None, log=False):
+        return 0, None
+
+
+def rss_mb():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024.0
+    return None
+
+
+def cpu_seconds():
+    times = os.times()
+    return times[0] + times[1]
+
+
+def wait_empty(hosts, timeout=120):
+    start = time.time()
+    while time.time() - start < timeout:
+        if all(host.taskQueue.empty() for host in hosts):
+            return time.time() - start
+        time.sleep(0.01)
+    return None
+
+
+def measure(nb_hosts, workers, idle_time):
+    import host_thread
+    import host_scheduler
+
+    scheduler = None
+    if workers:
+        scheduler = host_scheduler.HostScheduler(workers)
+        scheduler.start()
+    rss_before = rss_mb()
+    start = time.time()
+    hosts = []
+    for index in range(0, nb_hosts):
+        host = host_thread.host_thread(name="host-{}".format(index), host="10.0.0.1", user="bench", db=EmptyDb(),
+                                       test=True, image_path="/tmp", host_id="host-{}".format(index), version="0",
+                                       develop_mode=False, develop_bridge_iface=None, scheduler=scheduler)
+        host.start()
+        hosts.append(host)
+    start_time = time.time() - start
+    time.sleep(2)   # let initial loads finish
+
+    cpu = cpu_seconds()
+    time.sleep(idle_time)
+    idle_cpu = (cpu_seconds() - cpu) / idle_time
+    result = {"hosts": nb_hosts, "workers": workers, "start_s": start_time, "rss_mb": rss_mb() - rss_before,
+              "threads": threading.active_count(), "idle_cpu": idle_cpu}
+
+    for host in hosts:
+        host.insert_task("image")
+    result["drain_s"] = wait_empty(hosts)
+
+    start = time.time()
+    for host in hosts:
+        host.insert_task("exit")
+    for host in hosts:
+        host.join()
+    result["exit_s"] = time.time() - start
+    if scheduler:
+        result["scheduled_hosts"] = len(scheduler.hosts)
+        scheduler.stop()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='host thread versus host scheduler benchmark')
+    parser.add_argument("-n", "--hosts", type=int, default=2000, help="number of test hosts")
+    parser.add_argument("-w", "--workers", type=int, default=20, help="workers of the scheduler")
+    parser.add_argument("-t", "--idle-time", type=int, default=10, help="seconds measuring idle CPU")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print json.dumps(measure(args.hosts, args.child, args.idle_time))
+        sys.exit(0)
+
+    print "{:>6} {:>8} {:>8} {:>8} {:>8} {:>9} {:>8} {:>8}".format("hosts", "workers", "threads", "rss MB",
+                                                                   "start s", "idle cpu", "drain s", "exit s")
+    for workers in (0, args.workers):
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "-n", str(args.hosts),
+                                          "-t", str(args.idle_time), "--child", str(workers)])
+        result = json.loads(output.strip().splitlines()[-1])
+        print "{:>6} {:>8} {:>8} {:>8.1f} {:>8.2f} {:>8.0f}% {:>8.2f} {:>8.2f}".format(
+            result["hosts"], "thread" if not workers else workers, result["threads"], result["rss_mb"],
+            result["start_s"], result["idle_cpu"] * 100, result["drain_s"], result["exit_s"])
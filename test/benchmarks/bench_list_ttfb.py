@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+Measures time to first byte and total time of the openvim list endpoints against a running openvimd.
+Use it with a populated database (e.g. test mode with many servers and ports) before and after changes of the
+listing code. Server is taken from OPENVIM_HOST/OPENVIM_ADMIN_PORT as the openvim client does.
+'''
+
+__date__ = "$19-oct-2026 10:00:00$"
+
+import os
+import sys
+import time
+import argparse
+import requests
+
+
+def measure(url, accept, repetitions):
+    """
+    GET an url several times reading the response as a stream
+    :param url: url to get
+    :param accept: Accept header value
+    :param repetitions: number of requests
+    :return: list of (ttfb, total, bytes) tuples, in seconds and bytes
+    """
+    results = []
+    for _ in range(0, repetitions):
+        start = time.time()
+        response = requests.get(url, headers={'Accept': accept}, stream=True)
+        if response.status_code != 200:
+            print "GET {} error {}: {}".format(url, response.status_code, response.text)
+            sys.exit(1)
+        size = 0
+        ttfb = None
+        for chunk in response.iter_content(chunk_size=4096):
+            if ttfb is None:
+                ttfb = time.time() - start
+            size += len(chunk)
+        results.append((ttfb or 0, time.time() - start, size))
+    return results
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time to first byte benchmark of openvim list endpoints')
+    parser.add_argument("-n", "--repetitions", type=int, default=10, help="requests per endpoint")
+    parser.add_argument("--limit", type=int, default=100000, help="'limit' query string value")
+    parser.add_argument("--yaml", action="store_true", help="request yaml instead of json")
+    parser.add_argument("--compact", action="store_true", help="request compact json")
+    parser.add_argument("endpoints", nargs="*", default=["hosts", "any/servers", "ports", "networks"],
+                        help="endpoints to measure, relative to /openvim")
+    args = parser.parse_args()
+
+    base = "http://{}:{}/openvim/".format(os.getenv('OPENVIM_HOST', 'localhost'),
+                                          os.getenv('OPENVIM_ADMIN_PORT', '9085'))
+    accept = 'application/yaml' if args.yaml else 'application/json'
+    print "{:<16} {:>10} {:>10} {:>10} {:>10} {:>12}".format("endpoint", "ttfb p50", "ttfb p99", "total p50",
+                                                            "total p99", "bytes")
+    for endpoint in args.endpoints:
+        url = "{}{}?limit={}".format(base, endpoint, args.limit)
+        if args.compact:
+            url += "&compact=true"
+        r = measure(url, accept, args.repetitions)
+        ttfb = [x[0] for x in r]
+        total = [x[1] for x in r]
+        print "{:<16} {:>9.1f}ms {:>9.1f}ms {:>9.1f}ms {:>9.1f}ms {:>12}".format(
+            endpoint, percentile(ttfb, 50) * 1000, percentile(ttfb, 99) * 1000, percentile(total, 50) * 1000,
+            percentile(total, 99) * 1000, r[-1][2])
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+Benchmark of openflow_thread.update_of_flows when a port is added to or removed from a 'data' net: full recompute of
+the net flows versus the incremental update of the flows of the changed port. It uses the OfTestConnector and an in
+memory table store instead of the database, so that only the flow computation and the number of writes are measured.
+After every incremental update the resulting flows are checked against a full computation. With --broadcast-groups
+the broadcast traffic is sent to openflow groups instead of a per port list of outputs, and the number of actions of
+the flow table is reported too. Run from the repository root:
+    python test/benchmarks/bench_of_flows.py [-n 25 50 100 200] [-r 5] [--broadcast-groups]
+'''
+
+__date__ = "$19-oct-2026 10:00:00$"
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "osm_openvim"))
+
+import openflow_conn
+import openflow_thread
+
+
+class MemoryDb(object):
+    """In memory replacement of the vim_db queries done by openflow_thread, counting the writes. Rows are kept by
+    their 'id' or 'uuid' so that deleting by key costs as with a database primary key"""
+
+    def __init__(self):
+        self.tables = {"nets": {}, "ports": {}, "of_flows": {}, "ofcs": {}}
+        self.last_id = 0
+        self.writes = 0
+
+    def get_table(self, FROM, SELECT=None, WHERE=None, WHERE_OR=None, WHERE_LIKE=None):
+        rows = self.tables[FROM].values()
+        if WHERE:
+            rows = [row for row in rows if all(row.get(k) == v for k, v in WHERE.items())]
+        if WHERE_LIKE:  # only 'prefix%' patterns
+            rows = [row for row in rows if all(str(row.get(k)).startswith(v.rstrip("%")) for k, v in WHERE_LIKE.items())]
+        if WHERE_OR:
+            rows = [row for row in rows if any(row.get(k) == v for k, v in WHERE_OR.items())]
+        if SELECT:
+            rows = [dict((k, row.get(k)) for k in SELECT) for row in rows]
+        else:
+            rows = [dict(row) for row in rows]
+        return len(rows), tuple(rows)
+
+    def new_row(self, table, row, add_uuid=False, root_uuid=False, log=False):
+        row = dict(row)
+        if table == "of_flows":
+            self.last_id += 1
+            row["id"] = self.last_id
+        self.tables[table][row.get("id", row.get("uuid"))] = row
+        self.writes += 1
+        return 1, row.get("id", row.get("uuid"))
+
+    def delete_row_by_key(self, table, key, value):
+        self.writes += 1
+        if not key:
+            nb = len(self.tables[table])
+            self.tables[table] = {}
+            return nb, None
+        return (1 if self.tables[table].pop(value, None) else 0), None
+
+    def update_rows(self, table, UPDATE, WHERE, log=False):
+        nb = 0
+        for row in self.tables[table].values():
+            if all(row.get(k) in v if isinstance(v, list) else row.get(k) == v for k, v in WHERE.items()):
+                row.update(UPDATE)
+                nb += 1
+        return nb, None
+
+
+def new_port(net_id, index):
+    return {"uuid": "port-{}".format(index), "net_id": net_id, "switch_port": "eth{}".format(index), "vlan": None,
+            "mac": "5e:00:00:00:{:02x}:{:02x}".format(*divmod(index, 256)), "type": "instance:data", "model": "PF",
+            "admin_state_up": "true", "status": "ACTIVE"}
+
+
+def flow_keys(of_thread, flows):
+    keys = set()
+    for flow in flows:
+        flow = dict(flow)
+        if isinstance(flow["actions"], str):
+            openflow_thread.change_db2of(flow)
+        keys.add(of_thread._flow_key(flow))
+    return keys
+
+
+def check_flows(of_thread, db, net_id):
+    """Check that the flows at database are the ones of a full computation"""
+    r, nets = db.get_table(FROM="nets", WHERE={"uuid": net_id})
+    r, nets[0]["ports"] = db.get_table(FROM="ports", WHERE={"net_id": net_id})
+    r, expected = of_thread._compute_net_flows(nets, groups={})
+    if flow_keys(of_thread, expected) != flow_keys(of_thread, db.tables["of_flows"].values()):
+        print "ERROR: incremental flows differ from the full computation"
+        sys.exit(1)
+
+
+def update(of_thread, db, net_id, changed_ports):
+    writes = db.writes
+    start = time.time()
+    r, c = of_thread.update_of_flows(net_id, changed_ports)
+    elapsed = time.time() - start
+    if r < 0:
+        print "update_of_flows error: {}".format(c)
+        sys.exit(1)
+    return elapsed, db.writes - writes
+
+
+def measure(nb_ports, repetitions, incremental, broadcast_groups=False):
+    """
+    Create a net with nb_ports ports and add/remove one port repetitions times
+    :return: (add seconds, add writes, remove seconds, remove writes, number of flows, number of actions of the flows
+        and groups), averages per operation
+    """
+    db = MemoryDb()
+    of_conn = openflow_conn.OfTestConnector({"name": "bench", "dpid": "00:01"})
+    of_thread = openflow_thread.openflow_thread("bench", of_conn, db, of_test=True, broadcast_groups=broadcast_groups)
+    net_id = "net-bench"
+    db.tables["nets"][net_id] = {"uuid": net_id, "type": "data", "admin_state_up": "true", "vlan": None,
+                                 "provider": None, "bind_net": None, "bind_type": None}
+    for index in range(0, nb_ports):
+        port = new_port(net_id, index)
+        db.tables["ports"][port["uuid"]] = port
+    update(of_thread, db, net_id, None)
+    nb_flows = len(db.tables["of_flows"])
+    nb_actions = sum(len(flow["actions"].split(",")) for flow in db.tables["of_flows"].values()) + \
+        sum(len(bucket) for group in of_conn.groups.values() for bucket in group["buckets"])
+
+    add_time = add_writes = remove_time = remove_writes = 0
+    for repetition in range(0, repetitions):
+        port = new_port(net_id, nb_ports + repetition)
+        changed_ports = [port["switch_port"]] if incremental else None
+        db.tables["ports"][port["uuid"]] = port
+        elapsed, writes = update(of_thread, db, net_id, changed_ports)
+        add_time += elapsed
+        add_writes += writes
+        if incremental:
+            check_flows(of_thread, db, net_id)
+        del db.tables["ports"][port["uuid"]]
+        elapsed, writes = update(of_thread, db, net_id, changed_ports)
+        remove_time += elapsed
+        remove_writes += writes
+        if incremental:
+            check_flows(of_thread, db, net_id)
+    return (add_time / repetitions, add_writes // repetitions, remove_time / repetitions,
+            remove_writes // repetitions, nb_flows, nb_actions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='openflow flows update benchmark')
+    parser.add_argument("-n", "--ports", type=int, nargs="+", default=[25, 50, 100, 200], help="ports of the net")
+    parser.add_argument("-r", "--repetitions", type=int, default=5, help="port additions/removals per size")
+    parser.add_argument("--broadcast-groups", action="store_true", help="compare with broadcast groups")
+    args = parser.parse_args()
+
+    modes = [("full", False), ("incremental", False)]
+    if args.broadcast_groups:
+        modes += [("full+groups", True), ("incr+groups", True)]
+    print "{:>6} {:>7} {:>8} {:<12} {:>10} {:>7} {:>10} {:>7}".format("ports", "flows", "actions", "mode", "add ms",
+                                                                      "writes", "remove ms", "writes")
+    for nb_ports in args.ports:
+        for mode, broadcast_groups in modes:
+            add_time, add_writes, remove_time, remove_writes, nb_flows, nb_actions = measure(
+                nb_ports, args.repetitions, mode.startswith("incr"), broadcast_groups)
+            print "{:>6} {:>7} {:>8} {:<12} {:>10.1f} {:>7} {:>10.1f} {:>7}".format(
+                nb_ports, nb_flows, nb_actions, mode, add_time * 1000, add_writes, remove_time * 1000, remove_writes)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+Benchmark of of_port_mappings import: one vim_db.new_row per mapping, as done before, versus the bulk
+vim_db.new_rows used by ovim.import_of_port_mappings. It writes to the configured database, using a dedicated region
+that is deleted at the end. Run from the repository root:
+    python test/benchmarks/bench_of_port_mapping_import.py [-n 10000] [--db-host localhost ...]
+'''
+
+__date__ = "$19-oct-2026 10:00:00$"
+
+import os
+import sys
+import time
+import argparse
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "osm_openvim"))
+
+import vim_db
+
+
+def build_mappings(region, number):
+    """
+    Create a switch map of number entries, 48 ports per compute node
+    :param region: region of the entries
+    :param number: number of entries
+    :return: list of mapping dictionaries
+    """
+    mappings = []
+    for index in range(0, number):
+        compute, port = divmod(index, 48)
+        mappings.append({"region": region, "compute_node": "compute-{}".format(compute),
+                         "pci": "0000:{:02x}:00.{}".format(port // 8 + 1, port % 8),
+                         "switch_dpid": "00:00:00:00:00:00:{:02x}:{:02x}".format(*divmod(index // 4096, 256)),
+                         "switch_port": "port-{}".format(index % 4096),
+                         "switch_mac": "5e:00:{:02x}:{:02x}:{:02x}:{:02x}".format(
+                             (index >> 24) & 255, (index >> 16) & 255, (index >> 8) & 255, index & 255)})
+    return mappings
+
+
+def clean(db, region):
+    result, content = db.delete_row_by_dict(FROM='of_port_mappings', WHERE={'region': region})
+    if result < 0:
+        print "Cannot delete region {}: {}".format(region, content)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='of_port_mappings import benchmark')
+    parser.add_argument("-n", "--number", type=int, default=10000, help="number of mappings")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="rows per INSERT statement of new_rows")
+    parser.add_argument("--skip-single", action="store_true", help="do not measure the row by row insertion")
+    parser.add_argument("--db-host", default="localhost")
+    parser.add_argument("--db-user", default="vim")
+    parser.add_argument("--db-passwd", default="vimpw")
+    parser.add_argument("--db-name", default="vim_db")
+    args = parser.parse_args()
+
+    db = vim_db.vim_db((3000, 3100), "openvim.bench.db", "ERROR")
+    if db.connect(args.db_host, args.db_user, args.db_passwd, args.db_name) == -1:
+        print "Cannot connect to database {} at {}@{}".format(args.db_name, args.db_user, args.db_host)
+        sys.exit(1)
+    region = "bench-" + str(uuid.uuid4())[:8]
+
+    print "{:<24} {:>10} {:>14}".format("method", "seconds", "mappings/s")
+    try:
+        if not args.skip_single:
+            start = time.time()
+            for mapping in build_mappings(region, args.number):
+                result, content = db.new_row('of_port_mappings', mapping, True)
+                if result <= 0:
+                    print "new_row error: {}".format(content)
+                    sys.exit(1)
+            elapsed = time.time() - start
+            print "{:<24} {:>10.2f} {:>14.0f}".format("new_row per mapping", elapsed, args.number / elapsed)
+            clean(db, region)
+
+        start = time.time()
+        result, content = db.new_rows('of_port_mappings', build_mappings(region, args.number), add_uuid=True,
+                                      chunk_size=args.chunk_size)
+        if result < 0:
+            print "new_rows error: {}".format(content)
+            sys.exit(1)
+        elapsed = time.time() - start
+        print "{:<24} {:>10.2f} {:>14.0f}".format("new_rows", elapsed, args.number / elapsed)
+
+        start = time.time()
+        result, content = db.new_rows('of_port_mappings', build_mappings(region, args.number), add_uuid=True,
+                                      DELETE_WHERE={'region': region}, chunk_size=args.chunk_size)
+        if result < 0:
+            print "new_rows replace error: {}".format(content)
+            sys.exit(1)
+        elapsed = time.time() - start
+        print "{:<24} {:>10.2f} {:>14.0f}".format("new_rows replace region", elapsed, args.number / elapsed)
+    finally:
+        clean(db, region)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+Micro-benchmark of input validation: jsonschema.validate versus the cached validators of schema_validator, for
+server_new_schema and host_new_schema payloads. Run from the repository root:
+    python test/benchmarks/bench_schema_validation.py [-n iterations]
+'''
+
+__date__ = "$19-oct-2026 10:00:00$"
+
+import os
+import sys
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "osm_openvim"))
+
+from jsonschema import validate as jsonschema_validate
+import schema_validator
+from vim_schema import server_new_schema, host_new_schema
+
+server_payload = {
+    "server": {
+        "name": "vnf-benchmark",
+        "description": "server payload for validation benchmark",
+        "flavorRef": "6a1e2b58-4e5a-11e7-9b2a-0242ac110002",
+        "imageRef": "7b2f3c69-4e5a-11e7-9b2a-0242ac110002",
+        "start": "yes",
+        "extended": {
+            "processor_ranking": 100,
+            "numas": [{
+                "memory": 8,
+                "paired-threads": 4,
+                "paired-threads-id": [[0, 1], [2, 3], [4, 5], [6, 7]],
+                "interfaces": [{"name": "xe{}".format(i), "dedicated": "yes" if i % 2 else "no",
+                                "bandwidth": "10 Gbps", "vpci": "0000:00:{:02x}.0".format(0x10 + i),
+                                "mac_address": "52:54:00:00:00:{:02x}".format(i)} for i in range(0, 8)]
+            }],
+            "devices": [{"type": "disk", "vpci": "0000:00:0a.0", "size": 10}]
+        },
+        "networks": [{"name": "eth{}".format(i), "uuid": "8c3f4d7a-4e5a-11e7-9b2a-0242ac1100{:02x}".format(i),
+                      "vpci": "0000:00:{:02x}.0".format(0x20 + i), "mac_address": "52:54:00:00:01:{:02x}".format(i),
+                      "model": "virtio"} for i in range(0, 4)]
+    }
+}
+
+host_payload = {
+    "host": {
+        "name": "compute-benchmark",
+        "user": "openvim",
+        "ip_name": "10.0.0.10",
+        "description": "host payload for validation benchmark",
+        "ranking": 100,
+    },
+    "host-data": {
+        "name": "compute-benchmark",
+        "user": "openvim",
+        "ip_name": "10.0.0.10",
+        "ranking": 100,
+        "numas": [{
+            "numa_socket": numa,
+            "hugepages": 28,
+            "memory": 32,
+            "cores": [{"core_id": c, "thread_id": c * 2 + t} for c in range(0, 10) for t in range(0, 2)],
+            "interfaces": [{
+                "source_name": "p{}p{}".format(numa, i),
+                "mac": "a0:36:9f:{:02x}:00:{:02x}".format(numa, i),
+                "Mbps": 10000,
+                "pci": "0000:{:02x}:00.{}".format(0x04 + numa * 0x80, i),
+                "switch_port": "Te{}/{}".format(numa, i),
+                "switch_dpid": "00:01:02:03:04:05:06:07",
+                "sriovs": [{"source_name": v, "mac": "a0:36:9f:{:02x}:{:02x}:{:02x}".format(numa, i, v),
+                            "pci": "0000:{:02x}:10.{}".format(0x04 + numa * 0x80, v)} for v in range(0, 8)]
+            } for i in range(0, 4)]
+        } for numa in range(0, 2)]
+    }
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='jsonschema validation micro-benchmark')
+    parser.add_argument("-n", "--iterations", type=int, default=1000, help="validations per case")
+    args = parser.parse_args()
+
+    print "{:<20} {:>16} {:>16} {:>8}".format("schema", "js_v us/call", "cached us/call", "speedup")
+    for name, payload, schema in (("server_new_schema", server_payload, server_new_schema),
+                                  ("host_new_schema", host_payload, host_new_schema)):
+        schema_validator.validate(payload, schema)  # also checks that the payload is valid
+        plain = timeit.timeit(lambda: jsonschema_validate(payload, schema), number=args.iterations)
+        cached = timeit.timeit(lambda: schema_validator.validate(payload, schema), number=args.iterations)
+        print "{:<20} {:>16.1f} {:>16.1f} {:>7.1f}x".format(name, plain * 1e6 / args.iterations,
+                                                           cached * 1e6 / args.iterations, plain / cached)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+Measures the latency of server creation and deletion against a running openvimd, with every server attached to an ovs
+network with dhcp enabled, so that the dhcp server, links and fixed ip set up of the openvim controller is exercised.
+Run it against the same test mode openvimd and database before and after changes of the server creation code.
+Server is taken from OPENVIM_HOST/OPENVIM_PORT/OPENVIM_ADMIN_PORT as the openvim client does. The tenant, flavor and
+image must exist and a host be available, e.g. as created by test/test_openvim.py:
+    python test/benchmarks/bench_server_create.py -t TENANT -f FLAVOR -i IMAGE [-n 100]
+'''
+
+__date__ = "$19-oct-2026 10:00:00$"
+
+import os
+import sys
+import time
+import argparse
+import requests
+
+
+def call(method, url, body=None):
+    start = time.time()
+    response = requests.request(method, url, json=body, headers={'Accept': 'application/json'})
+    elapsed = time.time() - start
+    if response.status_code != 200:
+        print "{} {} error {}: {}".format(method, url, response.status_code, response.text)
+        sys.exit(1)
+    return elapsed, response.json()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='server creation latency benchmark')
+    parser.add_argument("-t", "--tenant", default=os.getenv('OPENVIM_TENANT'), help="tenant id")
+    parser.add_argument("-f", "--flavor", required=True, help="flavor id")
+    parser.add_argument("-i", "--image", required=True, help="image id")
+    parser.add_argument("-n", "--servers", type=int, default=100, help="number of servers to create")
+    parser.add_argument("--net", help="ovs network id to use. By default one with dhcp is created and deleted")
+    args = parser.parse_args()
+    if not args.tenant:
+        print "tenant needed, use -t or OPENVIM_TENANT"
+        sys.exit(1)
+
+    host = os.getenv('OPENVIM_HOST', 'localhost')
+    base = "http://{}:{}/openvim/".format(host, os.getenv('OPENVIM_PORT', '9080'))
+    admin_base = "http://{}:{}/openvim/".format(host, os.getenv('OPENVIM_ADMIN_PORT', '9085'))
+
+    net_id = args.net
+    if not net_id:
+        _, content = call("POST", admin_base + "networks",
+                          {"network": {"name": "bench-server-create", "type": "bridge_man", "shared": True,
+                                       "tenant_id": args.tenant, "cidr": "10.212.0.0/16", "enable_dhcp": True,
+                                       "dhcp_first_ip": "10.212.0.2", "dhcp_last_ip": "10.212.255.250"}})
+        net_id = content["network"]["id"]
+
+    create = []
+    delete = []
+    servers = []
+    try:
+        for index in range(0, args.servers):
+            elapsed, content = call("POST", "{}{}/servers".format(base, args.tenant),
+                                    {"server": {"name": "bench-server-{}".format(index), "imageRef": args.image,
+                                                "flavorRef": args.flavor,
+                                                "networks": [{"name": "eth0", "uuid": net_id}]}})
+            create.append(elapsed)
+            servers.append(content["server"]["id"])
+    finally:
+        for server_id in servers:
+            elapsed, _ = call("DELETE", "{}{}/servers/{}".format(base, args.tenant, server_id))
+            delete.append(elapsed)
+        if not args.net:
+            # wait for the deletion of the servers ports
+            time.sleep(2)
+            call("DELETE", admin_base + "networks/" + net_id)
+
+    print "{:<8} {:>8} {:>10} {:>10} {:>10}".format("action", "servers", "p50", "p99", "max")
+    for action, values in (("create", create), ("delete", delete)):
+        if values:
+            print "{:<8} {:>8} {:>8.1f}ms {:>8.1f}ms {:>8.1f}ms".format(
+                action, len(values), percentile(values, 50) * 1000, percentile(values, 99) * 1000,
+                max(values) * 1000)
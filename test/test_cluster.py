@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+Unit tests of the cluster members with an in memory lease store in place of the cluster tables of the database, with
+its own clock: leases acquired, expired and taken over, resources shared out, and tasks routed to the owner. No
+database is needed:
+    pytest -v test/test_cluster.py
+'''
+
+__date__ = "$19-oct-2026 10:00:00$"
+
+import os
+import sys
+import time
+import threading
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "osm_openvim"))
+
+import cluster
+
+
+class MemoryLeaseStore(object):
+    """Lease store with the cluster_* methods of vim_db. Time is advanced by the tests"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.members = {}   # instance_id: heartbeat time
+        self.leases = {}    # (resource_type, resource_id): {"owner", "expires_at"}
+        self.tasks = []     # (id, resource_type, resource_id, task)
+        self.task_id = 0
+        self.fail = False
+
+    def _expired(self, lease):
+        return lease["expires_at"] is None or lease["expires_at"] < self.now
+
+    def cluster_heartbeat(self, instance_id, endpoint, lease_time):
+        if self.fail:
+            return -500, "database down"
+        self.members[instance_id] = self.now
+        for lease in self.leases.values():
+            if lease["owner"] == instance_id:
+                lease["expires_at"] = self.now + lease_time
+        members = sum(1 for heartbeat in self.members.values() if heartbeat >= self.now - lease_time)
+        return members, [{"resource_type": key[0], "resource_id": key[1], "owner": lease["owner"],
+                          "expired": "true" if self._expired(lease) else "false"}
+                         for key, lease in self.leases.items()]
+
+    def cluster_acquire_lease(self, instance_id, resource_type, resource_id, lease_time):
+        lease = self.leases.setdefault((resource_type, resource_id), {"owner": None, "expires_at": None})
+        if lease["owner"] is None or self._expired(lease):
+            lease["owner"] = instance_id
+            lease["expires_at"] = self.now + lease_time
+            return 1, None
+        return 0, None
+
+    def cluster_release_leases(self, instance_id, resources=None, delete=False):
+        if self.fail:
+            return -500, "database down"
+        released = 0
+        for key, lease in self.leases.items():
+            if resources is not None and key not in resources:
+                continue
+            if lease["owner"] == instance_id or (delete and (lease["owner"] is None or self._expired(lease))):
+                released += 1
+                if delete:
+                    del self.leases[key]
+                    self.tasks = [task for task in self.tasks if (task[1], task[2]) != key]
+                else:
+                    lease["owner"] = lease["expires_at"] = None
+        return released, None
+
+    def cluster_new_task(self, resource_type, resource_id, task):
+        self.task_id += 1
+        self.tasks.append((self.task_id, resource_type, resource_id, task))
+        return 1, self.task_id
+
+    def cluster_pop_tasks(self, instance_id, limit=100, exclude=None):
+        tasks = [task for task in self.tasks
+                 if self.leases.get((task[1], task[2]), {}).get("owner") == instance_id and
+                 (task[1], task[2]) not in (exclude or ())][:limit]
+        self.tasks = [task for task in self.tasks if task not in tasks]
+        return len(tasks), [{"id": task[0], "resource_type": task[1], "resource_id": task[2], "task": task[3]}
+                            for task in tasks]
+
+    def cluster_get_status(self):
+        return len(self.members), {"members": sorted(self.members), "leases": []}
+
+    def delete_row_by_key(self, table, column, value):
+        self.members.pop(value, None)
+        return 1, None
+
+
+class FakeThread(object):
+    def __init__(self, name):
+        self.name = name
+        self.tasks = []
+        self.reset = []
+        self.exited = False
+        self.busy = threading.Event()   # set while in the middle of a long task, that delays the exit
+
+    def insert_task(self, task, *aditional):
+        self.tasks.append((task,) + aditional)
+        if task == "exit":
+            self.exited = True
+        return 1, None
+
+    def reset_net_status(self, net_id):
+        self.reset.append(net_id)
+
+    def join(self, timeout=None):
+        if self.busy.is_set():
+            time.sleep(timeout)
+
+    def is_alive(self):
+        return not self.exited or self.busy.is_set()
+
+
+class Instance(object):
+    """openvim instance with its cluster member and the threads it has started and attached"""
+
+    def __init__(self, instance_id, store, resources):
+        self.resources = resources
+        self.started = []
+        self.attached = {}
+        self.invalidations = 0
+        self.member = cluster.ClusterMember(instance_id, store, lambda: dict(self.resources), self.start,
+                                            self.attach, lease_time=30, heartbeat=0.1,
+                                            invalidate_caches=self.invalidate)
+
+    def start(self, resource_type, resource_id, info):
+        thread = FakeThread(resource_id)
+        self.started.append(thread)
+        return thread
+
+    def attach(self, resource_type, resource_id, thread, info):
+        self.attached[(resource_type, resource_id)] = thread
+
+    def invalidate(self):
+        self.invalidations += 1
+
+    def owned(self):
+        return set(key[1] for key in self.member.owned)
+
+
+@pytest.fixture
+def store():
+    return MemoryLeaseStore()
+
+
+@pytest.fixture
+def resources():
+    return dict((("host", "host-{}".format(i)), {"name": "host-{}".format(i)}) for i in range(0, 4))
+
+
+def test_acquire_all_alone(store, resources):
+    a = Instance("a", store, resources)
+    a.member.heartbeat()
+    assert a.owned() == set(["host-0", "host-1", "host-2", "host-3"])
+    assert all(store.leases[key]["owner"] == "a" for key in resources)
+    assert a.invalidations == 0
+
+
+def test_share_out_and_takeover(store, resources):
+    a = Instance("a", store, resources)
+    b = Instance("b", store, resources)
+    a.member.heartbeat()
+    b.member.heartbeat()
+    # a gives away its surplus, that b takes at its next heartbeat
+    a.member.heartbeat()
+    b.member.heartbeat()
+    assert len(a.owned()) == 2 and len(b.owned()) == 2
+    assert a.owned().isdisjoint(b.owned())
+    assert isinstance(b.attached[("host", sorted(a.owned())[0])], cluster.RemoteThread)
+    assert a.invalidations > 0 and b.invalidations > 0
+
+    # a stops renewing; its leases are taken by b once expired
+    store.now += 20
+    b.member.heartbeat()
+    assert len(b.owned()) == 2
+    store.now += 20
+    b.member.heartbeat()
+    assert b.owned() == set(["host-0", "host-1", "host-2", "host-3"])
+    assert not isinstance(b.attached[("host", "host-0")], cluster.RemoteThread)
+
+
+def test_lease_lost(store, resources):
+    a = Instance("a", store, resources)
+    a.member.heartbeat()
+    threads = list(a.started)
+    store.leases[("host", "host-0")]["owner"] = "b"
+    a.member.heartbeat()
+    assert "host-0" not in a.owned()
+    assert threads[0].exited
+    assert a.member.stats["lost"] == 1
+
+
+def test_database_lost(store, resources):
+    a = Instance("a", store, resources)
+    a.member.lease_time = 30
+    a.member.heartbeat_time = 5
+    a.member.heartbeat()
+    store.fail = True
+    # some heartbeats without database are tolerated
+    store.now += 15
+    a.member.last_renew -= 15
+    a.member.heartbeat()
+    assert len(a.owned()) == 4
+    # the owned threads are stopped two heartbeats before the leases expire
+    store.now += 5
+    a.member.last_renew -= 5
+    a.member.heartbeat()
+    assert not a.owned()
+    assert all(thread.exited for thread in a.started)
+    # and no other instance can take them yet
+    store.fail = False
+    b = Instance("b", store, resources)
+    b.member.heartbeat()
+    assert not b.owned()
+    store.now += 20
+    b.member.heartbeat()
+    assert len(b.owned()) == 4
+
+
+def test_stop_busy_thread(store, resources):
+    a = Instance("a", store, resources)
+    b = Instance("b", store, resources)
+    a.member.heartbeat()
+    b.member.heartbeat()
+    busy = a.member.owned[sorted(a.member.owned)[-1]]
+    busy.busy.set()
+    start = time.time()
+    a.member.heartbeat()
+    # the surplus is told to exit at once, and waited for a heartbeat at most
+    assert time.time() - start < 1
+    assert len(a.owned()) == 2
+    assert all(thread.exited for thread in a.started if thread.name not in a.owned())
+    # the lease of the busy thread is kept until it ends, and its tasks wait for the next owner
+    key = ("host", busy.name)
+    assert store.leases[key]["owner"] == "a"
+    assert b.member.route("host", busy.name, ("instance", {"uuid": "vm-1"})) == (1, None)
+    assert a.member.deliver_tasks() == 0
+    b.member.heartbeat()
+    assert busy.name not in b.owned()
+    busy.busy.clear()
+    a.member.heartbeat()
+    assert store.leases[key]["owner"] is None
+    b.member.heartbeat()
+    assert busy.name in b.owned()
+    assert b.member.deliver_tasks() == 1
+    assert b.member.owned[key].tasks == [("instance", {"uuid": "vm-1"})]
+
+
+def test_route(store, resources):
+    a = Instance("a", store, resources)
+    b = Instance("b", store, resources)
+    a.member.heartbeat()
+    b.member.heartbeat()
+    a.member.heartbeat()
+    b.member.heartbeat()
+    local = sorted(a.owned())[0]
+    remote = sorted(b.owned())[0]
+    # tasks of owned resources are delivered at once, the rest through the store
+    assert a.member.route("host", local, ("instance", {"uuid": "vm-1"})) == (1, None)
+    assert a.member.route("host", remote, ("instance", {"uuid": "vm-2"})) == (1, None)
+    a.attached[("host", remote)].insert_task("instance", {"uuid": "vm-3"})
+    a.attached[("host", remote)].name = "renamed"
+    a.attached[("host", remote)].reset_net_status("net-1")
+    assert a.member.owned[("host", local)].tasks == [("instance", {"uuid": "vm-1"})]
+    assert a.member.stats["routed"] == 4
+    assert b.member.deliver_tasks() == 4
+    thread = b.member.owned[("host", remote)]
+    assert thread.tasks == [("instance", {"uuid": "vm-2"}), ("instance", {"uuid": "vm-3"})]
+    assert thread.name == "renamed"
+    assert thread.reset == ["net-1"]
+
+
+def test_route_concurrent(store, resources):
+    a = Instance("a", store, resources)
+    a.member.heartbeat()
+    errors = []
+
+    def router():
+        for index in range(0, 200):
+            if a.member.route("host", "host-1", ("instance", index)) != (1, None):
+                errors.append(index)
+
+    threads = [threading.Thread(target=router) for _ in range(0, 4)]
+    for thread in threads:
+        thread.start()
+    for _ in range(0, 20):
+        a.member.heartbeat()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(a.member.owned[("host", "host-1")].tasks) == 800
+    assert a.member.stats["delivered"] == 800
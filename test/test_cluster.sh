@@ -0,0 +1,187 @@
+#!/bin/bash
+
+##
+# Copyright 2015 Telefónica Investigación y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+#
+#script to test several openvimd instances sharing the same database in 'test' mode: hosts are shared out among
+#the instances, tasks of a host are routed to the instance that owns it, and the hosts of a killed instance are
+#taken by the others once its leases expire
+#
+
+function usage(){
+    echo -e "usage: ${BASH_SOURCE[0]} [OPTIONS] \n  test openvim cluster in test mode"
+    echo -e "  OPTIONS:"
+    echo -e "    -n NUMBER        number of openvimd instances, 3 by default"
+    echo -e "    -c CONFIG        openvimd.cfg with the database parameters, by default osm_openvim/openvimd.cfg"
+    echo -e "    -p PORT          first http port. Instance i uses PORT+10*i and PORT+10*i+5 for admin. 9180 by default"
+    echo -e "    -h --help        shows this help"
+    echo
+    echo    "The database must be created and empty of hosts. The instances run in 'test' mode with a lease time of"
+    echo    "6 seconds, and their logs are kept at a temporal folder."
+}
+
+#detect if is called with a source to use the 'exit'/'return' command for exiting
+[[ ${BASH_SOURCE[0]} != $0 ]] && echo "Do not execute this script as SOURCE" >&2 && return 1
+
+DIRNAME=$(dirname $(readlink -f ${BASH_SOURCE[0]}))
+DIRNAME=$(dirname $DIRNAME)
+instances=3
+config=${DIRNAME}/osm_openvim/openvimd.cfg
+base_port=9180
+lease_time=6
+while getopts ":n:c:p:h-:" o; do
+    case "${o}" in
+        n) instances="$OPTARG" ;;
+        c) config="$OPTARG" ;;
+        p) base_port="$OPTARG" ;;
+        h) usage && exit 0 ;;
+        -) [[ "${OPTARG}" == "help" ]] && usage && exit 0
+           echo "Invalid option: --$OPTARG" >&2 && usage >&2 && exit 1 ;;
+        \?) echo "Invalid option: -$OPTARG" >&2 && usage >&2 && exit 1 ;;
+        :) echo "Option -$OPTARG requires an argument" >&2 && usage >&2 && exit 1 ;;
+    esac
+done
+
+workdir=$(mktemp -d /tmp/openvim-cluster.XXXX)
+PIDS=""
+HOSTS=""
+
+function delete_and_exit(){
+    for host in $HOSTS
+    do
+        admin_port $alive
+        openvim host-remove -f $host > /dev/null
+    done
+    [[ -n $PIDS ]] && kill $PIDS 2>/dev/null
+    wait 2>/dev/null
+    echo "logs at $workdir"
+    exit $1
+}
+
+function admin_port(){
+    # set openvim client environment for instance $1
+    export OPENVIM_HOST=localhost
+    export OPENVIM_PORT=$(($base_port + 10 * $1))
+    export OPENVIM_ADMIN_PORT=$(($base_port + 10 * $1 + 5))
+}
+
+function cluster_status(){
+    # print owner of every lease, one per line, as seen by instance $1
+    admin_port $1
+    curl -s http://localhost:${OPENVIM_ADMIN_PORT}/openvim/cluster | python -c '
+import json, sys
+for lease in json.load(sys.stdin)["cluster"]["leases"]:
+    print lease["resource_type"], lease["resource_id"], lease["owner"]'
+}
+
+function delivered_tasks(){
+    # print the number of tasks delivered by instance $1 to the threads it owns
+    admin_port $1
+    curl -s http://localhost:${OPENVIM_ADMIN_PORT}/openvim/cluster | python -c '
+import json, sys
+print json.load(sys.stdin)["cluster"]["stats"]["delivered"]'
+}
+
+function wait_leases(){
+    # wait until every lease is owned by an instance other than $2, as seen by instance $1
+    timeout_=$((3 * $lease_time))
+    while true
+    do
+        result=`cluster_status $1`
+        [[ -n "$result" ]] && ! echo "$result" | grep -q -w -e None -e "cluster-$2" && break
+        [[ $timeout_ == 0 ]] && echo "FAIL leases not taken: $result" >&2 && delete_and_exit 1
+        timeout_=$((timeout_ - 1))
+        sleep 1
+    done
+}
+
+trap 'delete_and_exit 1' INT
+
+#start instances
+for i in `seq 1 $instances`
+do
+    python -c "
+import yaml
+config = yaml.load(open('$config'))
+config.update({'mode': 'test', 'http_port': $base_port + 10 * $i, 'http_admin_port': $base_port + 10 * $i + 5,
+               'cluster': {'instance_id': 'cluster-$i', 'lease_time': $lease_time, 'task_poll': 0.2},
+               'log_level': 'INFO', 'log_level_db': 'ERROR', 'log_level_of': 'INFO'})
+config.pop('dhcp_server', None)
+yaml.safe_dump(config, open('$workdir/openvimd-$i.cfg', 'w'), default_flow_style=False)"
+    ${DIRNAME}/openvimd -c $workdir/openvimd-$i.cfg < /dev/null > $workdir/openvimd-$i.log 2>&1 &
+    PIDS="${PIDS:+$PIDS }$!"
+    echo "started instance $i at port $(($base_port + 10 * $i)), logs at $workdir/openvimd-$i.log"
+done
+for i in `seq 1 $instances`
+do
+    timeout_=20
+    until grep -q "openvimd ready" $workdir/openvimd-$i.log
+    do
+        [[ $timeout_ == 0 ]] && echo "FAIL instance $i not ready" >&2 && delete_and_exit 1
+        timeout_=$((timeout_ - 1))
+        sleep 1
+    done
+done
+alive=$instances
+
+#create hosts at first instance
+admin_port 1
+for host_file in ${DIRNAME}/test/hosts/host-example*.yaml
+do
+    result=`openvim host-add $host_file`
+    host=`echo $result | gawk '{print $1}'`
+    [[ -z $host ]] && echo "FAIL host-add $host_file: $result" >&2 && delete_and_exit 1
+    HOSTS="$HOSTS $host"
+done
+
+#hosts are shared out after some heartbeats
+sleep $(($lease_time * 2))
+result=`cluster_status $instances`
+echo "$result"
+owners=`echo "$result" | gawk '{print $3}' | sort -u | grep -v None | wc -l`
+nb_hosts=`echo $HOSTS | wc -w`
+[[ $owners -lt $(( nb_hosts < instances ? nb_hosts : instances )) ]] && echo "FAIL hosts not shared out" >&2 &&
+    delete_and_exit 1
+echo "hosts shared out among $owners instances: OK"
+
+#tasks of a host owned by another instance are routed to it
+host=`echo "$result" | grep -v -w cluster-1 | grep -w host | head -1 | gawk '{print $2}'`
+if [[ -n $host ]]
+then
+    owner=`echo "$result" | grep -w $host | gawk '{print $3}'`
+    owner=${owner#cluster-}
+    delivered=`delivered_tasks $owner`
+    admin_port 1
+    openvim host-edit -f $host "name: renamed-by-cluster-1" > /dev/null || ! echo "FAIL host-edit" >&2 ||
+        delete_and_exit 1
+    sleep 1
+    [[ `delivered_tasks $owner` -gt $delivered ]] || ! echo "FAIL task not routed to $owner" >&2 || delete_and_exit 1
+    echo "task routed from instance 1 to instance $owner: OK"
+fi
+
+#kill first instance, the others take its hosts
+kill -9 ${PIDS%% *} 2>/dev/null
+PIDS=${PIDS#* }
+wait_leases $instances 1
+echo "`cluster_status $instances`"
+echo "hosts of killed instance taken by the others: OK"
+delete_and_exit 0
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+Unit tests of the libvirt domain XML renderer against the golden files of test/domain_xml, recorded from the former
+string concatenation of host_thread.create_xml_server for the servers of test/domain_xml/cases.yaml. No connection to
+a compute node is needed:
+    pytest -v test/test_domain_xml.py
+'''
+
+__date__ = "$19-oct-2026 10:00:00$"
+
+import os
+import sys
+import copy
+import threading
+import yaml
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "osm_openvim"))
+
+import domain_xml
+
+CASES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "domain_xml")
+
+with open(os.path.join(CASES_FOLDER, "cases.yaml")) as f:
+    CASES = yaml.safe_load(f)
+
+
+def render(case):
+    return domain_xml.render_domain(case["server"], case["devices"], case.get("metadata"), case.get("providers"),
+                                    case.get("develop_mode", False), case.get("develop_bridge_iface"),
+                                    case.get("iface_names"))
+
+
+@pytest.mark.parametrize("name", sorted(CASES.keys()))
+def test_render_domain_golden(name):
+    with open(os.path.join(CASES_FOLDER, name + ".xml")) as f:
+        golden = f.read()
+    result, xml = render(copy.deepcopy(CASES[name]))
+    assert result == 0, xml
+    assert xml + "\n" == golden
+
+
+def test_render_domain_errors():
+    case = copy.deepcopy(CASES["kvm_bridges"])
+    case["server"]["ram"] = 0
+    assert render(case) == (-1, "No memory assigned to instance")
+
+    case = copy.deepcopy(CASES["kvm_bridges"])
+    case["server"]["vcpus"] = 0
+    assert render(case) == (-1, "Instance without number of cpus")
+
+    case = copy.deepcopy(CASES["kvm_cores_threads"])
+    case["metadata"]["topology"] = "oneSocket:hyperthreading"
+    assert render(case) == (-1, "Cannot expose hyperthreading with an odd number of vcpus")
+
+    case = copy.deepcopy(CASES["kvm_bridges"])
+    case["devices"].append({"type": "floppy"})
+    assert render(case) == (-1, "Unknown device type floppy")
+
+    case = copy.deepcopy(CASES["kvm_bridges"])
+    case["providers"]["net-bridge"] = "vxlan:10"
+    assert render(case) == (-1, "Unknown Bridge net provider vxlan:10")
+
+    case = copy.deepcopy(CASES["kvm_bridges"])
+    del case["providers"]["net-ovs"]
+    assert render(case)[0] == -1
+
+
+def test_render_domain_concurrent():
+    # domains of different variants rendered at once by several threads must not mix their content
+    expected = dict((name, render(copy.deepcopy(case))) for name, case in CASES.items())
+    errors = []
+
+    def render_all():
+        for _ in range(0, 50):
+            for name, case in CASES.items():
+                if render(case) != expected[name]:
+                    errors.append(name)
+
+    threads = [threading.Thread(target=render_all) for _ in range(0, 8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+
+def test_pci2xml():
+    assert domain_xml.pci2xml(None, 2) == ""
+    assert domain_xml.pci2xml("0000:05:10.2", 1) == \
+        "\n  <address type='pci' domain='0x0000' bus='0x05' slot='0x10' function='0x2'/>"
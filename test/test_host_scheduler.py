@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+Unit tests of the host scheduler with fake hosts that record how they are run: tasks of a host processed in order
+and by one worker at a time, hosts added and removed while running, and the watchdog of blocked workers. No compute
+node is needed:
+    pytest -v test/test_host_scheduler.py
+'''
+
+__date__ = "$19-oct-2026 10:00:00$"
+
+import os
+import sys
+import time
+import threading
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "osm_openvim"))
+
+import host_scheduler
+
+
+class FakeHost(object):
+    """Host with a task list, that records the tasks it runs and fails if run by two workers at once"""
+
+    def __init__(self, name, task_time=0.001):
+        self.name = name
+        self.task_time = task_time
+        self.lock = threading.Lock()
+        self.tasks = []
+        self.done = []
+        self.runs = 0
+        self.running = 0
+        self.overlaps = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def insert_task(self, scheduler, task):
+        with self.lock:
+            self.tasks.append(task)
+        scheduler.notify(self)
+
+    def run_once(self, max_tasks):
+        with self.lock:
+            self.running += 1
+            if self.running > 1:
+                self.overlaps += 1
+            self.runs += 1
+        try:
+            self.release.wait()
+            for _ in range(0, max_tasks):
+                with self.lock:
+                    if not self.tasks:
+                        break
+                    task = self.tasks.pop(0)
+                time.sleep(self.task_time)
+                if task == "exit":
+                    return None
+                self.done.append(task)
+            else:
+                return 0    # there may be more tasks
+            return time.time() + 3600
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition():
+        if time.time() > end:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = host_scheduler.HostScheduler(workers=4, name="test-hosts", tasks_per_run=3)
+    scheduler.start()
+    yield scheduler
+    scheduler.stop(1)
+
+
+def test_host_tasks_serialized(scheduler):
+    hosts = [FakeHost("host-{}".format(i)) for i in range(0, 8)]
+    for host in hosts:
+        scheduler.add(host)
+
+    def producer(host, index):
+        for task in range(0, 50):
+            host.insert_task(scheduler, (index, task))
+
+    threads = [threading.Thread(target=producer, args=(host, index)) for host in hosts for index in range(0, 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert wait_for(lambda: all(len(host.done) == 100 for host in hosts))
+    for host in hosts:
+        assert host.overlaps == 0
+        # tasks are processed in the order each producer inserts them
+        for index in range(0, 2):
+            assert [task for producer, task in host.done if producer == index] == range(0, 50)
+
+
+def test_host_exit(scheduler):
+    host = FakeHost("host-exit")
+    scheduler.add(host)
+    assert wait_for(lambda: host.runs == 1)
+    assert scheduler.is_scheduled(host)
+    host.insert_task(scheduler, "exit")
+    assert wait_for(lambda: not scheduler.is_scheduled(host))
+    host.insert_task(scheduler, 1)
+    time.sleep(0.1)
+    assert host.done == []
+
+
+def test_remove_add_while_running(scheduler):
+    host = FakeHost("host-readd")
+    host.release.clear()
+    scheduler.add(host)
+    assert wait_for(lambda: host.running == 1)
+    scheduler.remove(host)
+    scheduler.add(host)
+    scheduler.add(host)
+    host.insert_task(scheduler, 1)
+    time.sleep(0.1)
+    host.release.set()
+    assert wait_for(lambda: host.done == [1])
+    time.sleep(0.1)
+    assert host.overlaps == 0
+    assert host.runs == 2
+    assert scheduler.is_scheduled(host)
+
+
+def test_remove_add_while_queued():
+    scheduler = host_scheduler.HostScheduler(workers=1, name="test-hosts")
+    scheduler.start()
+    try:
+        blocker = FakeHost("host-blocker")
+        blocker.release.clear()
+        scheduler.add(blocker)
+        assert wait_for(lambda: blocker.running == 1)
+        host = FakeHost("host-queued")
+        scheduler.add(host)
+        scheduler.remove(host)
+        scheduler.add(host)
+        blocker.release.set()
+        assert wait_for(lambda: host.runs == 1)
+        time.sleep(0.1)
+        assert host.runs == 1
+        assert scheduler.is_scheduled(host)
+    finally:
+        scheduler.stop(1)
+
+
+def test_remove(scheduler):
+    host = FakeHost("host-removed")
+    scheduler.add(host)
+    assert wait_for(lambda: host.runs == 1)
+    scheduler.remove(host)
+    assert not scheduler.is_scheduled(host)
+    host.insert_task(scheduler, 1)
+    time.sleep(0.1)
+    assert host.runs == 1
+    assert host.done == []
+
+
+def test_watchdog_replaces_blocked_worker():
+    scheduler = host_scheduler.HostScheduler(workers=1, name="test-hosts", stall_timeout=0.2)
+    scheduler.start()
+    try:
+        blocked = FakeHost("host-blocked")
+        blocked.release.clear()
+        scheduler.add(blocked)
+        assert wait_for(lambda: blocked.running == 1)
+        host = FakeHost("host-other")
+        scheduler.add(host)
+        host.insert_task(scheduler, 1)
+        assert wait_for(lambda: host.done == [1], timeout=2)
+        blocked.release.set()
+        # the blocked worker exits once its host returns, keeping the number of workers
+        assert wait_for(lambda: len(scheduler.threads) == 2)
+    finally:
+        scheduler.stop(1)
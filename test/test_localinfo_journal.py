@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+Unit tests of the localinfo snapshot and journal of the compute nodes, with the commands of load_localinfo and
+save_localinfo run against the files of a fake host: legacy yaml snapshots, replay of the journal, truncated lines,
+compaction and failed appends. No compute node is needed:
+    pytest -v test/test_localinfo_journal.py
+'''
+
+__date__ = "$19-oct-2026 10:00:00$"
+
+import os
+import sys
+import json
+import yaml
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "osm_openvim"))
+
+import host_thread
+
+IMAGE_PATH = "/opt/VNF/images"
+SNAPSHOT = IMAGE_PATH + "/.openvim.yaml"
+JOURNAL = IMAGE_PATH + "/.openvim.journal"
+
+
+class FakeStream(object):
+    def __init__(self):
+        self.text = ""
+
+    def write(self, text):
+        self.text += text
+
+
+class FakeHostFiles(object):
+    """Files of the image path of a host, changed by the commands that host_thread runs to load and save localinfo"""
+
+    def __init__(self, files=None):
+        self.files = dict(files or {})
+        self.session = None
+        self.commands = []
+        self.fail_append = 0    # number of appends that fail, leaving a truncated line
+
+    def run_command(self, command, keep_session=False, ignore_exit_status=False):
+        if keep_session:
+            self.session = FakeStream()
+            return self.session
+        self.commands.append(command)
+        if command.startswith("sudo mkdir"):
+            return ""
+        if command.startswith("cat {} &&".format(SNAPSHOT)):
+            if SNAPSHOT not in self.files:
+                raise host_thread.RunCommandException("cat: {}: No such file or directory".format(SNAPSHOT))
+            return "{}\n\n{}\n{}".format(self.files[SNAPSHOT], host_thread.host_thread.localinfo_journal_mark,
+                                         self.files.get(JOURNAL, ""))
+        text = self.session.text
+        self.session = None
+        if command.startswith("cat > "):
+            self.files[SNAPSHOT] = text
+            self.files.pop(JOURNAL, None)
+        elif command.startswith("cat >> "):
+            if self.fail_append:
+                self.fail_append -= 1
+                self.files[JOURNAL] = self.files.get(JOURNAL, "") + text[:len(text) // 2]
+                raise host_thread.RunCommandException("Connection reset by peer")
+            self.files[JOURNAL] = self.files.get(JOURNAL, "") + text
+        else:
+            raise AssertionError("unexpected command " + command)
+        return ""
+
+    def journal_lines(self):
+        return self.files.get(JOURNAL, "").splitlines()
+
+
+def new_host(files):
+    thread = host_thread.host_thread(name="compute-1", host="compute-1", user="user", db=None, test=True,
+                                     image_path=IMAGE_PATH, host_id="host-1", version="0.5", develop_mode=False,
+                                     develop_bridge_iface=None)
+    # the commands are run at the fake host instead of at a compute node
+    thread.test = False
+    thread.run_command = files.run_command
+    return thread
+
+
+def snapshot(files, server_files=None):
+    return json.dumps({"files": files, "server_files": server_files or {}}, indent=1, separators=(',', ': '))
+
+
+def line(*change):
+    return json.dumps(change, separators=(',', ':'))
+
+
+def test_legacy_yaml_then_json_snapshot():
+    files = FakeHostFiles({SNAPSHOT: yaml.safe_dump({"files": {"/img/a.qcow2": "a"}}, default_flow_style=False)})
+    thread = new_host(files)
+    thread.load_localinfo()
+    assert thread.localinfo == {"files": {"/img/a.qcow2": "a"}, "server_files": {}}
+    assert thread.localinfo_journal_lines is None
+
+    # a legacy snapshot is rewritten as json at the first save
+    thread.set_localinfo("files", "/img/b.qcow2", "b")
+    thread.save_localinfo()
+    assert json.loads(files.files[SNAPSHOT]) == {"files": {"/img/a.qcow2": "a", "/img/b.qcow2": "b"},
+                                                 "server_files": {}}
+    assert JOURNAL not in files.files
+    assert thread.localinfo_journal_lines == 0
+
+    thread = new_host(files)
+    thread.load_localinfo()
+    assert thread.localinfo["files"] == {"/img/a.qcow2": "a", "/img/b.qcow2": "b"}
+    assert thread.localinfo_journal_lines == 0
+
+
+def test_replay_set_and_del():
+    files = FakeHostFiles({
+        SNAPSHOT: snapshot({"/img/a.qcow2": "a", "/img/b.qcow2": "b"}),
+        JOURNAL: "".join(l + "\n" for l in (line("set", "files", "/img/c.qcow2", "c"),
+                                            line("del", "files", "/img/a.qcow2"),
+                                            line("set", "server_files", "vm-1", {"vda": "/img/c.qcow2"}))),
+    })
+    thread = new_host(files)
+    thread.load_localinfo()
+    assert thread.localinfo == {"files": {"/img/b.qcow2": "b", "/img/c.qcow2": "c"},
+                                "server_files": {"vm-1": {"vda": "/img/c.qcow2"}}}
+    assert thread.localinfo_journal_lines == 3
+
+    # new changes are appended to the journal, keeping the snapshot
+    thread.del_localinfo("server_files", "vm-1")
+    thread.save_localinfo()
+    assert files.journal_lines()[3:] == [line("del", "server_files", "vm-1")]
+    assert thread.localinfo_journal_lines == 4
+    assert json.loads(files.files[SNAPSHOT])["files"] == {"/img/a.qcow2": "a", "/img/b.qcow2": "b"}
+
+    thread = new_host(files)
+    thread.load_localinfo()
+    assert thread.localinfo["server_files"] == {}
+
+
+def test_truncated_last_line():
+    files = FakeHostFiles({
+        SNAPSHOT: snapshot({"/img/a.qcow2": "a"}),
+        JOURNAL: line("set", "files", "/img/b.qcow2", "b") + "\n" + line("set", "files", "/img/c.qcow2", "c")[:20],
+    })
+    thread = new_host(files)
+    thread.load_localinfo()
+    assert thread.localinfo["files"] == {"/img/a.qcow2": "a", "/img/b.qcow2": "b"}
+    assert thread.localinfo_journal_lines is None
+
+    # the broken journal is replaced by a snapshot at the next save
+    thread.set_localinfo("files", "/img/d.qcow2", "d")
+    thread.save_localinfo()
+    assert JOURNAL not in files.files
+    assert json.loads(files.files[SNAPSHOT])["files"] == {"/img/a.qcow2": "a", "/img/b.qcow2": "b",
+                                                          "/img/d.qcow2": "d"}
+
+
+def test_compaction():
+    files = FakeHostFiles({SNAPSHOT: snapshot({})})
+    thread = new_host(files)
+    thread.localinfo_compact_lines = 3
+    thread.load_localinfo()
+    for name in ("a", "b"):
+        thread.set_localinfo("files", "/img/{}.qcow2".format(name), name)
+        thread.save_localinfo()
+    assert len(files.journal_lines()) == 2
+    assert thread.localinfo_journal_lines == 2
+
+    # the journal would exceed localinfo_compact_lines: written as a new snapshot that removes it
+    thread.set_localinfo("files", "/img/c.qcow2", "c")
+    thread.del_localinfo("files", "/img/a.qcow2")
+    thread.save_localinfo()
+    assert JOURNAL not in files.files
+    assert json.loads(files.files[SNAPSHOT])["files"] == {"/img/b.qcow2": "b", "/img/c.qcow2": "c"}
+    assert thread.localinfo_journal_lines == 0
+
+    thread.set_localinfo("files", "/img/d.qcow2", "d")
+    thread.save_localinfo()
+    assert files.journal_lines() == [line("set", "files", "/img/d.qcow2", "d")]
+
+
+@pytest.mark.parametrize("tries", [3, 0])
+def test_failed_append_forces_snapshot(tries):
+    files = FakeHostFiles({SNAPSHOT: snapshot({"/img/a.qcow2": "a"})})
+    thread = new_host(files)
+    thread.load_localinfo()
+    files.fail_append = 1
+    thread.set_localinfo("files", "/img/b.qcow2", "b")
+    thread.save_localinfo(tries=tries)
+    if not tries:
+        # the changes are kept for the next save, that writes a snapshot over the broken journal
+        assert thread.localinfo_dirty
+        assert thread.localinfo_journal == [line("set", "files", "/img/b.qcow2", "b")]
+        assert JOURNAL in files.files
+        thread.save_localinfo(tries=tries)
+    assert not thread.localinfo_dirty
+    assert thread.localinfo_journal == []
+    assert JOURNAL not in files.files
+    assert json.loads(files.files[SNAPSHOT])["files"] == {"/img/a.qcow2": "a", "/img/b.qcow2": "b"}
+    assert thread.localinfo_journal_lines == 0
+
+    thread = new_host(files)
+    thread.load_localinfo()
+    assert thread.localinfo["files"] == {"/img/a.qcow2": "a", "/img/b.qcow2": "b"}
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+##
+# Copyright 2015 Telefonica Investigacion y Desarrollo, S.A.U.
+# This file is part of openvim
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+# For those usages not covered by the Apache License, Version 2.0 please
+# contact with: nfvlabs@tid.es
+##
+
+'''
+Unit tests of the RADclass inventory parser against the recorded output of a compute node, at
+test/radclass/host-inventory-example.yaml. No connection to a compute node is needed:
+    pytest -v test/test_radclass.py
+'''
+
+__date__ = "$19-oct-2026 10:00:00$"
+
+import os
+import sys
+import yaml
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "osm_openvim"))
+
+import RADclass
+
+INVENTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "radclass", "host-inventory-example.yaml")
+
+
+@pytest.fixture
+def inventory_data():
+    with open(INVENTORY_FILE) as f:
+        return yaml.safe_load(f)
+
+
+def test_radclass_parse_inventory(inventory_data):
+    rad = RADclass.RADclass()
+    result, warning = rad.parse_inventory(RADclass.HostInventory(inventory_data), "compute-0")
+    assert result, warning
+    assert rad.name == "compute-0"
+    assert rad.nr_processors == 2
+    assert rad.processor_family == "Xeon"
+    assert rad.processor_features == ['ht', 'hwsv', 'dioc', 'lps', '64b', 'tlbps', 'iommu']
+    assert rad.memory_hugepage_sz == 1073741824
+    assert rad.os.id_ == "Ubuntu 16.04.3 LTS"
+    assert rad.hypervisor.domains == ['kvm']
+
+    node0 = rad.nodes[0]
+    assert node0.processor.cores == [[0, 4], [1, 5]]
+    assert node0.memory.hugepage_nr == 24
+    assert rad.nodes[1].memory.hugepage_nr == 28
+
+
+def test_radclass_parse_inventory_nics(inventory_data):
+    rad = RADclass.RADclass()
+    result, warning = rad.parse_inventory(RADclass.HostInventory(inventory_data), "compute-0")
+    assert result, warning
+    ports = rad.nodes[0].nic_list[0].ports
+    # interfaces whose parent is not a pci device are skipped
+    assert sorted(ports.keys()) == ["0000:01:00.0", "0000:04:00.0", "0000:04:00.1", "0000:04:10.0", "0000:04:10.2"]
+    assert ports["0000:04:00.0"].speed == 10000000000
+    assert ports["0000:04:00.0"].enabled
+    assert not ports["0000:04:00.1"].enabled
+    # virtual functions take the PF status
+    assert ports["0000:04:10.2"].virtual
+    assert ports["0000:04:10.2"].PF_pci_device_id == "0000:04:00.0"
+    assert ports["0000:04:10.2"].enabled
+    assert rad.nodes[1].nic_list[0].ports.keys() == ["0000:84:00.0"]
+
+
+def test_radclass_parse_inventory_script_error(inventory_data):
+    script_output = inventory_data["script_output"]
+    inventory_data["script_output"] = script_output.replace("@@@ hugepage_size:stderr\n",
+                                                            "@@@ hugepage_size:stderr\nsudo: hugeadm: not found\n")
+    rad = RADclass.RADclass()
+    result, error = rad.parse_inventory(RADclass.HostInventory(inventory_data), "compute-0")
+    assert not result
+    assert "hugeadm: not found" in error
+
+
+def test_host_inventory_to_dict(inventory_data):
+    inventory = RADclass.HostInventory(inventory_data)
+    assert RADclass.HostInventory(yaml.safe_load(yaml.safe_dump(inventory.to_dict()))).to_dict() == inventory_data
+    assert inventory.section("os_type") == "GNU/Linux\n"
+    assert inventory.section("missing") == ""